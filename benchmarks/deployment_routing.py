@@ -0,0 +1,119 @@
+"""Measure completion throughput through the deployment router as deployments are added.
+
+Every simulated deployment serves at most ``--capacity`` concurrent requests
+with ``--latency`` seconds each and answers anything beyond that with a 429
+and a ``Retry-After``, like an Azure OpenAI deployment at its TPM quota. One
+deployment can be made slower (``--slow``) and one can fail with 503s
+(``--failing``) to check that traffic moves away from them.
+
+    python benchmarks/deployment_routing.py --max-targets 4 --requests 200
+
+Runs ``webapp/deployment_router.py`` in process; nothing is sent over the network.
+"""
+from __future__ import annotations
+
+import argparse
+import sys
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "webapp"))
+
+from deployment_router import DeploymentRouter  # noqa: E402
+
+
+class Throttled(Exception):
+    status_code = 429
+
+    def __init__(self, retry_after: float) -> None:
+        super().__init__("429 Too Many Requests")
+        self.response = type("Response", (), {"headers": {"retry-after-ms": str(int(retry_after * 1000))}})()
+
+
+class Unavailable(Exception):
+    status_code = 503
+
+
+class SimulatedDeployment:
+    def __init__(self, capacity: int, latency: float, retry_after: float, failing: bool = False) -> None:
+        self.capacity = capacity
+        self.latency = latency
+        self.retry_after = retry_after
+        self.failing = failing
+        self._active = 0
+        self._lock = threading.Lock()
+
+    def create(self) -> str:
+        with self._lock:
+            if self._active >= self.capacity:
+                raise Throttled(self.retry_after)
+            self._active += 1
+        try:
+            time.sleep(self.latency)
+            if self.failing:
+                raise Unavailable("503 Service Unavailable")
+            return "ok"
+        finally:
+            with self._lock:
+                self._active -= 1
+
+
+def run(targets: int, args: argparse.Namespace) -> None:
+    names = [f"region-{i + 1}" for i in range(targets)]
+    deployments = {
+        name: SimulatedDeployment(
+            args.capacity,
+            args.latency * (3 if args.slow and i == 1 else 1),
+            args.retry_after,
+            failing=args.failing and i == targets - 1 and targets > 1,
+        )
+        for i, name in enumerate(names)
+    }
+    router = DeploymentRouter([{"name": name, "endpoint": f"https://{name}.example/", "deployment": "agent"} for name in names])
+
+    def complete(_: int) -> str:
+        try:
+            _, target = router.complete(lambda target: deployments[target.name].create(), max_wait=args.max_wait)
+            return target.name
+        except Exception as e:
+            return type(e).__name__
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        outcomes = Counter(executor.map(complete, range(args.requests)))
+    elapsed = time.perf_counter() - started
+
+    served = sum(count for name, count in outcomes.items() if name in deployments)
+    print(f"{targets} deployment(s): {served / elapsed:6.1f} completions/s, {served}/{args.requests} served in {elapsed:.1f}s")
+    for stats in router.snapshot():
+        print(
+            f"    {stats['name']}: {stats['successes']} ok, {stats['throttled']} throttled, {stats['errors']} errors, "
+            f"ewma {stats['ewma_latency_ms']} ms, breaker {stats['breaker']['state']}"
+        )
+    failures = {name: count for name, count in outcomes.items() if name not in deployments}
+    if failures:
+        print(f"    failed requests: {failures}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--max-targets", type=int, default=4)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--capacity", type=int, default=4, help="concurrent requests per deployment before 429s")
+    parser.add_argument("--latency", type=float, default=0.2, help="seconds per completion")
+    parser.add_argument("--retry-after", type=float, default=1.0)
+    parser.add_argument("--max-wait", type=float, default=30.0, help="how long a request may wait out throttling")
+    parser.add_argument("--slow", action="store_true", help="make the second deployment 3x slower")
+    parser.add_argument("--failing", action="store_true", help="make the last deployment return 503s")
+    args = parser.parse_args()
+
+    for targets in range(1, args.max_targets + 1):
+        run(targets, args)
+
+
+if __name__ == "__main__":
+    main()
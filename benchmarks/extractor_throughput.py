@@ -0,0 +1,236 @@
+"""pytest-benchmark suite for the corpus extraction scripts on a synthetic corpus.
+
+``synthetic_corpus.py`` generates CORPUS_SIZE modules, schema files and
+quickstarts once per session (or CORPUS_DIR keeps and reuses them). Each
+extractor then runs over the whole corpus with the fake ``az`` first on
+PATH, so neither the Azure CLI nor the network is needed. Every benchmark
+records ``files``, ``files_per_sec`` and ``peak_rss_mb`` in ``extra_info``.
+The RSS is summed over this process, the pool workers and their ``az``
+children. The extractors that use a process pool run once per worker count
+in BENCH_WORKERS, and ``speedup`` compares each count with the first.
+
+    pip install pytest pytest-benchmark
+    pytest benchmarks/extractor_throughput.py
+    CORPUS_SIZE=100000 CORPUS_DIR=/tmp/corpus BENCH_WORKERS=1,4,16 pytest benchmarks/extractor_throughput.py --benchmark-json=extractors.json
+    FAKE_AZ_DELAY_MS=400 pytest benchmarks/extractor_throughput.py -k avm_data_extract_fast
+
+The file has no ``test_`` prefix, so pytest only runs it when it is named.
+"""
+from __future__ import annotations
+
+import importlib.util
+import multiprocessing
+import os
+import resource
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+import pytest
+
+BENCHMARKS_DIR = Path(__file__).resolve().parent
+BASE_DIR = BENCHMARKS_DIR.parent
+GROUNDING_SCRIPTS = BASE_DIR / "grounding-data" / "scripts"
+TRAINING_SCRIPTS = BASE_DIR / "training-data" / "scripts"
+sys.path[:0] = [str(BENCHMARKS_DIR), str(GROUNDING_SCRIPTS), str(TRAINING_SCRIPTS)]
+
+from synthetic_corpus import Corpus, generate  # noqa: E402
+
+CPUS = os.cpu_count() or 1
+CORPUS_SIZE = int(os.getenv("CORPUS_SIZE", "1000"))
+CORPUS_DIR = os.getenv("CORPUS_DIR")
+CORPUS_SEED = int(os.getenv("CORPUS_SEED", "0"))
+WORKERS = [int(n) for n in os.getenv("BENCH_WORKERS", ",".join(str(n) for n in sorted({1, min(2, CPUS), min(4, CPUS), CPUS}))).split(",")]
+ROUNDS = int(os.getenv("BENCH_ROUNDS", "1"))
+RSS_SAMPLE_SECONDS = 0.05
+
+# The scripts' functions are pickled by reference, so forked workers find the modules loaded here
+POOL_CONTEXT = multiprocessing.get_context("fork") if "fork" in multiprocessing.get_all_start_methods() else None
+_baselines: Dict[str, float] = {}
+
+
+def load_script(name: str, path: Path):
+    """Import a script by path under a unique name (both data folders have an extract_avm_examples.py)."""
+    spec = importlib.util.spec_from_file_location(f"bench_{name}", path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+grounding_avm = load_script("grounding_avm_data_extract_fast", GROUNDING_SCRIPTS / "avm_data_extract_fast.py")
+training_avm = load_script("training_avm_data_extract_fast", TRAINING_SCRIPTS / "avm_data_extract_fast.py")
+classic = load_script("classic_data_extract", GROUNDING_SCRIPTS / "classic_data_extract.py")
+grounding_examples = load_script("grounding_extract_avm_examples", GROUNDING_SCRIPTS / "extract_avm_examples.py")
+training_examples = load_script("training_extract_avm_examples", TRAINING_SCRIPTS / "extract_avm_examples.py")
+run_extraction = load_script("run_extraction", TRAINING_SCRIPTS / "run_extraction.py")
+arm_parse = load_script("arm_parse", TRAINING_SCRIPTS / "arm-parse.py")
+
+
+def _process_tree_rss(root_pid: int) -> Optional[int]:
+    """RSS of `root_pid` and all of its descendants, or None without /proc."""
+    page_size = os.sysconf("SC_PAGE_SIZE")
+    children: Dict[int, List[int]] = {}
+    try:
+        entries = os.listdir("/proc")
+    except OSError:
+        return None
+    for entry in entries:
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat", "rb") as f:
+                # The command name may contain spaces; the fields after it are fixed
+                parent = int(f.read().rsplit(b")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(parent, []).append(int(entry))
+
+    total = 0
+    pending = [root_pid]
+    while pending:
+        pid = pending.pop()
+        pending.extend(children.get(pid, ()))
+        try:
+            with open(f"/proc/{pid}/statm", "rb") as f:
+                total += int(f.read().split()[1]) * page_size
+        except (OSError, IndexError, ValueError):
+            continue
+    return total
+
+
+class PeakRss:
+    """Peak RSS of this process tree while the block runs.
+
+    Without /proc it falls back to the largest single process seen by getrusage (self or
+    one child), which is a lower bound for the tree and not reset between runs.
+    """
+
+    def __init__(self) -> None:
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, name="peak-rss", daemon=True)
+        self._proc = _process_tree_rss(os.getpid()) is not None
+
+    def __enter__(self) -> "PeakRss":
+        if self._proc:
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+            self._observe()
+        else:
+            # ru_maxrss is in KiB on Linux and bytes on macOS
+            scale = 1 if sys.platform == "darwin" else 1024
+            self.peak = scale * max(
+                resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+            )
+
+    def _observe(self) -> None:
+        self.peak = max(self.peak, _process_tree_rss(os.getpid()) or 0)
+
+    def _sample(self) -> None:
+        self._observe()
+        while not self._stop.wait(RSS_SAMPLE_SECONDS):
+            self._observe()
+
+
+def pool_map(function: Callable, workers: int, *iterables) -> list:
+    """`executor.map` as the scripts call it, with a fixed number of workers."""
+    with ProcessPoolExecutor(max_workers=workers, mp_context=POOL_CONTEXT) as executor:
+        return list(executor.map(function, *iterables))
+
+
+def measure(benchmark, group: str, files: int, target: Callable, workers: Optional[int] = None):
+    """Run `target` under the benchmark and record throughput, peak RSS and the speedup over the first worker count."""
+    benchmark.group = group
+    peaks: List[int] = []
+
+    def run():
+        with PeakRss() as rss:
+            result = target()
+        peaks.append(rss.peak)
+        return result
+
+    result = benchmark.pedantic(run, rounds=ROUNDS, iterations=1, warmup_rounds=0)
+    mean = benchmark.stats.stats.mean
+    benchmark.extra_info.update({
+        "files": files,
+        "files_per_sec": round(files / mean, 1) if mean else None,
+        "peak_rss_mb": round(max(peaks) / (1024 * 1024), 1),
+    })
+    if workers is not None:
+        benchmark.extra_info["workers"] = workers
+        baseline = _baselines.setdefault(group, mean)
+        benchmark.extra_info["speedup"] = round(baseline / mean, 2) if mean else None
+    return result
+
+
+@pytest.fixture(scope="session")
+def corpus(tmp_path_factory) -> Corpus:
+    root = Path(CORPUS_DIR) if CORPUS_DIR else tmp_path_factory.mktemp("corpus")
+    existing = Corpus(root)
+    if CORPUS_DIR and existing.main_bicep_files():
+        corpus = existing
+    else:
+        started = time.perf_counter()
+        corpus = generate(root, CORPUS_SIZE, CORPUS_SIZE, CORPUS_SIZE, CORPUS_SEED)
+        print(f"\nGenerated a corpus of {CORPUS_SIZE} in {time.perf_counter() - started:.1f}s at {root}")
+    path = os.environ.get("PATH", "")
+    os.environ["PATH"] = f"{corpus.bin_dir}{os.pathsep}{path}"
+    yield corpus
+    os.environ["PATH"] = path
+
+
+@pytest.mark.parametrize("workers", WORKERS)
+@pytest.mark.parametrize("script", [grounding_avm, training_avm], ids=["grounding", "training"])
+def test_avm_data_extract_fast(benchmark, corpus, script, workers):
+    files = corpus.main_bicep_files()
+    name = "grounding" if script is grounding_avm else "training"
+    results = measure(benchmark, f"avm_data_extract_fast ({name})", len(files), lambda: pool_map(script.process_bicep_file, workers, files), workers)
+    assert all(results), "az bicep build failed for some modules; is the fake az on PATH?"
+
+
+def test_classic_data_extract(benchmark, corpus, monkeypatch):
+    monkeypatch.chdir(corpus.schemas_root)
+    files = corpus.schema_files()
+    processed = measure(benchmark, "classic_data_extract", len(files), classic.parse_arm_schemas_to_jsonl)
+    assert processed >= len(files) - 1
+
+
+def test_extract_avm_examples_grounding(benchmark, corpus, tmp_path, monkeypatch):
+    monkeypatch.setattr(grounding_examples, "MODULES_ROOT", corpus.modules_root)
+    monkeypatch.setattr(grounding_examples, "OUTPUT_PATH", tmp_path / "extracted_avm_examples.jsonl")
+    files = corpus.readme_files()
+    measure(benchmark, "extract_avm_examples (grounding)", len(files), grounding_examples.main)
+    assert (tmp_path / "extracted_avm_examples.jsonl").stat().st_size > 0
+
+
+def test_extract_avm_examples_training(benchmark, corpus, tmp_path, monkeypatch):
+    files = corpus.readme_files()
+    monkeypatch.setattr(training_examples, "_readme_paths", lambda: files)
+    # main() writes next to its own file's parent folder; point that at tmp_path
+    monkeypatch.setattr(training_examples, "__file__", str(tmp_path / "scripts" / "extract_avm_examples.py"))
+    measure(benchmark, "extract_avm_examples (training)", len(files), training_examples.main)
+    assert (tmp_path / "avm_examples.jsonl").stat().st_size > 0
+
+
+@pytest.mark.parametrize("workers", WORKERS)
+def test_run_extraction(benchmark, corpus, workers):
+    files = run_extraction._collect_supported_files(corpus.quickstarts_root)
+    results = measure(benchmark, "run_extraction", len(files), lambda: pool_map(run_extraction.process_file, workers, files, range(len(files))), workers)
+    assert all(results), "az bicep decompile failed for some templates; is the fake az on PATH?"
+
+
+@pytest.mark.parametrize("workers", WORKERS)
+def test_arm_parse(benchmark, corpus, workers):
+    files = corpus.quickstart_bicep_files()
+    results = measure(benchmark, "arm-parse", len(files), lambda: pool_map(arm_parse.process_bicep_file, workers, files), workers)
+    assert all(results)
@@ -0,0 +1,146 @@
+"""Compare the agent's completion size and latency under the full and compact output contracts.
+
+Offline (default): every expected answer in ``train_agent_validation.jsonl``
+is written out the way each contract asks for it. Under the full contract that
+is ``plan`` + ``files`` (main.bicep and parameters.json) + ``warnings``. Under
+the compact contract it is ``bicep`` + ``rationale`` + ``warnings``. The
+script counts the completion tokens of each. It also checks that the plan
+``agent_output.py`` derives from the Bicep covers the resources of the
+expected plan.
+
+    python benchmarks/output_contract.py
+    python benchmarks/output_contract.py --live 20     # also time 20 real completions per contract
+
+``--live`` sends validation prompts (without search context) to
+``AZURE_OPENAI_ENDPOINT`` / ``AZURE_OPENAI_DEPLOYMENT_NAME`` under both
+contracts. It reports the completion tokens and latency the service returns.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import Callable, Dict, List
+
+BASE_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BASE_DIR / "webapp"))
+
+from agent_output import derive_plan  # noqa: E402
+from bicep_parameters import derive_parameters_json  # noqa: E402
+from prompting import COMPACT_CONTRACT, FULL_CONTRACT, MODE_QUERY_SUFFIXES, build_agent_messages, format_context  # noqa: E402
+
+VALIDATION_PATH = BASE_DIR / "training-data" / "train_agent_validation.jsonl"
+
+
+def token_counter() -> Callable[[str], int]:
+    try:
+        import tiktoken
+
+        encoding = tiktoken.encoding_for_model("gpt-4o-mini")
+        return lambda text: len(encoding.encode(text))
+    except Exception:
+        print("tiktoken encoding unavailable, estimating tokens as characters / 4")
+        return lambda text: len(text) // 4
+
+
+def load_answers(path: Path) -> List[dict]:
+    answers = []
+    with path.open(encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            messages = json.loads(line)["messages"]
+            prompt = next(m["content"] for m in messages if m["role"] == "user")
+            answers.append({"prompt": prompt, "expected": json.loads(next(m["content"] for m in messages if m["role"] == "assistant"))})
+    return answers
+
+
+def main_bicep(payload: dict) -> str:
+    return next((f.get("content", "") for f in payload.get("files", []) if f.get("path") == "main.bicep"), "")
+
+
+def full_answer(payload: dict) -> str:
+    """The answer as the full contract asks for it, parameters.json included."""
+    files = list(payload.get("files", []))
+    if not any(f.get("path") == "parameters.json" for f in files):
+        files.append({"path": "parameters.json", "language": "json", "content": derive_parameters_json(main_bicep(payload))})
+    return json.dumps(dict(payload, files=files))
+
+
+def compact_answer(payload: dict) -> str:
+    return json.dumps({
+        "bicep": main_bicep(payload),
+        "rationale": (payload.get("plan") or {}).get("rationale", ""),
+        "warnings": payload.get("warnings", []),
+    })
+
+
+def offline(answers: List[dict]) -> None:
+    count = token_counter()
+    full = [count(full_answer(a["expected"])) for a in answers]
+    compact = [count(compact_answer(a["expected"])) for a in answers]
+    saved = 1 - sum(compact) / sum(full)
+    print(f"{len(answers)} validation answers, completion tokens per answer:")
+    for name, tokens in ((FULL_CONTRACT, full), (COMPACT_CONTRACT, compact)):
+        ordered = sorted(tokens)
+        print(f"  {name:8} mean {statistics.mean(tokens):7.0f}  median {statistics.median(tokens):6.0f}  p95 {ordered[int(0.95 * (len(ordered) - 1))]:6d}")
+    print(f"  compact saves {saved:.1%} of completion tokens")
+
+    # Training plans built by data_transformer.generate_plan_and_warnings name only the first declaration.
+    covered = extra = 0
+    for answer in answers:
+        expected = {r.get("resourceType") for r in (answer["expected"].get("plan") or {}).get("resources", [])}
+        derived = {r["resourceType"] for r in derive_plan(main_bicep(answer["expected"]))["resources"]}
+        covered += expected <= derived
+        extra += expected < derived
+    print(f"  derived plan covers the expected resources for {covered}/{len(answers)} answers ({extra} list further declarations)")
+
+
+def live(answers: List[dict], count: int) -> None:
+    from openai import AzureOpenAI
+    from azure.identity import DefaultAzureCredential, get_bearer_token_provider
+
+    client = AzureOpenAI(
+        azure_endpoint=os.environ["AZURE_OPENAI_ENDPOINT"],
+        api_version=os.getenv("AZURE_OPENAI_API_VERSION", "2024-10-21"),
+        azure_ad_token_provider=get_bearer_token_provider(DefaultAzureCredential(), "https://cognitiveservices.azure.com/.default"),
+    )
+    deployment = os.environ["AZURE_OPENAI_DEPLOYMENT_NAME"]
+
+    results: Dict[str, List[tuple]] = {FULL_CONTRACT: [], COMPACT_CONTRACT: []}
+    for answer in answers[:count]:
+        mode = "avm" if "br/public:avm" in main_bicep(answer["expected"]) else "classic"
+        for contract in results:
+            messages = build_agent_messages(answer["prompt"] + MODE_QUERY_SUFFIXES[mode], format_context([]), contract)
+            started = time.perf_counter()
+            response = client.chat.completions.create(
+                model=deployment, messages=messages, response_format={"type": "json_object"}, temperature=0.1
+            )
+            results[contract].append((response.usage.completion_tokens, time.perf_counter() - started))
+
+    print(f"live, {count} prompts per contract:")
+    for contract, rows in results.items():
+        print(
+            f"  {contract:8} mean completion tokens {statistics.mean(r[0] for r in rows):7.0f}  "
+            f"mean latency {statistics.mean(r[1] for r in rows):5.2f}s"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--validation", type=Path, default=VALIDATION_PATH)
+    parser.add_argument("--live", type=int, default=0, metavar="N", help="also time N completions per contract")
+    args = parser.parse_args()
+
+    answers = load_answers(args.validation)
+    offline(answers)
+    if args.live:
+        live(answers, args.live)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,486 @@
+"""Generate a synthetic corpus for benchmarking the extraction scripts offline.
+
+The extractors normally run against local checkouts of bicep-registry-modules,
+azure-resource-manager-schemas and azure-quickstart-templates, and some of
+them shell out to the Azure CLI. This script writes checkouts of any size
+with the same layout and file formats, plus a fake ``az`` that answers the
+two commands the extractors use:
+
+    <root>/bicep-registry-modules-main/avm/res/<provider>/<resource>/
+        main.bicep, README.md (``### Example N: _..._`` sections), version.json
+    <root>/azure-resource-manager-schemas/schemas/
+        <apiVersion>/<Provider>.json (``resourceDefinitions`` with local and
+        common ``$ref``s), common/definitions.json
+    <root>/azure-quickstart-templates/quickstarts/<category>/<name>/
+        azuredeploy.json, and main.bicep (with modules/*.bicep) for half of them
+    <root>/bin/az, az.cmd
+        ``az bicep build --file F --stdout`` prints ARM JSON with F's params and
+        their descriptions. ``az bicep decompile --file F`` prints Bicep for
+        F's parameters and resources. FAKE_AZ_DELAY_MS adds a fixed delay per
+        call, to model the real CLI's startup.
+
+    python benchmarks/synthetic_corpus.py /tmp/corpus --size 10000
+    python benchmarks/synthetic_corpus.py /tmp/corpus --modules 1000 --schemas 200 --quickstarts 5000
+
+Output is deterministic for a given ``--seed``. ``extractor_throughput.py``
+uses it to benchmark each extractor.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import random
+import stat
+import sys
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+MODULES_DIR = "bicep-registry-modules-main"
+SCHEMAS_DIR = "azure-resource-manager-schemas"
+QUICKSTARTS_DIR = "azure-quickstart-templates"
+BIN_DIR = "bin"
+
+PROVIDERS = [
+    ("key-vault", "Microsoft.KeyVault", ["vault", "managed-hsm"]),
+    ("storage", "Microsoft.Storage", ["storage-account"]),
+    ("network", "Microsoft.Network", ["virtual-network", "network-security-group", "public-ip-address", "private-endpoint", "application-gateway", "load-balancer"]),
+    ("compute", "Microsoft.Compute", ["virtual-machine", "disk", "availability-set"]),
+    ("web", "Microsoft.Web", ["site", "serverfarm", "static-site"]),
+    ("sql", "Microsoft.Sql", ["server", "managed-instance"]),
+    ("container-registry", "Microsoft.ContainerRegistry", ["registry"]),
+    ("container-service", "Microsoft.ContainerService", ["managed-cluster"]),
+    ("cognitive-services", "Microsoft.CognitiveServices", ["account"]),
+    ("insights", "Microsoft.Insights", ["component", "action-group", "diagnostic-setting"]),
+    ("operational-insights", "Microsoft.OperationalInsights", ["workspace"]),
+    ("service-bus", "Microsoft.ServiceBus", ["namespace"]),
+    ("event-hub", "Microsoft.EventHub", ["namespace"]),
+    ("document-db", "Microsoft.DocumentDB", ["database-account"]),
+    ("app", "Microsoft.App", ["container-app", "managed-environment"]),
+]
+WORDS = [
+    "the", "resource", "configuration", "enable", "disable", "network", "access", "identity", "policy", "rule",
+    "default", "value", "name", "location", "deployment", "private", "public", "endpoint", "setting", "diagnostic",
+    "retention", "days", "tier", "capacity", "zone", "redundant", "encryption", "key", "customer", "managed",
+]
+SHARED_PARAMETERS = [
+    ("location", "string", "Optional. Location for all resources."),
+    ("tags", "object", "Optional. Tags of the resource."),
+    ("enableTelemetry", "bool", "Optional. Enable/Disable usage telemetry for module."),
+    ("lock", "object", "Optional. The lock settings of the service."),
+    ("roleAssignments", "array", "Optional. Array of role assignments to create."),
+    ("diagnosticSettings", "array", "Optional. The diagnostic settings of the service."),
+]
+EXAMPLES = [
+    ("Using only defaults", "This instance deploys the module with the minimum set of required parameters."),
+    ("Using large parameter set", "This instance deploys the module with most of its features enabled."),
+    ("WAF-aligned", "This instance deploys the module in alignment with the best-practices of the Azure Well-Architected Framework."),
+]
+QUICKSTART_CATEGORIES = ["quickstarts/microsoft.storage", "quickstarts/microsoft.web", "quickstarts/microsoft.network", "quickstarts/microsoft.compute", "demos", "application-workloads"]
+BICEP_TYPES = {"string": "string", "object": "object", "bool": "bool", "array": "array", "int": "int"}
+
+FAKE_AZ_SOURCE = r'''"""Fake Azure CLI for offline extractor benchmarks (see synthetic_corpus.py)."""
+import json
+import os
+import re
+import sys
+import time
+
+PARAM_RE = re.compile(r"(?:@description\('((?:[^'\\]|\\.)*)'\)\s*\n)?param\s+(\w+)\s+(\w+)")
+RESOURCE_RE = re.compile(r"^(?:resource|module)\s+(\w+)\s+'([^'@]+)(?:@([^']+))?'", re.MULTILINE)
+
+
+def build(path):
+    with open(path, encoding="utf-8") as f:
+        source = f.read()
+    parameters = {}
+    for description, name, kind in PARAM_RE.findall(source):
+        parameters[name] = {"type": kind, "metadata": {"description": description or "No description."}}
+    resources = [
+        {"type": kind, "apiVersion": api or "2023-01-01", "name": f"[parameters('{name}')]"}
+        for name, kind, api in RESOURCE_RE.findall(source)
+    ]
+    print(json.dumps({
+        "$schema": "https://schema.management.azure.com/schemas/2019-04-01/deploymentTemplate.json#",
+        "contentVersion": "1.0.0.0",
+        "parameters": parameters,
+        "resources": resources,
+    }, indent=2))
+
+
+def decompile(path):
+    with open(path, encoding="utf-8") as f:
+        template = json.load(f)
+    lines = []
+    for name, spec in template.get("parameters", {}).items():
+        description = spec.get("metadata", {}).get("description")
+        if description:
+            lines.append(f"@description('{description}')")
+        lines.append(f"param {name} {spec.get('type', 'string')}")
+    for index, resource in enumerate(template.get("resources", [])):
+        lines += [
+            "",
+            f"resource resource{index} '{resource['type']}@{resource.get('apiVersion', '2023-01-01')}' = {{",
+            f"  name: '{resource.get('name', 'resource')}'",
+            "  location: location",
+            "}",
+        ]
+    print("\n".join(lines))
+
+
+def main(argv):
+    delay = float(os.environ.get("FAKE_AZ_DELAY_MS", "0"))
+    if delay:
+        time.sleep(delay / 1000)
+    if len(argv) < 4 or argv[0] != "bicep" or "--file" not in argv:
+        print(f"fake az: unsupported command: {' '.join(argv)}", file=sys.stderr)
+        return 2
+    path = argv[argv.index("--file") + 1]
+    try:
+        if argv[1] == "build":
+            build(path)
+        elif argv[1] == "decompile":
+            decompile(path)
+        else:
+            print(f"fake az: unsupported bicep command: {argv[1]}", file=sys.stderr)
+            return 2
+    except (OSError, ValueError) as e:
+        print(f"fake az: {e}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
+'''
+
+
+@dataclass
+class Corpus:
+    """Where the parts of a generated corpus are; also works on one generated earlier."""
+
+    root: Path
+
+    @property
+    def modules_root(self) -> Path:
+        return self.root / MODULES_DIR
+
+    @property
+    def schemas_root(self) -> Path:
+        return self.root / SCHEMAS_DIR
+
+    @property
+    def quickstarts_root(self) -> Path:
+        return self.root / QUICKSTARTS_DIR
+
+    @property
+    def bin_dir(self) -> Path:
+        return self.root / BIN_DIR
+
+    def main_bicep_files(self) -> List[str]:
+        return sorted(str(path) for path in (self.modules_root / "avm" / "res").glob("*/*/main.bicep"))
+
+    def readme_files(self) -> List[Path]:
+        return sorted((self.modules_root / "avm").glob("**/README.md"))
+
+    def schema_files(self) -> List[Path]:
+        return sorted((self.schemas_root / "schemas").glob("**/*.json"))
+
+    def quickstart_bicep_files(self) -> List[str]:
+        return sorted(str(path) for path in self.quickstarts_root.glob("**/*.bicep"))
+
+
+def _sentence(rng: random.Random, low: int = 6, high: int = 18) -> str:
+    words = rng.choices(WORDS, k=rng.randint(low, high))
+    return " ".join(words).capitalize() + "."
+
+
+def _pascal(slug: str) -> str:
+    return "".join(part.capitalize() for part in slug.split("-"))
+
+
+def _module_names(count: int) -> List[Tuple[str, str, str]]:
+    """(provider slug, resource slug, resource type) for `count` modules, numbered once the vocabulary runs out."""
+    base = [(slug, resource, f"{namespace}/{_pascal(resource)[0].lower() + _pascal(resource)[1:]}s")
+            for slug, namespace, resources in PROVIDERS for resource in resources]
+    names = []
+    for index in range(count):
+        slug, resource, resource_type = base[index % len(base)]
+        generation = index // len(base)
+        names.append((slug, f"{resource}-{generation}" if generation else resource, resource_type))
+    return names
+
+
+def _parameters(rng: random.Random, count: int) -> List[Tuple[str, str, str]]:
+    parameters = [("name", "string", "Required. Name of the resource.")]
+    parameters += rng.sample(SHARED_PARAMETERS, k=min(len(SHARED_PARAMETERS), rng.randint(3, len(SHARED_PARAMETERS))))
+    for index in range(count):
+        word = rng.choice(WORDS)
+        parameters.append((f"{word}{_pascal(rng.choice(WORDS))}{index}", rng.choice(list(BICEP_TYPES)), f"Optional. {_sentence(rng)}"))
+    return parameters
+
+
+def _main_bicep(rng: random.Random, resource_type: str, parameters: List[Tuple[str, str, str]]) -> str:
+    lines = [
+        f"metadata name = '{resource_type}'",
+        f"metadata description = 'This module deploys a {resource_type}.'",
+        "",
+    ]
+    for name, kind, description in parameters:
+        lines += [f"@description('{description}')", f"param {name} {kind}{' = resourceGroup().location' if name == 'location' else ''}", ""]
+    lines += [
+        f"resource mainResource '{resource_type}@2023-{rng.randint(1, 12):02d}-01' = {{",
+        "  name: name",
+        "  location: location",
+        "  properties: {",
+    ]
+    lines += [f"    {name}: {name}" for name, _, _ in parameters[1:] if name not in ("location", "tags", "lock", "enableTelemetry")]
+    lines += [
+        "  }",
+        "}",
+        "",
+        "@description('The resource ID of the deployed resource.')",
+        "output resourceId string = mainResource.id",
+        "",
+    ]
+    return "\n".join(lines)
+
+
+def _readme(rng: random.Random, module_path: str, resource_type: str, parameters: List[Tuple[str, str, str]]) -> str:
+    title = " ".join(part.capitalize() for part in module_path.rsplit("/", 1)[-1].split("-"))
+    symbol = _pascal(module_path.rsplit("/", 1)[-1])
+    symbol = symbol[0].lower() + symbol[1:]
+    lines = [
+        f"# {title} `[{resource_type}]`",
+        "",
+        f"This module deploys a {title}.",
+        "",
+        "## Navigation",
+        "",
+        "- [Resource Types](#Resource-Types)",
+        "- [Usage examples](#Usage-examples)",
+        "- [Parameters](#Parameters)",
+        "",
+        "## Usage examples",
+        "",
+    ]
+    for number, (short, long) in enumerate(EXAMPLES[:rng.randint(1, len(EXAMPLES))], start=1):
+        used = parameters[:2 + number * 3]
+        params = [f"    {name}: {'<placeholder>' if kind == 'string' else 'true' if kind == 'bool' else '{}' if kind == 'object' else '[]'}" for name, kind, _ in used]
+        lines += [
+            f"### Example {number}: _{short}_",
+            "",
+            long,
+            "",
+            "<details>",
+            "",
+            "<summary>via Bicep module</summary>",
+            "",
+            "```bicep",
+            f"module {symbol} 'br/public:{module_path}:<version>' = {{",
+            f"  name: '{symbol}Deployment'",
+            "  params: {",
+            "    // Required parameters",
+            *params,
+            "  }",
+            "}",
+            "```",
+            "",
+            "</details>",
+            "<p>",
+            "",
+            "<details>",
+            "",
+            "<summary>via JSON parameters file</summary>",
+            "",
+            "```json",
+            json.dumps({"parameters": {name: {"value": "<placeholder>"} for name, _, _ in used}}, indent=2),
+            "```",
+            "",
+            "</details>",
+            "<p>",
+            "",
+        ]
+    lines += ["## Parameters", "", "| Parameter | Type | Description |", "| :-- | :-- | :-- |"]
+    lines += [f"| [`{name}`](#parameter-{name.lower()}) | {kind} | {description} |" for name, kind, description in parameters]
+    return "\n".join(lines) + "\n"
+
+
+def write_modules(root: Path, count: int, rng: random.Random) -> None:
+    for slug, resource, resource_type in _module_names(count):
+        module_path = f"avm/res/{slug}/{resource}"
+        module_dir = root / module_path
+        module_dir.mkdir(parents=True, exist_ok=True)
+        parameters = _parameters(rng, rng.randint(4, 30))
+        (module_dir / "main.bicep").write_text(_main_bicep(rng, resource_type, parameters), encoding="utf-8")
+        (module_dir / "README.md").write_text(_readme(rng, module_path, resource_type, parameters), encoding="utf-8")
+        version = {"$schema": "https://aka.ms/bicep-registry-module-version-file-schema#", "version": f"0.{rng.randint(1, 15)}", "pathFilters": ["./main.json"]}
+        (module_dir / "version.json").write_text(json.dumps(version, indent=2), encoding="utf-8")
+
+
+def _common_definitions() -> Dict[str, object]:
+    return {
+        "id": "https://schema.management.azure.com/schemas/common/definitions.json#",
+        "definitions": {
+            "expression": {"type": "string", "pattern": "^\\[([^\\[].*)?\\]$", "description": "Deployment template expression."},
+            "resourceLocations": {"type": "string", "enum": ["East US", "West US", "West Europe", "Sweden Central", "Japan East"]},
+            "Tags": {"type": "object", "description": "Resource tags.", "additionalProperties": {"type": "string"}},
+            "ManagedServiceIdentity": {
+                "type": "object",
+                "properties": {
+                    "type": {"oneOf": [{"type": "string", "enum": ["None", "SystemAssigned", "UserAssigned"]}, {"$ref": "#/definitions/expression"}]},
+                    "userAssignedIdentities": {"oneOf": [{"type": "object"}, {"$ref": "#/definitions/expression"}]},
+                },
+            },
+        },
+    }
+
+
+def _schema_file(rng: random.Random, namespace: str, api_version: str, types: List[str]) -> Dict[str, object]:
+    common = "https://schema.management.azure.com/schemas/common/definitions.json#/definitions/"
+    expression = {"$ref": common + "expression"}
+    definitions: Dict[str, object] = {}
+    resource_definitions: Dict[str, object] = {}
+    for type_name in types:
+        properties_name = f"{_pascal(type_name)}Properties"
+        nested = {}
+        for index in range(rng.randint(5, 25)):
+            field_name = f"{rng.choice(WORDS)}{_pascal(rng.choice(WORDS))}{index}"
+            if rng.random() < 0.3:
+                nested[field_name] = {"oneOf": [{"type": "string", "enum": rng.sample(WORDS, k=4)}, expression], "description": _sentence(rng)}
+            elif rng.random() < 0.5:
+                child = f"{_pascal(type_name)}{_pascal(field_name)}"
+                definitions[child] = {
+                    "type": "object",
+                    "properties": {f"{word}{i}": {"oneOf": [{"type": "integer"}, expression], "description": _sentence(rng)} for i, word in enumerate(rng.sample(WORDS, k=3))},
+                    "description": _sentence(rng),
+                }
+                nested[field_name] = {"oneOf": [{"$ref": f"#/definitions/{child}"}, expression]}
+            else:
+                nested[field_name] = {"oneOf": [{"type": "boolean"}, expression], "description": _sentence(rng)}
+        # A self-reference, like the recursive definitions in the real schemas
+        nested["children"] = {"oneOf": [{"type": "array", "items": {"$ref": f"#/definitions/{properties_name}"}}, expression]}
+        definitions[properties_name] = {"type": "object", "properties": nested, "description": _sentence(rng)}
+        resource_definitions[type_name] = {
+            "type": "object",
+            "properties": {
+                "name": {"type": "string", "description": "The name of the resource."},
+                "type": {"type": "string", "enum": [f"{namespace}/{type_name}"]},
+                "apiVersion": {"type": "string", "enum": [api_version]},
+                "location": {"oneOf": [{"$ref": common + "resourceLocations"}, expression]},
+                "tags": {"oneOf": [{"$ref": common + "Tags"}, expression]},
+                "identity": {"oneOf": [{"$ref": common + "ManagedServiceIdentity"}, expression]},
+                "properties": {"oneOf": [{"$ref": f"#/definitions/{properties_name}"}, expression], "description": "Resource properties."},
+            },
+            "required": ["name", "type", "apiVersion", "properties"],
+            "description": f"{namespace}/{type_name}",
+        }
+    return {
+        "id": f"https://schema.management.azure.com/schemas/{api_version}/{namespace}.json#",
+        "$schema": "http://json-schema.org/draft-04/schema#",
+        "title": namespace,
+        "resourceDefinitions": resource_definitions,
+        "definitions": definitions,
+    }
+
+
+def write_schemas(root: Path, count: int, rng: random.Random) -> None:
+    schemas = root / "schemas"
+    (schemas / "common").mkdir(parents=True, exist_ok=True)
+    (schemas / "common" / "definitions.json").write_text(json.dumps(_common_definitions(), indent=2), encoding="utf-8")
+    for index in range(count):
+        _, namespace, resources = PROVIDERS[index % len(PROVIDERS)]
+        api_version = f"{2015 + index // len(PROVIDERS) % 10}-{index // (len(PROVIDERS) * 10) % 12 + 1:02d}-01"
+        types = [_pascal(resource)[0].lower() + _pascal(resource)[1:] + "s" for resource in resources]
+        types += [f"{types[0]}/child{i}" for i in range(rng.randint(0, 3))]
+        directory = schemas / (api_version if index < len(PROVIDERS) * 120 else f"{api_version}-preview{index}")
+        directory.mkdir(parents=True, exist_ok=True)
+        (directory / f"{namespace}.json").write_text(json.dumps(_schema_file(rng, namespace, api_version, types), indent=2), encoding="utf-8")
+
+
+def _arm_template(rng: random.Random, resource_types: List[str]) -> Dict[str, object]:
+    parameters = {"location": {"type": "string", "defaultValue": "[resourceGroup().location]", "metadata": {"description": "Location for all resources."}}}
+    for index in range(rng.randint(2, 12)):
+        parameters[f"{rng.choice(WORDS)}{_pascal(rng.choice(WORDS))}{index}"] = {"type": rng.choice(["string", "int", "bool"]), "metadata": {"description": _sentence(rng)}}
+    return {
+        "$schema": "https://schema.management.azure.com/schemas/2019-04-01/deploymentTemplate.json#",
+        "contentVersion": "1.0.0.0",
+        "parameters": parameters,
+        "resources": [
+            {"type": resource_type, "apiVersion": "2023-01-01", "name": f"[parameters('name{index}')]", "location": "[parameters('location')]", "properties": {}}
+            for index, resource_type in enumerate(resource_types)
+        ],
+    }
+
+
+def write_quickstarts(root: Path, count: int, rng: random.Random) -> None:
+    all_types = [resource_type for _, _, resource_type in _module_names(sum(len(r) for _, _, r in PROVIDERS))]
+    for index in range(count):
+        category = QUICKSTART_CATEGORIES[index % len(QUICKSTART_CATEGORIES)]
+        folder = root / category / f"{rng.choice(WORDS)}-{rng.choice(WORDS)}-{index}"
+        folder.mkdir(parents=True, exist_ok=True)
+        resource_types = rng.sample(all_types, k=rng.randint(1, 4))
+        template = _arm_template(rng, resource_types)
+        (folder / "azuredeploy.json").write_text(json.dumps(template, indent=2), encoding="utf-8")
+        (folder / "metadata.json").write_text(json.dumps({"itemDisplayName": folder.name, "description": _sentence(rng)}), encoding="utf-8")
+        if index % 2 == 0:
+            parameters = [(name, spec["type"], spec["metadata"]["description"]) for name, spec in template["parameters"].items()]
+            (folder / "main.bicep").write_text(_main_bicep(rng, resource_types[0], [("name", "string", "Name of the resource.")] + parameters), encoding="utf-8")
+            if len(resource_types) > 1:
+                (folder / "modules").mkdir(exist_ok=True)
+                for module_index, resource_type in enumerate(resource_types[1:]):
+                    (folder / "modules" / f"module{module_index}.bicep").write_text(_main_bicep(rng, resource_type, [("name", "string", "Name of the resource.")]), encoding="utf-8")
+
+
+def write_fake_az(bin_dir: Path) -> Path:
+    """Write the fake `az` (and `az.cmd` for Windows) to `bin_dir`; put that first on PATH to use it."""
+    bin_dir.mkdir(parents=True, exist_ok=True)
+    script = bin_dir / "fake_az.py"
+    script.write_text(FAKE_AZ_SOURCE, encoding="utf-8")
+    launcher = bin_dir / "az"
+    launcher.write_text(f'#!/bin/sh\nexec "{sys.executable}" -S "{script}" "$@"\n', encoding="utf-8")
+    launcher.chmod(launcher.stat().st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+    (bin_dir / "az.cmd").write_text(f'@"{sys.executable}" -S "%~dp0fake_az.py" %*\n', encoding="utf-8")
+    return launcher
+
+
+def generate(root: Path, modules: int, schemas: int, quickstarts: int, seed: int = 0) -> Corpus:
+    """Write every part of the corpus under `root` and return where it is."""
+    rng = random.Random(seed)
+    corpus = Corpus(root)
+    write_modules(corpus.modules_root, modules, rng)
+    write_schemas(corpus.schemas_root, schemas, rng)
+    write_quickstarts(corpus.quickstarts_root, quickstarts, rng)
+    write_fake_az(corpus.bin_dir)
+    return corpus
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("root", type=Path)
+    parser.add_argument("--size", type=int, default=1000, help="default count for modules, schema files and quickstarts")
+    parser.add_argument("--modules", type=int)
+    parser.add_argument("--schemas", type=int)
+    parser.add_argument("--quickstarts", type=int)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    corpus = generate(
+        args.root,
+        args.modules if args.modules is not None else args.size,
+        args.schemas if args.schemas is not None else args.size,
+        args.quickstarts if args.quickstarts is not None else args.size,
+        args.seed,
+    )
+    print(
+        f"Wrote {len(corpus.main_bicep_files())} modules, {len(corpus.schema_files())} schema files and "
+        f"{len(corpus.quickstart_bicep_files())} quickstart Bicep files to {corpus.root} in {time.perf_counter() - started:.1f}s"
+    )
+    print(f"Fake Azure CLI: {corpus.bin_dir} (export PATH=\"{corpus.bin_dir}{os.pathsep}$PATH\")")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""Compare per-worker memory of the webapp with and without gunicorn --preload.
+
+Starts gunicorn twice with N workers (GUNICORN_PRELOAD=false, then true),
+waits for the workers to boot and serve a few requests, and reads
+/proc/<pid>/smaps_rollup for each worker:
+
+* RSS - resident pages, shared pages counted in full for every worker
+* PSS - shared pages split between the processes sharing them
+* USS - pages private to the worker (what a new worker really costs)
+
+    python benchmarks/worker_memory.py --workers 4
+
+Linux only. Runs in local development mode (no Azure variables needed).
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import signal
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+from pathlib import Path
+from typing import Dict, List
+
+WEBAPP_DIR = Path(__file__).resolve().parents[1] / "webapp"
+
+
+def read_memory(pid: int) -> Dict[str, int]:
+    """Return RSS/PSS/USS in KiB from smaps_rollup."""
+    fields = {}
+    with open(f"/proc/{pid}/smaps_rollup", encoding="utf-8") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) >= 2 and parts[0].endswith(":") and parts[1].isdigit():
+                fields[parts[0][:-1]] = int(parts[1])
+    return {
+        "rss": fields.get("Rss", 0),
+        "pss": fields.get("Pss", 0),
+        "uss": fields.get("Private_Clean", 0) + fields.get("Private_Dirty", 0),
+    }
+
+
+def child_pids(parent: int) -> List[int]:
+    children = []
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat", encoding="utf-8") as f:
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, ValueError, IndexError):
+            continue
+        if ppid == parent:
+            children.append(int(entry))
+    return sorted(children)
+
+
+def warm_up(url: str) -> None:
+    try:
+        urllib.request.urlopen(url, timeout=5).read()
+    except urllib.error.HTTPError:
+        pass  # rate limited or degraded, but the worker handled it
+
+
+def wait_for_workers(master: subprocess.Popen, port: int, workers: int, timeout: float = 120.0) -> List[int]:
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if master.poll() is not None:
+            raise RuntimeError("gunicorn exited during startup")
+        pids = child_pids(master.pid)
+        if len(pids) == workers:
+            try:
+                # A few requests per worker so lazily initialised state is included.
+                for _ in range(workers * 2):
+                    warm_up(f"http://127.0.0.1:{port}/health")
+                return pids
+            except urllib.error.URLError:
+                pass
+        time.sleep(0.5)
+    raise TimeoutError("workers did not come up in time")
+
+
+def measure(preload: bool, workers: int, port: int) -> List[Dict[str, int]]:
+    env = {
+        key: value for key, value in os.environ.items()
+        if not key.startswith(("AZURE_SEARCH", "AZURE_OPENAI"))
+    }
+    env.update({
+        "GUNICORN_PRELOAD": str(preload).lower(),
+        "GUNICORN_WORKERS": str(workers),
+        "GUNICORN_BIND": f"127.0.0.1:{port}",
+        "LOG_LEVEL": "WARNING",
+    })
+    master = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "--config", "gunicorn.conf.py", "app:app"],
+        cwd=WEBAPP_DIR,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        pids = wait_for_workers(master, port, workers)
+        time.sleep(1.0)
+        return [read_memory(pid) for pid in pids]
+    finally:
+        master.send_signal(signal.SIGTERM)
+        master.wait(timeout=30)
+
+
+def report(label: str, samples: List[Dict[str, int]]) -> None:
+    n = len(samples)
+    avg = {key: sum(s[key] for s in samples) / n / 1024 for key in ("rss", "pss", "uss")}
+    total_pss = sum(s["pss"] for s in samples) / 1024
+    print(
+        f"{label:<12} RSS/worker {avg['rss']:7.1f} MiB   PSS/worker {avg['pss']:7.1f} MiB   "
+        f"USS/worker {avg['uss']:7.1f} MiB   total PSS ({n} workers) {total_pss:7.1f} MiB"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--port", type=int, default=8790)
+    args = parser.parse_args()
+
+    report("no preload", measure(False, args.workers, args.port))
+    report("preload", measure(True, args.workers, args.port + 1))
+
+
+if __name__ == "__main__":
+    main()
@@ -4,6 +4,60 @@ import subprocess
 import json
 from concurrent.futures import ProcessPoolExecutor
 import time
+from pathlib import Path
+
+def compile_bicep(bicep_file_path):
+    """
+    Returns the ARM JSON that `az bicep build` produces for a Bicep file, or
+    None when the build prints nothing. Build failures raise.
+    """
+    result = subprocess.run(
+        ["az", "bicep", "build", "--file", bicep_file_path, "--stdout"],
+        capture_output=True, text=True, check=True, encoding='utf-8', shell=os.name == "nt"
+    )
+
+    if not result.stdout:
+        print(f"  -> WARNING: No output from bicep build for {bicep_file_path}. Stderr: {result.stderr.strip()}")
+        return None
+
+    return json.loads(result.stdout)
+
+def module_document(bicep_file_path, arm_json):
+    """
+    Builds the search document for a module from its path (relative to the
+    folder that holds 'res') and its compiled ARM JSON.
+    """
+    root = os.path.dirname(bicep_file_path)
+    relative_path = os.path.normpath(root).replace('\\', '/')
+    module_id = f"br/public:{relative_path}:<version>"
+
+    # Sanitize the module_id to be a valid document key for Azure AI Search
+    replacements = {".": "-", "/": "_", "#": "_"}
+    pattern = re.compile("|".join(map(re.escape, replacements.keys())))
+    module_id_sanitized = pattern.sub(lambda match: replacements[match.group(0)], module_id)
+
+    parameters = []
+    if "parameters" in arm_json:
+        for param_name, param_details in arm_json["parameters"].items():
+            parameters.append({
+                "name": param_name,
+                "type": param_details.get("type", "N/A"),
+                "description": param_details.get("metadata", {}).get("description", "No description.")
+            })
+
+    param_descriptions = "\n".join([f"- {p['name']} ({p['type']}): {p['description']}" for p in parameters])
+
+    chunk_text = (
+        f"Recommended AVM Module for '{os.path.basename(root)}'. "
+        f"This is the preferred, verified module for Bicep.\n"
+        f"Module ID: {module_id_sanitized}\nParameters:\n{param_descriptions}"
+    )
+
+    return {
+        "id": module_id_sanitized,
+        "source": bicep_file_path,
+        "content_to_embed": chunk_text
+    }
 
 def process_bicep_file(bicep_file_path):
     """
@@ -12,48 +66,10 @@ def process_bicep_file(bicep_file_path):
     """
     print(f"Processing: {bicep_file_path}")
     try:
-        result = subprocess.run(
-            ["az", "bicep", "build", "--file", bicep_file_path, "--stdout"],
-            capture_output=True, text=True, check=True, encoding='utf-8', shell=True
-        )
-
-        if not result.stdout:
-            print(f"  -> WARNING: No output from bicep build for {bicep_file_path}. Stderr: {result.stderr.strip()}")
+        arm_json = compile_bicep(bicep_file_path)
+        if arm_json is None:
             return None
-
-        arm_json = json.loads(result.stdout)
-
-        root = os.path.dirname(bicep_file_path)
-        relative_path = os.path.normpath(root).replace('\\', '/')
-        module_id = f"br/public:{relative_path}:<version>"
-
-        # Sanitize the module_id to be a valid document key for Azure AI Search
-        replacements = {".": "-", "/": "_", "#": "_"}
-        pattern = re.compile("|".join(map(re.escape, replacements.keys())))
-        module_id_sanitized = pattern.sub(lambda match: replacements[match.group(0)], module_id)
-
-        parameters = []
-        if "parameters" in arm_json:
-            for param_name, param_details in arm_json["parameters"].items():
-                parameters.append({
-                    "name": param_name,
-                    "type": param_details.get("type", "N/A"),
-                    "description": param_details.get("metadata", {}).get("description", "No description.")
-                })
-
-        param_descriptions = "\n".join([f"- {p['name']} ({p['type']}): {p['description']}" for p in parameters])
-
-        chunk_text = (
-            f"Recommended AVM Module for '{os.path.basename(root)}'. "
-            f"This is the preferred, verified module for Bicep.\n"
-            f"Module ID: {module_id_sanitized}\nParameters:\n{param_descriptions}"
-        )
-
-        return {
-            "id": module_id_sanitized,
-            "source": bicep_file_path,
-            "content_to_embed": chunk_text
-        }
+        return module_document(bicep_file_path, arm_json)
 
     except subprocess.CalledProcessError as e:
         print(f"  -> FAILED to process {bicep_file_path}. Stderr: {e.stderr.strip()}")
@@ -94,6 +110,12 @@ def main():
                     f.write(json.dumps(result) + '\n')
                     processed_count += 1
 
+    # --- Step 4: Store parameter descriptions shared across modules once ---
+    from factor_shared_parameters import factor_file
+    factored = factor_file(Path(output_filename))
+    shared_count = sum(1 for record in factored if record["id"].startswith("shared_param_"))
+    print(f"Factored {shared_count} shared parameter definitions out of the module documents.")
+
     end_time = time.time()
     print("\n--- Data extraction complete! ---")
     print(f"Successfully processed and wrote {processed_count} modules in {end_time - start_time:.2f} seconds.")
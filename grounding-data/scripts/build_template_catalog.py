@@ -0,0 +1,414 @@
+"""Pre-generate a template catalog from the grounding corpus with the Batch API.
+
+The most common requests map directly to one AVM module (or one classic
+resource type), so instead of paying interactive latency for them we generate
+one template per module offline and let the webapp serve it from ``/catalog``.
+The catalog is export-only: ``/generate`` does not look templates up in it.
+
+Steps (each can be re-run; finished work is skipped):
+
+    python build_template_catalog.py prepare            # write batch request JSONL
+    python build_template_catalog.py submit              # upload + create the Azure OpenAI batch
+    python build_template_catalog.py status              # poll; downloads the output when done
+    python build_template_catalog.py ingest              # parse, verify and append to the catalog
+
+``submit --local`` answers the requests with a deterministic local stand-in
+instead of Azure OpenAI, which is enough to exercise the whole pipeline
+offline.
+
+The requests use the same system message, context formatting and message
+layout as ``/generate`` (``webapp/prompting.py``), under the output contract
+the webapp uses (``AGENT_OUTPUT_CONTRACT``, compact by default), so catalog
+templates match what the interactive path would produce for the same context.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import re
+import sys
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+BASE_DIR = Path(__file__).resolve().parents[2]
+GROUNDING_DIR = BASE_DIR / "grounding-data"
+WORK_DIR = GROUNDING_DIR / "batch"
+REQUESTS_PATH = WORK_DIR / "catalog_requests.jsonl"
+OUTPUT_PATH = WORK_DIR / "catalog_output.jsonl"
+STATE_PATH = WORK_DIR / "catalog_batch_state.json"
+
+sys.path.insert(0, str(BASE_DIR / "webapp"))
+
+from grounding import (  # noqa: E402
+    AVM_DATA_FILE,
+    SCHEMA_DATA_GLOB,
+    GroundingIndex,
+    read_jsonl,
+    record_module_id,
+    record_resource_type,
+    split_module_id,
+)
+from agent_output import expand_compact_response, is_compact  # noqa: E402
+from bicep_parameters import derive_parameters_json  # noqa: E402
+from prompting import COMPACT_CONTRACT, MODE_QUERY_SUFFIXES, SYSTEM_MESSAGES, build_agent_messages, format_context  # noqa: E402
+from template_catalog import CATALOG_FILE, TemplateCatalog  # noqa: E402
+
+MAX_CONTEXT_CHARS = 24000  # ~6000 tokens, the same budget as MAX_CONTEXT_TOKENS in the webapp
+BATCH_ENDPOINT = "/chat/completions"
+
+PARAM_DOC_TITLE_RE = re.compile(r"^Recommended AVM Module for '([^']+)'(?: \(Parent Chain: ([^)]+)\))?")
+EXAMPLE_TITLE_RE = re.compile(r"^Recommended AVM Module for ([^:]+):")
+
+
+def _module_title(records: List[dict], path: str) -> str:
+    for record in records:
+        first_line = record["content_to_embed"].split("\n", 1)[0]
+        match = PARAM_DOC_TITLE_RE.match(first_line)
+        if match:
+            name, parents = match.groups()
+            return f"{name} ({parents})" if parents else name
+    for record in records:
+        match = EXAMPLE_TITLE_RE.match(record["content_to_embed"])
+        if match:
+            return match.group(1).strip()
+    return path.rsplit("/", 1)[-1]
+
+
+def _version_key(module_id: str) -> List[int]:
+    return [int(part) for part in re.findall(r"\d+", split_module_id(module_id)[1] or "")]
+
+
+def _latest_module_id(records: List[dict]) -> str:
+    """The highest version, preferring the parameter documents' full versions over the README's major.minor."""
+    module_ids = [record_module_id(record["content_to_embed"]) for record in records]
+    full = [module_id for module_id in module_ids if module_id.count(".") >= 2]
+    return max(full or module_ids, key=_version_key)
+
+
+def _bounded_documents(records: List[dict]) -> List[Dict[str, str]]:
+    documents, used = [], 0
+    for record in sorted(records, key=lambda r: r["id"]):
+        content = record["content_to_embed"]
+        if documents and used + len(content) > MAX_CONTEXT_CHARS:
+            break
+        documents.append({"id": record["id"], "content": content})
+        used += len(content)
+    return documents
+
+
+def collect_targets(grounding_dir: Path) -> List[dict]:
+    """Group the corpus into one generation target per AVM module and per classic resource type."""
+    targets: List[dict] = []
+
+    modules: Dict[str, List[dict]] = defaultdict(list)
+    avm_path = grounding_dir / AVM_DATA_FILE
+    if avm_path.exists():
+        for record in read_jsonl(str(avm_path)):
+            module_id = record_module_id(record.get("content_to_embed", ""))
+            if module_id:
+                modules[split_module_id(module_id)[0]].append(record)
+
+    for path, records in sorted(modules.items()):
+        title = _module_title(records, path)
+        targets.append({
+            "key": f"avm:{path}",
+            "mode": "avm",
+            "title": title,
+            "target": _latest_module_id(records),
+            "prompt": f"Generate a Bicep template for the {title} module ({path})",
+            "documents": _bounded_documents(records),
+        })
+
+    resource_types: Dict[str, List[dict]] = defaultdict(list)
+    for schema_path in sorted(grounding_dir.glob(SCHEMA_DATA_GLOB)):
+        for record in read_jsonl(str(schema_path)):
+            resource_type = record_resource_type(record.get("content_to_embed", ""))
+            if resource_type:
+                resource_types[resource_type].append(record)
+
+    for resource_type, records in sorted(resource_types.items()):
+        targets.append({
+            "key": f"classic:{resource_type.lower()}",
+            "mode": "classic",
+            "title": resource_type,
+            "target": resource_type,
+            "prompt": f"Generate a Bicep template for a {resource_type} resource",
+            "documents": _bounded_documents(records),
+        })
+
+    return targets
+
+
+def build_batch_request(target: dict, deployment: str, shared_definitions: Dict[str, str], contract: str) -> dict:
+    """One Batch API line, assembled exactly like an interactive /generate request."""
+    user_query = target["prompt"] + MODE_QUERY_SUFFIXES[target["mode"]]
+    messages = build_agent_messages(user_query, format_context(target["documents"], shared_definitions), contract)
+    return {
+        "custom_id": target["key"],
+        "method": "POST",
+        "url": BATCH_ENDPOINT,
+        "body": {
+            "model": deployment,
+            "messages": messages,
+            "response_format": {"type": "json_object"},
+            "temperature": 0.1,
+        },
+    }
+
+
+def prepare(args: argparse.Namespace) -> None:
+    catalog = TemplateCatalog.load(str(args.catalog))
+    shared_definitions = GroundingIndex.load(str(args.grounding_dir)).shared_definitions
+    targets = collect_targets(args.grounding_dir)
+    if args.limit:
+        targets = targets[: args.limit]
+
+    WORK_DIR.mkdir(parents=True, exist_ok=True)
+    metadata = {}
+    written = skipped = 0
+    with REQUESTS_PATH.open("w", encoding="utf-8") as f:
+        for target in targets:
+            if target["key"] in catalog and not args.force:
+                skipped += 1
+                continue
+            f.write(json.dumps(build_batch_request(target, args.deployment, shared_definitions, args.contract)) + "\n")
+            metadata[target["key"]] = {k: target[k] for k in ("mode", "title", "target", "prompt")}
+            written += 1
+
+    STATE_PATH.write_text(json.dumps({"contract": args.contract, "targets": metadata}, indent=2), encoding="utf-8")
+    print(f"Wrote {written} batch requests to {REQUESTS_PATH} ({skipped} already in the catalog)")
+
+
+def _load_state() -> dict:
+    if not STATE_PATH.exists():
+        raise FileNotFoundError(f"No batch state at {STATE_PATH}; run 'prepare' first")
+    return json.loads(STATE_PATH.read_text(encoding="utf-8"))
+
+
+def _save_state(state: dict) -> None:
+    STATE_PATH.write_text(json.dumps(state, indent=2), encoding="utf-8")
+
+
+def _openai_client():
+    from openai import AzureOpenAI
+    from azure.identity import DefaultAzureCredential, get_bearer_token_provider
+
+    token_provider = get_bearer_token_provider(
+        DefaultAzureCredential(),
+        "https://cognitiveservices.azure.com/.default"
+    )
+    return AzureOpenAI(
+        azure_endpoint=os.environ["AZURE_OPENAI_ENDPOINT"],
+        api_version=os.getenv("AZURE_OPENAI_API_VERSION", "2024-10-21"),
+        azure_ad_token_provider=token_provider
+    )
+
+
+def local_batch_response(request: dict, target: dict, contract: str) -> dict:
+    """Deterministic stand-in for the model: a minimal template for the target's module or resource type.
+
+    The module ID or resource type comes from the target rather than the prompt, whose
+    context can mention other modules first; the response follows `contract`.
+    """
+    target_id = target.get("target", "")
+
+    if target.get("mode") == "avm" and target_id:
+        symbol = re.sub(r"\W", "", split_module_id(target_id)[0].rsplit("/", 1)[-1].title()) or "module"
+        symbol = symbol[0].lower() + symbol[1:]
+        bicep = f"param name string\n\nmodule {symbol} '{target_id}' = {{\n  name: '{symbol}Deployment'\n  params: {{\n    name: name\n  }}\n}}\n"
+        plan = {"resources": [{"resourceType": target_id, "name": symbol}], "rationale": "Local stand-in response."}
+    elif target_id:
+        bicep = f"param name string\nparam location string = resourceGroup().location\n\nresource res '{target_id}@2023-01-01' = {{\n  name: name\n  location: location\n}}\n"
+        plan = {"resources": [{"resourceType": target_id, "name": "res"}], "rationale": "Local stand-in response."}
+    else:
+        bicep, plan = "", {"resources": [], "rationale": "No module or resource type for this target."}
+
+    if contract == COMPACT_CONTRACT:
+        content = json.dumps({"bicep": bicep, "rationale": plan["rationale"], "warnings": []})
+    else:
+        content = json.dumps({
+            "plan": plan,
+            "files": [{"path": "main.bicep", "language": "bicep", "content": bicep}],
+            "warnings": [],
+        })
+    return {
+        "id": f"batch_req_{request['custom_id']}",
+        "custom_id": request["custom_id"],
+        "response": {
+            "status_code": 200,
+            "request_id": request["custom_id"],
+            "body": {
+                "object": "chat.completion",
+                "model": request["body"]["model"],
+                "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}],
+                "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+            },
+        },
+        "error": None,
+    }
+
+
+def submit(args: argparse.Namespace) -> None:
+    state = _load_state()
+
+    if args.local:
+        targets = state.get("targets", {})
+        contract = state.get("contract", COMPACT_CONTRACT)
+        with REQUESTS_PATH.open(encoding="utf-8") as requests, OUTPUT_PATH.open("w", encoding="utf-8") as output:
+            count = 0
+            for line in requests:
+                request = json.loads(line)
+                response = local_batch_response(request, targets.get(request["custom_id"], {}), contract)
+                output.write(json.dumps(response) + "\n")
+                count += 1
+        state.update({"batch_id": "local", "status": "completed"})
+        _save_state(state)
+        print(f"Local stand-in answered {count} requests into {OUTPUT_PATH}")
+        return
+
+    client = _openai_client()
+    with REQUESTS_PATH.open("rb") as f:
+        input_file = client.files.create(file=f, purpose="batch")
+    batch = client.batches.create(
+        input_file_id=input_file.id,
+        endpoint=BATCH_ENDPOINT,
+        completion_window="24h"
+    )
+    state.update({"batch_id": batch.id, "input_file_id": input_file.id, "status": batch.status})
+    _save_state(state)
+    print(f"Submitted batch {batch.id} ({batch.status})")
+
+
+def status(args: argparse.Namespace) -> None:
+    state = _load_state()
+    if state.get("batch_id") in (None, "local"):
+        print(f"Batch status: {state.get('status', 'not submitted')}")
+        return
+
+    client = _openai_client()
+    while True:
+        batch = client.batches.retrieve(state["batch_id"])
+        counts = batch.request_counts
+        print(f"Batch {batch.id}: {batch.status} ({counts.completed}/{counts.total} done, {counts.failed} failed)")
+        if batch.status in ("completed", "failed", "expired", "cancelled") or not args.wait:
+            break
+        time.sleep(args.poll_interval)
+
+    state["status"] = batch.status
+    # Expired and cancelled batches still return the requests that finished, so ingest what there is.
+    if batch.output_file_id:
+        OUTPUT_PATH.write_bytes(client.files.content(batch.output_file_id).read())
+        state["output_file_id"] = batch.output_file_id
+        print(f"Downloaded results to {OUTPUT_PATH}")
+    _save_state(state)
+
+
+def _catalog_entry(result: dict, metadata: dict, index: Optional[GroundingIndex]) -> Optional[dict]:
+    response = result.get("response") or {}
+    if result.get("error") or response.get("status_code") != 200:
+        return None
+
+    content = response["body"]["choices"][0]["message"]["content"]
+    try:
+        payload = json.loads(content)
+    except json.JSONDecodeError:
+        return None
+    if is_compact(payload):
+        payload = expand_compact_response(payload)
+
+    bicep = next(
+        (f.get("content", "") for f in payload.get("files", []) if isinstance(f, dict) and f.get("path") == "main.bicep"),
+        "",
+    )
+    if not bicep:
+        return None
+
+    grounding_warnings = index.verify(bicep) if index else []
+    return {
+        "key": result["custom_id"],
+        **metadata,
+        "plan": payload.get("plan", {}),
+        "bicep": bicep,
+        "parameters": derive_parameters_json(bicep),
+        "warnings": list(payload.get("warnings", [])) + grounding_warnings,
+        "status": "needs_review" if grounding_warnings else "verified",
+        "generated_at": time.time(),
+    }
+
+
+def _iter_results(path: Path) -> Iterable[dict]:
+    with path.open(encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                continue  # truncated last line of a partial download
+
+
+def ingest(args: argparse.Namespace) -> None:
+    state = _load_state()
+    metadata = state.get("targets", {})
+    catalog = TemplateCatalog.load(str(args.catalog))
+    index = GroundingIndex.load(str(args.grounding_dir))
+
+    def entries():
+        nonlocal failed, skipped
+        for result in _iter_results(args.output):
+            key = result.get("custom_id")
+            if key in catalog and not args.force:
+                skipped += 1
+                continue
+            entry = _catalog_entry(result, metadata.get(key, {}), index)
+            if entry is None:
+                failed += 1
+                continue
+            yield entry
+
+    failed = skipped = 0
+    written = catalog.append(entries())
+    print(f"Ingested {written} templates into {args.catalog} ({skipped} already present, {failed} failed)")
+
+
+def main() -> None:
+    default_contract = os.getenv("AGENT_OUTPUT_CONTRACT", COMPACT_CONTRACT)
+    if default_contract not in SYSTEM_MESSAGES:
+        default_contract = COMPACT_CONTRACT
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--grounding-dir", type=Path, default=GROUNDING_DIR)
+    parser.add_argument("--catalog", type=Path, default=GROUNDING_DIR / CATALOG_FILE)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    prepare_parser = subparsers.add_parser("prepare", help="build the batch request JSONL")
+    prepare_parser.add_argument("--deployment", default=os.getenv("AZURE_OPENAI_BATCH_DEPLOYMENT_NAME", os.getenv("AZURE_OPENAI_DEPLOYMENT_NAME", "")))
+    prepare_parser.add_argument("--contract", choices=sorted(SYSTEM_MESSAGES), default=default_contract, help="agent output contract, as in the webapp")
+    prepare_parser.add_argument("--limit", type=int, default=0, help="only the first N targets")
+    prepare_parser.add_argument("--force", action="store_true", help="include targets already in the catalog")
+    prepare_parser.set_defaults(func=prepare)
+
+    submit_parser = subparsers.add_parser("submit", help="submit the batch")
+    submit_parser.add_argument("--local", action="store_true", help="answer with the local stand-in instead of Azure OpenAI")
+    submit_parser.set_defaults(func=submit)
+
+    status_parser = subparsers.add_parser("status", help="check the batch and download its output")
+    status_parser.add_argument("--wait", action="store_true")
+    status_parser.add_argument("--poll-interval", type=float, default=60.0)
+    status_parser.set_defaults(func=status)
+
+    ingest_parser = subparsers.add_parser("ingest", help="append batch results to the catalog")
+    ingest_parser.add_argument("--output", type=Path, default=OUTPUT_PATH)
+    ingest_parser.add_argument("--force", action="store_true", help="re-ingest keys already in the catalog")
+    ingest_parser.set_defaults(func=ingest)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,64 @@
 import os
 import json
 import re
+import time
+
+from schema_resolver import SchemaResolver, render_properties
+
+# Nesting levels emitted per resource (1 = top-level properties only).
+MAX_PROPERTY_DEPTH = 3
+
+def schema_documents(file_path, resolver, source_path=None):
+    """
+    Returns one document per resource definition in a schema file. The id and
+    source are built from `source_path` (default: `file_path`), so a schema
+    read from another directory gets the same documents as when this script
+    runs in the schemas repo.
+    """
+    source_path = source_path or file_path
+    relative_path = os.path.normpath(source_path).replace('\\', '/')
+    with open(file_path, 'r', encoding='utf-8') as schema_file:
+        schema = json.load(schema_file)
+
+    resource_definitions = schema.get('resourceDefinitions')
+    if not resource_definitions:
+        return []
+
+    documents = []
+    # Loop through each definition in the file
+    for resource_name, resource_def in resource_definitions.items():
+        properties = resource_def.get('properties', {})
+        if not properties:
+            continue
+
+        resource_type = resource_def.get('description', resource_name)
+        unique_id = f"{relative_path}_{resource_type}"
+
+        replacements = {
+            ".": "-",
+            " ": "-",
+            "/": "_",
+            "#": "_",
+            ":": "_"
+        }
+        pattern = re.compile("|".join(map(re.escape, replacements.keys())))
+        unique_id_sanitized = pattern.sub(lambda match: replacements[match.group(0)], unique_id).strip('-')
+
+        property_tree = resolver.resolve_properties(resource_def, file_path)
+        prop_descriptions = "\n".join(render_properties(property_tree, MAX_PROPERTY_DEPTH))
+
+        chunk_text = (
+            f"ARM Schema for Resource Type: '{resource_type}'\n"
+            f"Schema ID: {unique_id_sanitized}\n"
+            f"Valid Top-Level Properties:\n{prop_descriptions}"
+        )
+
+        documents.append({
+            "id": unique_id_sanitized,
+            "source": source_path,
+            "content_to_embed": chunk_text
+        })
+    return documents
 
 def parse_arm_schemas_to_jsonl():
     """
@@ -12,6 +70,10 @@ def parse_arm_schemas_to_jsonl():
     schemas_root = 'schemas'
     output_filename = 'extracted_schema_data.jsonl'
     processed_count = 0
+    start_time = time.time()
+
+    # One resolver for the whole run: common definitions are resolved once and reused by every file.
+    resolver = SchemaResolver(schemas_root)
 
     with open(output_filename, 'w', encoding='utf-8') as f:
         print(f"Starting schema extraction, output will be in '{output_filename}'")
@@ -23,61 +85,22 @@ def parse_arm_schemas_to_jsonl():
                     continue
 
                 file_path = os.path.join(root, file)
-                relative_path = os.path.normpath(file_path).replace('\\', '/')
 
                 try:
-                    with open(file_path, 'r', encoding='utf-8') as schema_file:
-                        schema = json.load(schema_file)
-
-                    resource_definitions = schema.get('resourceDefinitions')
-                    if not resource_definitions:
-                        continue
-
-                    # Loop through each definition in the file
-                    for resource_name, resource_def in resource_definitions.items():
-                        properties = resource_def.get('properties', {})
-                        if not properties:
-                            continue
-
-                        resource_type = resource_def.get('description', resource_name)
-                        unique_id = f"{relative_path}_{resource_type}"
-
-                        replacements = {
-                            ".": "-",
-                            " ": "-",
-                            "/": "_",
-                            "#": "_",
-                            ":": "_"
-                        }
-                        pattern = re.compile("|".join(map(re.escape, replacements.keys())))
-                        unique_id_sanitized = pattern.sub(lambda match: replacements[match.group(0)], unique_id).strip('-')
-
-                        prop_descriptions = "\n".join(
-                            f"- {prop_name} (type: {prop.get('type', 'N/A')}) - {prop.get('description', '')}"
-                            for prop_name, prop in properties.items()
-                        )
-
-                        chunk_text = (
-                            f"ARM Schema for Resource Type: '{resource_type}'\n"
-                            f"Schema ID: {unique_id_sanitized}\n"
-                            f"Valid Top-Level Properties:\n{prop_descriptions}"
-                        )
-
-                        line_object = {
-                            "id": unique_id_sanitized,
-                            "source": file_path,
-                            "content_to_embed": chunk_text
-                        }
-
+                    for line_object in schema_documents(file_path, resolver):
                         f.write(json.dumps(line_object) + '\n')
                         processed_count += 1
                         if processed_count % 500 == 0:
                             print(f"Processed {processed_count} definitions...")
 
-
                 except Exception as e:
                     print(f"  -> Failed to process {file_path}: {e}")
 
+    stats = resolver.stats
+    print(
+        f"Resolved {stats.refs_resolved} definitions from {stats.files_loaded} files in {time.time() - start_time:.2f}s "
+        f"({stats.cache_hits} cache hits, {stats.cycles} recursive references cut, {stats.missing_refs} unresolved)"
+    )
     return processed_count
 
 if __name__ == "__main__":
@@ -0,0 +1,603 @@
+"""Build every grounding and training dataset from the source checkouts in one run.
+
+The extraction scripts each walk their own checkout and are started by hand
+from different directories. This runner does the same work as a DAG of
+stages. Each source tree is walked once, by its discover stage:
+
+    discover:modules        bicep-registry-modules-main/avm: res/**/main.bicep and **/README.md
+    discover:schemas        azure-resource-manager-schemas/schemas/**/*.json
+    discover:quickstarts    azure-quickstart-templates: template files and every *.bicep
+    compile:modules         az bicep build per module            (avm_data_extract_fast.compile_bicep)
+    extract:avm-modules     module documents                     (avm_data_extract_fast.module_document)
+    factor:avm-modules      shared parameter definitions         (factor_shared_parameters.factor_records)
+    extract:schemas         schema documents                     (classic_data_extract.schema_documents)
+    extract:avm-examples    README example documents             (extract_avm_examples.readme_examples)
+    extract:avm-training-examples  README training examples      (training-data extract_avm_examples)
+    decompile:quickstarts   az bicep decompile per azuredeploy.json (run_extraction)
+    transform:quickstarts   plan, parameters and warnings        (run_extraction.build_example)
+    extract:classic-templates  raw Bicep training templates      (arm-parse.py)
+    dedup:*                 drop repeated templates
+    write:*                 each dataset, replaced atomically (never appended to)
+
+Stages whose inputs are ready run concurrently, and their per-file work goes
+to one shared process pool. Every stage's output is cached under
+``--cache-dir``. The cache key is a hash of the stage's code, its settings
+and the keys of the stages it depends on. Discover stages always run, and
+their key is the listing they produce (path, size and mtime of every file),
+so a stage only runs again when its files or its code change. The az stages
+also cache each file's result by its content. After a one-module change only
+that module goes through ``az`` again.
+
+    python data_pipeline.py                        # every dataset
+    python data_pipeline.py grounding              # grounding datasets only (or: training)
+    python data_pipeline.py write:quickstarts      # one dataset and the stages it needs
+    python data_pipeline.py --list                 # the stages and their dependencies
+    python data_pipeline.py --force --workers 8    # ignore the cache
+
+Checkouts are expected at grounding-data/bicep-registry-modules-main,
+grounding-data/azure-resource-manager-schemas and
+training-data/azure-quickstart-templates; the ``--*-root`` options point
+elsewhere. The run ends with a table of per-stage timings, also saved as
+``last_run.json`` in the cache directory.
+"""
+from __future__ import annotations
+
+import argparse
+import hashlib
+import importlib.util
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+SCRIPTS_DIR = Path(__file__).resolve().parent
+BASE_DIR = SCRIPTS_DIR.parents[1]
+GROUNDING_DIR = BASE_DIR / "grounding-data"
+TRAINING_DIR = BASE_DIR / "training-data"
+TRAINING_SCRIPTS_DIR = TRAINING_DIR / "scripts"
+CACHE_DIR = GROUNDING_DIR / ".pipeline-cache"
+
+# Appended, so the grounding scripts win where both folders have a script of the same name
+sys.path.append(str(TRAINING_SCRIPTS_DIR))
+
+import avm_data_extract_fast  # noqa: E402
+import classic_data_extract  # noqa: E402
+import extract_avm_examples  # noqa: E402
+import run_extraction  # noqa: E402
+from factor_shared_parameters import MIN_DESCRIPTION_CHARS, MIN_MODULES, factor_records  # noqa: E402
+from schema_resolver import SchemaResolver  # noqa: E402
+
+
+def _load_script(path: Path, name: str):
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+training_examples = _load_script(TRAINING_SCRIPTS_DIR / "extract_avm_examples.py", "training_extract_avm_examples")
+arm_parse = _load_script(TRAINING_SCRIPTS_DIR / "arm-parse.py", "arm_parse")
+
+GROUNDING_TARGETS = ("write:avm-modules", "write:schemas", "write:avm-examples")
+TRAINING_TARGETS = ("write:avm-training-examples", "write:quickstarts", "write:classic-templates")
+TARGET_GROUPS = {"grounding": GROUNDING_TARGETS, "training": TRAINING_TARGETS, "all": GROUNDING_TARGETS + TRAINING_TARGETS}
+
+
+def _digest(*parts: str) -> str:
+    digest = hashlib.sha1()
+    for part in parts:
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def _file_digest(path: Path) -> str:
+    return hashlib.sha1(path.read_bytes()).hexdigest()
+
+
+# --- Work done in the shared process pool. Module-level, so it pickles under any start method. ---
+
+def _compile_module(path: str) -> Optional[dict]:
+    try:
+        arm_json = avm_data_extract_fast.compile_bicep(path)
+    except Exception as e:
+        print(f"  -> FAILED to build {path}: {getattr(e, 'stderr', '') or e}")
+        return None
+    return {"parameters": arm_json.get("parameters", {})} if arm_json is not None else None
+
+
+def _decompile_template(path: str) -> Optional[str]:
+    return run_extraction._decompile_bicep(Path(path))
+
+
+def _schema_documents(schemas_root: str, relative_paths: List[str]) -> List[dict]:
+    # One resolver per chunk of neighbouring files, so shared definitions are resolved once per chunk
+    resolver = SchemaResolver(os.path.join(schemas_root, "schemas"))
+    documents = []
+    for relative_path in relative_paths:
+        file_path = os.path.join(schemas_root, relative_path)
+        try:
+            documents.extend(classic_data_extract.schema_documents(file_path, resolver, os.path.normpath(relative_path)))
+        except Exception as e:
+            print(f"  -> Failed to process {file_path}: {e}")
+    return documents
+
+
+def _readme_examples(modules_root: str, relative_path: str) -> List[dict]:
+    return extract_avm_examples.readme_examples(Path(modules_root) / relative_path, Path(modules_root))
+
+
+def _training_readme_examples(path: str) -> Tuple[List[str], List[str]]:
+    examples = training_examples._collect_examples(Path(path))
+    return (
+        [training_examples._record_to_jsonl(example, include_resource_type=True) for example in examples],
+        [training_examples._record_to_jsonl(example, include_resource_type=False) for example in examples],
+    )
+
+
+def _quickstart_example(path: str, bicep_code: Optional[str]) -> Optional[dict]:
+    if bicep_code is None:
+        bicep_code = run_extraction._read_bicep(Path(path))
+    if not bicep_code or not bicep_code.strip():
+        return None
+    return run_extraction.build_example(Path(path), bicep_code)
+
+
+def _classic_template(path: str) -> Optional[dict]:
+    return arm_parse.process_bicep_file(path)
+
+
+# --- The DAG runner ---
+
+@dataclass
+class Stage:
+    name: str
+    run: Callable[["StageRun"], object]
+    deps: Tuple[str, ...] = ()
+    code: Tuple[Path, ...] = ()     # the scripts doing the work; part of every cache key
+    params: Tuple[str, ...] = ()    # settings that change the output, such as a source root
+    outputs: Tuple[Path, ...] = ()  # files written; the stage runs again if they are changed or removed
+    always: bool = False            # a discover stage: runs every time, and its output is its key
+
+
+@dataclass
+class StageResult:
+    name: str
+    status: str  # ran, cached, failed or skipped
+    seconds: float = 0.0
+    items: Optional[int] = None
+    cached_items: int = 0
+    error: str = ""
+    key: str = ""
+
+
+class StageRun:
+    """What a stage's `run` gets: its inputs, the shared pool and the per-file cache."""
+
+    def __init__(self, pipeline: "Pipeline", stage: Stage, code_key: str) -> None:
+        self.pipeline = pipeline
+        self.stage = stage
+        self.code_key = code_key
+        self.items: Optional[int] = None
+        self.cached_items = 0
+        self.item_cache: Optional[Dict[str, object]] = None
+
+    def input(self, name: str):
+        return self.pipeline.output(name)
+
+    def map(self, function: Callable, *iterables) -> list:
+        """`function` over the items on the shared process pool, in order."""
+        columns = [list(iterable) for iterable in iterables]
+        count = len(columns[0]) if columns else 0
+        self.items = (self.items or 0) + count
+        if not count:
+            return []
+        chunksize = max(1, count // (self.pipeline.workers * 8))
+        return list(self.pipeline.pool.map(function, *columns, chunksize=chunksize))
+
+    def map_files(self, function: Callable, root: Path, relative_paths: List[str]) -> Dict[str, object]:
+        """`function(absolute path)` per file, reusing earlier results for files whose content is unchanged.
+
+        Results are keyed by relative path. None (a failed file) is not cached.
+        """
+        previous = self.pipeline.load_items(self.stage.name)
+        keys = {path: _digest(self.code_key, path, _file_digest(root / path)) for path in relative_paths}
+        results: Dict[str, object] = {}
+        todo = []
+        for path in relative_paths:
+            if keys[path] in previous:
+                results[path] = previous[keys[path]]
+            else:
+                todo.append(path)
+        self.cached_items = len(relative_paths) - len(todo)
+        for path, result in zip(todo, self.map(function, [str(root / path) for path in todo])):
+            results[path] = result
+        self.items = len(relative_paths)
+        self.item_cache = {keys[path]: result for path, result in results.items() if result is not None}
+        return results
+
+
+class Pipeline:
+    """Runs the stages needed for some targets, in dependency order and concurrently where possible."""
+
+    def __init__(self, stages: List[Stage], cache_dir: Path, workers: int, force: bool = False) -> None:
+        self.stages = {stage.name: stage for stage in stages}
+        self.cache_dir = cache_dir
+        self.workers = workers
+        self.force = force
+        self.pool: Optional[ProcessPoolExecutor] = None
+        self._outputs: Dict[str, object] = {}
+        self._lock = threading.Lock()
+        self._self_key = _file_digest(Path(__file__).resolve())
+
+    def plan(self, targets: List[str]) -> List[Stage]:
+        """The stages the targets need, dependencies first. Raises ValueError for an unknown name."""
+        order: List[Stage] = []
+        seen = set()
+
+        def visit(name: str) -> None:
+            if name in seen:
+                return
+            if name not in self.stages:
+                raise ValueError(f"Unknown stage or target: {name}")
+            seen.add(name)
+            for dep in self.stages[name].deps:
+                visit(dep)
+            order.append(self.stages[name])
+
+        for target in targets:
+            for name in TARGET_GROUPS.get(target, (target,)):
+                visit(name)
+        return order
+
+    def _path(self, name: str, suffix: str) -> Path:
+        return self.cache_dir / f"{name.replace(':', '-')}{suffix}"
+
+    def _read_json(self, path: Path, default):
+        try:
+            return json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return default
+
+    def _write_json(self, path: Path, value) -> None:
+        # Write to a temp file first so an interrupted run never leaves a truncated cache entry
+        tmp_path = path.with_suffix(".tmp")
+        tmp_path.write_text(json.dumps(value), encoding="utf-8")
+        tmp_path.replace(path)
+
+    def output(self, name: str):
+        """A finished stage's output, read from the cache if the stage was skipped as cached."""
+        with self._lock:
+            if name not in self._outputs:
+                self._outputs[name] = self._read_json(self._path(name, ".output.json"), None)
+            return self._outputs[name]
+
+    def load_items(self, name: str) -> Dict[str, object]:
+        return {} if self.force else self._read_json(self._path(name, ".items.json"), {})
+
+    @staticmethod
+    def _output_stats(stage: Stage) -> Dict[str, List[int]]:
+        stats = {}
+        for path in stage.outputs:
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            stats[str(path)] = [stat.st_size, stat.st_mtime_ns]
+        return stats
+
+    def _execute(self, stage: Stage, dep_keys: List[str]) -> StageResult:
+        started = time.perf_counter()
+        code_key = _digest(*(_file_digest(path) for path in stage.code))
+        entry = self._read_json(self._path(stage.name, ".json"), {})
+        key = _digest(stage.name, self._self_key, code_key, *stage.params, *dep_keys)
+        if (
+            not stage.always and not self.force and entry.get("key") == key
+            and entry.get("outputs", {}) == self._output_stats(stage)
+        ):
+            return StageResult(stage.name, "cached", time.perf_counter() - started, entry.get("items"), entry.get("items"), key=key)
+
+        run = StageRun(self, stage, code_key)
+        output = stage.run(run)
+        if stage.always:
+            key = _digest(stage.name, self._self_key, code_key, *stage.params, json.dumps(output, sort_keys=True))
+        with self._lock:
+            self._outputs[stage.name] = output
+        self._write_json(self._path(stage.name, ".output.json"), output)
+        if run.item_cache is not None:
+            self._write_json(self._path(stage.name, ".items.json"), run.item_cache)
+        self._write_json(self._path(stage.name, ".json"), {"key": key, "items": run.items, "outputs": self._output_stats(stage)})
+        return StageResult(stage.name, "ran", time.perf_counter() - started, run.items, run.cached_items, key=key)
+
+    def run(self, targets: List[str]) -> List[StageResult]:
+        order = self.plan(targets)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        results: Dict[str, StageResult] = {}
+        pending = list(order)
+        running: Dict[Future, Stage] = {}
+        with ProcessPoolExecutor(max_workers=self.workers) as pool, ThreadPoolExecutor(max_workers=len(order) or 1) as threads:
+            self.pool = pool
+            # Start the workers before any stage thread, so they are never forked from a busy process
+            for future in [pool.submit(int) for _ in range(self.workers)]:
+                future.result()
+            while pending or running:
+                for stage in list(pending):
+                    deps = [results.get(dep) for dep in stage.deps]
+                    if any(dep is not None and dep.status in ("failed", "skipped") for dep in deps):
+                        failed = next(dep.name for dep in deps if dep is not None and dep.status in ("failed", "skipped"))
+                        results[stage.name] = StageResult(stage.name, "skipped", error=f"{failed} did not finish")
+                        pending.remove(stage)
+                    elif all(dep is not None for dep in deps):
+                        print(f"[{stage.name}] started")
+                        running[threads.submit(self._execute, stage, [dep.key for dep in deps])] = stage
+                        pending.remove(stage)
+                if not running:
+                    continue
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    stage = running.pop(future)
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        result = StageResult(stage.name, "failed", error=f"{type(e).__name__}: {e}")
+                    results[stage.name] = result
+                    print(f"[{stage.name}] {result.status} in {result.seconds:.2f}s" + (f": {result.error}" if result.error else ""))
+        self.pool = None
+        ordered = [results[stage.name] for stage in order]
+        self._write_json(self.cache_dir / "last_run.json", [result.__dict__ for result in ordered])
+        return ordered
+
+
+# --- The stages ---
+
+@dataclass
+class Sources:
+    modules_root: Path = GROUNDING_DIR / "bicep-registry-modules-main"
+    schemas_root: Path = GROUNDING_DIR / "azure-resource-manager-schemas"
+    quickstarts_root: Path = TRAINING_DIR / "azure-quickstart-templates"
+    grounding_dir: Path = GROUNDING_DIR
+    training_dir: Path = TRAINING_DIR
+
+
+def _walk(root: Path, keep: Callable[[str, str], Optional[str]]) -> Dict[str, List[list]]:
+    """One os.walk of `root`: [relative path, size, mtime_ns] for each file, grouped by `keep(relative dir, name)`."""
+    if not root.is_dir():
+        raise FileNotFoundError(f"Source checkout not found: {root}")
+    groups: Dict[str, List[list]] = {}
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        relative_dir = Path(dirpath).relative_to(root).as_posix()
+        for filename in sorted(filenames):
+            group = keep(relative_dir, filename)
+            if group is None:
+                continue
+            stat = os.stat(os.path.join(dirpath, filename))
+            relative_path = filename if relative_dir == "." else f"{relative_dir}/{filename}"
+            groups.setdefault(group, []).append([relative_path, stat.st_size, stat.st_mtime_ns])
+    return groups
+
+
+def _paths(listing: Dict[str, List[list]], group: str) -> List[str]:
+    return [entry[0] for entry in listing.get(group, [])]
+
+
+def _write_jsonl(path: Path, lines: List[str]) -> int:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(".tmp")
+    with tmp_path.open("w", encoding="utf-8") as f:
+        for line in lines:
+            f.write(line + "\n")
+    tmp_path.replace(path)
+    return len(lines)
+
+
+def _chunks(items: List[str], count: int) -> List[List[str]]:
+    size = max(1, -(-len(items) // max(1, count)))
+    return [items[start:start + size] for start in range(0, len(items), size)]
+
+
+def _unique_templates(examples: List[dict], content: Callable[[dict], str]) -> List[dict]:
+    """Drop examples whose template text repeats an earlier one (quickstarts copy templates between folders)."""
+    seen = set()
+    unique = []
+    for example in examples:
+        digest = hashlib.sha1(" ".join(content(example).split()).encode("utf-8")).hexdigest()
+        if digest not in seen:
+            seen.add(digest)
+            unique.append(example)
+    return unique
+
+
+def build_stages(sources: Sources, workers: int) -> List[Stage]:
+    grounding_scripts = SCRIPTS_DIR
+    factor_code = (grounding_scripts / "factor_shared_parameters.py", BASE_DIR / "webapp" / "shared_parameters.py")
+    avm_output = sources.grounding_dir / "extracted_avm_data.jsonl"
+    schema_output = sources.grounding_dir / "extracted_schema_data.jsonl"
+    examples_output = sources.grounding_dir / "extracted_avm_examples.jsonl"
+    training_examples_output = sources.training_dir / "avm_examples.jsonl"
+    quickstarts_output = sources.training_dir / "train_agent_v2.jsonl"
+    classic_output = sources.training_dir / "classic-training-data-template.jsonl"
+
+    def discover_modules(run: StageRun):
+        def keep(relative_dir: str, name: str) -> Optional[str]:
+            if name == "main.bicep" and relative_dir.startswith("res"):
+                return "main_bicep"
+            return "readmes" if name == "README.md" else None
+        listing = _walk(sources.modules_root / "avm", keep)
+        run.items = sum(len(files) for files in listing.values())
+        return listing
+
+    def discover_schemas(run: StageRun):
+        listing = _walk(sources.schemas_root / "schemas", lambda relative_dir, name: "schemas" if name.endswith(".json") else None)
+        run.items = len(listing.get("schemas", []))
+        return {"schemas": [[f"schemas/{path}", size, mtime] for path, size, mtime in listing.get("schemas", [])]}
+
+    def discover_quickstarts(run: StageRun):
+        def keep(relative_dir: str, name: str) -> Optional[str]:
+            if name in run_extraction.SUPPORTED_FILES:
+                return "templates"
+            return "bicep" if name.endswith(".bicep") else None
+        listing = _walk(sources.quickstarts_root, keep)
+        # arm-parse.py reads every .bicep file, main.bicep and azuredeploy.bicep included
+        listing["bicep"] = sorted(listing.get("bicep", []) + [entry for entry in listing.get("templates", []) if entry[0].endswith(".bicep")])
+        run.items = sum(len(files) for files in listing.values())
+        return listing
+
+    def compile_modules(run: StageRun):
+        return run.map_files(_compile_module, sources.modules_root / "avm", _paths(run.input("discover:modules"), "main_bicep"))
+
+    def extract_avm_modules(run: StageRun):
+        compiled = run.input("compile:modules")
+        run.items = len(compiled)
+        # Relative to avm/ with the OS separator, as when avm_data_extract_fast.py runs there
+        return [
+            avm_data_extract_fast.module_document(os.path.join(*path.split("/")), arm_json)
+            for path, arm_json in sorted(compiled.items()) if arm_json is not None
+        ]
+
+    def factor_avm_modules(run: StageRun):
+        records = run.input("extract:avm-modules")
+        run.items = len(records)
+        return factor_records(records, MIN_MODULES, MIN_DESCRIPTION_CHARS)
+
+    def extract_schemas(run: StageRun):
+        paths = _paths(run.input("discover:schemas"), "schemas")
+        # Enough chunks to keep every worker busy, few enough that each resolver's memo pays off
+        chunks = _chunks(paths, workers * 4)
+        documents = [document for chunk in run.map(_schema_documents, [str(sources.schemas_root)] * len(chunks), chunks) for document in chunk]
+        run.items = len(paths)
+        return documents
+
+    def extract_examples(run: StageRun):
+        readmes = [f"avm/{path}" for path in _paths(run.input("discover:modules"), "readmes")]
+        return [example for examples in run.map(_readme_examples, [str(sources.modules_root)] * len(readmes), readmes) for example in examples]
+
+    def extract_training_examples(run: StageRun):
+        avm_root = sources.modules_root / "avm"
+        readmes = [str(avm_root / path) for path in _paths(run.input("discover:modules"), "readmes")]
+        results = run.map(_training_readme_examples, readmes)
+        # avm_examples.jsonl lists every example with the resource type, then every one without
+        return [line for with_type, _ in results for line in with_type] + [line for _, without in results for line in without]
+
+    def decompile_quickstarts(run: StageRun):
+        templates = [path for path in _paths(run.input("discover:quickstarts"), "templates") if path.endswith("azuredeploy.json")]
+        return run.map_files(_decompile_template, sources.quickstarts_root, templates)
+
+    def transform_quickstarts(run: StageRun):
+        templates = _paths(run.input("discover:quickstarts"), "templates")
+        decompiled = run.input("decompile:quickstarts")
+        codes = [decompiled.get(path) if path.endswith(".json") else None for path in templates]
+        examples = run.map(_quickstart_example, [str(sources.quickstarts_root / path) for path in templates], codes)
+        return [{"source": path, "example": example} for path, example in zip(templates, examples) if example is not None]
+
+    def dedup_quickstarts(run: StageRun):
+        examples = run.input("transform:quickstarts")
+        run.items = len(examples)
+        # A folder with main.bicep also has the azuredeploy.json built from it; keep the hand-written Bicep
+        bicep_folders = {os.path.dirname(item["source"]) for item in examples if item["source"].endswith(".bicep")}
+        examples = [item for item in examples if item["source"].endswith(".bicep") or os.path.dirname(item["source"]) not in bicep_folders]
+        examples = _unique_templates(examples, lambda item: item["example"]["files"][0]["content"])
+        return [json.dumps(run_extraction.training_record(item["example"])) for item in examples]
+
+    def extract_classic_templates(run: StageRun):
+        paths = [str(sources.quickstarts_root / path) for path in _paths(run.input("discover:quickstarts"), "bicep")]
+        return [pair for pair in run.map(_classic_template, paths) if pair is not None]
+
+    def dedup_classic_templates(run: StageRun):
+        pairs = run.input("extract:classic-templates")
+        run.items = len(pairs)
+        return [json.dumps(pair) for pair in _unique_templates(pairs, lambda pair: pair["completion"])]
+
+    def writer(source: str, path: Path, encode: Callable[[object], str] = json.dumps) -> Callable[[StageRun], object]:
+        def write(run: StageRun):
+            records = run.input(source)
+            run.items = _write_jsonl(path, [encode(record) for record in records])
+            print(f"  -> Wrote {run.items} records to {path}")
+            return {"records": run.items}
+        return write
+
+    def unchanged(line: str) -> str:
+        return line
+
+    modules, schemas, quickstarts = (str(sources.modules_root), str(sources.schemas_root), str(sources.quickstarts_root))
+    return [
+        Stage("discover:modules", discover_modules, params=(modules,), always=True),
+        Stage("discover:schemas", discover_schemas, params=(schemas,), always=True),
+        Stage("discover:quickstarts", discover_quickstarts, params=(quickstarts,), always=True),
+        Stage("compile:modules", compile_modules, ("discover:modules",), (grounding_scripts / "avm_data_extract_fast.py",)),
+        Stage("extract:avm-modules", extract_avm_modules, ("compile:modules",), (grounding_scripts / "avm_data_extract_fast.py",)),
+        Stage("factor:avm-modules", factor_avm_modules, ("extract:avm-modules",), factor_code),
+        Stage("write:avm-modules", writer("factor:avm-modules", avm_output), ("factor:avm-modules",), params=(str(avm_output),), outputs=(avm_output,)),
+        Stage("extract:schemas", extract_schemas, ("discover:schemas",), (grounding_scripts / "classic_data_extract.py", grounding_scripts / "schema_resolver.py"), (schemas,)),
+        Stage("write:schemas", writer("extract:schemas", schema_output), ("extract:schemas",), params=(str(schema_output),), outputs=(schema_output,)),
+        Stage("extract:avm-examples", extract_examples, ("discover:modules",), (grounding_scripts / "extract_avm_examples.py",), (modules,)),
+        Stage("write:avm-examples", writer("extract:avm-examples", examples_output), ("extract:avm-examples",), params=(str(examples_output),), outputs=(examples_output,)),
+        Stage("extract:avm-training-examples", extract_training_examples, ("discover:modules",), (TRAINING_SCRIPTS_DIR / "extract_avm_examples.py",), (modules,)),
+        Stage("write:avm-training-examples", writer("extract:avm-training-examples", training_examples_output, unchanged), ("extract:avm-training-examples",), params=(str(training_examples_output),), outputs=(training_examples_output,)),
+        Stage("decompile:quickstarts", decompile_quickstarts, ("discover:quickstarts",), (TRAINING_SCRIPTS_DIR / "run_extraction.py",), (quickstarts,)),
+        Stage("transform:quickstarts", transform_quickstarts, ("discover:quickstarts", "decompile:quickstarts"), (TRAINING_SCRIPTS_DIR / "run_extraction.py", TRAINING_SCRIPTS_DIR / "data_transformer.py"), (quickstarts,)),
+        Stage("dedup:quickstarts", dedup_quickstarts, ("transform:quickstarts",), (TRAINING_SCRIPTS_DIR / "run_extraction.py",)),
+        Stage("write:quickstarts", writer("dedup:quickstarts", quickstarts_output, unchanged), ("dedup:quickstarts",), params=(str(quickstarts_output),), outputs=(quickstarts_output,)),
+        Stage("extract:classic-templates", extract_classic_templates, ("discover:quickstarts",), (TRAINING_SCRIPTS_DIR / "arm-parse.py",), (quickstarts,)),
+        Stage("dedup:classic-templates", dedup_classic_templates, ("extract:classic-templates",)),
+        Stage("write:classic-templates", writer("dedup:classic-templates", classic_output, unchanged), ("dedup:classic-templates",), params=(str(classic_output),), outputs=(classic_output,)),
+    ]
+
+
+def print_report(results: List[StageResult]) -> None:
+    print(f"\n{'Stage':<32} {'Status':<8} {'Seconds':>9} {'Items':>8} {'Cached':>8}")
+    for result in results:
+        items = "" if result.items is None else str(result.items)
+        cached = str(result.cached_items) if result.cached_items else ""
+        print(f"{result.name:<32} {result.status:<8} {result.seconds:>9.2f} {items:>8} {cached:>8}")
+        if result.error:
+            print(f"    {result.error}")
+    print(f"{'Total':<32} {'':<8} {sum(result.seconds for result in results):>9.2f}  (stage time; stages overlap)")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("targets", nargs="*", default=["all"], help="stage names, or grounding / training / all (default)")
+    parser.add_argument("--list", action="store_true", help="print the stages and their dependencies")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="size of the shared process pool")
+    parser.add_argument("--force", action="store_true", help="run every stage, ignoring the cache")
+    parser.add_argument("--cache-dir", type=Path, default=CACHE_DIR)
+    parser.add_argument("--modules-root", type=Path, default=Sources.modules_root, help="bicep-registry-modules checkout")
+    parser.add_argument("--schemas-root", type=Path, default=Sources.schemas_root, help="azure-resource-manager-schemas checkout")
+    parser.add_argument("--quickstarts-root", type=Path, default=Sources.quickstarts_root, help="azure-quickstart-templates checkout")
+    parser.add_argument("--grounding-dir", type=Path, default=GROUNDING_DIR, help="where the grounding datasets are written")
+    parser.add_argument("--training-dir", type=Path, default=TRAINING_DIR, help="where the training datasets are written")
+    args = parser.parse_args()
+
+    sources = Sources(
+        args.modules_root.resolve(), args.schemas_root.resolve(), args.quickstarts_root.resolve(),
+        args.grounding_dir.resolve(), args.training_dir.resolve(),
+    )
+    workers = max(1, args.workers)
+    pipeline = Pipeline(build_stages(sources, workers), args.cache_dir, workers, args.force)
+    try:
+        order = pipeline.plan(args.targets)
+    except ValueError as e:
+        parser.error(str(e))
+
+    if args.list:
+        for stage in order:
+            print(f"{stage.name:<32} <- {', '.join(stage.deps) or '(source checkout)'}")
+        return
+
+    started = time.perf_counter()
+    results = pipeline.run(args.targets)
+    print_report(results)
+    print(f"Finished in {time.perf_counter() - started:.2f}s with {workers} workers")
+    if any(result.status in ("failed", "skipped") for result in results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
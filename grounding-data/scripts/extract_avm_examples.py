@@ -3,7 +3,7 @@ import re
 from pathlib import Path
 from typing import List, Optional
 
-BASE_DIR = Path(__file__).resolve().parents[3]
+BASE_DIR = Path(__file__).resolve().parents[2]
 MODULES_ROOT = BASE_DIR / "grounding-data" / "bicep-registry-modules-main"
 OUTPUT_PATH = BASE_DIR / "grounding-data" / "extracted_avm_examples.jsonl"
 
@@ -82,75 +82,78 @@ def extract_bicep_snippet(section: str) -> Optional[str]:
     return match.group(1).strip()
 
 
-def main() -> None:
-    if not MODULES_ROOT.exists():
-        raise FileNotFoundError(f"Modules root not found: {MODULES_ROOT}")
+def readme_examples(readme_path: Path, modules_root: Path = MODULES_ROOT) -> List[dict]:
+    """The example documents of one module README; empty without a title, version or examples."""
+    relative_readme = readme_path.relative_to(modules_root)
 
-    results = []
+    with readme_path.open(encoding="utf-8") as f:
+        readme_text = f.read()
 
-    readme_paths = sorted(MODULES_ROOT.glob("avm/**/README.md"))
+    title_match = TITLE_RE.search(readme_text)
+    if not title_match:
+        return []
 
-    for readme_path in readme_paths:
-        relative_readme = readme_path.relative_to(MODULES_ROOT)
+    title = title_match.group(1).strip()
+    resource_type = title_match.group(2).strip()
 
-        with readme_path.open(encoding="utf-8") as f:
-            readme_text = f.read()
+    version = load_version(readme_path.parent)
+    if not version:
+        return []
 
-        title_match = TITLE_RE.search(readme_text)
-        if not title_match:
-            continue
+    module_rel_path = str(relative_readme.parent).replace("\\", "/")
+    module_id = derive_module_id(version, module_rel_path)
 
-        title = title_match.group(1).strip()
-        resource_type = title_match.group(2).strip()
+    resource_path_display = resource_type
 
-        version = load_version(readme_path.parent)
-        if not version:
-            continue
+    results = []
+    example_matches = parse_examples(readme_text)
+    for idx, match in enumerate(example_matches):
+        example_number = match.group(1)
+        example_short = match.group(2).strip()
 
-        module_rel_path = str(relative_readme.parent).replace("\\", "/")
-        module_id = derive_module_id(version, module_rel_path)
+        example_start = match.end()
+        example_end = example_matches[idx + 1].start() if idx + 1 < len(example_matches) else len(readme_text)
+        example_section = readme_text[example_start:example_end]
 
-        resource_path_display = resource_type
+        example_long = extract_long_description(example_section)
+        example_description = example_short if not example_long else f"{example_short} - {example_long}"
 
-        example_matches = parse_examples(readme_text)
-        if not example_matches:
+        bicep_snippet = extract_bicep_snippet(example_section)
+        if not bicep_snippet:
             continue
 
-        for idx, match in enumerate(example_matches):
-            example_number = match.group(1)
-            example_short = match.group(2).strip()
+        bicep_snippet = normalise_module_id(bicep_snippet, module_id)
+
+        params_block = clean_params_block(extract_params_block(bicep_snippet))
 
-            example_start = match.end()
-            example_end = example_matches[idx + 1].start() if idx + 1 < len(example_matches) else len(readme_text)
-            example_section = readme_text[example_start:example_end]
+        content_to_embed = "\n".join([
+            f"Recommended AVM Module for {title}: {example_description}",
+            f"Resource Type Path: {resource_path_display}",
+            f"Module ID: {module_id}",
+            "Parameters:",
+            params_block,
+        ])
 
-            example_long = extract_long_description(example_section)
-            example_description = example_short if not example_long else f"{example_short} - {example_long}"
+        results.append({
+            "id": f"{module_rel_path.replace('/', '_')}_example_{example_number}",
+            "source": relative_readme.as_posix(),
+            "content_to_embed": content_to_embed,
+            "bicep": bicep_snippet,
+        })
 
-            bicep_snippet = extract_bicep_snippet(example_section)
-            if not bicep_snippet:
-                continue
+    return results
 
-            bicep_snippet = normalise_module_id(bicep_snippet, module_id)
 
-            params_block = clean_params_block(extract_params_block(bicep_snippet))
+def main() -> None:
+    if not MODULES_ROOT.exists():
+        raise FileNotFoundError(f"Modules root not found: {MODULES_ROOT}")
 
-            content_to_embed = "\n".join([
-                f"Recommended AVM Module for {title}: {example_description}",
-                f"Resource Type Path: {resource_path_display}",
-                f"Module ID: {module_id}",
-                "Parameters:",
-                params_block,
-            ])
+    results = []
 
-            result = {
-                "id": f"{module_rel_path.replace('/', '_')}_example_{example_number}",
-                "source": relative_readme.as_posix(),
-                "content_to_embed": content_to_embed,
-                "bicep": bicep_snippet,
-            }
+    readme_paths = sorted(MODULES_ROOT.glob("avm/**/README.md"))
 
-            results.append(result)
+    for readme_path in readme_paths:
+        results.extend(readme_examples(readme_path, MODULES_ROOT))
 
     with OUTPUT_PATH.open("w", encoding="utf-8") as outfile:
         for entry in results:
@@ -0,0 +1,154 @@
+"""Factor parameter descriptions shared across AVM modules into shared documents.
+
+Rewrites ``extracted_avm_data.jsonl`` so that every parameter description
+repeated verbatim in at least ``--min-modules`` module documents is stored
+once as a ``shared_param_*`` document and referenced from the modules as
+``[shared:<ref>]``. Re-running is safe: existing references are expanded
+first and the shared documents rebuilt from scratch.
+
+    python factor_shared_parameters.py                 # rewrite the corpus in place and report savings
+    python factor_shared_parameters.py --dry-run       # only report
+
+The report covers the corpus size and the context of simulated requests
+(three retrieved documents, as in /generate), in tokens.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import random
+import sys
+from collections import defaultdict
+from pathlib import Path
+from typing import Callable, Dict, List
+
+BASE_DIR = Path(__file__).resolve().parents[2]
+AVM_DATA_PATH = BASE_DIR / "grounding-data" / "extracted_avm_data.jsonl"
+
+sys.path.insert(0, str(BASE_DIR / "webapp"))
+
+from grounding import record_module_id, split_module_id  # noqa: E402
+from prompting import format_context  # noqa: E402
+from shared_parameters import (  # noqa: E402
+    factor_content,
+    find_shared_definitions,
+    inline_references,
+    is_shared_record,
+    load_shared_definitions,
+    shared_record,
+)
+
+MIN_MODULES = 3
+MIN_DESCRIPTION_CHARS = 40
+SIMULATED_REQUESTS = 2000
+DOCUMENTS_PER_REQUEST = 3
+
+
+def _token_counter() -> Callable[[str], int]:
+    try:
+        import tiktoken
+
+        encoding = tiktoken.encoding_for_model("gpt-4o-mini")
+        return lambda text: len(encoding.encode(text))
+    except Exception:
+        return lambda text: len(text) // 4
+
+
+def factor_records(records: List[dict], min_modules: int, min_chars: int) -> List[dict]:
+    """Return the module records with shared descriptions replaced, followed by the shared records."""
+    existing = load_shared_definitions(records)
+    modules = [
+        {**record, "content_to_embed": inline_references(record["content_to_embed"], existing)}
+        for record in records if not is_shared_record(record)
+    ]
+
+    definitions = find_shared_definitions(modules, min_modules, min_chars)
+    refs_by_line = {(d.name, d.type, d.description): d.ref for d in definitions}
+    factored = [
+        record if record.get("bicep") else {**record, "content_to_embed": factor_content(record["content_to_embed"], refs_by_line)}
+        for record in modules
+    ]
+    return factored + [shared_record(definition) for definition in definitions]
+
+
+def factor_file(path: Path, min_modules: int = MIN_MODULES, min_chars: int = MIN_DESCRIPTION_CHARS) -> List[dict]:
+    """Factor the corpus file in place (via a temp file) and return the new records."""
+    with path.open(encoding="utf-8") as f:
+        records = [json.loads(line) for line in f if line.strip()]
+
+    factored = factor_records(records, min_modules, min_chars)
+    tmp_path = path.with_suffix(".tmp")
+    with tmp_path.open("w", encoding="utf-8") as f:
+        for record in factored:
+            f.write(json.dumps(record) + "\n")
+    tmp_path.replace(path)
+    return factored
+
+
+def _as_documents(records: List[dict]) -> List[Dict[str, str]]:
+    return [{"id": r["id"], "content": r["content_to_embed"]} for r in records]
+
+
+def report(original: List[dict], factored: List[dict], count_tokens: Callable[[str], int]) -> None:
+    original_modules = [r for r in original if not is_shared_record(r)]
+    existing = load_shared_definitions(original)
+    original_modules = [
+        {**r, "content_to_embed": inline_references(r["content_to_embed"], existing)} for r in original_modules
+    ]
+    definitions = load_shared_definitions(factored)
+    shared_count = sum(1 for r in factored if is_shared_record(r))
+
+    before = sum(count_tokens(r["content_to_embed"]) for r in original_modules)
+    after = sum(count_tokens(r["content_to_embed"]) for r in factored)
+    print(f"Shared definitions: {shared_count}")
+    print(f"Corpus: {before:,} -> {after:,} tokens ({(before - after) / before:.1%} smaller)")
+
+    # Simulated requests: the same documents before and after factoring, with references
+    # resolved the way /generate resolves them. Random documents rarely share much, while a
+    # search for one resource typically returns sibling modules of the same provider.
+    factored_by_id = {r["id"]: r for r in factored}
+    families: Dict[str, List[dict]] = defaultdict(list)
+    for record in original_modules:
+        module_id = record_module_id(record["content_to_embed"])
+        if module_id and not record.get("bicep"):
+            families["/".join(split_module_id(module_id)[0].split("/")[:3])].append(record)
+    related = [family for family in families.values() if len(family) >= DOCUMENTS_PER_REQUEST]
+
+    rng = random.Random(964)
+    for label, draw in (
+        ("Random documents", lambda: rng.sample(original_modules, DOCUMENTS_PER_REQUEST)),
+        ("Related parameter documents", lambda: rng.sample(rng.choice(related), DOCUMENTS_PER_REQUEST)),
+    ):
+        before_total = after_total = 0
+        for _ in range(SIMULATED_REQUESTS):
+            sample = draw()
+            before_total += count_tokens(format_context(_as_documents(sample)))
+            after_total += count_tokens(format_context(_as_documents([factored_by_id[r["id"]] for r in sample]), definitions))
+        print(
+            f"{label}: {before_total / SIMULATED_REQUESTS:,.0f} -> {after_total / SIMULATED_REQUESTS:,.0f} "
+            f"context tokens per request ({(before_total - after_total) / before_total:.1%} smaller)"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--input", type=Path, default=AVM_DATA_PATH)
+    parser.add_argument("--min-modules", type=int, default=MIN_MODULES)
+    parser.add_argument("--min-chars", type=int, default=MIN_DESCRIPTION_CHARS)
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+
+    with args.input.open(encoding="utf-8") as f:
+        original = [json.loads(line) for line in f if line.strip()]
+
+    if args.dry_run:
+        factored = factor_records(original, args.min_modules, args.min_chars)
+    else:
+        factored = factor_file(args.input, args.min_modules, args.min_chars)
+        print(f"Rewrote {args.input}")
+
+    report(original, factored, _token_counter())
+
+
+if __name__ == "__main__":
+    main()
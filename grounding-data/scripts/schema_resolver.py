@@ -0,0 +1,226 @@
+"""Resolve `$ref`s in ARM schemas into compact nested property trees.
+
+ARM resource definitions keep most of their structure behind `$ref` pointers
+into the file's own `definitions` and into shared files such as
+`common/definitions.json`. `SchemaResolver` follows local, relative and
+`https://schema.management.azure.com/schemas/...` references against a local
+checkout of the schemas repo.
+
+Every referenced definition is resolved once and memoized by its absolute
+location (file + JSON pointer), and every file is parsed once, so extracting
+all resource definitions costs roughly the total schema size rather than the
+size of every expanded tree. Recursive definitions are cut at the first
+repeat, and trees are rendered to a bounded depth.
+
+Where a cut falls depends on the path that reached a definition: B reached
+from A is cut at A. A memo entry therefore keeps the set of definitions its
+tree reached. It is only stored when none of them was on the path that built
+it, and only reused when none of them is on the current path, so every
+definition renders the same whichever resource (or worker) reaches it first.
+"""
+from __future__ import annotations
+
+import json
+import os
+from dataclasses import dataclass, field
+from typing import Dict, FrozenSet, Iterable, List, Optional, Set, Tuple
+
+SCHEMA_BASE_URLS = (
+    "https://schema.management.azure.com/schemas/",
+    "http://schema.management.azure.com/schemas/",
+)
+# Almost every ARM property is `oneOf: [<real schema>, <ARM template expression>]`; the expression branch adds nothing.
+EXPRESSION_DEFINITION = "common/definitions.json#/definitions/expression"
+
+MAX_ENUM_VALUES = 12
+MAX_CHILDREN = 40
+
+
+@dataclass
+class SchemaNode:
+    """Compact view of one schema: type, description, enum values and child properties."""
+
+    type: str = "N/A"
+    description: str = ""
+    enum: List[str] = field(default_factory=list)
+    properties: Dict[str, "SchemaNode"] = field(default_factory=dict)
+    items: Optional["SchemaNode"] = None
+    recursive: Optional[str] = None  # name of the definition this node repeats
+
+
+@dataclass
+class ResolverStats:
+    files_loaded: int = 0
+    refs_resolved: int = 0
+    cache_hits: int = 0
+    cycles: int = 0
+    missing_refs: int = 0
+
+
+class SchemaResolver:
+    """Follows `$ref`s across a schemas checkout with a memo shared by every resource definition."""
+
+    def __init__(self, schemas_root: str) -> None:
+        self.schemas_root = os.path.normpath(schemas_root)
+        self.stats = ResolverStats()
+        self._files: Dict[str, Optional[dict]] = {}
+        # Resolved definition -> (node, every definition its tree reached, itself included)
+        self._memo: Dict[Tuple[str, str], Tuple[SchemaNode, FrozenSet[Tuple[str, str]]]] = {}
+        self._in_progress: List[Tuple[str, str]] = []
+        self._reached: List[Set[Tuple[str, str]]] = []  # per in-progress ref
+
+    def resolve_properties(self, definition: dict, file_path: str) -> Dict[str, SchemaNode]:
+        """Resolve the top-level `properties` of a resource definition."""
+        file_path = os.path.normpath(file_path)
+        return {name: self.resolve(schema, file_path) for name, schema in definition.get("properties", {}).items()}
+
+    def resolve(self, schema: dict, file_path: str) -> SchemaNode:
+        if not isinstance(schema, dict):
+            return SchemaNode()
+
+        if "$ref" in schema:
+            node = self._resolve_ref(schema["$ref"], file_path)
+            if schema.get("description") and not node.description:
+                node = SchemaNode(**{**node.__dict__, "description": schema["description"]})
+            return node
+
+        for combinator in ("oneOf", "anyOf", "allOf"):
+            if combinator in schema:
+                return self._resolve_combined(schema, combinator, file_path)
+
+        node = SchemaNode(
+            type=str(schema.get("type", "N/A")),
+            description=schema.get("description", ""),
+            enum=[str(value) for value in schema.get("enum", [])],
+        )
+        for name, child in schema.get("properties", {}).items():
+            node.properties[name] = self.resolve(child, file_path)
+        if isinstance(schema.get("items"), dict):
+            node.items = self.resolve(schema["items"], file_path)
+        if node.type == "N/A" and node.properties:
+            node.type = "object"
+        return node
+
+    def _resolve_combined(self, schema: dict, combinator: str, file_path: str) -> SchemaNode:
+        variants = [v for v in schema[combinator] if not _is_expression_ref(v)]
+        resolved = [self.resolve(v, file_path) for v in variants]
+        if len(resolved) == 1 and combinator != "allOf":
+            node = resolved[0]
+        else:
+            node = SchemaNode(type=str(schema.get("type", "N/A")))
+            for variant in resolved:
+                if node.type == "N/A":
+                    node.type = variant.type
+                node.description = node.description or variant.description
+                node.enum.extend(value for value in variant.enum if value not in node.enum)
+                for name, child in variant.properties.items():
+                    node.properties.setdefault(name, child)
+                node.items = node.items or variant.items
+        if schema.get("description"):
+            node = SchemaNode(**{**node.__dict__, "description": schema["description"]})
+        return node
+
+    def _on_path(self, keys: Iterable[Tuple[str, str]]) -> bool:
+        return any(key in keys for key in self._in_progress)
+
+    def _note_reached(self, keys: Iterable[Tuple[str, str]]) -> None:
+        if self._reached:
+            self._reached[-1].update(keys)
+
+    def _resolve_ref(self, ref: str, file_path: str) -> SchemaNode:
+        key = self._absolute_ref(ref, file_path)
+        if key in self._in_progress:
+            self.stats.cycles += 1
+            self._note_reached((key,))
+            return SchemaNode(type="object", recursive=key[1].rsplit("/", 1)[-1])
+        cached = self._memo.get(key)
+        if cached is not None and not self._on_path(cached[1]):
+            self.stats.cache_hits += 1
+            self._note_reached(cached[1])
+            return cached[0]
+
+        target = self._lookup(*key)
+        if target is None:
+            self.stats.missing_refs += 1
+            return SchemaNode(description=f"Unresolved reference {ref}")
+
+        self._in_progress.append(key)
+        self._reached.append({key})
+        try:
+            node = self.resolve(target, key[0])
+        finally:
+            self._in_progress.pop()
+            reached = self._reached.pop()
+        self._note_reached(reached)
+        self.stats.refs_resolved += 1
+        # A tree cut at a definition further up the path would render differently reached on its own
+        if not self._on_path(reached):
+            self._memo[key] = (node, frozenset(reached))
+        return node
+
+    def _absolute_ref(self, ref: str, file_path: str) -> Tuple[str, str]:
+        location, _, pointer = ref.partition("#")
+        if not location:
+            return file_path, pointer
+        for base_url in SCHEMA_BASE_URLS:
+            if location.startswith(base_url):
+                return os.path.normpath(os.path.join(self.schemas_root, location[len(base_url):])), pointer
+        return os.path.normpath(os.path.join(os.path.dirname(file_path), location)), pointer
+
+    def _lookup(self, file_path: str, pointer: str) -> Optional[dict]:
+        document = self._load(file_path)
+        for part in filter(None, pointer.split("/")):
+            if not isinstance(document, dict):
+                return None
+            document = document.get(part.replace("~1", "/").replace("~0", "~"))
+        return document if isinstance(document, dict) else None
+
+    def _load(self, file_path: str) -> Optional[dict]:
+        if file_path not in self._files:
+            try:
+                with open(file_path, "r", encoding="utf-8-sig") as f:
+                    self._files[file_path] = json.load(f)
+                self.stats.files_loaded += 1
+            except (OSError, json.JSONDecodeError):
+                self._files[file_path] = None
+        return self._files[file_path]
+
+
+def _is_expression_ref(schema) -> bool:
+    return isinstance(schema, dict) and str(schema.get("$ref", "")).endswith(EXPRESSION_DEFINITION)
+
+
+def _type_label(node: SchemaNode) -> str:
+    label = node.type
+    if node.type == "array" and node.items is not None:
+        label = f"array of {node.items.type}"
+    if node.enum:
+        values = node.enum[:MAX_ENUM_VALUES]
+        more = f", +{len(node.enum) - len(values)} more" if len(node.enum) > len(values) else ""
+        label += f"; enum: {', '.join(values)}{more}"
+    return label
+
+
+def render_properties(properties: Dict[str, SchemaNode], max_depth: int, indent: int = 0) -> List[str]:
+    """Render a property tree as indented `- name (type: ...) - description` lines.
+
+    Top-level lines keep the original `Valid Top-Level Properties` format;
+    nested properties are indented two spaces per level, down to `max_depth`.
+    """
+    lines = []
+    for index, (name, node) in enumerate(properties.items()):
+        if indent and index >= MAX_CHILDREN:
+            lines.append(f"{'  ' * indent}- ... ({len(properties) - MAX_CHILDREN} more)")
+            break
+        line = f"{'  ' * indent}- {name} (type: {_type_label(node)})"
+        description = " ".join(node.description.split())
+        if description:
+            line += f" - {description}"
+        if node.recursive:
+            line += f" (recursive: {node.recursive})"
+        lines.append(line)
+
+        children = node.properties or (node.items.properties if node.items is not None else {})
+        if children and indent + 1 < max_depth:
+            lines.extend(render_properties(children, max_depth, indent + 1))
+    return lines
@@ -0,0 +1,389 @@
+"""Upload the grounding corpus to the Azure AI Search index, sending only what changed.
+
+The JSONL extracts are streamed, mapped to index documents (``id``,
+``content`` and optionally ``vector``) and compared against a manifest of
+content hashes from the previous run. New and changed documents are sent as
+``mergeOrUpload`` actions, documents that disappeared from the corpus are
+deleted, and unchanged ones are skipped. Batches are capped at the service
+limits (1000 documents / 16 MB per request) and uploaded concurrently, with
+exponential backoff on throttling (429/503), including per-document throttling
+inside a 207 response.
+
+    python upload_search_index.py upload                        # AZURE_SEARCH_SERVICE_ENDPOINT / AZURE_SEARCH_INDEX_NAME
+    python upload_search_index.py upload --full                 # ignore the manifest and re-send everything
+    python upload_search_index.py serve-local --port 8765       # in-memory stand-in for the docs/index API
+    python upload_search_index.py upload --endpoint http://127.0.0.1:8765 --index local
+
+The manifest is only updated for documents the service accepted, so a failed
+or interrupted run is picked up by the next one.
+
+Module documents reference factored-out parameter descriptions as
+``[shared:<ref>]`` (see ``webapp/shared_parameters.py``). Those references are
+inlined again before upload, so search results carry the full text; the
+shared documents themselves are not uploaded.
+"""
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import os
+import random
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+BASE_DIR = Path(__file__).resolve().parents[2]
+GROUNDING_DIR = BASE_DIR / "grounding-data"
+CORPUS_GLOBS = ("extracted_avm_data.jsonl", "extracted_schema_data*.jsonl")
+
+SEARCH_API_VERSION = "2024-07-01"
+MAX_BATCH_DOCUMENTS = 1000
+MAX_BATCH_BYTES = 15 * 1024 * 1024  # service limit is 16 MB per request; leave room for the envelope
+MAX_RETRIES = 6
+RETRYABLE_STATUS = {429, 503}
+EMBEDDING_CHUNK_SIZE = 64
+
+sys.path.insert(0, str(BASE_DIR / "webapp"))
+
+from shared_parameters import inline_references, is_shared_record, load_shared_definitions  # noqa: E402
+
+
+def manifest_path(index_name: str) -> Path:
+    return GROUNDING_DIR / f"search_manifest_{index_name}.json"
+
+
+def load_manifest(path: Path) -> Dict[str, str]:
+    if not path.exists():
+        return {}
+    return json.loads(path.read_text(encoding="utf-8"))
+
+
+def save_manifest(path: Path, manifest: Dict[str, str]) -> None:
+    # Write to a temp file first so an interrupted run never leaves a truncated manifest.
+    tmp_path = path.with_suffix(".tmp")
+    tmp_path.write_text(json.dumps(manifest, indent=0, sort_keys=True), encoding="utf-8")
+    tmp_path.replace(path)
+
+
+def content_hash(document: dict) -> str:
+    return hashlib.sha256(json.dumps(document, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def iter_records(grounding_dir: Path) -> Iterator[dict]:
+    """Stream the corpus records, one JSONL line at a time."""
+    for pattern in CORPUS_GLOBS:
+        for path in sorted(grounding_dir.glob(pattern)):
+            with path.open(encoding="utf-8") as f:
+                for line in f:
+                    line = line.strip()
+                    if line:
+                        yield json.loads(line)
+
+
+def iter_corpus(grounding_dir: Path) -> Iterator[dict]:
+    """Stream the corpus as index documents with shared parameter references inlined."""
+    definitions = load_shared_definitions(record for record in iter_records(grounding_dir) if is_shared_record(record))
+    for record in iter_records(grounding_dir):
+        if is_shared_record(record):
+            continue  # inlined into the module documents below
+        yield {"id": record["id"], "content": inline_references(record["content_to_embed"], definitions)}
+
+
+def plan_actions(
+    documents: Iterable[dict],
+    manifest: Dict[str, str],
+    full: bool,
+    stats: Dict[str, int],
+) -> Iterator[Tuple[dict, str]]:
+    """Yield (action, hash) for new/changed documents, then deletions for ids no longer in the corpus."""
+    seen = set()
+    for document in documents:
+        if document["id"] in seen:
+            stats["duplicates"] += 1
+            continue
+        seen.add(document["id"])
+
+        digest = content_hash(document)
+        if not full and manifest.get(document["id"]) == digest:
+            stats["unchanged"] += 1
+            continue
+        yield {"@search.action": "mergeOrUpload", **document}, digest
+
+    for doc_id in sorted(set(manifest) - seen):
+        yield {"@search.action": "delete", "id": doc_id}, ""
+
+
+def batch_actions(actions: Iterable[Tuple[dict, str]]) -> Iterator[List[Tuple[dict, str]]]:
+    """Group actions into batches within the service's per-request document and size limits."""
+    batch: List[Tuple[dict, str]] = []
+    batch_bytes = 0
+    for action, digest in actions:
+        size = len(json.dumps(action).encode("utf-8"))
+        if batch and (len(batch) >= MAX_BATCH_DOCUMENTS or batch_bytes + size > MAX_BATCH_BYTES):
+            yield batch
+            batch, batch_bytes = [], 0
+        batch.append((action, digest))
+        batch_bytes += size
+    if batch:
+        yield batch
+
+
+class SearchIndexClient:
+    """Minimal REST client for the docs/index API so it can point at a local stand-in."""
+
+    def __init__(self, endpoint: str, index_name: str, headers_factory: Callable[[], Dict[str, str]]) -> None:
+        self.url = f"{endpoint.rstrip('/')}/indexes/{index_name}/docs/index?api-version={SEARCH_API_VERSION}"
+        self.headers_factory = headers_factory
+
+    def index(self, actions: List[dict]) -> Tuple[int, Dict[str, int], Optional[float]]:
+        """Send one batch; return the HTTP status, per-key statuses and any Retry-After delay."""
+        body = json.dumps({"value": actions}).encode("utf-8")
+        request = urllib.request.Request(
+            self.url,
+            data=body,
+            headers={"Content-Type": "application/json", **self.headers_factory()},
+            method="POST",
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=120) as response:
+                status, payload, headers = response.status, json.loads(response.read() or b"{}"), response.headers
+        except urllib.error.HTTPError as e:
+            status, payload, headers = e.code, {}, e.headers
+
+        results = {item["key"]: item.get("statusCode", 500) for item in payload.get("value", [])}
+        return status, results, _retry_after(headers)
+
+
+def _retry_after(headers) -> Optional[float]:
+    if headers is None:
+        return None
+    if headers.get("retry-after-ms"):
+        return float(headers["retry-after-ms"]) / 1000
+    if headers.get("Retry-After"):
+        try:
+            return float(headers["Retry-After"])
+        except ValueError:
+            return None
+    return None
+
+
+def _backoff(attempt: int, retry_after: Optional[float]) -> float:
+    if retry_after is not None:
+        return retry_after
+    return min(30.0, 0.5 * 2 ** attempt) * (0.5 + random.random() / 2)
+
+
+def upload_batch(
+    client: SearchIndexClient,
+    batch: List[Tuple[dict, str]],
+    embed: Optional[Callable[[List[str]], List[List[float]]]] = None,
+) -> Tuple[Dict[str, str], List[str]]:
+    """Upload one batch, retrying throttled documents; return (accepted id -> hash, failed ids)."""
+    if embed:
+        uploads = [action for action, _ in batch if action["@search.action"] != "delete"]
+        for start in range(0, len(uploads), EMBEDDING_CHUNK_SIZE):
+            chunk = uploads[start:start + EMBEDDING_CHUNK_SIZE]
+            for action, vector in zip(chunk, embed([a["content"] for a in chunk])):
+                action["vector"] = vector
+
+    pending = {action["id"]: (action, digest) for action, digest in batch}
+    accepted: Dict[str, str] = {}
+
+    for attempt in range(MAX_RETRIES + 1):
+        status, results, retry_after = client.index([action for action, _ in pending.values()])
+
+        if status in (200, 207):
+            retry = {}
+            for doc_id, (action, digest) in pending.items():
+                doc_status = results.get(doc_id, 500)
+                if doc_status in (200, 201):
+                    accepted[doc_id] = digest
+                elif doc_status == 404 and action["@search.action"] == "delete":
+                    accepted[doc_id] = digest  # already gone
+                elif doc_status in RETRYABLE_STATUS:
+                    retry[doc_id] = (action, digest)
+            failed = set(pending) - set(accepted) - set(retry)
+            pending = retry
+            if not pending:
+                return accepted, sorted(failed)
+        elif status not in RETRYABLE_STATUS:
+            return accepted, sorted(pending)
+
+        if attempt < MAX_RETRIES:
+            time.sleep(_backoff(attempt, retry_after))
+
+    return accepted, sorted(pending)
+
+
+def _auth_headers(endpoint: str) -> Callable[[], Dict[str, str]]:
+    api_key = os.getenv("AZURE_SEARCH_API_KEY")
+    if api_key:
+        return lambda: {"api-key": api_key}
+    if endpoint.startswith("http://"):
+        return lambda: {}  # local stand-in
+
+    from azure.identity import DefaultAzureCredential
+
+    credential = DefaultAzureCredential()
+    return lambda: {"Authorization": f"Bearer {credential.get_token('https://search.azure.com/.default').token}"}
+
+
+def _embedder(deployment: str) -> Callable[[List[str]], List[List[float]]]:
+    from openai import AzureOpenAI
+    from azure.identity import DefaultAzureCredential, get_bearer_token_provider
+
+    token_provider = get_bearer_token_provider(
+        DefaultAzureCredential(),
+        "https://cognitiveservices.azure.com/.default"
+    )
+    client = AzureOpenAI(
+        azure_endpoint=os.environ["AZURE_OPENAI_ENDPOINT"],
+        api_version=os.getenv("AZURE_OPENAI_API_VERSION", "2024-10-21"),
+        azure_ad_token_provider=token_provider
+    )
+    return lambda texts: [item.embedding for item in client.embeddings.create(input=texts, model=deployment).data]
+
+
+def upload(args: argparse.Namespace) -> None:
+    if not args.endpoint or not args.index:
+        sys.exit("Set AZURE_SEARCH_SERVICE_ENDPOINT and AZURE_SEARCH_INDEX_NAME, or pass --endpoint and --index")
+
+    path = args.manifest or manifest_path(args.index)
+    manifest = load_manifest(path)
+    client = SearchIndexClient(args.endpoint, args.index, _auth_headers(args.endpoint))
+    embed = _embedder(args.embedding_deployment) if args.embedding_deployment else None
+
+    stats = {"unchanged": 0, "duplicates": 0, "uploaded": 0, "deleted": 0, "failed": 0, "batches": 0}
+    batches = batch_actions(plan_actions(iter_corpus(args.grounding_dir), manifest, args.full, stats))
+    started = time.perf_counter()
+
+    def record(future) -> None:
+        accepted, failed = future.result()
+        for doc_id, digest in accepted.items():
+            if digest:
+                manifest[doc_id] = digest
+                stats["uploaded"] += 1
+            else:
+                manifest.pop(doc_id, None)
+                stats["deleted"] += 1
+        stats["failed"] += len(failed)
+        for doc_id in failed[:5]:
+            print(f"⚠ Warning: failed to index '{doc_id}'")
+
+    # Keep only a few batches in flight so the corpus is streamed rather than loaded up front.
+    in_flight = set()
+    try:
+        with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+            for batch in batches:
+                stats["batches"] += 1
+                in_flight.add(executor.submit(upload_batch, client, batch, embed))
+                if len(in_flight) >= args.concurrency * 2:
+                    done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        record(future)
+            for future in in_flight:
+                record(future)
+    finally:
+        save_manifest(path, manifest)
+
+    elapsed = time.perf_counter() - started
+    sent = stats["uploaded"] + stats["deleted"]
+    rate = sent / elapsed if elapsed > 0 else 0.0
+    print(
+        f"✓ {stats['uploaded']} uploaded, {stats['deleted']} deleted, {stats['unchanged']} unchanged, "
+        f"{stats['failed']} failed in {stats['batches']} batches ({elapsed:.2f}s, {rate:.0f} docs/sec)"
+    )
+    if stats["duplicates"]:
+        print(f"⚠ Warning: skipped {stats['duplicates']} document(s) with duplicate ids")
+
+
+class _LocalIndexHandler(BaseHTTPRequestHandler):
+    """Accepts docs/index batches into memory and throttles a fraction of them."""
+
+    documents: Dict[str, dict] = {}
+    lock = threading.Lock()
+    throttle_rate = 0.0
+    latency = 0.0
+
+    def do_POST(self) -> None:
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        time.sleep(self.latency)
+
+        if random.random() < self.throttle_rate:
+            self._reply(429, {"error": {"message": "Throttled"}}, {"Retry-After": "0.1"})
+            return
+
+        results = []
+        with self.lock:
+            for action in body["value"]:
+                if random.random() < self.throttle_rate / 2:
+                    results.append({"key": action["id"], "status": False, "statusCode": 503})
+                elif action["@search.action"] == "delete":
+                    found = self.documents.pop(action["id"], None) is not None
+                    results.append({"key": action["id"], "status": found, "statusCode": 200 if found else 404})
+                else:
+                    self.documents[action["id"]] = {k: v for k, v in action.items() if k != "@search.action"}
+                    results.append({"key": action["id"], "status": True, "statusCode": 200})
+
+        status = 200 if all(r["statusCode"] == 200 for r in results) else 207
+        self._reply(status, {"value": results})
+
+    def _reply(self, status: int, payload: dict, headers: Optional[Dict[str, str]] = None) -> None:
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args) -> None:
+        pass
+
+
+def serve_local(args: argparse.Namespace) -> None:
+    _LocalIndexHandler.throttle_rate = args.throttle_rate
+    _LocalIndexHandler.latency = args.latency
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), _LocalIndexHandler)
+    print(f"Local search stand-in on http://127.0.0.1:{args.port} (throttle rate {args.throttle_rate})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print(f"Stopped with {len(_LocalIndexHandler.documents)} documents indexed")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    upload_parser = subparsers.add_parser("upload", help="upload new/changed documents and delete removed ones")
+    upload_parser.add_argument("--endpoint", default=os.getenv("AZURE_SEARCH_SERVICE_ENDPOINT"))
+    upload_parser.add_argument("--index", default=os.getenv("AZURE_SEARCH_INDEX_NAME"))
+    upload_parser.add_argument("--grounding-dir", type=Path, default=GROUNDING_DIR)
+    upload_parser.add_argument("--manifest", type=Path, help="defaults to grounding-data/search_manifest_<index>.json")
+    upload_parser.add_argument("--concurrency", type=int, default=4)
+    upload_parser.add_argument("--full", action="store_true", help="re-send every document regardless of the manifest")
+    upload_parser.add_argument("--embedding-deployment", default=os.getenv("AZURE_OPENAI_EMBEDDING_DEPLOYMENT_NAME"),
+                               help="compute the `vector` field with this Azure OpenAI embedding deployment")
+    upload_parser.set_defaults(func=upload)
+
+    serve_parser = subparsers.add_parser("serve-local", help="run an in-memory stand-in for the docs/index API")
+    serve_parser.add_argument("--port", type=int, default=8765)
+    serve_parser.add_argument("--throttle-rate", type=float, default=0.1, help="fraction of requests answered with 429")
+    serve_parser.add_argument("--latency", type=float, default=0.05, help="seconds of simulated latency per request")
+    serve_parser.set_defaults(func=serve_local)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
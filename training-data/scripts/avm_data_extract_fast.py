@@ -13,7 +13,7 @@ def process_bicep_file(bicep_file_path):
     try:
         result = subprocess.run(
             ["az", "bicep", "build", "--file", bicep_file_path, "--stdout"],
-            capture_output=True, text=True, check=True, encoding='utf-8', shell=True
+            capture_output=True, text=True, check=True, encoding='utf-8', shell=os.name == "nt"
         )
 
         if not result.stdout:
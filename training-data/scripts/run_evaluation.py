@@ -0,0 +1,480 @@
+"""Offline evaluation of the fine-tuned agent against the validation set.
+
+Every example in ``train_agent_validation.jsonl`` is sent through the same
+prompt assembly as ``/generate`` (system message, context block, user
+request with the mode suffix), optionally with live Azure AI Search context.
+Requests run concurrently with a bounded number in flight; throttling (429)
+pauses all workers for the Retry-After period. Each finished example is
+appended to a checkpoint file, so an interrupted run continues where it
+stopped. Scoring runs in one batch over the checkpoint at the end:
+
+* ``json_valid`` - the response parses and has ``plan`` and ``files`` (compact
+  responses, from ``--contract compact``, are expanded to that structure first)
+* ``module_id_match`` - predicted ``plan.resources`` ids equal the expected ones (AVM examples)
+* ``declarations_match`` - the Bicep declares the same module/resource types
+* ``bicep_similarity`` - line diff ratio of the normalized ``main.bicep`` (comments and whitespace removed)
+
+    python run_evaluation.py serve-mock --port 8766 &                 # local stand-in for the chat endpoint
+    python run_evaluation.py run --endpoint http://127.0.0.1:8766     # mock
+    python run_evaluation.py run                                      # AZURE_OPENAI_ENDPOINT / AZURE_OPENAI_DEPLOYMENT_NAME
+    python run_evaluation.py run --mock                               # self-contained, for CI
+    python run_evaluation.py score                                    # re-score an existing checkpoint
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import difflib
+import hashlib
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, List, Optional, Set
+
+BASE_DIR = Path(__file__).resolve().parents[2]
+VALIDATION_PATH = BASE_DIR / "training-data" / "train_agent_validation.jsonl"
+RESULTS_DIR = BASE_DIR / "training-data" / "eval-results"
+
+sys.path.insert(0, str(BASE_DIR / "webapp"))
+
+from grounding import scan_bicep  # noqa: E402
+from agent_output import expand_compact_response, is_compact  # noqa: E402
+from prompting import FULL_CONTRACT, MODE_QUERY_SUFFIXES, SYSTEM_MESSAGES, build_agent_messages, format_context  # noqa: E402
+from usage import extract_usage  # noqa: E402
+
+MAX_RETRIES = 6
+RETRYABLE_STATUS = {500, 502, 503, 504}
+REQUEST_TIMEOUT = 120.0
+USER_REQUEST_RE = re.compile(r'User Request: "(?P<query>.*)"\s*$', re.DOTALL)
+
+
+def example_id(index: int, prompt: str) -> str:
+    return f"{index:04d}-{hashlib.sha1(prompt.encode('utf-8')).hexdigest()[:8]}"
+
+
+def load_examples(path: Path) -> List[dict]:
+    examples = []
+    with path.open(encoding="utf-8") as f:
+        for index, line in enumerate(f):
+            if not line.strip():
+                continue
+            messages = json.loads(line)["messages"]
+            prompt = next(m["content"] for m in messages if m["role"] == "user")
+            expected = next(m["content"] for m in messages if m["role"] == "assistant")
+            examples.append({
+                "id": example_id(index, prompt),
+                "prompt": prompt,
+                "mode": _expected_mode(expected),
+                "expected": expected,
+            })
+    return examples
+
+
+def _expected_mode(expected: str) -> str:
+    try:
+        resources = json.loads(expected)["plan"]["resources"]
+    except (json.JSONDecodeError, KeyError, TypeError):
+        return "classic"
+    return "avm" if any(str(r.get("resourceType", "")).startswith("br/") for r in resources) else "classic"
+
+
+def load_checkpoint(path: Path) -> Dict[str, dict]:
+    """Latest row per example id; a truncated last line from a crash is ignored."""
+    rows: Dict[str, dict] = {}
+    if path.exists():
+        with path.open(encoding="utf-8") as f:
+            for line in f:
+                try:
+                    row = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                rows[row["id"]] = row
+    return rows
+
+
+class _Retriever:
+    """Live Azure AI Search context through the webapp's own search plan and merge."""
+
+    def __init__(self) -> None:
+        import app
+
+        self.app = app
+        grounding_index = app.snapshots.current.grounding_index
+        self.shared_definitions = grounding_index.shared_definitions if grounding_index else {}
+
+    def documents(self, prompt: str, mode: str) -> List[Dict[str, str]]:
+        plan = self.app.build_search_plan(prompt, mode)
+        return self.app.retrieve_context(plan.search_query, plan.filter, plan.sub_queries, plan.sub_filters)
+
+
+async def _assemble_messages(example: dict, retriever: Optional[_Retriever], contract: str) -> List[Dict[str, str]]:
+    query = example["prompt"] + MODE_QUERY_SUFFIXES[example["mode"]]
+    if retriever is None:
+        return build_agent_messages(query, format_context([]), contract)
+    documents = await asyncio.to_thread(retriever.documents, example["prompt"], example["mode"])
+    return build_agent_messages(query, format_context(documents, retriever.shared_definitions), contract)
+
+
+def _make_client(endpoint: Optional[str]):
+    if endpoint:
+        from openai import AsyncOpenAI
+
+        return AsyncOpenAI(base_url=endpoint, api_key="mock", max_retries=0)
+
+    from openai import AsyncAzureOpenAI
+    from azure.identity import DefaultAzureCredential, get_bearer_token_provider
+
+    token_provider = get_bearer_token_provider(
+        DefaultAzureCredential(),
+        "https://cognitiveservices.azure.com/.default"
+    )
+    return AsyncAzureOpenAI(
+        azure_endpoint=os.environ["AZURE_OPENAI_ENDPOINT"],
+        api_version=os.getenv("AZURE_OPENAI_API_VERSION", "2024-10-21"),
+        azure_ad_token_provider=token_provider,
+        max_retries=0
+    )
+
+
+def _retry_after(error) -> Optional[float]:
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    for name, scale in (("retry-after-ms", 0.001), ("retry-after", 1.0)):
+        try:
+            return float(headers[name]) * scale
+        except (KeyError, TypeError, ValueError):
+            continue
+    return None
+
+
+class _Throttle:
+    """Shared cool-down: one 429 pauses every worker instead of each hammering the endpoint."""
+
+    def __init__(self) -> None:
+        self.resume_at = 0.0
+
+    async def wait(self) -> None:
+        delay = self.resume_at - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def pause(self, seconds: float) -> None:
+        self.resume_at = max(self.resume_at, time.monotonic() + seconds)
+
+
+def _backoff(attempt: int) -> float:
+    return min(30.0, 2 ** attempt) * (0.5 + random.random() / 2)
+
+
+async def _complete(client, deployment: str, messages, throttle: _Throttle) -> dict:
+    from openai import APIConnectionError, APIStatusError, RateLimitError
+
+    error = None
+    for attempt in range(MAX_RETRIES + 1):
+        await throttle.wait()
+        started = time.perf_counter()
+        try:
+            response = await client.chat.completions.create(
+                model=deployment,
+                messages=messages,
+                response_format={"type": "json_object"},
+                temperature=0.1,
+                timeout=REQUEST_TIMEOUT
+            )
+            return {
+                "content": response.choices[0].message.content,
+                "finish_reason": response.choices[0].finish_reason,
+                "usage": extract_usage(response),
+                "latency": round(time.perf_counter() - started, 3),
+                "attempts": attempt + 1,
+                "error": None,
+            }
+        except RateLimitError as e:
+            error = f"429: {e}"
+            throttle.pause(_retry_after(e) or _backoff(attempt))
+        except APIStatusError as e:
+            if e.status_code not in RETRYABLE_STATUS:
+                return {"error": f"{e.status_code}: {e}", "attempts": attempt + 1}
+            error = f"{e.status_code}: {e}"
+            if attempt < MAX_RETRIES:
+                await asyncio.sleep(_retry_after(e) or _backoff(attempt))
+        except APIConnectionError as e:
+            error = f"connection: {e}"
+            if attempt < MAX_RETRIES:
+                await asyncio.sleep(_backoff(attempt))
+
+    return {"error": error, "attempts": MAX_RETRIES + 1}
+
+
+async def run_examples(examples: List[dict], args: argparse.Namespace) -> None:
+    # Rows that failed after all retries are run again.
+    done = {doc_id for doc_id, row in load_checkpoint(args.checkpoint).items() if row.get("error") is None}
+    pending = [e for e in examples if e["id"] not in done]
+    print(f"{len(examples) - len(pending)} examples already in {args.checkpoint}, {len(pending)} to run")
+    if not pending:
+        return
+
+    client = _make_client(args.endpoint)
+    deployment = args.deployment or os.getenv("AZURE_OPENAI_DEPLOYMENT_NAME", "mock")
+    retriever = _Retriever() if args.search else None
+    throttle = _Throttle()
+    semaphore = asyncio.Semaphore(args.concurrency)
+    args.checkpoint.parent.mkdir(parents=True, exist_ok=True)
+    started = time.perf_counter()
+    finished = 0
+
+    with args.checkpoint.open("a", encoding="utf-8") as out:
+        async def evaluate(example: dict) -> None:
+            nonlocal finished
+            async with semaphore:
+                messages = await _assemble_messages(example, retriever, args.contract)
+                result = await _complete(client, deployment, messages, throttle)
+            # Single-threaded event loop: writes never interleave.
+            out.write(json.dumps({"id": example["id"], "mode": example["mode"], **result}) + "\n")
+            out.flush()
+            finished += 1
+            if finished % 50 == 0:
+                print(f"  {finished}/{len(pending)} done ({finished / (time.perf_counter() - started):.1f}/s)")
+
+        await asyncio.gather(*(evaluate(example) for example in pending))
+
+    elapsed = time.perf_counter() - started
+    print(f"Ran {len(pending)} examples in {elapsed:.1f}s ({len(pending) / elapsed:.1f}/s)")
+
+
+def _main_bicep(payload: dict) -> str:
+    for f in payload.get("files", []) or []:
+        if isinstance(f, dict) and f.get("path") == "main.bicep":
+            return f.get("content") or ""
+    return ""
+
+
+def _strip_comment(line: str) -> str:
+    in_string = escaped = False
+    for i, ch in enumerate(line):
+        if escaped:
+            escaped = False
+        elif ch == "\\":
+            escaped = True
+        elif ch == "'":
+            in_string = not in_string
+        elif not in_string and line.startswith("//", i):
+            return line[:i]
+    return line
+
+
+def normalize_bicep(bicep: str) -> List[str]:
+    """Drop comments, blank lines and whitespace differences before diffing."""
+    lines = []
+    for line in bicep.splitlines():
+        line = " ".join(_strip_comment(line).split())
+        if line:
+            lines.append(line)
+    return lines
+
+
+def _plan_ids(payload: dict) -> Set[str]:
+    resources = (payload.get("plan") or {}).get("resources") or []
+    return {str(r.get("resourceType", "")) for r in resources if isinstance(r, dict) and r.get("resourceType")}
+
+
+def _declared_types(bicep: str) -> Set[str]:
+    return {d.type.split("@", 1)[0].lower() for d in scan_bicep(bicep)}
+
+
+def score_example(pair) -> dict:
+    """Score one (expected, actual) pair; runs in a worker process."""
+    example, row = pair
+    expected = json.loads(example["expected"])
+    scores = {"id": example["id"], "mode": example["mode"], "error": row.get("error")}
+    if row.get("error"):
+        return scores
+
+    try:
+        actual = json.loads(row.get("content") or "")
+        if is_compact(actual):
+            actual = expand_compact_response(actual)
+        valid = isinstance(actual, dict) and "plan" in actual and "files" in actual
+    except json.JSONDecodeError:
+        actual, valid = {}, False
+    scores["json_valid"] = valid
+    if not valid:
+        return scores
+
+    expected_ids = _plan_ids(expected)
+    if expected_ids:
+        scores["module_id_match"] = _plan_ids(actual) == expected_ids
+
+    expected_bicep, actual_bicep = _main_bicep(expected), _main_bicep(actual)
+    scores["declarations_match"] = _declared_types(actual_bicep) == _declared_types(expected_bicep)
+    scores["bicep_similarity"] = round(
+        difflib.SequenceMatcher(None, normalize_bicep(expected_bicep), normalize_bicep(actual_bicep), autojunk=False).ratio(), 4
+    )
+    scores["latency"] = row.get("latency")
+    scores["usage"] = row.get("usage")
+    return scores
+
+
+def _rate(scores: List[dict], key: str) -> Optional[float]:
+    values = [s[key] for s in scores if key in s]
+    return round(sum(values) / len(values), 4) if values else None
+
+
+def _percentile(values: List[float], pct: float) -> Optional[float]:
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(pct * len(values)))]
+
+
+def score(examples: List[dict], args: argparse.Namespace) -> dict:
+    rows = load_checkpoint(args.checkpoint)
+    pairs = [(e, rows[e["id"]]) for e in examples if e["id"] in rows]
+    with ProcessPoolExecutor() as executor:
+        scores = list(executor.map(score_example, pairs, chunksize=32))
+
+    scored = [s for s in scores if not s.get("error")]
+    latencies = [s["latency"] for s in scored if s.get("latency") is not None]
+    summary = {
+        "examples": len(examples),
+        "completed": len(scored),
+        "errors": len(scores) - len(scored),
+        "json_valid": _rate(scored, "json_valid"),
+        "module_id_match": _rate(scored, "module_id_match"),
+        "declarations_match": _rate(scored, "declarations_match"),
+        "bicep_similarity": _rate(scored, "bicep_similarity"),
+        "latency_p50": _percentile(latencies, 0.5),
+        "latency_p95": _percentile(latencies, 0.95),
+        "prompt_tokens": sum((s.get("usage") or {}).get("prompt_tokens", 0) for s in scored),
+        "completion_tokens": sum((s.get("usage") or {}).get("completion_tokens", 0) for s in scored),
+        "by_mode": {
+            mode: {
+                "completed": len([s for s in scored if s["mode"] == mode]),
+                "json_valid": _rate([s for s in scored if s["mode"] == mode], "json_valid"),
+                "bicep_similarity": _rate([s for s in scored if s["mode"] == mode], "bicep_similarity"),
+            }
+            for mode in sorted({s["mode"] for s in scored})
+        },
+    }
+
+    report_path = args.checkpoint.with_name(args.checkpoint.stem + "_report.json")
+    report_path.write_text(json.dumps({"summary": summary, "examples": scores}, indent=2), encoding="utf-8")
+    print(json.dumps(summary, indent=2))
+    print(f"Report written to {report_path}")
+    return summary
+
+
+class _MockChatHandler(BaseHTTPRequestHandler):
+    """Answers chat completions with the expected validation output, with injected 429s and corruptions."""
+
+    answers: Dict[str, str] = {}
+    throttle_rate = 0.0
+    corrupt_rate = 0.0
+    latency = 0.0
+
+    def do_POST(self) -> None:
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        time.sleep(self.latency)
+        if random.random() < self.throttle_rate:
+            self._reply(429, {"error": {"code": "429", "message": "Rate limit exceeded"}}, {"retry-after-ms": "200"})
+            return
+
+        match = USER_REQUEST_RE.search(body["messages"][-1]["content"])
+        query = match.group("query") if match else ""
+        for suffix in MODE_QUERY_SUFFIXES.values():
+            if query.endswith(suffix):
+                query = query[: -len(suffix)]
+                break
+        content = self.answers.get(query, json.dumps({"plan": {"resources": []}, "files": [], "warnings": []}))
+        if random.random() < self.corrupt_rate:
+            content = content[: len(content) // 2]  # truncated JSON, as with finish_reason=length
+
+        self._reply(200, {
+            "id": "chatcmpl-mock",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "mock"),
+            "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}],
+            "usage": {"prompt_tokens": len(json.dumps(body["messages"])) // 4, "completion_tokens": len(content) // 4,
+                      "total_tokens": (len(json.dumps(body["messages"])) + len(content)) // 4},
+        })
+
+    def _reply(self, status: int, payload: dict, headers: Optional[Dict[str, str]] = None) -> None:
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args) -> None:
+        pass
+
+
+def start_mock_server(examples: List[dict], port: int, throttle_rate: float, corrupt_rate: float, latency: float) -> ThreadingHTTPServer:
+    # Several classic examples share the same generic prompt; the mock can only answer one of them.
+    _MockChatHandler.answers = {e["prompt"]: e["expected"] for e in examples}
+    _MockChatHandler.throttle_rate = throttle_rate
+    _MockChatHandler.corrupt_rate = corrupt_rate
+    _MockChatHandler.latency = latency
+    return ThreadingHTTPServer(("127.0.0.1", port), _MockChatHandler)
+
+
+def serve_mock(examples: List[dict], args: argparse.Namespace) -> None:
+    server = start_mock_server(examples, args.port, args.throttle_rate, args.corrupt_rate, args.latency)
+    print(f"Mock chat endpoint on http://127.0.0.1:{args.port} ({len(examples)} answers)")
+    server.serve_forever()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--validation", type=Path, default=VALIDATION_PATH)
+    parser.add_argument("--checkpoint", type=Path, default=RESULTS_DIR / "checkpoint.jsonl")
+    parser.add_argument("--limit", type=int, default=0, help="only the first N examples")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="run the remaining examples, then score")
+    run_parser.add_argument("--endpoint", help="OpenAI-compatible base URL (e.g. the mock); defaults to Azure OpenAI")
+    run_parser.add_argument("--deployment", help="defaults to AZURE_OPENAI_DEPLOYMENT_NAME")
+    run_parser.add_argument("--concurrency", type=int, default=8)
+    run_parser.add_argument("--search", action="store_true", help="add Azure AI Search context like /generate")
+    run_parser.add_argument("--mock", action="store_true", help="run against an in-process mock endpoint (CI)")
+    run_parser.add_argument("--contract", choices=sorted(SYSTEM_MESSAGES), default=FULL_CONTRACT,
+                            help="output contract in the system message (see webapp/prompting.py)")
+
+    subparsers.add_parser("score", help="score the checkpoint without running anything")
+
+    mock_parser = subparsers.add_parser("serve-mock", help="local stand-in for the chat completions endpoint")
+    mock_parser.add_argument("--port", type=int, default=8766)
+    mock_parser.add_argument("--throttle-rate", type=float, default=0.1)
+    mock_parser.add_argument("--corrupt-rate", type=float, default=0.05)
+    mock_parser.add_argument("--latency", type=float, default=0.2)
+
+    args = parser.parse_args()
+    examples = load_examples(args.validation)
+    if args.limit:
+        examples = examples[: args.limit]
+
+    if args.command == "serve-mock":
+        serve_mock(examples, args)
+        return
+    if args.command == "run":
+        if args.mock:
+            # Self-contained run for CI: the mock answers from a background thread on a free port.
+            server = start_mock_server(examples, 0, throttle_rate=0.1, corrupt_rate=0.05, latency=0.05)
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            args.endpoint = f"http://127.0.0.1:{server.server_address[1]}"
+        asyncio.run(run_examples(examples, args))
+    score(examples, args)
+
+
+if __name__ == "__main__":
+    main()
@@ -17,7 +17,7 @@ def _decompile_bicep(file_path: Path) -> Optional[str]:
     try:
         completed = subprocess.run(
             ["az", "bicep", "decompile", "--file", str(file_path)],
-            capture_output=True, text=True, check=True, shell=True
+            capture_output=True, text=True, check=True, shell=os.name == "nt"
         )
     except FileNotFoundError:
         print(f"bicep CLI not found while processing {file_path}")
@@ -48,21 +48,8 @@ def _read_bicep(file_path: Path) -> Optional[str]:
         return None
 
 
-def process_file(file_path: str, i: int) -> Optional[dict]:
-    """Convert a single template file into an agent training example."""
-    path = Path(file_path)
-    bicep_code: Optional[str] = None
-
-    print(f"Processing file {i}: {path}...")
-
-    if path.name == "azuredeploy.json":
-        bicep_code = _decompile_bicep(path)
-    elif path.name in {"main.bicep", "azuredeploy.bicep"}:
-        bicep_code = _read_bicep(path)
-
-    if not bicep_code or not bicep_code.strip():
-        return None
-
+def build_example(path: Path, bicep_code: str) -> dict:
+    """The agent output (plan, files, warnings) for a template's Bicep code."""
     plan, warnings = generate_plan_and_warnings(bicep_code)
     parameters_json = generate_parameters_json(bicep_code)
 
@@ -70,7 +57,7 @@ def process_file(file_path: str, i: int) -> Optional[dict]:
     if path.suffix.lower() == ".json":
         bicep_filename = path.with_suffix(".bicep").name
 
-    example = {
+    return {
         "plan": plan,
         "files": [
             {
@@ -87,7 +74,33 @@ def process_file(file_path: str, i: int) -> Optional[dict]:
         "warnings": warnings,
     }
 
-    return example
+
+def training_record(example: dict) -> dict:
+    """A chat training record with the example as the assistant turn; the prompt is filled in later."""
+    return {
+        "messages": [
+            {"role": "user", "content": ""},
+            {"role": "assistant", "content": json.dumps(example)},
+        ]
+    }
+
+
+def process_file(file_path: str, i: int) -> Optional[dict]:
+    """Convert a single template file into an agent training example."""
+    path = Path(file_path)
+    bicep_code: Optional[str] = None
+
+    print(f"Processing file {i}: {path}...")
+
+    if path.name == "azuredeploy.json":
+        bicep_code = _decompile_bicep(path)
+    elif path.name in {"main.bicep", "azuredeploy.bicep"}:
+        bicep_code = _read_bicep(path)
+
+    if not bicep_code or not bicep_code.strip():
+        return None
+
+    return build_example(path, bicep_code)
 
 
 def _collect_supported_files(root: Path) -> List[str]:
@@ -114,18 +127,11 @@ def main() -> None:
 
     with ProcessPoolExecutor() as executor:
         results = executor.map(process_file, template_files, generate_index())
-        with output_path.open("a", encoding="utf-8") as f_out:
+        with output_path.open("w", encoding="utf-8") as f_out:
             for result in results:
                 if result is None:
                     continue
-                assistant_payload = json.dumps(result)
-                record = {
-                    "messages": [
-                        {"role": "user", "content": ""},
-                        {"role": "assistant", "content": assistant_payload},
-                    ]
-                }
-                f_out.write(json.dumps(record) + "\n")
+                f_out.write(json.dumps(training_record(result)) + "\n")
                 processed += 1
 
     print(f"Wrote {processed} training records to {output_path}")
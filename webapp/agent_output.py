@@ -0,0 +1,51 @@
+"""Turn a compact agent response back into the full plan/files/warnings structure.
+
+Under the compact output contract (see ``prompting.COMPACT_AGENT_SYSTEM_MESSAGE``)
+the agent writes only ``{"bicep", "rationale", "warnings"}``. Everything
+else the full contract asks for is a function of the Bicep: the plan lists
+its module/resource declarations (the way the training data builds it, see
+``training-data/scripts/extract_avm_examples.py``) and parameters.json comes
+from its ``param`` declarations (``bicep_parameters``). Downstream code keeps
+working on the full structure either way.
+"""
+from __future__ import annotations
+
+from typing import Dict, List
+
+from bicep_parameters import derive_parameters_json
+from grounding import scan_bicep
+
+AVM_RATIONALE = "AVM module selected."
+CLASSIC_RATIONALE = "Classic Bicep resource selected."
+
+
+def is_compact(payload) -> bool:
+    return isinstance(payload, dict) and "bicep" in payload and "files" not in payload
+
+
+def derive_plan(bicep_code: str, rationale: str = "") -> Dict[str, object]:
+    """The plan for `bicep_code`: every declared module/resource, in order."""
+    resources: List[Dict[str, str]] = [
+        {"resourceType": declaration.type, "name": declaration.symbol}
+        for declaration in scan_bicep(bicep_code)
+        if not declaration.existing
+    ]
+    if not rationale:
+        rationale = AVM_RATIONALE if "br/public:avm" in bicep_code else CLASSIC_RATIONALE
+    return {"resources": resources, "rationale": rationale}
+
+
+def expand_compact_response(payload: dict) -> dict:
+    """The full-contract payload for a compact one."""
+    bicep_code = payload.get("bicep") or ""
+    if not isinstance(bicep_code, str):
+        bicep_code = ""
+    warnings = payload.get("warnings") or []
+    return {
+        "plan": derive_plan(bicep_code, str(payload.get("rationale") or "")),
+        "files": [
+            {"path": "main.bicep", "language": "bicep", "content": bicep_code},
+            {"path": "parameters.json", "language": "json", "content": derive_parameters_json(bicep_code)},
+        ],
+        "warnings": [str(warning) for warning in warnings] if isinstance(warnings, list) else [str(warnings)],
+    }
@@ -1,56 +1,152 @@
+import hmac
 import json
 import logging
 import os
+import queue
+import threading
 import tiktoken
 import time
 import uuid
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, wait
 from flask import Flask, render_template, request, jsonify, Response
 from flask_compress import Compress
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
-
-logging.basicConfig(level=logging.INFO)
+from grounding import default_data_dir
+from prompting import COMPACT_CONTRACT, MODE_QUERY_SUFFIXES, SYSTEM_MESSAGES, CONTINUE_PROMPT, build_agent_messages, build_refinement_messages, format_context
+from agent_output import expand_compact_response, is_compact
+from bicep_parameters import derive_parameters_json
+from deployment_router import DeploymentRouter, parse_targets
+from entities import narrow_filter, widen_filter
+from fallback_retrieval import SearchResultCache
+from fast_path import render as render_example
+from partial_json import loads_tolerant, stitch
+from profiling import WEIGHTS as PROFILE_WEIGHTS, Profiler
+from resilience import BudgetExhausted, CircuitBreaker, CircuitOpenError, Deadline, RequestCancelled
+from structured_logging import RequestLog, configure_logging, should_sample
+from refinement import SessionStore, apply_edits, new_resource_phrases, parse_edits, reused_documents
+from result_store import ResultStore, summarize, tail
+from retrieval import MAX_SUB_QUERIES, decompose_query, merge_documents
+from snapshot import SnapshotManager, build_snapshot
+from usage import UsageStats, extract_usage
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_CONTEXT_SAMPLE_RATE = float(os.getenv("LOG_CONTEXT_SAMPLE_RATE", "0.01"))
+DEBUG_CONTENT_MAX_CHARS = int(os.getenv("DEBUG_CONTENT_MAX_CHARS", "4000"))
+
+log_handler = configure_logging(LOG_LEVEL)
 
 SEARCH_ENDPOINT = os.getenv("AZURE_SEARCH_SERVICE_ENDPOINT")
 SEARCH_INDEX_NAME = os.getenv("AZURE_SEARCH_INDEX_NAME")
 OPENAI_ENDPOINT = os.getenv("AZURE_OPENAI_ENDPOINT")
 OPENAI_DEPLOYMENT_NAME = os.getenv("AZURE_OPENAI_DEPLOYMENT_NAME")
-
-AGENT_SYSTEM_MESSAGE = """
-You are an expert Azure Bicep assistant. Your sole purpose is to generate accurate and best-practice Bicep code based *only* on the user's request and the provided context documents.
-
-You MUST follow these rules strictly:
-1.  **Prioritize AVM (Azure Verified Modules):** If the user's prompt or toggle (indicated in the augmented query) asks for an AVM, you **MUST** use the AVM `module` syntax. You **MUST** use the exact `Module ID` (including the version) provided in the context documents.
-2.  **Use Classic Bicep:** If the user's prompt or toggle (indicated in the augmented query) explicitly asks for 'classic Bicep', 'non-AVM', or 'without a module', you **MUST** generate a classic Bicep `resource` definition. You **MUST** use the properties and resource types found in the "ARM Schema" context documents.
-3.  **Strict Grounding:** Your response **MUST** be based *solely* on the information provided in the user request and the accompanying context documents. Do not hallucinate module paths.
-4.  **Output Format:** You **MUST** return your final response as a single, valid JSON object. Do not provide any other text, conversation, or markdown formatting (like ```json).
-
-**Required Output JSON Schema:**
-```json
-{
-  "plan": {
-    "resources": [
-      {"resourceType": "e.g., br/public:avm/res/storage/storage-account:0.8.0", "name": "e.g., stg-prod-001"}
-    ],
-    "rationale": "A one-sentence explanation for the choice, e.g., 'User requested an AVM for Storage Account.'"
-  },
-  "files": [
-    {"path": "main.bicep", "language": "bicep", "content": "The full, valid Bicep code."},
-    {"path": "parameters.json", "language": "json", "content": "The full, valid parameters.json content."}
-  ],
-  "warnings": [
-    "e.g., 'Fell back to classic Bicep as no AVM module was found in context.'"
-  ]
+OPENAI_API_VERSION = os.getenv("AZURE_OPENAI_API_VERSION", "2024-10-21")
+OPENAI_TARGETS = os.getenv("AZURE_OPENAI_TARGETS")  # JSON list of {name, endpoint, deployment}; see deployment_router.py
+# "compact": the agent writes only the Bicep, rationale and warnings; the plan and
+# parameters.json are derived here (agent_output.py). "full": the fine-tuning format.
+AGENT_OUTPUT_CONTRACT = os.getenv("AGENT_OUTPUT_CONTRACT", COMPACT_CONTRACT)
+
+SEARCH_TOP = 3
+SEARCH_TOP_PER_RESOURCE = 2
+MAX_CONTEXT_TOKENS = int(os.getenv("MAX_CONTEXT_TOKENS", "6000"))
+GENERATION_WORKERS = int(os.getenv("GENERATION_WORKERS", "8"))
+RESULT_STORE_MAX_ENTRIES = int(os.getenv("RESULT_STORE_MAX_ENTRIES", "200"))
+RESULT_STORE_TTL_SECONDS = float(os.getenv("RESULT_STORE_TTL_SECONDS", "900"))
+# Refinement sessions (refinement.py) keep each generation's Bicep and documents for follow-ups
+SESSION_STORE_MAX_ENTRIES = int(os.getenv("SESSION_STORE_MAX_ENTRIES", "200"))
+SESSION_TTL_SECONDS = float(os.getenv("SESSION_TTL_SECONDS", "1800"))
+# A closed connection is only noticed when the next frame is written, so the
+# keepalive interval also bounds how long a disconnect goes unnoticed
+SSE_KEEPALIVE_SECONDS = 5.0
+
+# When the last client of a running generation disconnects, its search and completion
+# are cancelled unless a client resumes the stream within the grace period
+CANCEL_ON_DISCONNECT = os.getenv("CANCEL_ON_DISCONNECT", "true").lower() == "true"
+CANCEL_GRACE_SECONDS = float(os.getenv("CANCEL_GRACE_SECONDS", "10"))
+CANCEL_POLL_SECONDS = 0.1
+
+# End-to-end budget for one generation; keep it below the ingress idle timeout.
+# Search gets a share of what remains (falling back to cached/local retrieval
+# when it runs over), and the completion gets the rest.
+REQUEST_DEADLINE_SECONDS = float(os.getenv("REQUEST_DEADLINE_SECONDS", "90"))
+SEARCH_TIMEOUT_SECONDS = float(os.getenv("SEARCH_TIMEOUT_SECONDS", "8"))
+SEARCH_BUDGET_SHARE = 0.25
+COMPLETION_TIMEOUT_SECONDS = 60.0
+MIN_COMPLETION_SECONDS = 5.0
+# A completion cut off by the output token limit is continued from where it stopped,
+# for at most this many extra calls and this many completion tokens in total
+CONTINUATION_MAX_ROUNDS = int(os.getenv("CONTINUATION_MAX_ROUNDS", "3"))
+CONTINUATION_MAX_TOKENS = int(os.getenv("CONTINUATION_MAX_TOKENS", "32000"))
+TRUNCATED_WARNING = "The agent's response was cut off by the output token limit; the template may be incomplete."
+# Opt-in request profiling (profiling.py): requests sent with `X-Profile: 1` and the admin
+# token, plus PROFILE_SAMPLE_RATE of all requests. Off unless ADMIN_TOKEN is set, since the
+# profiles are only readable from /admin/profiles with it.
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+PROFILE_MAX_ENTRIES = int(os.getenv("PROFILE_MAX_ENTRIES", "50"))
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "3"))
+BREAKER_RESET_SECONDS = float(os.getenv("BREAKER_RESET_SECONDS", "30"))
+
+# Single-module AVM prompts that clearly match a module are answered from its README
+# example without search or the model; see fast_path.py for how the score is computed.
+FAST_PATH_ENABLED = os.getenv("FAST_PATH_ENABLED", "true").lower() == "true"
+FAST_PATH_MIN_SCORE = float(os.getenv("FAST_PATH_MIN_SCORE", "0.75"))
+FAST_PATH_MIN_MARGIN = float(os.getenv("FAST_PATH_MIN_MARGIN", "0.25"))
+
+# Resources a prompt names (kv, aks, key vault, ...) narrow its searches to their documents;
+# see entities.py. A search whose resources have more documents than this keeps the mode filter.
+ENTITY_FILTERS_ENABLED = os.getenv("ENTITY_FILTERS_ENABLED", "true").lower() == "true"
+ENTITY_FILTER_MAX_IDS = int(os.getenv("ENTITY_FILTER_MAX_IDS", "100"))
+
+if PROFILE_SAMPLE_RATE > 0 and not ADMIN_TOKEN:
+    print("⚠ Warning: PROFILE_SAMPLE_RATE is set but ADMIN_TOKEN is not; request profiling stays off")
+
+if AGENT_OUTPUT_CONTRACT not in SYSTEM_MESSAGES:
+    print(f"⚠ Warning: Unknown AGENT_OUTPUT_CONTRACT '{AGENT_OUTPUT_CONTRACT}', using '{COMPACT_CONTRACT}'")
+    AGENT_OUTPUT_CONTRACT = COMPACT_CONTRACT
+
+SEARCH_MODES = {
+    'avm': {'filter': "search.ismatch('AVM Module', 'content')", 'query_suffix': MODE_QUERY_SUFFIXES['avm']},
+    'classic': {'filter': "search.ismatch('ARM Schema', 'content')", 'query_suffix': MODE_QUERY_SUFFIXES['classic']},
 }
-```
-"""
 
-AZURE_ENABLED = all([SEARCH_ENDPOINT, SEARCH_INDEX_NAME, OPENAI_ENDPOINT, OPENAI_DEPLOYMENT_NAME])
+# Enough threads for every generation worker to run a compare request's searches at once (the
+# full prompt plus MAX_SUB_QUERIES per mode), so a search never waits in the queue for a thread
+SEARCH_CONCURRENCY = int(os.getenv("SEARCH_CONCURRENCY", str(GENERATION_WORKERS * len(SEARCH_MODES) * (MAX_SUB_QUERIES + 1))))
+
+openai_targets = []
+try:
+    openai_targets = parse_targets(OPENAI_TARGETS, OPENAI_ENDPOINT, OPENAI_DEPLOYMENT_NAME)
+except ValueError as e:
+    print(f"⚠ Warning: Invalid AZURE_OPENAI_TARGETS: {e}")
+
+# Slow completions count as failures too; a target whose breaker is open is skipped until it resets
+openai_router = DeploymentRouter(
+    openai_targets,
+    failure_threshold=BREAKER_FAILURE_THRESHOLD,
+    reset_after=BREAKER_RESET_SECONDS,
+    slow_after=COMPLETION_TIMEOUT_SECONDS * 0.75
+)
+
+AZURE_ENABLED = all([SEARCH_ENDPOINT, SEARCH_INDEX_NAME, openai_targets])
+
+# Under `gunicorn --preload` the app is imported once in the master and forked.
+# HTTP connection pools and credential caches are not fork-safe, so the clients
+# are then created in each worker by the post_fork hook (gunicorn.conf.py).
+AZURE_CLIENTS_POST_FORK = os.getenv("AZURE_CLIENTS_POST_FORK", "false").lower() == "true"
 
 search_client = None
-openai_client = None
 
-if AZURE_ENABLED:
+def init_azure_clients():
+    """Create the Azure Search and OpenAI clients for the current process"""
+    global AZURE_ENABLED, search_client
+
+    if not AZURE_ENABLED:
+        print("ℹ Running in local development mode (Azure environment variables not set)")
+        return
+
     try:
         from openai import AzureOpenAI
         from azure.search.documents import SearchClient
@@ -69,19 +165,45 @@ if AZURE_ENABLED:
             "https://cognitiveservices.azure.com/.default"
         )
 
-        openai_client = AzureOpenAI(
-            azure_endpoint=OPENAI_ENDPOINT,
-            api_version="2024-02-15-preview",
-            azure_ad_token_provider=token_provider
-        )
+        # With several deployments a 429 is better spilled over to another target than retried in place
+        max_retries = 0 if len(openai_router) > 1 else 2
+        openai_router.connect(lambda endpoint: AzureOpenAI(
+            azure_endpoint=endpoint,
+            api_version=OPENAI_API_VERSION,
+            azure_ad_token_provider=token_provider,
+            max_retries=max_retries
+        ))
 
-        print("✓ Azure services initialized successfully")
+        print(f"✓ Azure services initialized successfully with {len(openai_router)} OpenAI deployment(s) (pid {os.getpid()})")
     except Exception as e:
         print(f"⚠ Warning: Failed to initialize Azure services: {e}")
         print("  Running in local development mode without Azure integration")
         AZURE_ENABLED = False
-else:
-    print("ℹ Running in local development mode (Azure environment variables not set)")
+
+if not AZURE_CLIENTS_POST_FORK:
+    init_azure_clients()
+
+GROUNDING_DATA_DIR = os.getenv("GROUNDING_DATA_DIR") or default_data_dir(os.path.dirname(os.path.abspath(__file__)))
+GROUNDING_RETRY = os.getenv("GROUNDING_RETRY", "false").lower() == "true"
+
+# The grounding data is reloaded in the background when its files change (snapshot.py); 0 turns that off
+GROUNDING_RELOAD_SECONDS = float(os.getenv("GROUNDING_RELOAD_SECONDS", "60"))
+
+def build_grounding_snapshot(data_dir, version, initial=False):
+    """Everything loaded from the grounding data; a reload raises instead of dropping a part"""
+    return build_snapshot(
+        data_dir, version, FAST_PATH_ENABLED, FAST_PATH_MIN_SCORE, FAST_PATH_MIN_MARGIN,
+        report=print if initial else logging.getLogger(__name__).info,
+        strict=not initial
+    )
+
+snapshots = SnapshotManager(GROUNDING_DATA_DIR, build_grounding_snapshot, GROUNDING_RELOAD_SECONDS, logging.getLogger(__name__))
+snapshots.load()
+print(f"✓ Grounding snapshot {snapshots.current.version} ready in {snapshots.last_build['build_seconds']:.2f}s")
+
+# Like the Azure clients, the watcher thread would not survive the fork; post_fork starts it in each worker
+if not AZURE_CLIENTS_POST_FORK:
+    snapshots.start()
 
 VERSION = "unknown"
 try:
@@ -104,6 +226,19 @@ limiter = Limiter(
 def index():
     return render_template('index.html', version=VERSION)
 
+usage_stats = UsageStats()
+search_executor = ThreadPoolExecutor(max_workers=SEARCH_CONCURRENCY, thread_name_prefix='search')
+# One thread per variant of every generation worker, so a compare request never queues behind others
+compare_executor = ThreadPoolExecutor(max_workers=GENERATION_WORKERS * len(SEARCH_MODES), thread_name_prefix='compare')
+generation_executor = ThreadPoolExecutor(max_workers=GENERATION_WORKERS, thread_name_prefix='generate')
+result_store = ResultStore(max_entries=RESULT_STORE_MAX_ENTRIES, ttl=RESULT_STORE_TTL_SECONDS)
+session_store = SessionStore(max_entries=SESSION_STORE_MAX_ENTRIES, ttl=SESSION_TTL_SECONDS)
+search_cache = SearchResultCache()
+profiler = Profiler(PROFILE_INTERVAL_MS / 1000, PROFILE_MAX_ENTRIES, REQUEST_DEADLINE_SECONDS + CANCEL_GRACE_SECONDS + 60)
+
+# Slow calls count as failures too; once the breaker opens, requests skip search until it resets
+search_breaker = CircuitBreaker('search', BREAKER_FAILURE_THRESHOLD, BREAKER_RESET_SECONDS, slow_after=SEARCH_TIMEOUT_SECONDS / 2)
+
 try:
     encoding = tiktoken.encoding_for_model("gpt-4o-mini")
 except:
@@ -116,15 +251,399 @@ def count_tokens(text):
     else:
         return len(text) // 4
 
-def generate_stream(user_query, search_filter=None):
+def run_search(search_text, search_filter, top):
+    """Run one hybrid search and materialize the results (the pager is lazy)"""
+    search_results = search_client.search(
+        search_text=search_text,
+        filter=search_filter,
+        top=top,
+        query_type="semantic",
+        semantic_configuration_name='avm-semantic-config',
+        select=["id", "content"],
+        vector_queries=[{
+            "kind": "text",
+            "text": search_text,
+            "k": 5,
+            "fields": "vector"
+        }]
+    )
+
+    return [
+        {'id': result.get('id', ''), 'content': result.get('content', 'No content available')}
+        for result in search_results
+    ]
+
+def timed_search(search_text, search_filter, top):
+    """Run one search and time it; a search narrowed to entity documents that finds none is retried on the mode filter"""
+    started = time.time()
+    documents = run_search(search_text, search_filter, top)
+    broad_filter = widen_filter(search_filter)
+    if not documents and broad_filter != search_filter:
+        documents = run_search(search_text, broad_filter, top)
+    return documents, time.time() - started
+
+def fallback_search(search_text, search_filter, top, local_retriever=None):
+    """Answer one search without Azure AI Search: a cached result if there is one, else local BM25"""
+    cached = search_cache.get(search_text, search_filter, top)
+    if cached is not None:
+        return cached, 'cache'
+    if local_retriever is not None:
+        return local_retriever.search(search_text, search_filter, top), 'local'
+    return [], 'none'
+
+def wait_unless_cancelled(futures, timeout, deadline=None):
+    """Wait up to `timeout` seconds for `futures`; cancel the pending ones and raise if the request is cancelled"""
+    if deadline is None:
+        wait(futures, timeout=timeout)
+        return
+    wait_until = time.monotonic() + timeout
+    while True:
+        _, pending = wait(futures, timeout=min(CANCEL_POLL_SECONDS, max(0.0, wait_until - time.monotonic())))
+        if deadline.is_cancelled():
+            for future in pending:
+                future.cancel()
+            raise RequestCancelled('search')
+        if not pending or time.monotonic() >= wait_until:
+            return
+
+def retrieve_with_budget(user_query, search_filter, sub_queries=None, budget=SEARCH_TIMEOUT_SECONDS, deadline=None, snapshot=None, sub_filters=None):
+    """Search the full prompt plus one sub-query per resource concurrently, within `budget` seconds.
+
+    A search that fails, misses the budget or is skipped by the open breaker is answered by
+    `fallback_search` instead. Only the time a search actually ran counts for the breaker: one
+    still queued for a search thread when the budget ran out, or cut off before it had run for
+    the breaker's `slow_after`, says nothing about Azure AI Search. Returns the merged documents and where they came from, including
+    the document ids each search returned (`by_query`). Raises
+    RequestCancelled as soon as `deadline` is cancelled; searches that have not started yet
+    are dropped, running ones finish in the background and are discarded. Local fallback
+    retrieval uses the request's grounding `snapshot` (the current one if not given). Each
+    sub-query uses its entry in `sub_filters`, if given, instead of `search_filter`.
+    """
+    snapshot = snapshot or snapshots.current
+    sub_queries = sub_queries or []
+    sub_filters = sub_filters or [search_filter] * len(sub_queries)
+    searches = [(user_query, search_filter, SEARCH_TOP)] + [
+        (sub_query, sub_filter, SEARCH_TOP_PER_RESOURCE) for sub_query, sub_filter in zip(sub_queries, sub_filters)
+    ]
+    if sub_queries:
+        app.logger.debug(f"Decomposed prompt into {len(sub_queries)} resource searches: {sub_queries}")
+
+    futures = []
+    started_at = {}
+
+    def start_search(index, text, text_filter, top):
+        started_at[index] = time.monotonic()
+        return timed_search(text, text_filter, top)
+
+    breaker_open = not search_breaker.allow()
+    if not breaker_open:
+        futures = [search_executor.submit(start_search, index, *search) for index, search in enumerate(searches)]
+        try:
+            wait_unless_cancelled(futures, budget, deadline)
+        except RequestCancelled:
+            search_breaker.abandon()
+            raise
+
+    result_lists = []
+    fallbacks = []
+    by_query = {}
+    slowest = 0.0
+    failed = False
+    for index, (text, text_filter, top) in enumerate(searches):
+        reason = 'breaker_open' if breaker_open else None
+        if futures:
+            future = futures[index]
+            if not future.done():
+                reason = 'queued' if future.cancel() else 'timeout'
+                if reason == 'timeout':
+                    ran_for = time.monotonic() - started_at.get(index, time.monotonic())
+                    failed = failed or ran_for >= (search_breaker.slow_after or 0.0)
+            elif future.exception() is not None:
+                app.logger.warning(f"Resource search failed, falling back: {future.exception()}")
+                reason = 'error'
+                failed = True
+            else:
+                documents, duration = future.result()
+                slowest = max(slowest, duration)
+                search_cache.put(text, text_filter, top, documents)
+                result_lists.append(documents)
+                by_query[text] = [doc['id'] for doc in documents]
+                continue
+
+        documents, source = fallback_search(text, text_filter, top, snapshot.local_retriever)
+        fallbacks.append({'query': text, 'reason': reason, 'source': source})
+        result_lists.append(documents)
+        by_query[text] = [doc.get('id') for doc in documents]
+
+    if futures:
+        if failed:
+            search_breaker.record_failure()
+        elif len(fallbacks) < len(searches):
+            search_breaker.record_success(slowest)
+        else:
+            search_breaker.abandon()  # no search ran long enough to tell
+
+    if not fallbacks:
+        source = 'search'
+    elif len(fallbacks) == len(searches) and len({fallback['source'] for fallback in fallbacks}) == 1:
+        source = fallbacks[0]['source']
+    else:
+        source = 'mixed'
+    retrieval = {'source': source, 'fallbacks': fallbacks, 'by_query': by_query}
+
+    if not sub_queries:
+        return result_lists[0], retrieval
+    return merge_documents(result_lists, MAX_CONTEXT_TOKENS, count_tokens), retrieval
+
+def retrieve_context(user_query, search_filter, sub_queries=None, sub_filters=None):
+    """Search the full prompt plus one sub-query per resource concurrently and merge the results"""
+    return retrieve_with_budget(user_query, search_filter, sub_queries, sub_filters=sub_filters)[0]
+
+StreamedCompletion = namedtuple('StreamedCompletion', ['content', 'finish_reason', 'usage'])
+
+def read_completion_stream(stream, expires, deadline=None):
+    """Assemble a streamed completion, closing the stream when the request is cancelled or runs out of time.
+
+    Closing the stream aborts the HTTP request, so the model stops generating (and billing)
+    tokens nobody will read. `usage` comes from the final chunk (`include_usage`).
+    """
+    parts = []
+    finish_reason = None
+    usage = None
+    try:
+        for chunk in stream:
+            if getattr(chunk, 'usage', None) is not None:
+                usage = chunk.usage
+            for choice in chunk.choices:
+                if choice.delta is not None and choice.delta.content:
+                    parts.append(choice.delta.content)
+                if choice.finish_reason:
+                    finish_reason = choice.finish_reason
+            if deadline is not None and deadline.is_cancelled():
+                raise RequestCancelled('completion', count_tokens(''.join(parts)))
+            if time.time() > expires:
+                raise TimeoutError("Azure OpenAI stream exceeded the completion budget")
+    finally:
+        stream.close()
+    return StreamedCompletion(''.join(parts), finish_reason, usage)
+
+def call_agent(messages, timeout=COMPLETION_TIMEOUT_SECONDS, deadline=None, json_mode=True, max_tokens=None):
+    """Call the agent model and return its content, finish reason, token usage, duration and deployment.
+
+    The router picks the deployment and spills over to the next one on throttling or failure,
+    all within `timeout`. Raises TimeoutError when that runs out, and CircuitOpenError without
+    calling the model when no deployment is available. The completion is streamed so that it
+    can be aborted between chunks with RequestCancelled when `deadline` is cancelled.
+    Continuations of a cut-off response are not JSON objects on their own, so they are
+    requested with `json_mode` off.
+    """
+    app.logger.debug(f"Calling Azure OpenAI agent to generate Bicep code...")
+    openai_start = time.time()
+
+    def create(target):
+        remaining = timeout - (time.time() - openai_start)
+        if remaining < MIN_COMPLETION_SECONDS:
+            raise BudgetExhausted(f"Only {remaining:.1f}s left for the completion after trying other deployments")
+        if deadline is not None:
+            deadline.raise_if_cancelled('completion')
+        # When the request deadline is tighter than the usual timeout, SDK retries would overrun it
+        client = target.client if remaining >= COMPLETION_TIMEOUT_SECONDS else target.client.with_options(max_retries=0)
+        options = {"response_format": {"type": "json_object"}} if json_mode else {}
+        if max_tokens is not None:
+            options["max_tokens"] = max_tokens
+        try:
+            stream = client.chat.completions.create(
+                model=target.deployment,
+                messages=messages,
+                temperature=0.1,
+                timeout=remaining,
+                stream=True,
+                stream_options={"include_usage": True},
+                **options
+            )
+            return read_completion_stream(stream, openai_start + timeout, deadline)
+        except Exception as e:
+            if type(e).__name__ == 'APITimeoutError':
+                raise TimeoutError(f"Azure OpenAI call to '{target.name}' exceeded {remaining:.1f}s") from e
+            raise
+
+    # If every deployment is throttled, waiting out a Retry-After is fine while enough time remains
+    response, target = openai_router.complete(create, max_wait=timeout - MIN_COMPLETION_SECONDS, deadline=deadline, cancel_poll=CANCEL_POLL_SECONDS)
+
+    openai_duration = time.time() - openai_start
+    app.logger.debug(f"OpenAI call to '{target.name}' took: {openai_duration:.2f}s")
+
+    usage = extract_usage(response)
+    usage_stats.record(usage, openai_duration)
+    app.logger.debug(
+        f"Token usage: prompt={usage['prompt_tokens']} (cached={usage['cached_tokens']}), "
+        f"completion={usage['completion_tokens']}"
+    )
+
+    app.logger.debug(f"Received JSON response from agent model (finish_reason: {response.finish_reason})")
+
+    return response.content, response.finish_reason, usage, openai_duration, target.name
+
+def continue_truncated(messages, partial_content, usage, deadline):
+    """Continue a completion cut off by the token limit, stitching the fragments together.
+
+    Each round sends the output so far back with CONTINUE_PROMPT and joins the continuation
+    to it (partial_json.stitch). Stops when a round finishes, after CONTINUATION_MAX_ROUNDS
+    rounds or CONTINUATION_MAX_TOKENS completion tokens, or when the deadline leaves too
+    little time. Returns the content, last finish reason, summed usage, time spent and rounds.
+    """
+    finish_reason = 'length'
+    duration = 0.0
+    rounds = 0
+    while finish_reason == 'length' and rounds < CONTINUATION_MAX_ROUNDS:
+        tokens_left = CONTINUATION_MAX_TOKENS - usage['completion_tokens']
+        if tokens_left <= 0 or deadline.remaining() < MIN_COMPLETION_SECONDS:
+            break
+        continuation_messages = messages + [
+            {"role": "assistant", "content": partial_content},
+            {"role": "user", "content": CONTINUE_PROMPT}
+        ]
+        fragment, finish_reason, round_usage, round_duration, _ = call_agent(
+            continuation_messages, completion_budget(deadline), deadline, json_mode=False, max_tokens=tokens_left
+        )
+        partial_content = stitch(partial_content, fragment)
+        usage = {key: usage[key] + round_usage[key] for key in usage}
+        duration += round_duration
+        rounds += 1
+        app.logger.debug(f"Continuation round {rounds}: +{round_usage['completion_tokens']} tokens (finish_reason: {finish_reason})")
+    return partial_content, finish_reason, usage, duration, rounds
+
+def completion_budget(deadline):
+    """Seconds the next completion may take, or BudgetExhausted if the deadline leaves too little"""
+    remaining = deadline.remaining()
+    if remaining < MIN_COMPLETION_SECONDS:
+        raise BudgetExhausted(f"Only {remaining:.1f}s left of the request deadline for the completion")
+    return min(COMPLETION_TIMEOUT_SECONDS, remaining)
+
+def parse_agent_response(model_response_content):
+    """Extract main.bicep, the plan, the warnings and parameters.json from the agent's JSON.
+
+    Compact responses are expanded to the full structure first. A response that is still
+    cut off is closed by the tolerant parser and gets a warning. The plan is None when the
+    response is not valid JSON even then.
+    """
+    try:
+        response_data, complete = loads_tolerant(model_response_content)
+        if not isinstance(response_data, dict):
+            raise ValueError(f"expected a JSON object, got {type(response_data).__name__}")
+        app.logger.debug(f"Successfully parsed JSON response")
+    except ValueError as e:
+        app.logger.error(f"Failed to parse model's JSON response: {e}", exc_info=True)
+        app.logger.error(f"Raw response: {model_response_content[:500]}")
+        return f"# ERROR: Model returned invalid JSON\n# {str(e)}", None, [], None
+
+    if not complete:
+        app.logger.warning("Model response was cut off; closed it with the tolerant parser")
+
+    if is_compact(response_data):
+        response_data = expand_compact_response(response_data)
+
+    # Extract the Bicep code from the JSON structure
+    generated_bicep = ""
+    parameters = None
+    files = response_data.get("files", [])
+
+    for file_obj in files:
+        if isinstance(file_obj, dict):
+            if file_obj.get("path") == "main.bicep" and not generated_bicep:
+                generated_bicep = file_obj.get("content", "")
+            elif file_obj.get("path") == "parameters.json":
+                parameters = file_obj.get("content")
+        elif isinstance(file_obj, str):
+            app.logger.warning(f"Unexpected string in files array: {file_obj[:100]}")
+            continue
+
+    if not generated_bicep:
+        app.logger.error("Model response did not contain a 'main.bicep' file")
+        app.logger.error(f"Files structure: {files}")
+        generated_bicep = "# ERROR: Model did not generate a main.bicep file."
+
+    plan = response_data.get("plan", {})
+    warnings = response_data.get("warnings") or []
+    if not complete:
+        warnings = list(warnings) + [TRUNCATED_WARNING]
+    app.logger.debug(f"Plan: {plan}")
+
+    return generated_bicep, plan, list(warnings), parameters
+
+def build_correction_prompt(grounding_warnings):
+    """Ask the agent to fix the references the grounding check rejected"""
+    issues = "\n".join(f"- {warning}" for warning in grounding_warnings)
+    return (
+        "The Bicep you generated references modules, versions, parameters or properties that do not exist "
+        f"in the context documents:\n{issues}\n\n"
+        "Fix these issues using only the Module IDs, parameters and properties from the context documents, "
+        "and return the complete JSON object again in the same format."
+    )
+
+def build_edit_correction_prompt(failures):
+    """Ask the agent to redo the refinement edits that could not be applied"""
+    issues = "\n".join(f"- {failure}" for failure in failures)
+    return (
+        f"Some of your edits could not be applied to the current main.bicep:\n{issues}\n\n"
+        "Return all the edits again in the same JSON format. Copy each find text exactly from the current "
+        "main.bicep, with enough surrounding lines to make it unique."
+    )
+
+def apply_refinement(current_bicep, model_response_content):
+    """The patched Bicep, the number of edits, the edits that did not apply and the agent's warnings"""
+    try:
+        edits, replacement, warnings = parse_edits(model_response_content)
+    except ValueError as e:
+        return current_bicep, 0, [f"The response was not valid JSON: {e}"], []
+    if replacement is not None:
+        return replacement, 0, [], warnings
+    if not edits:
+        return current_bicep, 0, [], warnings + ["The agent made no changes to the template."]
+    bicep, failures = apply_edits(current_bicep, edits)
+    return bicep, len(edits), failures, warnings
+
+def resources_by_phrase(retrieval, mode, phrases=None):
+    """The document ids of each search, keyed by its phrase in `phrases` or the searched text without the mode suffix"""
+    suffix = SEARCH_MODES[mode]['query_suffix']
+    phrases = phrases or {}
+    return {
+        phrases.get(text) or (text[:-len(suffix)] if suffix and text.endswith(suffix) else text): ids
+        for text, ids in retrieval.get('by_query', {}).items()
+    }
+
+def format_sse(event, event_id=None):
+    """Serialize one event as a Server-Sent Events frame"""
+    if event_id is None:
+        return f"data: {json.dumps(event)}\n\n"
+    return f"id: {event_id}\ndata: {json.dumps(event)}\n\n"
+
+def generate_events(user_query, search_filter=None, sub_queries=None, request_id=None, mode=None, debug_content=False, deadline=None, session=None, snapshot=None, search_plan=None):
+    """Run search and generation for one mode, yielding progress/debug/complete/error events.
+
+    Emits one structured log record for the request when it finishes. The retrieved context is
+    only sent to the client when `debug_content` is set, and is capped at DEBUG_CONTENT_MAX_CHARS.
+    Every phase is bounded by `deadline` (a new REQUEST_DEADLINE_SECONDS one if not given), and
+    stops with a `cancelled` event once the deadline is cancelled. The result and its documents
+    are committed to the refinement `session`, if given. The whole request uses one grounding
+    `snapshot`, so a reload while it runs does not change its data. With a `search_plan`,
+    retrieval uses its search texts and per-search filters.
+    """
+    entities = search_plan.entities if search_plan else None
+    request_log = RequestLog(request_id or '-', mode=mode, query=user_query, filter=widen_filter(search_filter), sub_queries=sub_queries or [], entities=entities)
+    deadline = deadline or Deadline(REQUEST_DEADLINE_SECONDS)
+    snapshot = snapshot or snapshots.current
+    grounding_index = snapshot.grounding_index
+
     try:
         start_time = time.time()
+        deadline.raise_if_cancelled('queued')
 
-        yield f"data: {json.dumps({'status': 'progress', 'message': '🔍 Validating request...'})}\n\n"
+        yield {'status': 'progress', 'message': '🔍 Validating request...'}
         time.sleep(0.1)
 
         if not AZURE_ENABLED:
-            yield f"data: {json.dumps({'status': 'progress', 'message': '⚠️ Running in local development mode...'})}\n\n"
+            yield {'status': 'progress', 'message': '⚠️ Running in local development mode...'}
             time.sleep(0.5)
 
             dummy_bicep = f"""// Local development mode - Azure services not configured
@@ -145,158 +664,510 @@ resource storageAccount 'Microsoft.Storage/storageAccounts@2023-01-01' = {{
 
 output storageAccountId string = storageAccount.id
 """
-            yield f"data: {json.dumps({'status': 'complete', 'bicep': dummy_bicep})}\n\n"
+            yield {'status': 'complete', 'bicep': dummy_bicep}
+            request_log.update(outcome='local')
+            request_log.emit(app.logger)
             return
 
         # Perform Azure AI Search to retrieve relevant context
-        yield f"data: {json.dumps({'status': 'progress', 'message': '🔎 Searching Azure AI Search for relevant context...'})}\n\n"
-        app.logger.info(f"Performing AI Search with text: {user_query}")
-        app.logger.info(f"Using search filter: {search_filter}")
+        if sub_queries:
+            yield {'status': 'progress', 'message': f'🔎 Searching Azure AI Search for {len(sub_queries)} resources in parallel...'}
+        else:
+            yield {'status': 'progress', 'message': '🔎 Searching Azure AI Search for relevant context...'}
+        app.logger.debug(f"Performing AI Search with text: {user_query}")
+        app.logger.debug(f"Using search filter: {search_filter}")
 
         search_start = time.time()
 
-        search_results = search_client.search(
-            search_text=user_query,
-            filter=search_filter,
-            top=3,
-            query_type="semantic",
-            semantic_configuration_name='avm-semantic-config',
-            select=["content"],
-            vector_queries=[{
-                "kind": "text",
-                "text": user_query,
-                "k": 5,
-                "fields": "vector"
-            }]
-        )
+        search_budget = deadline.share(SEARCH_BUDGET_SHARE, cap=SEARCH_TIMEOUT_SECONDS)
+        if search_plan is not None:
+            documents, retrieval = retrieve_with_budget(search_plan.search_query, search_filter, sub_queries, search_budget, deadline, snapshot, search_plan.sub_filters)
+        else:
+            documents, retrieval = retrieve_with_budget(user_query, search_filter, sub_queries, search_budget, deadline, snapshot)
 
         search_end = time.time()
         search_duration = search_end - search_start
-        app.logger.info(f"Search took: {search_duration:.2f}s")
+        request_log.timing('search', search_duration)
+        budget_info = {
+            'deadline': f"{deadline.seconds:.0f}s",
+            'search_budget': f"{search_budget:.2f}s",
+            'retrieval': retrieval['source'],
+            'fallbacks': retrieval['fallbacks']
+        }
 
-        # Extract and format the retrieved content
-        yield f"data: {json.dumps({'status': 'progress', 'message': '📚 Processing search results...'})}\n\n"
+        if retrieval['fallbacks']:
+            request_log.update(retrieval=retrieval['source'], fallbacks=len(retrieval['fallbacks']))
+            yield {'status': 'progress', 'message': '⚠️ Search is slow or unavailable, using cached/local context...'}
 
-        retrieved_content = ""
-        result_count = 0
-        total_context_chars = 0
+        # Extract and format the retrieved content
+        yield {'status': 'progress', 'message': '📚 Processing search results...'}
 
-        for result in search_results:
-            result_count += 1
-            content = result.get('content', 'No content available')
-            retrieved_content += f"--- Context {result_count} ---\n{content}\n\n"
-            total_context_chars += len(content)
+        total_context_chars = sum(len(doc['content']) for doc in documents)
+        result_count = len(documents)
+        retrieved_content = format_context(documents, grounding_index.shared_definitions if grounding_index else None)
+        context_tokens = count_tokens(retrieved_content)
+        request_log.update(result_count=result_count, context_chars=total_context_chars, context_tokens=context_tokens)
 
-        # If no results found, set a default message
+        # If no results found, the context block falls back to a default message
         if result_count == 0:
-            retrieved_content = "No relevant context found."
             app.logger.warning("No search results found for the query")
-            yield f"data: {json.dumps({'status': 'progress', 'message': '⚠️ No relevant context found, proceeding anyway...'})}\n\n"
+            yield {'status': 'progress', 'message': '⚠️ No relevant context found, proceeding anyway...'}
         else:
-            app.logger.info(f"Retrieved {result_count} context documents from AI Search")
-            app.logger.info(f"Total context size: {total_context_chars} characters (~{total_context_chars // 4} tokens)")
-            yield f"data: {json.dumps({'status': 'progress', 'message': f'✅ Found {result_count} relevant document(s)'})}\n\n"
+            app.logger.debug(f"Retrieved {result_count} context documents from AI Search")
+            yield {'status': 'progress', 'message': f'✅ Found {result_count} relevant document(s)'}
 
-        app.logger.info("--- Retrieved Context ---")
-        app.logger.info(f"Context preview (first 500 chars): {retrieved_content[:500]}...")
-        app.logger.info("--- End Retrieved Context ---")
+        # Context dumps are large, so only a sample of requests log them
+        if should_sample(LOG_CONTEXT_SAMPLE_RATE):
+            request_log.update(context_preview=retrieved_content[:500])
 
-        # Construct the augmented prompt for the agent
-        agent_user_prompt = f"""User Request: "{user_query}"
-
-{retrieved_content}"""
+        # Construct the messages for the agent: system message, then context, then the query,
+        # so everything up to the query is a reusable prefix for prompt caching
+        messages = build_agent_messages(user_query, retrieved_content, AGENT_OUTPUT_CONTRACT)
 
         # Call Azure OpenAI with the context from AI Search
-        yield f"data: {json.dumps({'status': 'progress', 'message': '🤖 Generating Bicep code with Azure OpenAI agent...'})}\n\n"
-        app.logger.info(f"Calling Azure OpenAI agent to generate Bicep code...")
-        app.logger.info(f"Agent prompt length: {len(agent_user_prompt)} characters (~{len(agent_user_prompt) // 4} tokens)")
-
-        openai_start = time.time()
-
-        response = openai_client.chat.completions.create(
-            model=OPENAI_DEPLOYMENT_NAME,
-            messages=[
-                {"role": "system", "content": AGENT_SYSTEM_MESSAGE},
-                {"role": "user", "content": agent_user_prompt}
-            ],
-            response_format={"type": "json_object"},
-            temperature=0.1,
-            timeout=60.0
-        )
-
-        openai_end = time.time()
-        openai_duration = openai_end - openai_start
-        app.logger.info(f"OpenAI call took: {openai_duration:.2f}s")
-
-        # Parse the JSON response from the model
-        model_response_content = response.choices[0].message.content
-        finish_reason = response.choices[0].finish_reason
+        yield {'status': 'progress', 'message': '🤖 Generating Bicep code with Azure OpenAI agent...'}
+        app.logger.debug(f"Agent prompt length: {len(messages[-1]['content'])} characters, context {context_tokens} tokens")
 
-        app.logger.info(f"Received JSON response from agent model (finish_reason: {finish_reason})")
+        deadline.raise_if_cancelled('search')
+        completion_timeout = completion_budget(deadline)
+        budget_info['completion_budget'] = f"{completion_timeout:.2f}s"
+        model_response_content, finish_reason, usage, openai_duration, deployment = call_agent(messages, completion_timeout, deadline)
+        request_log.timing('completion', openai_duration)
+        request_log.update(finish_reason=finish_reason, deployment=deployment)
 
-        # Check if response was truncated due to token limits
+        # A response cut off by the token limit is continued rather than failing to parse
         if finish_reason == 'length':
-            app.logger.warning("⚠️ Model response was truncated due to token limit!")
-            yield f"data: {json.dumps({'status': 'progress', 'message': '⚠️ Response may be incomplete due to length...'})}\n\n"
-
-        try:
-            response_data = json.loads(model_response_content)
-            app.logger.info(f"Successfully parsed JSON response")
-
-            # Extract the Bicep code from the JSON structure
-            generated_bicep = ""
-            files = response_data.get("files", [])
-
-            for file_obj in files:
-                if isinstance(file_obj, dict):
-                    if file_obj.get("path") == "main.bicep":
-                        generated_bicep = file_obj.get("content", "")
-                        break
-                elif isinstance(file_obj, str):
-                    app.logger.warning(f"Unexpected string in files array: {file_obj[:100]}")
-                    continue
-
-            if not generated_bicep:
-                app.logger.error("Model response did not contain a 'main.bicep' file")
-                app.logger.error(f"Files structure: {files}")
-                generated_bicep = "# ERROR: Model did not generate a main.bicep file."
-
-            plan = response_data.get("plan", {})
-            warnings = response_data.get("warnings", [])
-            app.logger.info(f"Plan: {plan}")
-            if warnings:
-                app.logger.info(f"Warnings: {warnings}")
-
-        except json.JSONDecodeError as e:
-            app.logger.error(f"Failed to parse model's JSON response: {e}", exc_info=True)
-            app.logger.error(f"Raw response: {model_response_content[:500]}")
-            generated_bicep = f"# ERROR: Model returned invalid JSON\n# {str(e)}"
-
-        app.logger.info('Successfully generated Bicep code')
+            app.logger.warning("⚠️ Model response was truncated due to token limit, continuing")
+            yield {'status': 'progress', 'message': '⏩ Response hit the token limit, continuing where it stopped...'}
+            model_response_content, finish_reason, usage, continuation_duration, rounds = continue_truncated(messages, model_response_content, usage, deadline)
+            openai_duration += continuation_duration
+            request_log.timing('continuation', continuation_duration)
+            request_log.update(finish_reason=finish_reason, continuation_rounds=rounds)
+            budget_info['continuation_rounds'] = rounds
+            if finish_reason == 'length':
+                yield {'status': 'progress', 'message': '⚠️ Response may be incomplete due to length...'}
+
+        generated_bicep, plan, warnings, parameters = parse_agent_response(model_response_content)
+
+        # Check the generated module/resource references against the grounding corpus
+        verify_start = time.perf_counter()
+        grounding_warnings = grounding_index.verify(generated_bicep) if grounding_index else []
+        verify_duration = time.perf_counter() - verify_start
+        request_log.timing('verify', verify_duration)
+
+        retry_skipped = bool(grounding_warnings and GROUNDING_RETRY and plan is not None and deadline.remaining() < MIN_COMPLETION_SECONDS)
+        if retry_skipped:
+            app.logger.debug("Skipping the grounding retry, not enough of the request deadline left")
+            budget_info['retry_skipped'] = True
+
+        if grounding_warnings and GROUNDING_RETRY and plan is not None and not retry_skipped:
+            app.logger.debug(f"Grounding check found {len(grounding_warnings)} issue(s), retrying with corrections")
+            yield {'status': 'progress', 'message': f'🔁 Correcting {len(grounding_warnings)} ungrounded reference(s)...'}
+
+            retry_messages = messages + [
+                {"role": "assistant", "content": model_response_content},
+                {"role": "user", "content": build_correction_prompt(grounding_warnings)}
+            ]
+            retry_content, _, retry_usage, retry_duration, _ = call_agent(retry_messages, completion_budget(deadline), deadline)
+            retry_bicep, retry_plan, retry_warnings, retry_parameters = parse_agent_response(retry_content)
+            retry_grounding_warnings = grounding_index.verify(retry_bicep)
+
+            openai_duration += retry_duration
+            request_log.timing('completion_retry', retry_duration)
+            usage = {key: usage[key] + retry_usage[key] for key in usage}
+
+            if retry_plan is not None and len(retry_grounding_warnings) < len(grounding_warnings):
+                generated_bicep, plan, warnings, parameters = retry_bicep, retry_plan, retry_warnings, retry_parameters
+                grounding_warnings = retry_grounding_warnings
+
+        warnings = warnings + grounding_warnings
         total_time = time.time() - start_time
-        app.logger.info(f"Total request time: {total_time:.2f}s")
 
         debug_info = {
             'search_time': f"{search_duration:.2f}s" if 'search_duration' in locals() else 'N/A',
             'ai_time': f"{openai_duration:.2f}s" if 'openai_duration' in locals() else 'N/A',
             'total_time': f"{total_time:.2f}s",
             'result_count': result_count if 'result_count' in locals() else 0,
-            'context_size': f"{total_context_chars} chars (~{total_context_chars // 4} tokens)" if 'total_context_chars' in locals() else 'N/A',
-            'search_content': retrieved_content if 'retrieved_content' in locals() else 'N/A'
+            'context_size': f"{total_context_chars} chars ({context_tokens} tokens)" if 'context_tokens' in locals() else 'N/A',
+            'search_content': retrieved_content[:DEBUG_CONTENT_MAX_CHARS] if debug_content else 'Not requested',
+            'usage': usage if 'usage' in locals() else 'N/A',
+            'sub_queries': sub_queries or [],
+            'entities': entities,
+            'verify_time': f"{verify_duration * 1000:.3f}ms" if 'verify_duration' in locals() else 'N/A',
+            'budget': dict(
+                budget_info,
+                remaining=f"{deadline.remaining():.2f}s",
+                breakers={'search': search_breaker.state, 'openai': openai_router.state()},
+                deployment=deployment
+            )
         }
 
-        yield f"data: {json.dumps({'status': 'debug', 'debug': debug_info})}\n\n"
-        yield f"data: {json.dumps({'status': 'complete', 'bicep': generated_bicep})}\n\n"
+        if session is not None and plan is not None:
+            session.commit(generated_bicep, documents, resources_by_phrase(retrieval, mode, search_plan.phrases if search_plan else None))
+
+        yield {'status': 'debug', 'debug': debug_info}
+        yield {'status': 'complete', 'bicep': generated_bicep, 'parameters': parameters, 'warnings': warnings}
+
+        request_log.update(outcome='complete', usage=usage, plan=plan, warnings=warnings, contract=AGENT_OUTPUT_CONTRACT)
+        request_log.emit(app.logger)
 
     except TimeoutError as e:
         app.logger.error(f"Timeout during generation: {e}", exc_info=True)
+        request_log.update(outcome='timeout')
+        request_log.emit(app.logger, level=logging.ERROR)
+
+        yield {'status': 'error', 'error': 'The request timed out. The query may be too complex or the service is experiencing high load. Please try simplifying your request or try again later.'}
+
+    except RequestCancelled as e:
+        tokens_saved = usage_stats.record_cancelled(e.phase, e.generated_tokens)
+        request_log.update(outcome='cancelled', cancelled_phase=e.phase, generated_tokens=e.generated_tokens, estimated_tokens_saved=tokens_saved)
+        request_log.emit(app.logger)
+
+        yield {'status': 'cancelled', 'phase': e.phase}
 
-        yield f"data: {json.dumps({'status': 'error', 'error': 'The request timed out. The query may be too complex or the service is experiencing high load. Please try simplifying your request or try again later.'})}\n\n"
+    except CircuitOpenError as e:
+        app.logger.warning(f"Skipping generation: {e}")
+        request_log.update(outcome='unavailable')
+        request_log.emit(app.logger, level=logging.WARNING)
+
+        yield {'status': 'error', 'error': 'The generation service is temporarily unavailable after repeated failures. Please try again in a minute.'}
 
     except Exception as e:
         app.logger.error(f"Error during generation: {e}", exc_info=True)
+        request_log.update(outcome='error', error=str(e))
+        request_log.emit(app.logger, level=logging.ERROR)
+
+        yield {'status': 'error', 'error': 'An error occurred while generating the Bicep template. Please try again or contact support if the problem persists.'}
+
+def generate_fast_path_events(user_query, match, request_id=None, session=None, snapshot=None):
+    """Answer a prompt from the README example it matched, without search or the model"""
+    request_log = RequestLog(request_id or '-', mode='avm', query=user_query, fast_path=match.as_dict())
+    grounding_index = (snapshot or snapshots.current).grounding_index
+    start_time = time.perf_counter()
+
+    yield {'status': 'progress', 'message': f'⚡ Using the {match.example.title} README example...'}
+
+    generated_bicep, parameters, warnings = render_example(match.example)
+    render_duration = time.perf_counter() - start_time
+    grounding_warnings = grounding_index.verify(generated_bicep) if grounding_index else []
+    warnings = warnings + grounding_warnings
+    total_time = time.perf_counter() - start_time
+    request_log.timing('render', render_duration)
+    if session is not None:
+        session.commit(generated_bicep)
+
+    yield {'status': 'debug', 'debug': {
+        'search_time': 'skipped (fast path)',
+        'ai_time': 'skipped (fast path)',
+        'total_time': f"{total_time * 1000:.2f}ms",
+        'result_count': 0,
+        'context_size': 'N/A',
+        'search_content': 'Not requested',
+        'usage': 'N/A',
+        'sub_queries': [],
+        'fast_path': dict(match.as_dict(), render_time=f"{render_duration * 1000:.3f}ms")
+    }}
+    yield {'status': 'complete', 'bicep': generated_bicep, 'parameters': parameters, 'warnings': warnings}
+
+    request_log.update(outcome='fast_path', warnings=warnings)
+    request_log.emit(app.logger)
+
+def generate_refinement_events(session, change_request, request_id=None, debug_content=False, deadline=None, snapshot=None):
+    """Apply a follow-up to a session's template, yielding progress/debug/complete/error events.
+
+    Only the resources the follow-up adds are searched, and the stored documents of the ones it
+    mentions are reused. The agent answers with edits to the current Bicep (refinement.py),
+    which are applied here; one correction round is allowed when an edit does not apply.
+    """
+    request_log = RequestLog(request_id or '-', mode=session.mode, query=change_request, session_id=session.session_id, turn=session.turns)
+    deadline = deadline or Deadline(REQUEST_DEADLINE_SECONDS)
+    search_mode = SEARCH_MODES[session.mode]
+    snapshot = snapshot or snapshots.current
+    grounding_index = snapshot.grounding_index
 
-        yield f"data: {json.dumps({'status': 'error', 'error': 'An error occurred while generating the Bicep template. Please try again or contact support if the problem persists.'})}\n\n"
+    try:
+        start_time = time.time()
+        deadline.raise_if_cancelled('queued')
+        current_bicep = session.bicep
+
+        yield {'status': 'progress', 'message': '✏️ Refining the current template...'}
+
+        reused = reused_documents(change_request, session)
+        phrases = new_resource_phrases(change_request, session, snapshot.entity_index.names_resource)
+        new_documents, retrieval, search_duration = [], {}, 0.0
+        if phrases:
+            yield {'status': 'progress', 'message': f'🔎 Searching Azure AI Search for {len(phrases)} new resource(s)...'}
+            queries = [phrase + search_mode['query_suffix'] for phrase in phrases]
+            search_start = time.time()
+            search_budget = deadline.share(SEARCH_BUDGET_SHARE, cap=SEARCH_TIMEOUT_SECONDS)
+            new_documents, retrieval = retrieve_with_budget(queries[0], search_mode['filter'], queries[1:] or None, search_budget, deadline, snapshot)
+            search_duration = time.time() - search_start
+            request_log.timing('search', search_duration)
+            if retrieval['fallbacks']:
+                request_log.update(retrieval=retrieval['source'], fallbacks=len(retrieval['fallbacks']))
+                yield {'status': 'progress', 'message': '⚠️ Search is slow or unavailable, using cached/local context...'}
+
+        documents = merge_documents([reused, new_documents], MAX_CONTEXT_TOKENS, count_tokens)
+        total_context_chars = sum(len(doc['content']) for doc in documents)
+        retrieved_content = format_context(documents, grounding_index.shared_definitions if grounding_index else None)
+        context_tokens = count_tokens(retrieved_content)
+        request_log.update(reused_documents=len(reused), new_searches=phrases, result_count=len(documents), context_chars=total_context_chars, context_tokens=context_tokens)
+
+        messages = build_refinement_messages(session.prompt, current_bicep, change_request, retrieved_content)
+
+        yield {'status': 'progress', 'message': '🤖 Asking the agent for the changes...'}
+        deadline.raise_if_cancelled('search')
+        model_response_content, finish_reason, usage, openai_duration, deployment = call_agent(messages, completion_budget(deadline), deadline)
+        request_log.timing('completion', openai_duration)
+        request_log.update(finish_reason=finish_reason, deployment=deployment)
+        if finish_reason == 'length':
+            yield {'status': 'progress', 'message': '⏩ Response hit the token limit, continuing where it stopped...'}
+            model_response_content, finish_reason, usage, continuation_duration, rounds = continue_truncated(messages, model_response_content, usage, deadline)
+            openai_duration += continuation_duration
+            request_log.timing('continuation', continuation_duration)
+            request_log.update(finish_reason=finish_reason, continuation_rounds=rounds)
+
+        generated_bicep, edit_count, failures, warnings = apply_refinement(current_bicep, model_response_content)
+        first_failures = len(failures)
+        if failures and deadline.remaining() >= MIN_COMPLETION_SECONDS:
+            app.logger.debug(f"{len(failures)} refinement edit(s) did not apply, retrying: {failures}")
+            yield {'status': 'progress', 'message': f'🔁 Retrying {len(failures)} edit(s) that did not apply...'}
+
+            retry_messages = messages + [
+                {"role": "assistant", "content": model_response_content},
+                {"role": "user", "content": build_edit_correction_prompt(failures)}
+            ]
+            retry_content, _, retry_usage, retry_duration, _ = call_agent(retry_messages, completion_budget(deadline), deadline)
+            openai_duration += retry_duration
+            request_log.timing('completion_retry', retry_duration)
+            usage = {key: usage[key] + retry_usage[key] for key in usage}
+            generated_bicep, edit_count, failures, warnings = apply_refinement(current_bicep, retry_content)
+
+        if failures:
+            app.logger.warning(f"Refinement edits did not apply: {failures}")
+            request_log.update(outcome='edit_failed', usage=usage, failures=failures)
+            request_log.emit(app.logger, level=logging.WARNING)
+            yield {'status': 'error', 'error': 'The requested change could not be applied to the template. Please rephrase it or generate the template again.'}
+            return
+
+        verify_start = time.perf_counter()
+        grounding_warnings = grounding_index.verify(generated_bicep) if grounding_index else []
+        verify_duration = time.perf_counter() - verify_start
+        request_log.timing('verify', verify_duration)
+        warnings = warnings + grounding_warnings
+        parameters = derive_parameters_json(generated_bicep)
+
+        session.commit(generated_bicep, new_documents, resources_by_phrase(retrieval, session.mode))
+
+        yield {'status': 'debug', 'debug': {
+            'search_time': f"{search_duration:.2f}s" if phrases else 'skipped (no new resources)',
+            'ai_time': f"{openai_duration:.2f}s",
+            'total_time': f"{time.time() - start_time:.2f}s",
+            'result_count': len(documents),
+            'context_size': f"{total_context_chars} chars ({context_tokens} tokens)",
+            'search_content': retrieved_content[:DEBUG_CONTENT_MAX_CHARS] if debug_content else 'Not requested',
+            'usage': usage,
+            'sub_queries': phrases,
+            'verify_time': f"{verify_duration * 1000:.3f}ms",
+            'refinement': {
+                'session_id': session.session_id,
+                'turn': session.turns,
+                'reused_documents': len(reused),
+                'new_documents': len(new_documents),
+                'edits': edit_count,
+                'edits_retried': first_failures,
+                'deployment': deployment
+            }
+        }}
+        yield {'status': 'complete', 'bicep': generated_bicep, 'parameters': parameters, 'warnings': warnings, 'edits': edit_count}
+
+        request_log.update(outcome='complete', usage=usage, edits=edit_count, warnings=warnings)
+        request_log.emit(app.logger)
+
+    except RequestCancelled as e:
+        tokens_saved = usage_stats.record_cancelled(e.phase, e.generated_tokens)
+        request_log.update(outcome='cancelled', cancelled_phase=e.phase, generated_tokens=e.generated_tokens, estimated_tokens_saved=tokens_saved)
+        request_log.emit(app.logger)
+
+        yield {'status': 'cancelled', 'phase': e.phase}
+
+    except TimeoutError as e:
+        app.logger.error(f"Timeout during refinement: {e}", exc_info=True)
+        request_log.update(outcome='timeout')
+        request_log.emit(app.logger, level=logging.ERROR)
+
+        yield {'status': 'error', 'error': 'The request timed out. The service may be experiencing high load. Please try again later.'}
+
+    except CircuitOpenError as e:
+        app.logger.warning(f"Skipping refinement: {e}")
+        request_log.update(outcome='unavailable')
+        request_log.emit(app.logger, level=logging.WARNING)
+
+        yield {'status': 'error', 'error': 'The generation service is temporarily unavailable after repeated failures. Please try again in a minute.'}
+
+    except Exception as e:
+        app.logger.error(f"Error during refinement: {e}", exc_info=True)
+        request_log.update(outcome='error', error=str(e))
+        request_log.emit(app.logger, level=logging.ERROR)
+
+        yield {'status': 'error', 'error': 'An error occurred while refining the Bicep template. Please try again or contact support if the problem persists.'}
+
+    finally:
+        session.release()
+
+def generate_compare_events(variants, request_id=None, debug_content=False, deadline=None, snapshot=None, profile=None):
+    """Run the AVM and classic pipelines concurrently and interleave their events.
+
+    Every event is tagged with its `variant` so the client can route it to the right tab.
+    """
+    events = queue.Queue()
+
+    def run_variant(variant, plan):
+        if profile is not None:
+            profile.enter(f'compare:{variant}')
+        try:
+            for event in generate_events(
+                plan.query, plan.filter, plan.sub_queries, request_id, variant, debug_content, deadline,
+                snapshot=snapshot, search_plan=plan
+            ):
+                events.put(dict(event, variant=variant))
+        finally:
+            if profile is not None:
+                profile.exit()
+            events.put(None)
+
+    for variant_args in variants:
+        compare_executor.submit(run_variant, *variant_args)
+
+    remaining = len(variants)
+    while remaining:
+        event = events.get()
+        if event is None:
+            remaining -= 1
+            continue
+        yield event
+
+def run_generation(entry, events, profile=None):
+    """Drain a pipeline's events into the result store, independently of any connected client"""
+    if profile is not None:
+        profile.enter('generate')
+    try:
+        for event in events:
+            entry.append(event)
+    except Exception as e:
+        app.logger.error(f"[{entry.request_id}] Generation failed: {e}", exc_info=True)
+        entry.append({'status': 'error', 'error': 'An error occurred while generating the Bicep template. Please try again or contact support if the problem persists.'})
+    finally:
+        entry.finish()
+        if profile is not None:
+            profile.exit()
+
+def cancel_if_detached(entry):
+    if entry.cancel(only_if_detached=True):
+        app.logger.info(f"[{entry.request_id}] Client disconnected, cancelling generation")
+
+def generate_stream(entry, last_event_id=-1, profile=None):
+    """Stream a request's stored events as SSE frames, starting after `last_event_id`.
+
+    The server closes the generator when the client disconnects. If that was the last client
+    and the pipeline is still running, it is cancelled after CANCEL_GRACE_SECONDS unless the
+    client resumes from GET /stream/<request_id> first. A `profile` samples this thread too,
+    which covers encoding the frames and writing them to the client.
+    """
+    entry.attach()
+    if profile is not None:
+        profile.enter('sse')
+    try:
+        for item in tail(entry, last_event_id, keepalive=SSE_KEEPALIVE_SECONDS):
+            if item is None:
+                yield ": keepalive\n\n"
+                continue
+            event_id, event = item
+            yield format_sse(event, event_id)
+    finally:
+        if profile is not None:
+            profile.exit()
+        if entry.detach() == 0 and not entry.done and CANCEL_ON_DISCONNECT:
+            timer = threading.Timer(CANCEL_GRACE_SECONDS, cancel_if_detached, (entry,))
+            timer.daemon = True
+            timer.start()
+
+def sse_response(entry, last_event_id=-1, profile=None):
+    headers = {
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',
+        'X-Request-ID': entry.request_id
+    }
+    if profile is not None:
+        headers['X-Profile'] = profile.reason
+    return Response(
+        generate_stream(entry, last_event_id, profile),
+        mimetype='text/event-stream',
+        headers=headers
+    )
+
+def is_admin():
+    """Whether the request carries the ADMIN_TOKEN in its X-Admin-Token header"""
+    token = request.headers.get('X-Admin-Token', '')
+    return bool(ADMIN_TOKEN) and hmac.compare_digest(token.encode('utf-8'), ADMIN_TOKEN.encode('utf-8'))
+
+def start_profile(request_id):
+    """A profile for this request if an admin asked for one or it was sampled, else None
+
+    It expects the generation worker and the SSE response thread, so it runs until both are done
+    whichever of them finishes first.
+    """
+    if not ADMIN_TOKEN:
+        return None
+    if request.headers.get('X-Profile') == '1' and is_admin():
+        reason = 'requested'
+    elif should_sample(PROFILE_SAMPLE_RATE):
+        reason = 'sampled'
+    else:
+        return None
+    app.logger.info(f"[{request_id}] Profiling request ({reason})")
+    return profiler.start(request_id, reason, expected=('generate', 'sse'))
+
+# `query` is the prompt as the model sees it; `search_query` and `sub_queries` are the search texts,
+# and `phrases` maps each search text back to the prompt or resource phrase it was built from
+SearchPlan = namedtuple('SearchPlan', ['query', 'filter', 'sub_queries', 'sub_filters', 'search_query', 'phrases', 'entities'])
+
+def focus_search(text, mode, entity_index, narrow=True):
+    """Search text and filter for one search, and the resources it names (None if it names none).
+
+    A search that names resources is boosted with their module paths or resource types and,
+    when `narrow` is set and they have at most ENTITY_FILTER_MAX_IDS documents, filtered to
+    those documents instead of getting the mode's query suffix.
+    """
+    search_mode = SEARCH_MODES[mode]
+    focus = entity_index.focus(text, mode) if ENTITY_FILTERS_ENABLED else None
+    if focus is None:
+        return text + search_mode['query_suffix'], search_mode['filter'], None
+    boost = ' ' + ' '.join(focus.boost_terms)
+    if not narrow or len(focus.document_ids) > ENTITY_FILTER_MAX_IDS:
+        return text + search_mode['query_suffix'] + boost, search_mode['filter'], focus
+    return text + boost, narrow_filter(search_mode['filter'], focus.document_ids), focus
+
+def build_search_plan(user_query, mode, snapshot=None):
+    """Return the `SearchPlan` for a mode: the full-prompt search and one sub-query per resource.
+
+    The full-prompt search is only narrowed when every resource phrase named a known
+    resource, so a resource the entity index does not know still finds its documents.
+    """
+    entity_index = (snapshot or snapshots.current).entity_index
+    sub_queries, sub_filters, phrases = [], [], {}
+    all_known = True
+    for phrase in decompose_query(user_query, entity_index.names_resource):
+        text, phrase_filter, phrase_focus = focus_search(phrase, mode, entity_index)
+        sub_queries.append(text)
+        sub_filters.append(phrase_filter)
+        phrases[text] = phrase
+        all_known = all_known and phrase_focus is not None
+    search_query, search_filter, focus = focus_search(user_query, mode, entity_index, narrow=all_known)
+    phrases[search_query] = user_query
+    entities = dict(focus.as_dict(), narrowed=search_filter != SEARCH_MODES[mode]['filter']) if focus else None
+    query = user_query + SEARCH_MODES[mode]['query_suffix']
+    return SearchPlan(query, search_filter, sub_queries, sub_filters, search_query, phrases, entities)
 
 @app.route('/generate', methods=['POST'])
 @limiter.limit("5 per minute")
@@ -319,33 +1190,62 @@ def generate():
 
         mode = data.get('mode', 'avm')
 
-        if mode not in ['avm', 'classic']:
+        if mode not in ['avm', 'classic', 'compare']:
             app.logger.warning(f"Invalid mode received: {mode}, defaulting to 'avm'")
             mode = 'avm'
 
-        search_filter = None
-        augmented_user_query = user_query
-
-        if mode == 'avm':
-            search_filter = "search.ismatch('AVM Module', 'content')"
-            augmented_user_query += " avm"
+        app.logger.debug(f'[{request_id}] Mode: {mode}')
+
+        # Taken once: a grounding data reload while this request runs does not affect it
+        snapshot = snapshots.current
+
+        variants = []
+        for variant in (SEARCH_MODES if mode == 'compare' else [mode]):
+            plan = build_search_plan(user_query, variant, snapshot)
+            variants.append((variant, plan))
+
+            app.logger.debug(f'[{request_id}] [{variant}] Search filter: {plan.filter}')
+            app.logger.debug(f'[{request_id}] [{variant}] Augmented user query: {plan.query}')
+            app.logger.debug(f'[{request_id}] [{variant}] Search text: {plan.search_query}')
+            if plan.entities:
+                app.logger.debug(f'[{request_id}] [{variant}] Entities: {plan.entities}')
+            if plan.sub_queries:
+                app.logger.debug(f'[{request_id}] [{variant}] Resource sub-queries: {plan.sub_queries}')
+
+        debug_content = bool(data.get('debug')) or request.headers.get('X-Debug') == '1'
+
+        # Clients can opt out (e.g. to compare against the model's own answer)
+        fast_path_match = None
+        if mode == 'avm' and FAST_PATH_ENABLED and data.get('fast_path', True):
+            fast_path_match = snapshot.fast_path_index.match(user_query)
+            if fast_path_match:
+                app.logger.debug(f'[{request_id}] Fast path: {fast_path_match.as_dict()}')
+
+        # The pipeline runs in the background and writes to the result store, so a dropped
+        # connection can resume from GET /stream/<request_id> without regenerating.
+        # Cancelling the entry (client gone, POST /cancel) cancels the deadline.
+        entry = result_store.create(request_id)
+
+        # The deadline starts now, so time spent queued for a generation worker counts against it
+        deadline = Deadline(REQUEST_DEADLINE_SECONDS, entry.cancelled)
+
+        # A single-mode result can be refined with follow-ups; the request id doubles as the session id
+        session = session_store.create(request_id, mode, user_query) if mode != 'compare' else None
+        profile = start_profile(request_id)
+        if fast_path_match:
+            events = generate_fast_path_events(user_query, fast_path_match, request_id, session, snapshot)
+        elif mode == 'compare':
+            events = generate_compare_events(variants, request_id, debug_content, deadline, snapshot, profile)
         else:
-            search_filter = "search.ismatch('ARM Schema', 'content')"
-            augmented_user_query += " classic non-avm"
-
-        app.logger.info(f'[{request_id}] Search filter: {search_filter}')
-        app.logger.info(f'[{request_id}] Augmented user query: {augmented_user_query}')
-        app.logger.info(f'[{request_id}] Mode: {mode}')
-
-        return Response(
-            generate_stream(augmented_user_query, search_filter),
-            mimetype='text/event-stream',
-            headers={
-                'Cache-Control': 'no-cache',
-                'X-Accel-Buffering': 'no',
-                'X-Request-ID': request_id
-            }
-        )
+            plan = variants[0][1]
+            events = generate_events(
+                plan.query, plan.filter, plan.sub_queries, request_id=request_id, mode=mode, debug_content=debug_content,
+                deadline=deadline, session=session, snapshot=snapshot, search_plan=plan
+            )
+
+        generation_executor.submit(run_generation, entry, events, profile)
+
+        return sse_response(entry, profile=profile)
 
     except Exception as e:
         app.logger.error(f"Error during generation: {e}", exc_info=True)
@@ -354,6 +1254,173 @@ def generate():
             "error": "An error occurred while generating the Bicep template. Please try again or contact support if the problem persists."
         }), 500
 
+@app.route('/refine', methods=['POST'])
+@limiter.limit("5 per minute")
+def refine():
+    """Apply a follow-up to a previous generation's template, streaming progress like /generate"""
+    try:
+        request_id = str(uuid.uuid4())[:8]
+
+        data = request.get_json()
+
+        if not data:
+            app.logger.warning("Refinement received with no data")
+            return jsonify({"error": "No data provided"}), 400
+
+        change_request = data.get('prompt')
+        if not change_request:
+            app.logger.warning("Refinement received with empty prompt")
+            return jsonify({"error": "Prompt is required"}), 400
+
+        # Local development mode has neither search nor the agent to refine with
+        if not AZURE_ENABLED:
+            return jsonify({"error": "Refinement needs Azure OpenAI and Azure AI Search, which are not configured (local development mode)"}), 503
+
+        session = session_store.get(str(data.get('session_id') or ''))
+        if session is None:
+            return jsonify({"error": "Session not found or expired"}), 404
+        if session.bicep is None:
+            return jsonify({"error": "The session has no generated template to refine yet"}), 409
+        if not session.acquire():
+            return jsonify({"error": "A refinement of this session is already running"}), 409
+
+        # The pipeline releases the session when it ends, so release it here if it never gets queued
+        try:
+            app.logger.debug(f'[{request_id}] Refining session {session.session_id} (turn {session.turns}): {change_request}')
+            debug_content = bool(data.get('debug')) or request.headers.get('X-Debug') == '1'
+
+            entry = result_store.create(request_id)
+            deadline = Deadline(REQUEST_DEADLINE_SECONDS, entry.cancelled)
+            profile = start_profile(request_id)
+            events = generate_refinement_events(session, change_request, request_id, debug_content, deadline, snapshots.current)
+            generation_executor.submit(run_generation, entry, events, profile)
+        except Exception:
+            session.release()
+            raise
+
+        return sse_response(entry, profile=profile)
+
+    except Exception as e:
+        app.logger.error(f"Error during refinement: {e}", exc_info=True)
+
+        return jsonify({
+            "error": "An error occurred while refining the Bicep template. Please try again or contact support if the problem persists."
+        }), 500
+
+@app.route('/stream/<request_id>', methods=['GET'])
+def resume_stream(request_id):
+    """Resume a generation's event stream after the event given in the Last-Event-ID header"""
+    entry = result_store.get(request_id)
+    if entry is None:
+        return jsonify({"error": "Result not found or expired"}), 404
+
+    last_event_id = request.headers.get('Last-Event-ID', request.args.get('last_event_id', '-1'))
+    try:
+        last_event_id = int(last_event_id)
+    except ValueError:
+        return jsonify({"error": "Last-Event-ID must be an integer"}), 400
+
+    app.logger.info(f"[{request_id}] Client resumed stream after event {last_event_id}")
+    return sse_response(entry, last_event_id)
+
+@app.route('/cancel/<request_id>', methods=['POST'])
+def cancel_generation(request_id):
+    """Stop a running generation's search and completion, e.g. when the user starts another one"""
+    entry = result_store.get(request_id)
+    if entry is None:
+        return jsonify({"error": "Result not found or expired"}), 404
+
+    cancelled = entry.cancel()
+    if cancelled:
+        app.logger.info(f"[{request_id}] Generation cancelled by the client")
+    return jsonify({"request_id": request_id, "cancelled": cancelled}), 202 if cancelled else 200
+
+@app.route('/result/<request_id>', methods=['GET'])
+def get_result(request_id):
+    """Fetch a finished (or still running) generation without regenerating it"""
+    entry = result_store.get(request_id)
+    if entry is None:
+        return jsonify({"error": "Result not found or expired"}), 404
+
+    return jsonify(summarize(entry)), 200
+
+@app.route('/catalog', methods=['GET'])
+def list_catalog():
+    """List pre-generated templates, optionally filtered by a search query and mode"""
+    query = request.args.get('q', '')
+    mode = request.args.get('mode') or None
+    if mode is not None and mode not in SEARCH_MODES:
+        return jsonify({"error": f"Unknown mode '{mode}'"}), 400
+
+    entries = snapshots.current.template_catalog.search(query, mode)
+    return jsonify({
+        "count": len(entries),
+        "templates": [
+            {"key": e["key"], "title": e.get("title"), "mode": e.get("mode"), "status": e.get("status")}
+            for e in entries
+        ]
+    }), 200
+
+@app.route('/catalog/<path:key>', methods=['GET'])
+def get_catalog_entry(key):
+    """Serve one pre-generated template without calling the agent"""
+    entry = snapshots.current.template_catalog.get(key)
+    if entry is None:
+        return jsonify({"error": "Template not found in catalog"}), 404
+
+    return jsonify(entry), 200
+
+@app.route('/suggest', methods=['GET'])
+@limiter.limit("300 per minute")
+def suggest():
+    """Complete module paths, titles and resource types at the end of a prompt"""
+    query = request.args.get('q', '')
+    mode = request.args.get('mode') or None
+    if mode is not None and mode not in SEARCH_MODES and mode != 'compare':
+        return jsonify({"error": f"Unknown mode '{mode}'"}), 400
+    try:
+        limit = int(request.args.get('limit', 8))
+    except ValueError:
+        return jsonify({"error": "limit must be an integer"}), 400
+
+    started = time.perf_counter()
+    fragment, entries = snapshots.current.suggester.suggest(query[-200:], mode, limit)
+    return jsonify({
+        "fragment": fragment,
+        "suggestions": [entry.as_dict() for entry in entries],
+        "took_ms": round((time.perf_counter() - started) * 1000, 3)
+    }), 200
+
+@app.route('/admin/profiles', methods=['GET'])
+def list_profiles():
+    """List the stored request profiles, newest first"""
+    if not ADMIN_TOKEN:
+        return jsonify({"error": "Profiling is not enabled"}), 404
+    if not is_admin():
+        return jsonify({"error": "Admin token required"}), 403
+
+    return jsonify({"profiles": profiler.store.list()}), 200
+
+@app.route('/admin/profiles/<request_id>', methods=['GET'])
+def get_profile(request_id):
+    """One request's profile: a summary with the top frames, or collapsed stacks for a flame graph"""
+    if not ADMIN_TOKEN:
+        return jsonify({"error": "Profiling is not enabled"}), 404
+    if not is_admin():
+        return jsonify({"error": "Admin token required"}), 403
+
+    profile = profiler.store.get(request_id)
+    if profile is None:
+        return jsonify({"error": "Profile not found or evicted"}), 404
+
+    weight = request.args.get('weight', 'wall')
+    if weight not in PROFILE_WEIGHTS:
+        return jsonify({"error": f"weight must be one of {', '.join(PROFILE_WEIGHTS)}"}), 400
+
+    if request.args.get('format') == 'collapsed':
+        return Response(profile.collapsed(weight), mimetype='text/plain')
+    return jsonify(dict(profile.summary(), weight=weight, top_frames=profile.top_frames(weight))), 200
+
 @app.route('/health', methods=['GET'])
 def health():
     """Health check endpoint"""
@@ -361,6 +1428,7 @@ def health():
         "status": "healthy",
         "version": VERSION,
         "azure_enabled": AZURE_ENABLED,
+        "grounding_data": snapshots.stats(),
         "timestamp": time.time()
     }
 
@@ -374,5 +1442,20 @@ def health():
 
     return jsonify(health_status), 200 if health_status["status"] == "healthy" else 503
 
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Aggregated token usage, including prompt-cache hits"""
+    return jsonify({
+        "usage": usage_stats.snapshot(),
+        "output_contract": AGENT_OUTPUT_CONTRACT,
+        "breakers": {"search": search_breaker.snapshot()},
+        "deployments": openai_router.snapshot(),
+        "search_cache_entries": len(search_cache),
+        "result_store": result_store.stats(),
+        "refinement_sessions": len(session_store),
+        "profiles": len(profiler.store),
+        "logging": {"dropped_records": log_handler.dropped}
+    }), 200
+
 if __name__ == '__main__':
     app.run(debug=True)
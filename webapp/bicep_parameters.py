@@ -0,0 +1,60 @@
+"""Derive a parameters.json for a Bicep template from its `param` declarations.
+
+Parameters without a default get a ``<YOUR_VALUE_HERE>`` placeholder (the
+same convention as the training data, see
+``training-data/scripts/data_transformer.py``); parameters whose default is a
+literal get that literal, and parameters whose default is an expression such
+as ``resourceGroup().location`` are left out so Bicep evaluates them.
+"""
+from __future__ import annotations
+
+import json
+import re
+from typing import Dict, List, Optional, Tuple
+
+PLACEHOLDER_VALUE = "<YOUR_VALUE_HERE>"
+PARAMETERS_SCHEMA = "https://schema.management.azure.com/schemas/2019-04-01/deploymentParameters.json#"
+
+_PARAM = re.compile(r"^\s*param\s+(?P<name>\w+)\s+(?P<type>[\w.\[\]]+)(?:\s*=\s*(?P<default>.*?))?\s*$", re.MULTILINE)
+_STRING = re.compile(r"'(?P<value>(?:[^'\\]|\\.)*)'")
+_NUMBER = re.compile(r"-?\d+")
+
+
+def _literal(default: str) -> Tuple[bool, object]:
+    """(True, value) when `default` is a plain literal, (False, None) for an expression."""
+    default = default.split("//", 1)[0].strip()
+    string = _STRING.fullmatch(default)
+    if string:
+        value = string.group("value")
+        return ("${" not in value), value.replace("\\'", "'")
+    if _NUMBER.fullmatch(default):
+        return True, int(default)
+    if default in ("true", "false"):
+        return True, default == "true"
+    return False, None
+
+
+def declared_parameters(bicep_code: str) -> List[Tuple[str, str, Optional[str]]]:
+    """(name, type, default source or None) for every `param` declaration, in order."""
+    return [(m.group("name"), m.group("type"), m.group("default")) for m in _PARAM.finditer(bicep_code)]
+
+
+def derive_parameters(bicep_code: str) -> Dict[str, Dict[str, object]]:
+    parameters: Dict[str, Dict[str, object]] = {}
+    for name, _, default in declared_parameters(bicep_code):
+        if default is None:
+            parameters[name] = {"value": PLACEHOLDER_VALUE}
+            continue
+        is_literal, value = _literal(default)
+        if is_literal:
+            parameters[name] = {"value": value}
+    return parameters
+
+
+def derive_parameters_json(bicep_code: str) -> str:
+    """The parameters.json content for `bicep_code`."""
+    return json.dumps({
+        "$schema": PARAMETERS_SCHEMA,
+        "contentVersion": "1.0.0.0",
+        "parameters": derive_parameters(bicep_code),
+    }, indent=2)
@@ -35,6 +35,12 @@ if ($Version) {
 
 Write-Host ""
 
+Write-Host "Staging grounding data..." -ForegroundColor Cyan
+New-Item -ItemType Directory -Force -Path "grounding-data" | Out-Null
+Copy-Item -Path "..\grounding-data\*.jsonl" -Destination "grounding-data\" -Force
+Write-Host "✓ Grounding data copied to grounding-data\" -ForegroundColor Green
+Write-Host ""
+
 Write-Host "Building Docker image..." -ForegroundColor Cyan
 $IMAGE_TAG = "${REGISTRY}/${IMAGE_NAME}:${Version}"
 $IMAGE_LATEST = "${REGISTRY}/${IMAGE_NAME}:latest"
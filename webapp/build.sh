@@ -39,6 +39,12 @@ fi
 
 echo ""
 
+echo -e "${CYAN}Staging grounding data...${NOCOLOR}"
+mkdir -p grounding-data
+cp ../grounding-data/*.jsonl grounding-data/
+echo -e "${GREEN}✓ Grounding data copied to grounding-data/${NOCOLOR}"
+echo ""
+
 echo -e "${CYAN}Building Docker image...${NOCOLOR}"
 IMAGE_TAG="${REGISTRY}/${IMAGE_NAME}:${VERSION}"
 IMAGE_LATEST="${REGISTRY}/${IMAGE_NAME}:latest"
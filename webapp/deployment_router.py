@@ -0,0 +1,272 @@
+"""Routing of agent completions across several Azure OpenAI endpoint/deployment targets.
+
+The fine-tuned model is deployed in more than one region. Targets are
+configured as a JSON list in ``AZURE_OPENAI_TARGETS``::
+
+    [{"name": "eastus", "endpoint": "https://a.openai.azure.com/", "deployment": "bicep-agent"},
+     {"name": "swedencentral", "endpoint": "https://b.openai.azure.com/", "deployment": "bicep-agent"}]
+
+and default to the single ``AZURE_OPENAI_ENDPOINT`` /
+``AZURE_OPENAI_DEPLOYMENT_NAME`` pair.
+
+For every completion ``DeploymentRouter`` picks the healthy target with the
+lowest expected latency: its EWMA latency, scaled up by the requests it is
+already serving and by its recent error rate, so concurrent requests spread
+over the pool and aggregate throughput grows with the number of
+deployments. Targets that have not been used yet go first. A 429 puts the
+target in a cool-down for its ``Retry-After`` and the request spills over to
+the next target at once. When every target is cooling down, the request
+waits for the first one if that fits in its time budget. Server and
+connection errors spill over too and count against the target's circuit
+breaker. Client errors (bad request,
+content filter) are not the target's fault and are raised as they are.
+"""
+from __future__ import annotations
+
+import json
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+
+from resilience import CLOSED, HALF_OPEN, OPEN, BudgetExhausted, CircuitBreaker, CircuitOpenError, Deadline, RequestCancelled
+
+EWMA_ALPHA = 0.2
+ERROR_PENALTY = 4.0
+DEFAULT_THROTTLE_SECONDS = 10.0
+UNMEASURED_LATENCY_SECONDS = 10.0  # for a target that has only failed so far
+MIN_THROTTLE_SECONDS = 1.0
+MAX_THROTTLE_SECONDS = 60.0
+
+
+def parse_targets(targets_json: Optional[str], endpoint: Optional[str], deployment: Optional[str]) -> List[Dict[str, str]]:
+    """Target definitions from `AZURE_OPENAI_TARGETS`, or the single endpoint/deployment pair."""
+    if targets_json:
+        targets = json.loads(targets_json)
+        for index, target in enumerate(targets):
+            if not target.get("endpoint") or not target.get("deployment"):
+                raise ValueError(f"AZURE_OPENAI_TARGETS entry {index} needs an endpoint and a deployment")
+            target.setdefault("name", f"{urlparse(target['endpoint']).hostname}/{target['deployment']}")
+        return targets
+    if endpoint and deployment:
+        return [{"name": "default", "endpoint": endpoint, "deployment": deployment}]
+    return []
+
+
+def _retry_after(error) -> Optional[float]:
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    for header, scale in (("retry-after-ms", 0.001), ("retry-after", 1.0)):
+        value = headers.get(header)
+        if value:
+            try:
+                return float(value) * scale
+            except ValueError:
+                continue
+    return None
+
+
+class DeploymentTarget:
+    """One endpoint/deployment pair with its latency, error and throttling statistics."""
+
+    def __init__(self, name: str, endpoint: str, deployment: str, breaker: CircuitBreaker) -> None:
+        self.name = name
+        self.endpoint = endpoint
+        self.deployment = deployment
+        self.breaker = breaker
+        self.client = None
+        self.ewma_latency: Optional[float] = None
+        self.ewma_error_rate = 0.0
+        self.in_flight = 0
+        self.requests = 0
+        self.successes = 0
+        self.errors = 0
+        self.throttled = 0
+        self.cooldown_until = 0.0
+
+    def expected_latency(self) -> float:
+        if self.ewma_latency is not None:
+            latency = self.ewma_latency
+        else:
+            latency = 0.0 if self.successes + self.errors + self.throttled == 0 else UNMEASURED_LATENCY_SECONDS
+        return latency * (1 + self.in_flight) * (1 + ERROR_PENALTY * self.ewma_error_rate)
+
+    def _observe(self, latency: Optional[float], failed: bool) -> None:
+        if latency is not None:
+            self.ewma_latency = latency if self.ewma_latency is None else (
+                EWMA_ALPHA * latency + (1 - EWMA_ALPHA) * self.ewma_latency
+            )
+        self.ewma_error_rate = EWMA_ALPHA * float(failed) + (1 - EWMA_ALPHA) * self.ewma_error_rate
+
+    def snapshot(self, now: float) -> dict:
+        return {
+            "name": self.name,
+            "endpoint": urlparse(self.endpoint).hostname,
+            "deployment": self.deployment,
+            "ewma_latency_ms": round(self.ewma_latency * 1000, 1) if self.ewma_latency is not None else None,
+            "error_rate": round(self.ewma_error_rate, 3),
+            "in_flight": self.in_flight,
+            "requests": self.requests,
+            "successes": self.successes,
+            "errors": self.errors,
+            "throttled": self.throttled,
+            "cooling_down_for": round(max(0.0, self.cooldown_until - now), 1),
+            "breaker": self.breaker.snapshot(),
+        }
+
+
+class DeploymentRouter:
+    """Picks the best healthy target per completion and spills over on throttling or failure."""
+
+    def __init__(self, targets: List[Dict[str, str]], failure_threshold: int = 3, reset_after: float = 30.0,
+                 slow_after: Optional[float] = None) -> None:
+        self.targets = [
+            DeploymentTarget(
+                target["name"], target["endpoint"], target["deployment"],
+                CircuitBreaker(f"openai:{target['name']}", failure_threshold, reset_after, slow_after),
+            )
+            for target in targets
+        ]
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.targets)
+
+    def connect(self, client_factory: Callable[[str], object]) -> None:
+        """Create the clients (one per distinct endpoint) for the current process."""
+        clients: Dict[str, object] = {}
+        for target in self.targets:
+            if target.endpoint not in clients:
+                clients[target.endpoint] = client_factory(target.endpoint)
+            target.client = clients[target.endpoint]
+
+    def available(self) -> bool:
+        now = time.monotonic()
+        return any(t.cooldown_until <= now and t.breaker.state != OPEN for t in self.targets)
+
+    def state(self) -> str:
+        """`open` when no target accepts requests, `half_open` while any target's breaker is not closed, else `closed`."""
+        if not self.available():
+            return OPEN
+        return HALF_OPEN if any(t.breaker.state != CLOSED for t in self.targets) else CLOSED
+
+    def _acquire(self, tried: List[DeploymentTarget]) -> Optional[DeploymentTarget]:
+        with self._lock:
+            now = time.monotonic()
+            candidates = sorted(
+                (t for t in self.targets if t not in tried and t.cooldown_until <= now),
+                key=DeploymentTarget.expected_latency,
+            )
+            for target in candidates:
+                if target.breaker.allow():
+                    target.in_flight += 1
+                    target.requests += 1
+                    return target
+            return None
+
+    def complete(self, create: Callable[[DeploymentTarget], object], max_wait: float = 0.0,
+                 deadline: Optional[Deadline] = None, cancel_poll: float = 0.1) -> Tuple[object, DeploymentTarget]:
+        """Run `create(target)` on the best target, moving on to the next one on 429s and failures.
+
+        When every target is throttled, waits for the first cool-down to end if that is
+        within `max_wait` seconds, checking `deadline` for cancellation every `cancel_poll`
+        seconds. Raises the last error when every target failed, and CircuitOpenError when
+        no target could be tried at all. TimeoutError is raised at once: the request's time
+        is spent, so trying another target would overrun it. BudgetExhausted (raised by
+        `create` before it contacts the target) and RequestCancelled are raised at once
+        too, without counting against the target.
+        """
+        failed: List[DeploymentTarget] = []  # throttled targets are kept out by their cool-down instead
+        last_error: Optional[Exception] = None
+        wait_until = time.monotonic() + max_wait
+
+        while True:
+            target = self._acquire(failed)
+            if target is None:
+                resume_at = self._next_cooldown_end(failed)
+                if resume_at is None or resume_at > wait_until:
+                    break
+                while time.monotonic() < resume_at:
+                    if deadline is not None:
+                        deadline.raise_if_cancelled('completion')
+                    time.sleep(max(0.0, min(cancel_poll, resume_at - time.monotonic())))
+                continue
+            started = time.monotonic()
+            try:
+                response = create(target)
+            except BudgetExhausted:
+                # The request ran out of time before the target was called
+                self._release(target)
+                target.breaker.abandon()
+                raise
+            except TimeoutError:
+                self._record_failure(target, time.monotonic() - started)
+                raise
+            except RequestCancelled:
+                # The client went away; says nothing about the target
+                self._release(target)
+                target.breaker.abandon()
+                raise
+            except Exception as e:
+                status_code = getattr(e, "status_code", None)
+                if status_code == 429:
+                    # Throttling says nothing about the target's health; free a half-open trial slot
+                    self._record_throttle(target, _retry_after(e))
+                    target.breaker.abandon()
+                elif status_code is None or status_code >= 500 or status_code == 408:
+                    self._record_failure(target, None)
+                    failed.append(target)
+                else:
+                    self._release(target)
+                    target.breaker.abandon()
+                    raise
+                last_error = e
+                continue
+
+            self._record_success(target, time.monotonic() - started)
+            return response, target
+
+        if last_error is not None:
+            raise last_error
+        raise CircuitOpenError("No Azure OpenAI deployment is available (all throttled or failing)")
+
+    def _next_cooldown_end(self, failed: List[DeploymentTarget]) -> Optional[float]:
+        """When the first throttled target (not failed, breaker not open) becomes usable again."""
+        with self._lock:
+            now = time.monotonic()
+            ends = [
+                t.cooldown_until for t in self.targets
+                if t not in failed and t.cooldown_until > now and t.breaker.state != OPEN
+            ]
+            return min(ends) if ends else None
+
+    def _release(self, target: DeploymentTarget) -> None:
+        with self._lock:
+            target.in_flight -= 1
+
+    def _record_success(self, target: DeploymentTarget, latency: float) -> None:
+        with self._lock:
+            target.in_flight -= 1
+            target.successes += 1
+            target._observe(latency, failed=False)
+        target.breaker.record_success(latency)
+
+    def _record_failure(self, target: DeploymentTarget, latency: Optional[float]) -> None:
+        with self._lock:
+            target.in_flight -= 1
+            target.errors += 1
+            target._observe(latency, failed=True)
+        target.breaker.record_failure()
+
+    def _record_throttle(self, target: DeploymentTarget, retry_after: Optional[float]) -> None:
+        with self._lock:
+            target.in_flight -= 1
+            target.throttled += 1
+            cooldown = retry_after if retry_after is not None else DEFAULT_THROTTLE_SECONDS
+            cooldown = min(max(cooldown, MIN_THROTTLE_SECONDS), MAX_THROTTLE_SECONDS)
+            target.cooldown_until = max(target.cooldown_until, time.monotonic() + cooldown)
+            target._observe(None, failed=True)
+
+    def snapshot(self) -> List[dict]:
+        with self._lock:
+            now = time.monotonic()
+            return [target.snapshot(now) for target in self.targets]
@@ -0,0 +1,465 @@
+"""Resource entity detection in prompts, to narrow searches to a few documents.
+
+``EntityIndex`` is built once per grounding snapshot. Its patterns are word
+sequences that name a resource:
+
+* AVM resource modules - the resource segment (``virtual-network``), the
+  provider and resource together (``key-vault`` + ``vault`` is ``key
+  vault``), a provider with a single module (``service-bus``), and child
+  modules with their parent (``virtual network subnet``), which resolve to
+  the top-level module.
+* ARM resource types - the namespace and type together
+  (``Microsoft.KeyVault/vaults`` is ``key vault``), the namespace written as
+  one word (``keyvault``) and the full type name.
+* ``ALIASES`` - curated abbreviations and common names (``kv``, ``aks``,
+  ``subnet``, ``cosmos db``, ``app service plan``) for one of the phrases above.
+
+Words are lowercased, camelCase is split and plurals are folded, in patterns
+and prompts alike. One-word patterns are only kept when they name a single
+resource and are not in ``GENERIC_WORDS``, so ``account`` or ``server`` on
+their own match nothing. All patterns are compiled into one Aho-Corasick
+automaton over words, so detection is a single pass over the prompt however
+many patterns there are; overlapping matches resolve leftmost-longest (``app
+service plan`` beats ``app service``). A typical prompt is scanned in tens of
+microseconds.
+
+``EntityIndex.focus`` turns the matches into the document ids of the named
+resources (a top-level module with all its children, or the newest
+``API_VERSIONS_PER_TYPE`` schema versions of a resource type) and boost
+terms. Azure AI Search cannot filter the ``id`` key by prefix, so the
+prefixes are expanded to exact ids here and sent as a ``search.in`` filter
+(``narrow_filter``); ``widen_filter`` takes it off again.
+"""
+from __future__ import annotations
+
+import re
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from grounding import GroundingIndex, _API_VERSION, record_module_id, record_resource_type, split_module_id
+
+API_VERSIONS_PER_TYPE = 3
+ID_DELIMITER = "|"
+
+_WORD = re.compile(r"[a-z0-9]+")
+_CAMEL_BOUNDARY = re.compile(r"(?<=[a-z0-9])(?=[A-Z])")
+_ID_FILTER = re.compile(r"(?:^|\s+and\s+)search\.in\(id,\s*'(?P<ids>(?:[^']|'')*)',\s*'\|'\)$")
+
+# Alias -> the phrase it stands for; aliases whose phrase is not in the corpus are skipped.
+# Words that usually describe another resource ("WAF-aligned", "firewall rules") are left out.
+ALIASES: Dict[str, str] = {
+    "kv": "key vault",
+    "keyvault": "key vault",
+    "aks": "managed cluster",
+    "k8s": "managed cluster",
+    "kubernetes": "managed cluster",
+    "kubernetes cluster": "managed cluster",
+    "vnet": "virtual network",
+    "nsg": "network security group",
+    "asg": "application security group",
+    "pip": "public ip address",
+    "public ip": "public ip address",
+    "lb": "load balancer",
+    "appgw": "application gateway",
+    "app gateway": "application gateway",
+    "afd": "front door",
+    "bastion": "bastion host",
+    "azfw": "azure firewall",
+    "udr": "route table",
+    "nat": "nat gateway",
+    "subnet": "virtual network subnet",
+    "private dns": "private dns zone",
+    "expressroute": "express route circuit",
+    "acr": "container registry",
+    "aci": "container group",
+    "container instance": "container group",
+    "aca": "container app",
+    "container apps environment": "managed environment",
+    "cae": "managed environment",
+    "vm": "virtual machine",
+    "vmss": "virtual machine scale set",
+    "scale set": "virtual machine scale set",
+    "storage": "storage account",
+    "blob storage": "storage account",
+    "cosmos": "database account",
+    "cosmos db": "database account",
+    "cosmosdb": "database account",
+    "sql": "sql server",
+    "sql database": "sql server",
+    "sql db": "sql server",
+    "azure sql": "sql server",
+    "postgres": "db for postgre sql flexible server",
+    "postgresql": "db for postgre sql flexible server",
+    "postgres flexible server": "db for postgre sql flexible server",
+    "postgresql flexible server": "db for postgre sql flexible server",
+    "mysql": "db for my sql flexible server",
+    "mysql flexible server": "db for my sql flexible server",
+    "redis cache": "redis",
+    "web app": "web site",
+    "webapp": "web site",
+    "app service": "web site",
+    "function app": "web site",
+    "static web app": "static site",
+    "app service plan": "serverfarm",
+    "asp": "serverfarm",
+    "hosting plan": "serverfarm",
+    "log analytics": "operational insights workspace",
+    "log analytics workspace": "operational insights workspace",
+    "law": "operational insights workspace",
+    "app insights": "insights component",
+    "application insights": "insights component",
+    "appinsights": "insights component",
+    "appi": "insights component",
+    "managed identity": "user assigned identity",
+    "uami": "user assigned identity",
+    "msi": "user assigned identity",
+    "openai": "cognitive services account",
+    "azure openai": "cognitive services account",
+    "aoai": "cognitive services account",
+    "cognitive services": "cognitive services account",
+    "ai services": "cognitive services account",
+    "apim": "api management",
+    "eventhub": "event hub",
+    "servicebus": "service bus",
+    "adf": "data factory",
+    "ai search": "search service",
+    "cognitive search": "search service",
+    "logic app": "logic workflow",
+}
+
+# Too common on their own to mean one resource; they still count inside longer phrases.
+GENERIC_WORDS = {
+    "account", "app", "cluster", "component", "configuration", "connection", "container", "domain",
+    "extension", "factory", "gateway", "group", "image", "instance", "job", "lab", "license",
+    "machine", "map", "management", "namespace", "network", "policy", "pool", "portal", "profile", "project",
+    "query", "registry", "resource", "rule", "search", "server", "service", "setting", "site",
+    "solution", "topic", "web", "workspace",
+}
+
+# Scopes rather than resources; naming them must not narrow a search to them.
+IGNORED_PHRASES = {("resource", "group"), ("subscription",), ("management", "group"), ("tenant",)}
+
+# Deployed through the parameters every AVM resource module has (privateEndpoints,
+# diagnosticSettings, roleAssignments, managedIdentities), so "storage account with
+# private endpoint" describes one resource rather than naming two.
+INTERFACE_MODULES = {
+    "avm/res/network/private-endpoint",
+    "avm/res/insights/diagnostic-setting",
+    "avm/res/authorization/role-assignment",
+    "avm/res/managed-identity/user-assigned-identity",
+}
+
+
+def _singular(word: str) -> str:
+    if len(word) <= 3:
+        return word
+    if word.endswith("ies"):
+        return word[:-3] + "y"
+    if word.endswith(("sses", "xes", "ches", "shes")):
+        return word[:-2]
+    if word.endswith("s") and not word.endswith(("ss", "us", "is")):
+        return word[:-1]
+    return word
+
+
+def words(text: str) -> Tuple[str, ...]:
+    """Lowercased, camelCase-split, singular words of `text`; patterns and prompts go through this alike."""
+    return tuple(_singular(word) for word in _WORD.findall(_CAMEL_BOUNDARY.sub(" ", text).lower()))
+
+
+def _join(head: Tuple[str, ...], tail: Tuple[str, ...]) -> Tuple[str, ...]:
+    """`head` followed by `tail`, with the words they overlap on written once (key vault + vault)."""
+    for overlap in range(min(len(head), len(tail)), 0, -1):
+        if head[-overlap:] == tail[:overlap]:
+            return head + tail[overlap:]
+    return head + tail
+
+
+def module_phrases(path: str) -> List[Tuple[str, ...]]:
+    """Phrases naming the AVM resource module `path`; none for pattern and utility modules."""
+    parts = path.split("/")
+    if len(parts) < 4 or parts[1] != "res":
+        return []
+    provider, resource = words(parts[2]), words(parts[3])
+    if len(parts) == 4:
+        return [resource, _join(provider, resource)]
+    # Child names alone (cache, user, route) are too vague; only with their parent
+    child = words(parts[-1])
+    return [_join(resource, child), _join(_join(provider, resource), child)]
+
+
+def sole_provider_modules(paths: Iterable[str]) -> Dict[str, str]:
+    """Providers with a single top-level AVM resource module, which the provider alone names (key-vault)."""
+    providers: Dict[str, Set[str]] = defaultdict(set)
+    for path in paths:
+        parts = path.split("/")
+        if len(parts) == 4 and parts[1] == "res":
+            providers[parts[2]].add(path)
+    return {provider: next(iter(tops)) for provider, tops in providers.items() if len(tops) == 1}
+
+
+def resource_type_phrases(resource_type: str) -> List[Tuple[str, ...]]:
+    """Phrases naming the ARM `resource_type`: the full type, and namespace with type name."""
+    namespace, _, type_path = resource_type.partition("/")
+    segments = type_path.split("/")
+    namespace_words = words(namespace.split(".", 1)[-1])
+    phrases = [words(resource_type), _join(namespace_words, words(segments[-1]))]
+    if len(segments) == 1:
+        phrases.append(words(segments[0]))
+        if len(namespace_words) > 1:
+            phrases.append(("".join(namespace_words),))
+    return phrases
+
+
+def narrow_filter(search_filter: Optional[str], document_ids: Sequence[str]) -> str:
+    """`search_filter` restricted to `document_ids`."""
+    ids = ID_DELIMITER.join(document_id.replace("'", "''") for document_id in document_ids)
+    id_filter = f"search.in(id, '{ids}', '{ID_DELIMITER}')"
+    return f"{search_filter} and {id_filter}" if search_filter else id_filter
+
+
+def widen_filter(search_filter: Optional[str]) -> Optional[str]:
+    """`search_filter` without the id restriction `narrow_filter` added (unchanged if it has none)."""
+    if not search_filter:
+        return search_filter
+    return _ID_FILTER.sub("", search_filter)
+
+
+def filter_ids(search_filter: Optional[str]) -> Tuple[Optional[str], Optional[List[str]]]:
+    """Split a filter into the part before `narrow_filter`'s id restriction and its ids (None if it has none)."""
+    if not search_filter:
+        return search_filter, None
+    match = _ID_FILTER.search(search_filter)
+    if match is None:
+        return search_filter, None
+    ids = [document_id.replace("''", "'") for document_id in match.group("ids").split(ID_DELIMITER) if document_id]
+    return search_filter[:match.start()], ids
+
+
+@dataclass
+class Entity:
+    """A resource a phrase names: top-level AVM module paths and lowercase ARM resource types."""
+
+    name: str
+    modules: Set[str] = field(default_factory=set)
+    resource_types: Set[str] = field(default_factory=set)
+
+
+@dataclass
+class EntityMatch:
+    """One detected phrase: `start` and `end` are word offsets in the prompt."""
+
+    phrase: str
+    start: int
+    end: int
+    entity: Entity
+
+
+@dataclass
+class SearchFocus:
+    """What the entities in one search text narrow it to."""
+
+    entities: List[str]
+    document_ids: List[str]
+    boost_terms: List[str]
+
+    def as_dict(self) -> dict:
+        return {"entities": self.entities, "documents": len(self.document_ids), "boost_terms": self.boost_terms}
+
+
+class _Automaton:
+    """Aho-Corasick automaton over words."""
+
+    def __init__(self) -> None:
+        self.goto: List[Dict[str, int]] = [{}]
+        self.fail: List[int] = [0]
+        self.depth: List[int] = [0]
+        self.value: List[Optional[int]] = [None]
+        self.report: List[int] = [0]  # nearest proper suffix node that ends a pattern (0 if none)
+
+    def add(self, pattern: Tuple[str, ...], value: int) -> None:
+        node = 0
+        for word in pattern:
+            child = self.goto[node].get(word)
+            if child is None:
+                child = len(self.goto)
+                self.goto[node][word] = child
+                self.goto.append({})
+                self.fail.append(0)
+                self.depth.append(self.depth[node] + 1)
+                self.value.append(None)
+                self.report.append(0)
+            node = child
+        self.value[node] = value
+
+    def finalize(self) -> None:
+        queue = list(self.goto[0].values())
+        for node in queue:
+            for word, child in self.goto[node].items():
+                queue.append(child)
+                state = self.fail[node]
+                while state and word not in self.goto[state]:
+                    state = self.fail[state]
+                target = self.goto[state].get(word, 0)
+                self.fail[child] = target if target != child else 0
+                fallback = self.fail[child]
+                self.report[child] = fallback if self.value[fallback] is not None else self.report[fallback]
+
+    def scan(self, text: Sequence[str]) -> List[Tuple[int, int, int]]:
+        """Every (start, end, value) match in `text`, overlapping ones included."""
+        matches = []
+        node = 0
+        goto, fail, depth, value, report = self.goto, self.fail, self.depth, self.value, self.report
+        for position, word in enumerate(text):
+            while node and word not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(word, 0)
+            state = node if value[node] is not None else report[node]
+            while state:
+                matches.append((position + 1 - depth[state], position + 1, value[state]))
+                state = report[state]
+        return matches
+
+
+class EntityIndex:
+    """Detects resource entities in prompts and maps them to the grounding documents that cover them."""
+
+    def __init__(self) -> None:
+        self._automaton = _Automaton()
+        self._entities: List[Entity] = []
+        self._module_ids: Dict[str, List[str]] = {}
+        self._type_ids: Dict[str, List[str]] = {}
+        self._type_names: Dict[str, str] = {}
+
+    def __len__(self) -> int:
+        return len(self._entities)
+
+    @classmethod
+    def build(
+        cls,
+        grounding_index: Optional[GroundingIndex],
+        documents: Iterable[Dict[str, str]] = (),
+        aliases: Optional[Dict[str, str]] = None,
+        api_versions_per_type: int = API_VERSIONS_PER_TYPE,
+    ) -> "EntityIndex":
+        """Compile the patterns from the index's modules and resource types, and map `documents` to them.
+
+        `documents` are the `{id, content}` grounding documents (the local retriever's), the same
+        set that is pushed to the search index, so their ids are valid filter values.
+        """
+        index = cls()
+        if grounding_index is None:
+            return index
+        index._map_documents(documents, api_versions_per_type)
+        index._type_names = {key: info.resource_type for key, info in grounding_index.resource_types.items()}
+
+        phrases: Dict[Tuple[str, ...], Entity] = {}
+
+        def add(pattern: Tuple[str, ...], module: Optional[str] = None, resource_type: Optional[str] = None) -> None:
+            if not pattern or pattern in IGNORED_PHRASES or (len(pattern) == 1 and pattern[0] in GENERIC_WORDS):
+                return
+            entity = phrases.setdefault(pattern, Entity(name=" ".join(pattern)))
+            if module:
+                entity.modules.add(module)
+            if resource_type:
+                entity.resource_types.add(resource_type)
+
+        for path in sorted(grounding_index.modules):
+            top = "/".join(path.split("/")[:4])
+            for pattern in module_phrases(path):
+                add(pattern, module=top)
+        for provider, top in sole_provider_modules(sorted(grounding_index.modules)).items():
+            add(words(provider), module=top)
+
+        for key, info in sorted(grounding_index.resource_types.items()):
+            namespace, _, type_path = info.resource_type.partition("/")
+            top = f"{namespace}/{type_path.split('/')[0]}".lower()
+            for pattern in resource_type_phrases(info.resource_type):
+                add(pattern, resource_type=top)
+
+        # One word naming more than one module (vault) or type is ambiguous; a module and its type is fine
+        entities = {
+            pattern: entity for pattern, entity in phrases.items()
+            if len(pattern) > 1 or (len(entity.modules) <= 1 and len(entity.resource_types) <= 1)
+        }
+        for alias, phrase in (ALIASES if aliases is None else aliases).items():
+            entity = entities.get(words(phrase))
+            if entity is not None:
+                entities[words(alias)] = entity
+
+        values: Dict[int, int] = {}
+        for pattern, entity in entities.items():
+            value = values.setdefault(id(entity), len(index._entities))
+            if value == len(index._entities):
+                index._entities.append(entity)
+            index._automaton.add(pattern, value)
+        index._automaton.finalize()
+        return index
+
+    def _map_documents(self, documents: Iterable[Dict[str, str]], api_versions_per_type: int) -> None:
+        module_ids: Dict[str, List[str]] = defaultdict(list)
+        type_versions: Dict[str, Dict[str, List[str]]] = defaultdict(lambda: defaultdict(list))
+        for document in documents:
+            document_id, content = document.get("id", ""), document.get("content", "")
+            if not document_id or ID_DELIMITER in document_id:
+                continue
+            module_id = record_module_id(content)
+            if module_id:
+                parts = split_module_id(module_id)[0].split("/")
+                module_ids["/".join(parts[:4])].append(document_id)
+                continue
+            resource_type = record_resource_type(content)
+            if resource_type:
+                top = "/".join(resource_type.lower().split("/")[:2])
+                version = _API_VERSION.search(document_id)
+                type_versions[top][version.group(0) if version else ""].append(document_id)
+        self._module_ids = dict(module_ids)
+        self._type_ids = {
+            top: [document_id for version in sorted(versions, reverse=True)[:api_versions_per_type] for document_id in versions[version]]
+            for top, versions in type_versions.items()
+        }
+
+    def detect(self, text: str) -> List[EntityMatch]:
+        """Non-overlapping entity mentions in `text`, leftmost-longest first."""
+        prompt_words = words(text)
+        matches = sorted(self._automaton.scan(prompt_words), key=lambda match: (match[0], match[0] - match[1]))
+        detected: List[EntityMatch] = []
+        end = 0
+        for start, stop, value in matches:
+            if start < end:
+                continue
+            detected.append(EntityMatch(" ".join(prompt_words[start:stop]), start, stop, self._entities[value]))
+            end = stop
+        return detected
+
+    def names_resource(self, text: str) -> bool:
+        """Whether `text` names a resource of its own, not just one of the ``INTERFACE_MODULES``."""
+        return any(not match.entity.modules <= INTERFACE_MODULES for match in self.detect(text))
+
+    def focus(self, text: str, mode: str) -> Optional[SearchFocus]:
+        """The documents and boost terms for the entities `text` names in `mode` (`avm` or `classic`).
+
+        None when it names none that the corpus has documents for in that mode.
+        """
+        entities: List[str] = []
+        document_ids: List[str] = []
+        boost_terms: List[str] = []
+        seen: Set[str] = set()
+        for match in self.detect(text):
+            if mode == "avm":
+                targets = [(module, self._module_ids.get(module, []), module) for module in sorted(match.entity.modules)]
+            else:
+                targets = [(key, self._type_ids.get(key, []), self._type_names.get(key, key)) for key in sorted(match.entity.resource_types)]
+            targets = [target for target in targets if target[1] and target[0] not in seen]
+            if not targets:
+                continue
+            entities.append(match.phrase)
+            for key, ids, term in targets:
+                seen.add(key)
+                document_ids.extend(ids)
+                boost_terms.append(term)
+        if not entities:
+            return None
+        return SearchFocus(entities, document_ids, boost_terms)
+
@@ -0,0 +1,153 @@
+"""Retrieval that does not depend on Azure AI Search, for degraded requests.
+
+When a search misses its deadline, fails, or its circuit breaker is open,
+``app.retrieve_with_budget`` answers it from here instead:
+
+* ``SearchResultCache`` - the results of recent successful searches, keyed
+  by search text, filter and top. Identical and repeated prompts (examples,
+  retries, compare mode) get exactly what search returned last time.
+* ``LocalRetriever`` - BM25 over the grounding corpus documents held in
+  memory, so any prompt still gets relevant context. It honours the
+  ``search.ismatch('<phrase>', 'content')`` mode filters used by
+  ``SEARCH_MODES`` and the id lists ``entities.narrow_filter`` adds to
+  them. It has no vectors or semantic ranker, so its results are a best
+  effort rather than a match for the hybrid search.
+"""
+from __future__ import annotations
+
+import glob
+import heapq
+import math
+import os
+import re
+import threading
+import time
+from collections import Counter, OrderedDict, defaultdict
+from typing import Dict, List, Optional, Tuple
+
+from entities import filter_ids
+from grounding import AVM_DATA_FILE, SCHEMA_DATA_GLOB, read_jsonl
+from shared_parameters import is_shared_record
+
+_TERM = re.compile(r"[a-z0-9]+")
+_CAMEL_BOUNDARY = re.compile(r"(?<=[a-z0-9])(?=[A-Z])")
+_ISMATCH_FILTER = re.compile(r"search\.ismatch\('(?P<phrase>[^']+)',\s*'content'\)")
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+
+def _terms(text: str) -> List[str]:
+    return _TERM.findall(_CAMEL_BOUNDARY.sub(" ", text).lower())
+
+
+class SearchResultCache:
+    """LRU- and TTL-bounded cache of search results."""
+
+    def __init__(self, max_entries: int = 500, ttl: float = 3600.0) -> None:
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[Tuple[str, Optional[str], int], Tuple[float, List[Dict[str, str]]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def put(self, search_text: str, search_filter: Optional[str], top: int, documents: List[Dict[str, str]]) -> None:
+        key = (search_text, search_filter, top)
+        with self._lock:
+            self._entries[key] = (time.time(), documents)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get(self, search_text: str, search_filter: Optional[str], top: int) -> Optional[List[Dict[str, str]]]:
+        key = (search_text, search_filter, top)
+        with self._lock:
+            cached = self._entries.get(key)
+            if cached is None:
+                return None
+            stored_at, documents = cached
+            if time.time() - stored_at > self.ttl:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return documents
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class LocalRetriever:
+    """In-memory BM25 index over the grounding documents."""
+
+    def __init__(self) -> None:
+        self.documents: List[Dict[str, str]] = []
+        self._lowered: List[str] = []
+        self._lengths: List[int] = []
+        self._postings: Dict[str, List[Tuple[int, int]]] = defaultdict(list)
+        self._filters: Dict[str, frozenset] = {}
+        self._positions: Dict[str, int] = {}
+        self._average_length = 0.0
+
+    @classmethod
+    def load(cls, data_dir: str) -> "LocalRetriever":
+        retriever = cls()
+        paths = [os.path.join(data_dir, AVM_DATA_FILE)] + sorted(glob.glob(os.path.join(data_dir, SCHEMA_DATA_GLOB)))
+        for path in paths:
+            if os.path.exists(path):
+                for record in read_jsonl(path):
+                    if not is_shared_record(record):
+                        retriever.add(record.get("id", ""), record.get("content_to_embed", ""))
+        retriever._average_length = sum(retriever._lengths) / len(retriever._lengths) if retriever._lengths else 0.0
+        return retriever
+
+    def __len__(self) -> int:
+        return len(self.documents)
+
+    def add(self, document_id: str, content: str) -> None:
+        index = len(self.documents)
+        self.documents.append({"id": document_id, "content": content})
+        self._positions[document_id] = index
+        self._lowered.append(content.lower())
+        terms = _terms(content)
+        self._lengths.append(len(terms))
+        for term, count in Counter(terms).items():
+            self._postings[term].append((index, count))
+
+    def search(self, search_text: str, search_filter: Optional[str], top: int) -> List[Dict[str, str]]:
+        """Top `top` documents for `search_text`, in the same shape as `run_search` returns."""
+        allowed = self._allowed(search_filter)
+        total = len(self.documents)
+        scores: Dict[int, float] = defaultdict(float)
+
+        for term in set(_terms(search_text)):
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (total - len(postings) + 0.5) / (len(postings) + 0.5))
+            for index, count in postings:
+                if allowed is not None and index not in allowed:
+                    continue
+                norm = 1 - BM25_B + BM25_B * self._lengths[index] / self._average_length
+                scores[index] += idf * count * (BM25_K1 + 1) / (count + BM25_K1 * norm)
+
+        best = heapq.nlargest(top, scores.items(), key=lambda item: item[1])
+        return [dict(self.documents[index]) for index, _ in best]
+
+    def _allowed(self, search_filter: Optional[str]) -> Optional[frozenset]:
+        """Documents matching the `search.ismatch` phrase filter and its id list, if any (None means no filter)."""
+        if not search_filter:
+            return None
+        phrase_filter, ids = filter_ids(search_filter)
+        allowed = None
+        if phrase_filter:
+            match = _ISMATCH_FILTER.fullmatch(phrase_filter.strip())
+            if match is None and ids is None:
+                return None  # a filter we cannot evaluate locally; better unfiltered than empty
+            if match is not None:
+                phrase = match.group("phrase").lower()
+                if phrase not in self._filters:
+                    self._filters[phrase] = frozenset(i for i, content in enumerate(self._lowered) if phrase in content)
+                allowed = self._filters[phrase]
+        if ids is not None:
+            positions = frozenset(self._positions[document_id] for document_id in ids if document_id in self._positions)
+            allowed = positions if allowed is None else allowed & positions
+        return allowed
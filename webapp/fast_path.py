@@ -0,0 +1,313 @@
+"""Zero-LLM fast path: answer single-module AVM prompts from the README examples.
+
+Most AVM module READMEs ship a "Using only defaults", a "WAF-aligned" and a
+"Using large parameter set" example; the grounding corpus keeps them as the
+``bicep`` field of the records in ``extracted_avm_data.jsonl``. A prompt such
+as "key vault" or "WAF aligned storage account" is fully answered by one of
+them, so ``FastPathIndex.match`` scores the prompt against every module that
+has examples and, when one module wins clearly, ``render`` turns its example
+into a standalone main.bicep (``'<placeholder>'`` values become parameters)
+in well under a millisecond. Everything else goes through search and the
+model as before.
+
+A module's score is the share of its name covered by the prompt (by the last
+path segment, a product namespace such as ``service-bus`` or the README
+title, whichever is best; a title acronym such as "AKS" covers the whole
+title) times the share of the prompt's content words it explains. Filler
+words ("deploy", "a", "bicep") and the variant keywords do not count;
+anything else the prompt asks for (a second resource, a name, a region, a
+feature) lowers the score. The match is taken only when the best score
+reaches ``min_score`` and beats the runner-up by ``min_margin``.
+"""
+from __future__ import annotations
+
+import os
+import re
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Set, Tuple
+
+from bicep_parameters import derive_parameters_json
+from grounding import AVM_DATA_FILE, read_jsonl, record_module_id, split_module_id
+
+DEFAULTS = "defaults"
+WAF = "waf"
+MAX = "max"
+
+_HEADER_LINE = re.compile(r"^Recommended AVM Module for (?P<title>.+?): (?P<variant>.+?)(?: - (?P<description>.*))?$")
+_VARIANT_PATTERNS = [
+    (WAF, re.compile(r"\bwaf\b", re.IGNORECASE)),
+    (MAX, re.compile(r"\blarge parameter set\b|\bmax(?:imum)? parameters?\b", re.IGNORECASE)),
+    (DEFAULTS, re.compile(r"\bdefaults?\b|\bminimal\b|\bminimum\b", re.IGNORECASE)),
+]
+# Examples that deploy at another scope need a `targetScope` the README snippet does not carry.
+_OTHER_SCOPE = re.compile(r"\b(?:subscription|management group|tenant)\b", re.IGNORECASE)
+_PLACEHOLDER = re.compile(r"'<(?P<name>[A-Za-z_]\w*)>'")
+_LEFTOVER_PLACEHOLDER = re.compile(r"'[^'\n]*<[A-Za-z][\w-]*>[^'\n]*'")
+_RESOURCE_NAME = re.compile(r"^(?P<indent>    )name: '(?P<value>[^'$]*)'$", re.MULTILINE)  # directly under `params`
+_SECURE_NAME = re.compile(r"password|secret|token|connectionstring|accountkey|sharedkey", re.IGNORECASE)
+_WORD = re.compile(r"[a-z0-9]+")
+_CAMEL_BOUNDARY = re.compile(r"(?<=[a-z0-9])(?=[A-Z])")
+
+# Words that say which example to use, per variant.
+VARIANT_WORDS = {
+    WAF: {"waf", "well", "architected", "production", "prod", "secure", "hardened", "recommended", "aligned"},
+    MAX: {"full", "maximum", "max", "large", "complete", "everything", "all"},
+    DEFAULTS: {"minimal", "minimum", "basic", "simple", "default", "defaults", "quick", "starter"},
+}
+_VARIANT_OF_WORD = {word: variant for variant, words in VARIANT_WORDS.items() for word in words}
+
+# Words that do not change what is being asked for.
+FILLER_WORDS = {
+    "a", "an", "the", "me", "i", "we", "need", "want", "please", "can", "you", "create", "deploy", "generate",
+    "make", "provision", "build", "write", "give", "set", "up", "new", "single", "one", "bicep", "template",
+    "file", "code", "avm", "module", "verified", "azure", "using", "use", "uses", "for", "of", "to", "resource",
+    "instance", "deployment", "example", "sample", "parameter", "option", "setting", "config", "configuration",
+    "just", "only", "ready", "best", "practice", "with",
+}
+_TITLE_NOISE = {"azure", "and", "or", "for", "the", "of", "a", "an", "with"}
+
+# Common abbreviations for module names that neither the path nor the title spells out.
+ALIASES = {
+    "vnet": ("virtual", "network"),
+    "vm": ("virtual", "machine"),
+    "vmss": ("virtual", "machine", "scale", "set"),
+    "nsg": ("network", "security", "group"),
+    "pip": ("public", "ip", "address"),
+    "kv": ("key", "vault"),
+    "webapp": ("web", "app"),
+    "functionapp": ("function", "app"),
+    "cosmos": ("cosmos", "db"),
+    "cosmosdb": ("cosmos", "db"),
+}
+
+
+def _stem(word: str) -> str:
+    if len(word) > 4 and word.endswith("sses"):
+        return word[:-2]
+    return word[:-1] if len(word) > 3 and word.endswith("s") and not word.endswith("ss") else word
+
+
+def _words(text: str) -> List[str]:
+    return [_stem(word) for word in _WORD.findall(_CAMEL_BOUNDARY.sub(" ", text).lower())]
+
+
+@dataclass
+class Example:
+    """One README example of a module, as the grounding corpus stores it."""
+
+    example_id: str
+    module_path: str
+    module_id: str
+    title: str
+    variant: str
+    description: str
+    bicep: str
+
+
+@dataclass
+class _ModuleTerms:
+    """The words a prompt may use to name one module."""
+
+    path: str
+    group_rank: int
+    name_words: Set[str]
+    namespace_words: Set[str]
+    title_words: Set[str]
+    acronyms: Set[str]
+    vocabulary: Set[str]
+    joined: Dict[str, Tuple[str, ...]] = field(default_factory=dict)  # "keyvault" -> ("key", "vault")
+
+
+@dataclass
+class FastPathMatch:
+    example: Example
+    score: float
+    margin: float
+    variant_requested: bool
+    runner_up: Optional[str] = None
+
+    def as_dict(self) -> dict:
+        return {
+            "module": self.example.module_id,
+            "example": self.example.example_id,
+            "variant": self.example.variant,
+            "variant_requested": self.variant_requested,
+            "score": round(self.score, 3),
+            "margin": round(self.margin, 3),
+            "runner_up": self.runner_up,
+        }
+
+
+class FastPathIndex:
+    """README examples per (module path, variant) and the words that name each module."""
+
+    def __init__(self, min_score: float = 0.75, min_margin: float = 0.25) -> None:
+        self.min_score = min_score
+        self.min_margin = min_margin
+        self.examples: Dict[Tuple[str, str], Example] = {}
+        self._modules: Dict[str, _ModuleTerms] = {}
+
+    @classmethod
+    def load(cls, data_dir: str, min_score: float = 0.75, min_margin: float = 0.25) -> "FastPathIndex":
+        index = cls(min_score, min_margin)
+        path = os.path.join(data_dir, AVM_DATA_FILE)
+        if os.path.exists(path):
+            index.add_records(read_jsonl(path))
+        return index
+
+    def __len__(self) -> int:
+        return len(self.examples)
+
+    def add_records(self, records) -> None:
+        for record in records:
+            if not record.get("bicep") or "targetScope" in record["bicep"]:
+                continue
+            content = record.get("content_to_embed", "")
+            header = _HEADER_LINE.match(content.split("\n", 1)[0])
+            module_id = record_module_id(content)
+            if not header or not module_id:
+                continue
+            module_path, _ = split_module_id(module_id)
+            if module_path not in self._modules:
+                # Every module competes for a prompt, with or without a usable example.
+                self._modules[module_path] = _module_terms(module_path, header.group("title"))
+            if _OTHER_SCOPE.search(header.group("variant")):
+                continue
+            variant = next((name for name, pattern in _VARIANT_PATTERNS if pattern.search(header.group("variant"))), None)
+            if variant is None:
+                continue
+
+            # READMEs list the canonical example first; later ones of the same kind are specialisations.
+            self.examples.setdefault((module_path, variant), Example(
+                example_id=record.get("id", ""),
+                module_path=module_path,
+                module_id=module_id,
+                title=header.group("title").strip(),
+                variant=variant,
+                description=" - ".join(part for part in header.group("variant", "description") if part).strip(),
+                bicep=record["bicep"],
+            ))
+
+    def match(self, prompt: str) -> Optional[FastPathMatch]:
+        """The example `prompt` asks for, or None when no single module matches confidently."""
+        prompt_words: List[str] = []
+        for word in _words(prompt):
+            prompt_words.extend(ALIASES.get(word, (word,)))
+
+        requested = [_VARIANT_OF_WORD[word] for word in prompt_words if word in _VARIANT_OF_WORD]
+        if len(set(requested)) > 1:
+            return None
+        variant = requested[0] if requested else DEFAULTS
+        content = [word for word in prompt_words if word not in FILLER_WORDS and word not in _VARIANT_OF_WORD]
+        if not content or not self._modules:
+            return None
+
+        scored = sorted(
+            ((_score(terms, content), terms) for terms in self._modules.values()),
+            key=lambda item: (-item[0], item[1].group_rank, item[1].path),
+        )
+        best_score, best = scored[0]
+        second_score, second = scored[1] if len(scored) > 1 else (0.0, None)
+        margin = best_score - second_score
+        if best_score < self.min_score or margin < self.min_margin:
+            return None
+
+        example = self.examples.get((best.path, variant))
+        if example is None:
+            return None
+        return FastPathMatch(example, best_score, margin, bool(requested), second.path if second else None)
+
+
+def _module_terms(module_path: str, title: str) -> _ModuleTerms:
+    group, _, rest = module_path[len("avm/"):].partition("/")
+    segments = rest.split("/")
+    title_words = {word for word in _words(title) if word not in _TITLE_NOISE}
+    acronyms = {acronym.lower() for acronym in re.findall(r"\(([A-Z]{2,})\)", title)}
+
+    joined: Dict[str, Tuple[str, ...]] = {}
+    for text in segments + [title]:
+        for part in re.split(r"[\s/()]+", text):
+            words = tuple(_words(part))
+            if len(words) > 1:
+                joined["".join(words)] = words
+    title_list = [word for word in _words(title) if word not in _TITLE_NOISE]
+    for first, second in zip(title_list, title_list[1:]):
+        joined.setdefault(_stem(first + second), (first, second))
+
+    path_words = {word for segment in segments for word in _words(segment)}
+    return _ModuleTerms(
+        path=module_path,
+        group_rank={"res": 0, "ptn": 1, "utl": 2}.get(group, 3),
+        name_words=set(_words(segments[-1])),
+        # Single-word namespaces (network, compute, web) are categories rather than product names.
+        namespace_words=set(_words(segments[0])) if len(segments) > 1 and "-" in segments[0] else set(),
+        title_words=title_words,
+        acronyms=acronyms,
+        vocabulary=path_words | title_words,
+        joined=joined,
+    )
+
+
+def _score(terms: _ModuleTerms, content: List[str]) -> float:
+    covered: Set[str] = set()
+    explained = 0
+    for word in content:
+        if word in terms.vocabulary:
+            covered.add(word)
+            explained += 1
+        elif word in terms.joined:
+            covered.update(terms.joined[word])
+            explained += 1
+    if not explained:
+        return 0.0
+    if terms.acronyms & covered:
+        name_coverage = 1.0
+    else:
+        name_coverage = max(
+            len(names & covered) / len(names) if names else 0.0
+            for names in (terms.name_words, terms.namespace_words, terms.title_words)
+        )
+    return name_coverage * explained / len(content)
+
+
+def render(example: Example) -> Tuple[str, str, List[str]]:
+    """main.bicep, parameters.json and warnings for an example.
+
+    Every ``'<name>'`` placeholder becomes a `name` parameter (``location``
+    defaults to the resource group's) and the example's resource name becomes
+    the default of a ``name`` parameter, so the parameters file lists what the
+    user still has to fill in.
+    """
+    names: List[str] = []
+    for placeholder in _PLACEHOLDER.finditer(example.bicep):
+        if placeholder.group("name") not in names:
+            names.append(placeholder.group("name"))
+    body = _PLACEHOLDER.sub(lambda m: m.group("name"), example.bicep)
+
+    declarations = []
+    # The example's hard-coded resource name is the first thing a user changes.
+    resource_name = _RESOURCE_NAME.search(body)
+    if resource_name and "name" not in names:
+        declarations.append(f"param name string = '{resource_name.group('value')}'")
+        body = body[:resource_name.start()] + resource_name.group("indent") + "name: name" + body[resource_name.end():]
+
+    for name in names:
+        if name == "location":
+            declarations.append("param location string = resourceGroup().location")
+        elif _SECURE_NAME.search(name):
+            declarations.append(f"@secure()\nparam {name} string")
+        else:
+            declarations.append(f"param {name} string")
+
+    header = [
+        f"// {example.title}: {example.description}",
+        f"// Rendered from the {example.module_id} README example ({example.example_id}).",
+        "",
+    ]
+    bicep = "\n".join(header + declarations + ([""] if declarations else []) + [body, ""])
+
+    warnings = [f"Rendered from the module's '{example.description.split(' - ', 1)[0]}' README example without calling the model."]
+    if _LEFTOVER_PLACEHOLDER.search(body):
+        warnings.append("Replace the remaining '<...>' placeholder values before deploying.")
+    return bicep, derive_parameters_json(bicep), warnings
+
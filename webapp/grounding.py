@@ -0,0 +1,330 @@
+"""In-memory grounding index built from the RAG corpus, and a verifier for generated Bicep.
+
+The index is built once at startup from the same JSONL files that are pushed
+to Azure AI Search:
+
+* ``extracted_avm_data.jsonl`` - AVM module parameter documents and README
+  examples, each carrying a ``Module ID: br/public:<path>:<version>`` line.
+* ``extracted_schema_data*.jsonl`` - ARM schema documents with the resource
+  type and its valid top-level properties (optional).
+
+``GroundingIndex.verify`` scans the generated Bicep once, line by line, and
+reports module paths, versions, parameter names, resource types and
+top-level properties that do not exist in the corpus. Lookups are plain
+dict/set hits so a typical template verifies in well under a millisecond.
+"""
+from __future__ import annotations
+
+import glob
+import json
+import os
+import re
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional, Set
+
+from shared_parameters import is_shared_record, load_shared_definitions
+
+AVM_DATA_FILE = "extracted_avm_data.jsonl"
+SCHEMA_DATA_GLOB = "extracted_schema_data*.jsonl"
+
+_MODULE_TITLE_LINE = re.compile(r"^Recommended AVM Module for '(?P<name>[^']+)'(?: \(Parent Chain: (?P<parents>[^)]+)\))?")
+_MODULE_ID_LINE = re.compile(r"^Module ID:\s*(?P<id>\S+)\s*$", re.MULTILINE)
+_PARAM_DOC_LINE = re.compile(r"^-\s+(?P<name>[A-Za-z_$][\w$]*)\s+\(", re.MULTILINE)
+_SCHEMA_TYPE_LINE = re.compile(r"^ARM Schema for Resource Type:\s*'(?P<type>[^']+)'", re.MULTILINE)
+_SCHEMA_PROPERTY_LINE = re.compile(r"^-\s+(?P<name>[A-Za-z_$][\w$]*)\s+\(type:", re.MULTILINE)
+_API_VERSION = re.compile(r"\d{4}-\d{2}-\d{2}(?:-preview)?")
+
+_DECLARATION = re.compile(
+    r"^\s*(?P<kind>module|resource)\s+(?P<symbol>[A-Za-z_]\w*)\s+'(?P<type>[^']+)'(?P<existing>\s+existing)?"
+)
+_OBJECT_KEY = re.compile(r"^\s*'?(?P<key>[A-Za-z_$][\w$-]*)'?\s*:")
+_INLINE_KEY = re.compile(r"\s*'?(?P<key>[A-Za-z_$][\w$-]*)'?\s*:")
+_STRING_LITERAL = re.compile(r"'(?:[^'\\]|\\.)*'")
+
+# Keys that are part of the Bicep declaration syntax rather than the resource schema.
+BICEP_DECLARATION_KEYS = {"name", "parent", "scope", "dependsOn"}
+
+
+@dataclass
+class ModuleInfo:
+    """Valid versions, parameter names and display title for one AVM module path."""
+
+    path: str
+    title: Optional[str] = None
+    versions: Set[str] = field(default_factory=set)
+    params: Set[str] = field(default_factory=set)
+
+
+@dataclass
+class ResourceTypeInfo:
+    """Known API versions and top-level properties for one ARM resource type."""
+
+    resource_type: str
+    api_versions: Set[str] = field(default_factory=set)
+    properties: Set[str] = field(default_factory=set)
+
+
+@dataclass
+class Declaration:
+    """A `module` or `resource` declaration found in a Bicep file."""
+
+    kind: str
+    symbol: str
+    type: str
+    line: int
+    existing: bool = False
+    keys: Set[str] = field(default_factory=set)
+    params: Set[str] = field(default_factory=set)
+
+
+def normalize_module_path(module_reference: str) -> str:
+    """Map a registry reference (with or without `br/public:` and `avm/`) to `avm/<path>`."""
+    path = module_reference
+    for prefix in ("br/public:", "br:mcr.microsoft.com/bicep/"):
+        if path.startswith(prefix):
+            path = path[len(prefix):]
+            break
+    path = path.replace("\\", "/").strip("/")
+    if not path.startswith("avm/"):
+        path = f"avm/{path}"
+    return path
+
+
+def split_module_id(module_id: str):
+    """Split `br/public:avm/res/x/y:1.2.3` into (`avm/res/x/y`, `1.2.3`)."""
+    reference, _, version = module_id.rpartition(":")
+    if not reference or "/" in version:
+        return normalize_module_path(module_id), None
+    return normalize_module_path(reference), version
+
+
+def record_module_id(content: str) -> Optional[str]:
+    """Return the `Module ID:` of an AVM grounding document, if it has one."""
+    match = _MODULE_ID_LINE.search(content)
+    return match.group("id") if match else None
+
+
+def record_resource_type(content: str) -> Optional[str]:
+    """Return the resource type of an ARM schema grounding document, if it has one."""
+    match = _SCHEMA_TYPE_LINE.search(content)
+    return match.group("type") if match else None
+
+
+def _major_minor(version: str) -> str:
+    return ".".join(version.split(".")[:2])
+
+
+def _strip_line(line: str) -> str:
+    """Drop string literals and line comments so braces and keys can be counted safely."""
+    return _STRING_LITERAL.sub("''", line).split("//", 1)[0]
+
+
+def _inline_keys(text: str) -> Set[str]:
+    """Top-level keys of the object literal that opens in `text`, e.g. `{ name: 'x', sku: { name: 'y' } }`."""
+    keys: Set[str] = set()
+    depth = 0
+    for index, char in enumerate(text):
+        if char in "{[(":
+            depth += 1
+        elif char in "}])":
+            depth -= 1
+            if depth <= 0:
+                break
+        if depth == 1 and char in "{,":
+            match = _INLINE_KEY.match(text, index + 1)
+            if match:
+                keys.add(match.group("key"))
+    return keys
+
+
+def scan_bicep(bicep_code: str) -> List[Declaration]:
+    """Collect module/resource declarations with their top-level keys and `params` keys in one pass."""
+    declarations: List[Declaration] = []
+    current: Optional[Declaration] = None
+    body_depth = params_depth = -1
+    depth = 0
+
+    for line_number, raw_line in enumerate(bicep_code.splitlines(), start=1):
+        line = _strip_line(raw_line)
+        if not line.strip():
+            continue
+
+        if current is None or depth < body_depth:
+            match = _DECLARATION.match(raw_line)
+            if match and depth == 0:
+                current = Declaration(
+                    kind=match.group("kind"),
+                    symbol=match.group("symbol"),
+                    type=match.group("type"),
+                    line=line_number,
+                    existing=bool(match.group("existing")),
+                )
+                declarations.append(current)
+                depth += line.count("{") - line.count("}")
+                body_depth = depth
+                params_depth = -1
+                continue
+
+        if current is not None:
+            key_match = _OBJECT_KEY.match(line)
+            if key_match:
+                key = key_match.group("key")
+                if depth == body_depth:
+                    current.keys.add(key)
+                    if key == "params" and current.kind == "module":
+                        # `params: { name: 'x' }` and `params: {}` open and close on this line
+                        rest = line[key_match.end():]
+                        current.params.update(_inline_keys(rest))
+                        if rest.count("{") > rest.count("}"):
+                            params_depth = body_depth + 1
+                elif depth == params_depth:
+                    current.params.add(key)
+
+        depth += line.count("{") - line.count("}")
+        if current is not None and depth < body_depth:
+            current = None
+            body_depth = params_depth = -1
+        elif depth < params_depth:
+            params_depth = -1  # the params block closed; later sibling objects are not params
+
+    return declarations
+
+
+class GroundingIndex:
+    """Hash indexes over the grounding corpus used to verify generated Bicep."""
+
+    def __init__(self) -> None:
+        self.modules: Dict[str, ModuleInfo] = {}
+        self.resource_types: Dict[str, ResourceTypeInfo] = {}
+        self.shared_definitions: Dict[str, str] = {}
+        self.document_count = 0
+
+    @classmethod
+    def load(cls, data_dir: str) -> "GroundingIndex":
+        """Build the index from the JSONL files in `data_dir`; missing files are skipped."""
+        index = cls()
+        avm_path = os.path.join(data_dir, AVM_DATA_FILE)
+        if os.path.exists(avm_path):
+            index.add_avm_records(read_jsonl(avm_path))
+        for schema_path in sorted(glob.glob(os.path.join(data_dir, SCHEMA_DATA_GLOB))):
+            index.add_schema_records(read_jsonl(schema_path))
+        return index
+
+    def add_avm_records(self, records: Iterable[dict]) -> None:
+        for record in records:
+            if is_shared_record(record):
+                self.shared_definitions.update(load_shared_definitions([record]))
+                continue
+
+            content = record.get("content_to_embed", "")
+            module_id = record_module_id(content)
+            if not module_id:
+                continue
+            self.document_count += 1
+
+            path, version = split_module_id(module_id)
+            module = self.modules.setdefault(path, ModuleInfo(path=path))
+            if version and version != "<version>":
+                module.versions.add(version)
+
+            if record.get("bicep"):
+                for declaration in scan_bicep(record["bicep"]):
+                    if declaration.kind == "module":
+                        module.params.update(declaration.params)
+            else:
+                module.params.update(m.group("name") for m in _PARAM_DOC_LINE.finditer(content))
+                title = _MODULE_TITLE_LINE.match(content)
+                if title and module.title is None:
+                    name, parents = title.group("name", "parents")
+                    module.title = f"{name} ({parents})" if parents else name
+
+    def add_schema_records(self, records: Iterable[dict]) -> None:
+        for record in records:
+            content = record.get("content_to_embed", "")
+            resource_type = record_resource_type(content)
+            if not resource_type:
+                continue
+            self.document_count += 1
+
+            info = self.resource_types.setdefault(
+                resource_type.lower(), ResourceTypeInfo(resource_type=resource_type)
+            )
+            api_version = _API_VERSION.search(record.get("source", ""))
+            if api_version:
+                info.api_versions.add(api_version.group(0))
+            info.properties.update(m.group("name") for m in _SCHEMA_PROPERTY_LINE.finditer(content))
+
+    def verify(self, bicep_code: str) -> List[str]:
+        """Return a warning for every module or resource reference not backed by the corpus."""
+        warnings: List[str] = []
+
+        for declaration in scan_bicep(bicep_code):
+            if declaration.kind == "module":
+                warnings.extend(self._verify_module(declaration))
+            else:
+                warnings.extend(self._verify_resource(declaration))
+
+        return warnings
+
+    def _verify_module(self, declaration: Declaration) -> List[str]:
+        if not declaration.type.startswith(("br/public:", "br:")):
+            return []  # local module file, nothing to check against
+
+        path, version = split_module_id(declaration.type)
+        module = self.modules.get(path)
+        where = f"line {declaration.line}, module '{declaration.symbol}'"
+
+        if module is None:
+            return [f"Grounding: {where} references '{path}', which is not an AVM module in the grounding data."]
+
+        warnings = []
+        if version and module.versions and version not in module.versions:
+            known_minors = {_major_minor(v) for v in module.versions}
+            if _major_minor(version) not in known_minors:
+                known = ", ".join(sorted(module.versions))
+                warnings.append(f"Grounding: {where} uses version '{version}' of '{path}'; known versions: {known}.")
+
+        if module.params:
+            unknown = sorted(declaration.params - module.params)
+            if unknown:
+                warnings.append(f"Grounding: {where} passes unknown parameter(s) to '{path}': {', '.join(unknown)}.")
+
+        return warnings
+
+    def _verify_resource(self, declaration: Declaration) -> List[str]:
+        if not self.resource_types:
+            return []  # schema data not loaded
+
+        resource_type, _, api_version = declaration.type.partition("@")
+        info = self.resource_types.get(resource_type.lower())
+        where = f"line {declaration.line}, resource '{declaration.symbol}'"
+
+        if info is None:
+            return [f"Grounding: {where} uses resource type '{resource_type}', which is not in the schema grounding data."]
+
+        warnings = []
+        if api_version and info.api_versions and api_version not in info.api_versions:
+            warnings.append(f"Grounding: {where} uses API version '{api_version}' for '{info.resource_type}', which is not in the schema grounding data.")
+
+        if not declaration.existing and info.properties:
+            unknown = sorted(declaration.keys - info.properties - BICEP_DECLARATION_KEYS)
+            if unknown:
+                warnings.append(f"Grounding: {where} sets unknown top-level propert(ies) on '{info.resource_type}': {', '.join(unknown)}.")
+
+        return warnings
+
+
+def read_jsonl(path: str) -> Iterable[dict]:
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+def default_data_dir(app_dir: str) -> str:
+    """Grounding data is staged next to the app in the container, and lives one level up in the repo."""
+    staged = os.path.join(app_dir, "grounding-data")
+    if os.path.isdir(staged):
+        return staged
+    return os.path.join(os.path.dirname(app_dir), "grounding-data")
@@ -0,0 +1,51 @@
+"""Gunicorn settings for the container.
+
+With ``preload_app`` (the default here) the app module is imported once in the
+master: the tiktoken encoding, grounding index and template catalog are built
+there and shared with every worker copy-on-write. Network clients are not
+fork-safe, so app.py skips them at import and ``post_fork`` creates them in
+each worker, along with the thread that reloads the grounding data when it
+changes (a reloaded snapshot is private to the worker that built it). Set
+``GUNICORN_PRELOAD=false`` to import the app per worker instead.
+
+The result store (/stream, /result, /cancel), refinement sessions (/refine),
+request profiles (/admin/profiles) and the rate limiter all live in the
+worker's memory, and gunicorn does not route a client back to the same
+worker. So the default is one worker that scales with ``threads``; only set
+``GUNICORN_WORKERS`` above 1 behind sticky routing, or follow-up requests
+that reach another worker get a 404/409 and the rate limits multiply.
+"""
+import gc
+import os
+
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:8000")
+# One worker: the per-process stores above must see every request of a client
+workers = int(os.getenv("GUNICORN_WORKERS", "1"))
+
+# SSE responses hold a connection for the whole generation, so the worker
+# serves them from a thread pool rather than one request at a time.
+worker_class = "gthread"
+threads = int(os.getenv("GUNICORN_THREADS", "16"))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
+
+preload_app = os.getenv("GUNICORN_PRELOAD", "true").lower() == "true"
+
+if preload_app:
+    # Read by app.py at import, which happens in the master before this config is applied to workers.
+    os.environ.setdefault("AZURE_CLIENTS_POST_FORK", "true")
+
+
+def pre_fork(server, worker):
+    # Move everything loaded so far into the permanent GC generation so collections in
+    # the workers do not touch (and therefore copy) the shared pages.
+    if preload_app:
+        gc.freeze()
+
+
+def post_fork(server, worker):
+    if preload_app:
+        import app
+
+        if app.AZURE_CLIENTS_POST_FORK:
+            app.init_azure_clients()
+            app.snapshots.start()
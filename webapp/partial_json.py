@@ -0,0 +1,159 @@
+"""Tolerant parsing of agent JSON, and stitching of continued completions.
+
+When a completion stops at the output token limit (``finish_reason ==
+'length'``), the JSON object is cut off, usually in the middle of the Bicep
+string. The app then asks the agent to continue from where it stopped (see
+``app.continue_truncated``) and joins the fragments with ``stitch``. A
+fragment may repeat the tail of the output so far or start over from the
+beginning. ``loads_tolerant`` parses the result: it drops markdown fences
+and text around the object, and if the object is still incomplete after the
+last round it closes the open string, containers and dangling keys so that
+what was generated can be used.
+"""
+from __future__ import annotations
+
+import json
+import re
+from typing import List, Tuple
+
+_FENCE = re.compile(r"^\s*```[a-zA-Z]*\s*\n?|\n?\s*```\s*$")
+_LITERAL_PREFIXES = ("true", "false", "null")
+_PARTIAL_UNICODE_ESCAPE = re.compile(r"(\\+)u[0-9a-fA-F]{0,3}$")
+MIN_OVERLAP_CHARS = 20
+MAX_OVERLAP_CHARS = 2000
+
+
+def strip_fences(text: str) -> str:
+    """Remove a markdown code fence around the whole text."""
+    return _FENCE.sub("", text)
+
+
+def complete_json(text: str) -> str:
+    """Close whatever a truncation left open in `text`: a string, a key without a value, arrays and objects."""
+    stack: List[List[str]] = []  # [bracket, what comes next: key/colon/value/comma]
+    in_string = False
+    escaped = False
+    string_start = 0
+    literal_start = -1
+
+    def finish_value() -> None:
+        if stack:
+            stack[-1][1] = "colon" if stack[-1][0] == "{" and stack[-1][1] == "key" else "comma"
+
+    for index, char in enumerate(text):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+                finish_value()
+            continue
+        if literal_start >= 0 and not (char.isalnum() or char in "+-."):
+            literal_start = -1
+        if char == '"':
+            in_string = True
+            string_start = index
+        elif char in "{[":
+            finish_value()
+            stack.append([char, "key" if char == "{" else "value"])
+        elif char in "}]":
+            if stack:
+                stack.pop()
+        elif char == ":":
+            if stack:
+                stack[-1][1] = "value"
+        elif char == ",":
+            if stack:
+                stack[-1][1] = "key" if stack[-1][0] == "{" else "value"
+        elif not char.isspace() and literal_start < 0:
+            literal_start = index
+            finish_value()
+
+    closing = ""
+    if in_string:
+        # A cut-off escape sequence cannot be closed; drop it
+        if escaped:
+            text = text[:-1]
+        else:
+            unicode_escape = _PARTIAL_UNICODE_ESCAPE.search(text, string_start)
+            if unicode_escape and len(unicode_escape.group(1)) % 2 == 1:
+                text = text[:unicode_escape.start()] + unicode_escape.group(1)[:-1]
+        closing = '"'
+        finish_value()
+    elif literal_start >= 0:
+        literal = text[literal_start:].strip()
+        if literal.isalpha() and literal not in _LITERAL_PREFIXES:
+            text = text[:literal_start] + "null"
+        elif literal[:1] in "-0123456789" and literal.endswith((".", "-", "+", "e", "E")):
+            text = text[:literal_start] + (literal.rstrip(".-+eE") or "null")
+
+    if stack:
+        expecting = stack[-1][1]
+        if expecting == "colon":
+            closing += ": null"
+        elif expecting == "value" and text.rstrip().endswith(":"):
+            closing += "null"
+        elif text.rstrip().endswith(","):
+            text = text.rstrip()[:-1]
+    for bracket, _ in reversed(stack):
+        closing += "}" if bracket == "{" else "]"
+    return text + closing
+
+
+def loads_tolerant(text: str) -> Tuple[object, bool]:
+    """(value, complete): `text` parsed as JSON, closing it first if it was cut off.
+
+    `complete` is False when the JSON had to be closed. Text before the first
+    `{` and after the end of the object is ignored. Raises ValueError when even
+    that does not give valid JSON.
+    """
+    text = strip_fences(text).strip()
+    start = text.find("{")
+    if start < 0:
+        return json.loads(text), True
+    text = text[start:]
+    try:
+        value, _ = json.JSONDecoder().raw_decode(text)
+        return value, True
+    except json.JSONDecodeError:
+        pass
+    return json.loads(complete_json(text)), False
+
+
+def _is_complete_object(text: str) -> bool:
+    """Whether `text` is exactly one JSON object, with nothing missing or left over."""
+    try:
+        return isinstance(json.loads(text), dict)
+    except ValueError:
+        return False
+
+
+def stitch(partial: str, fragment: str) -> str:
+    """Join the output so far and the continuation of it.
+
+    A fragment that is a complete object on its own means the agent started over,
+    and it replaces the output. Otherwise the fragment is appended, dropping any
+    repeat of the tail of `partial` it starts with. The longest overlap that makes
+    the whole a valid object wins, trying those of at least MIN_OVERLAP_CHARS,
+    then no overlap, then shorter ones. When none does (the output is still
+    unfinished), the shortest overlap of at least MIN_OVERLAP_CHARS is dropped.
+    """
+    fragment = strip_fences(fragment)
+    if _is_complete_object(fragment) and not _is_complete_object(partial + fragment):
+        return fragment.strip()
+
+    overlaps = [
+        size for size in range(1, min(len(partial), len(fragment), MAX_OVERLAP_CHARS) + 1)
+        if partial.endswith(fragment[:size])
+    ]
+    # A short overlap is more likely a coincidence (indentation, a closing brace) than a repeat
+    long_overlaps = [size for size in reversed(overlaps) if size >= MIN_OVERLAP_CHARS]
+    short_overlaps = [size for size in reversed(overlaps) if size < MIN_OVERLAP_CHARS]
+    for size in long_overlaps + [0] + short_overlaps:
+        candidate = partial + fragment[size:]
+        if _is_complete_object(candidate):
+            return candidate
+    # Unfinished: in repetitive text a repeat plus any multiple of the period overlaps too
+    return partial + fragment[long_overlaps[-1] if long_overlaps else 0:]
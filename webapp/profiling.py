@@ -0,0 +1,250 @@
+"""Opt-in sampling profiler for single requests.
+
+The ``debug`` event only times search and the completion. When a request is
+slow for some other reason (JSON encoding of SSE frames, token counting, log
+formatting, writing to the socket), a ``RequestProfile`` shows where its
+threads spent their time. The threads working on the request register with
+``enter``/``exit``: the generation worker, the compare workers and the SSE
+response thread. The creator names the threads it expects up front, so a
+thread that exits before another one enters does not finish the profile. While at least one profile is active, a ``Sampler`` thread
+wakes every few milliseconds, reads the stacks of the registered threads
+(``sys._current_frames``) and adds the time since the last sample to each
+stack twice. Wall time goes to the ``wall`` profile. The thread's own CPU
+clock (``time.pthread_getcpuclockid``) goes to the ``cpu`` profile. A large
+gap between the two means waiting: on Azure, on a lock, on the socket.
+
+Nothing is installed in the interpreter (no ``sys.setprofile``), and the
+sampler thread only runs while a profile is active. Requests that are not
+profiled pay nothing. Finished profiles are kept in a bounded ``ProfileStore``
+under the request's ``X-Request-ID``. Their collapsed stacks
+(``thread;frame;frame <microseconds>``) feed straight into flamegraph.pl or
+speedscope.
+"""
+from __future__ import annotations
+
+import os
+import sys
+import threading
+import time
+from collections import Counter, OrderedDict
+from typing import Dict, Iterable, List, Optional
+
+MAX_STACK_DEPTH = 64
+WEIGHTS = ("wall", "cpu")
+
+
+def _frame_name(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def _thread_cpu_clock(ident: int) -> Optional[int]:
+    try:
+        return time.pthread_getcpuclockid(ident)
+    except (AttributeError, OSError):
+        return None
+
+
+class _ThreadState:
+    """A registered thread: where its stacks are cut off, and its clocks at the last sample."""
+
+    def __init__(self, label: str, root) -> None:
+        self.label = label
+        self.root = root
+        self.cpu_clock = _thread_cpu_clock(threading.get_ident())
+        self.last_wall = time.perf_counter()
+        self.last_cpu = time.thread_time()
+
+
+class RequestProfile:
+    """Wall and CPU time per stack for the threads of one request."""
+
+    def __init__(self, request_id: str, reason: str, expected: Iterable[str] = ()) -> None:
+        self.request_id = request_id
+        self.reason = reason
+        self.started_at = time.time()
+        self.duration = 0.0
+        self.samples = 0
+        self.finished = False
+        self.stacks: Dict[str, Counter] = {weight: Counter() for weight in WEIGHTS}
+        self._threads: Dict[int, _ThreadState] = {}
+        self._registered = 0
+        self._expected = Counter(expected)
+        self._started = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def enter(self, label: str) -> None:
+        """Profile the calling thread from here on; stacks are cut off at the caller's frame."""
+        with self._lock:
+            if self.finished:
+                return
+            self._threads[threading.get_ident()] = _ThreadState(label, sys._getframe(1))
+            self._registered += 1
+            self._expected[label] -= 1
+
+    def exit(self) -> None:
+        """Stop profiling the calling thread.
+
+        The profile finishes when its last thread exits and every expected thread has entered.
+        """
+        with self._lock:
+            if self._threads.pop(threading.get_ident(), None) is None or self._threads:
+                return
+            if any(count > 0 for count in self._expected.values()):
+                return
+        self.finish()
+
+    def finish(self) -> None:
+        with self._lock:
+            if self.finished:
+                return
+            self.finished = True
+            self._threads.clear()
+            self.duration = time.perf_counter() - self._started
+
+    def expired(self, now: float, max_seconds: float) -> bool:
+        return now - self._started > max_seconds
+
+    def sample(self, frames: Dict[int, object], now: float) -> None:
+        with self._lock:
+            self.samples += 1
+            for ident, state in self._threads.items():
+                frame = frames.get(ident)
+                if frame is None:
+                    continue
+                stack = self._collapse(state, frame)
+                self.stacks["wall"][stack] += int((now - state.last_wall) * 1e6)
+                state.last_wall = now
+                if state.cpu_clock is not None:
+                    try:
+                        cpu = time.clock_gettime(state.cpu_clock)
+                    except OSError:
+                        continue
+                    self.stacks["cpu"][stack] += int((cpu - state.last_cpu) * 1e6)
+                    state.last_cpu = cpu
+
+    @staticmethod
+    def _collapse(state: _ThreadState, frame) -> str:
+        # A suspended generator's root is not on the stack; the whole stack (e.g. the server writing the response) is kept
+        names: List[str] = []
+        while frame is not None and len(names) < MAX_STACK_DEPTH:
+            names.append(_frame_name(frame))
+            if frame is state.root:
+                break
+            frame = frame.f_back
+        names.append(state.label)
+        return ";".join(reversed(names))
+
+    def collapsed(self, weight: str = "wall") -> str:
+        """The profile in collapsed-stack format, one `stack microseconds` line per stack."""
+        with self._lock:
+            return "".join(f"{stack} {value}\n" for stack, value in sorted(self.stacks[weight].items()) if value > 0)
+
+    def top_frames(self, weight: str = "wall", limit: int = 15) -> List[Dict[str, object]]:
+        """The frames with the most self time (the innermost frame of each sample)."""
+        totals: Counter = Counter()
+        with self._lock:
+            for stack, value in self.stacks[weight].items():
+                totals[stack.rsplit(";", 1)[-1]] += value
+        return [{"frame": frame, "microseconds": value} for frame, value in totals.most_common(limit) if value > 0]
+
+    def summary(self) -> Dict[str, object]:
+        with self._lock:
+            totals = {weight: sum(self.stacks[weight].values()) for weight in WEIGHTS}
+        return {
+            "request_id": self.request_id,
+            "reason": self.reason,
+            "started_at": self.started_at,
+            "duration_ms": round(self.duration * 1000, 1),
+            "finished": self.finished,
+            "samples": self.samples,
+            "threads": self._registered,
+            "wall_ms": round(totals["wall"] / 1000, 1),
+            "cpu_ms": round(totals["cpu"] / 1000, 1),
+        }
+
+
+class Sampler:
+    """One thread that samples every active profile, running only while there is one.
+
+    A profile still running after `max_seconds` (e.g. one whose threads never exited) is finished.
+    """
+
+    def __init__(self, interval: float = 0.005, max_seconds: float = 300.0) -> None:
+        self.interval = interval
+        self.max_seconds = max_seconds
+        self._profiles: List[RequestProfile] = []
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def add(self, profile: RequestProfile) -> None:
+        with self._lock:
+            self._profiles.append(profile)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+                self._thread.start()
+
+    def _run(self) -> None:
+        me = threading.get_ident()
+        while True:
+            time.sleep(self.interval)
+            now = time.perf_counter()
+            with self._lock:
+                for profile in self._profiles:
+                    if profile.expired(now, self.max_seconds):
+                        profile.finish()
+                self._profiles = [profile for profile in self._profiles if not profile.finished]
+                if not self._profiles:
+                    self._thread = None
+                    return
+                profiles = list(self._profiles)
+            frames = sys._current_frames()
+            frames.pop(me, None)
+            now = time.perf_counter()
+            for profile in profiles:
+                profile.sample(frames, now)
+            del frames
+
+
+class ProfileStore:
+    """The most recent finished (and running) profiles, by request id."""
+
+    def __init__(self, max_entries: int = 50) -> None:
+        self.max_entries = max_entries
+        self._profiles: "OrderedDict[str, RequestProfile]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def put(self, profile: RequestProfile) -> None:
+        with self._lock:
+            self._profiles[profile.request_id] = profile
+            self._profiles.move_to_end(profile.request_id)
+            while len(self._profiles) > self.max_entries:
+                self._profiles.popitem(last=False)
+
+    def get(self, request_id: str) -> Optional[RequestProfile]:
+        with self._lock:
+            return self._profiles.get(request_id)
+
+    def list(self) -> List[Dict[str, object]]:
+        with self._lock:
+            profiles = list(reversed(self._profiles.values()))
+        return [profile.summary() for profile in profiles]
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._profiles)
+
+
+class Profiler:
+    """Starts request profiles on a shared `Sampler` and keeps them in a `ProfileStore`."""
+
+    def __init__(self, interval: float = 0.005, max_entries: int = 50, max_seconds: float = 300.0) -> None:
+        self.sampler = Sampler(interval, max_seconds)
+        self.store = ProfileStore(max_entries)
+
+    def start(self, request_id: str, reason: str, expected: Iterable[str] = ()) -> RequestProfile:
+        """Profile a request whose threads will enter with the `expected` labels."""
+        profile = RequestProfile(request_id, reason, expected)
+        self.store.put(profile)
+        self.sampler.add(profile)
+        return profile
@@ -0,0 +1,167 @@
+"""Prompt assembly shared by the webapp and the offline tooling.
+
+The chat messages are laid out so that the stable parts of a request come
+first: the system message, then the retrieved context documents in a
+deterministic order, and only then the variable user query. Azure OpenAI
+caches prompts by exact prefix, so two requests that retrieve the same
+documents share everything up to the query and only pay full price for the
+tail.
+"""
+from __future__ import annotations
+
+from typing import Dict, Iterable, List, Optional
+
+from shared_parameters import SHARED_BLOCK_HEADER, expand_shared_references
+
+# Output contracts. "full" is what the agent was fine-tuned on; "compact" has the agent
+# write only the Bicep, a rationale and warnings, and agent_output.py derives the plan
+# and parameters.json from the Bicep, which saves most of the parameters.json tokens.
+FULL_CONTRACT = "full"
+COMPACT_CONTRACT = "compact"
+
+_AGENT_RULES = """
+You are an expert Azure Bicep assistant. Your sole purpose is to generate accurate and best-practice Bicep code based *only* on the user's request and the provided context documents.
+
+You MUST follow these rules strictly:
+1.  **Prioritize AVM (Azure Verified Modules):** If the user's prompt or toggle (indicated in the augmented query) asks for an AVM, you **MUST** use the AVM `module` syntax. You **MUST** use the exact `Module ID` (including the version) provided in the context documents.
+2.  **Use Classic Bicep:** If the user's prompt or toggle (indicated in the augmented query) explicitly asks for 'classic Bicep', 'non-AVM', or 'without a module', you **MUST** generate a classic Bicep `resource` definition. You **MUST** use the properties and resource types found in the "ARM Schema" context documents.
+3.  **Strict Grounding:** Your response **MUST** be based *solely* on the information provided in the user request and the accompanying context documents. Do not hallucinate module paths.
+4.  **Output Format:** You **MUST** return your final response as a single, valid JSON object. Do not provide any other text, conversation, or markdown formatting (like ```json).
+
+"""
+
+AGENT_SYSTEM_MESSAGE = _AGENT_RULES + """**Required Output JSON Schema:**
+```json
+{
+  "plan": {
+    "resources": [
+      {"resourceType": "e.g., br/public:avm/res/storage/storage-account:0.8.0", "name": "e.g., stg-prod-001"}
+    ],
+    "rationale": "A one-sentence explanation for the choice, e.g., 'User requested an AVM for Storage Account.'"
+  },
+  "files": [
+    {"path": "main.bicep", "language": "bicep", "content": "The full, valid Bicep code."},
+    {"path": "parameters.json", "language": "json", "content": "The full, valid parameters.json content."}
+  ],
+  "warnings": [
+    "e.g., 'Fell back to classic Bicep as no AVM module was found in context.'"
+  ]
+}
+```
+"""
+
+COMPACT_AGENT_SYSTEM_MESSAGE = _AGENT_RULES + """**Required Output JSON Schema:**
+```json
+{
+  "bicep": "The full, valid main.bicep code.",
+  "rationale": "A one-sentence explanation for the choice, e.g., 'User requested an AVM for Storage Account.'",
+  "warnings": [
+    "e.g., 'Fell back to classic Bicep as no AVM module was found in context.'"
+  ]
+}
+```
+Do not include a plan or a parameters.json; both are derived from the Bicep.
+"""
+
+SYSTEM_MESSAGES = {
+    FULL_CONTRACT: AGENT_SYSTEM_MESSAGE,
+    COMPACT_CONTRACT: COMPACT_AGENT_SYSTEM_MESSAGE,
+}
+
+NO_CONTEXT_MESSAGE = "No relevant context found."
+
+# Sent after a response that stopped at the output token limit (see app.continue_truncated)
+CONTINUE_PROMPT = (
+    "Your previous response was cut off by the output token limit. Continue it from exactly where it "
+    "stopped, without repeating anything and without any other text, so that your previous response "
+    "followed by this one is the complete JSON object."
+)
+
+# Appended to the user's prompt to steer both retrieval and the agent towards a mode.
+MODE_QUERY_SUFFIXES = {
+    "avm": " avm",
+    "classic": " classic non-avm",
+}
+
+
+def order_documents(documents: Iterable[Dict[str, str]]) -> List[Dict[str, str]]:
+    """Return the documents sorted by id (then content) so the context block is stable."""
+    return sorted(documents, key=lambda doc: (doc.get("id") or "", doc.get("content") or ""))
+
+
+def format_context(documents: Iterable[Dict[str, str]], shared_definitions: Optional[Dict[str, str]] = None) -> str:
+    """Render retrieved documents into the context block sent to the agent.
+
+    With `shared_definitions`, shared parameter references are resolved so each
+    definition appears once (see shared_parameters.expand_shared_references).
+    """
+    ordered = order_documents(documents)
+    if not ordered:
+        return NO_CONTEXT_MESSAGE
+
+    ordered, shared_block = expand_shared_references(ordered, shared_definitions or {})
+
+    blocks = []
+    if shared_block:
+        blocks.append(f"{SHARED_BLOCK_HEADER}\n" + "\n".join(shared_block) + "\n")
+    for index, doc in enumerate(ordered, start=1):
+        content = doc.get("content") or "No content available"
+        blocks.append(f"--- Context {index} ---\n{content}\n")
+    return "\n".join(blocks)
+
+
+def build_user_prompt(user_query: str, retrieved_content: str) -> str:
+    """Place the context before the query so it stays part of the cacheable prefix."""
+    return f"""{retrieved_content}
+
+User Request: "{user_query}\""""
+
+
+def build_agent_messages(user_query: str, retrieved_content: str, contract: str = FULL_CONTRACT) -> List[Dict[str, str]]:
+    """Assemble the chat messages for a generation request under the given output contract."""
+    return [
+        {"role": "system", "content": SYSTEM_MESSAGES[contract]},
+        {"role": "user", "content": build_user_prompt(user_query, retrieved_content)},
+    ]
+
+
+# Follow-ups to a generated template (see refinement.py): the agent returns search/replace
+# edits against the current main.bicep instead of writing the whole file again.
+REFINE_SYSTEM_MESSAGE = """
+You are an expert Azure Bicep assistant. You are changing an existing main.bicep according to the user's change request, using only the module IDs, parameters and properties in the existing template and the provided context documents.
+
+You MUST follow these rules strictly:
+1.  **Keep the mode:** Keep using AVM `module` declarations with their exact `Module ID` (including the version) if the template uses them, and classic `resource` declarations otherwise.
+2.  **Strict Grounding:** Do not hallucinate module paths, versions, parameters or properties.
+3.  **Minimal edits:** Change only what the request needs. Each edit replaces the `find` text, which MUST be copied exactly from the current main.bicep and occur in it once, with the `replace` text. Use an empty `find` to append new declarations at the end of the file. Include any new `param` declarations the change needs.
+4.  **Output Format:** You **MUST** return a single, valid JSON object. Do not provide any other text, conversation, or markdown formatting (like ```json).
+
+**Required Output JSON Schema:**
+```json
+{
+  "edits": [
+    {"find": "Exact text from the current main.bicep.", "replace": "The text to put in its place."}
+  ],
+  "warnings": [
+    "e.g., 'No AVM module for NAT gateways was found in context; used a classic resource.'"
+  ]
+}
+```
+"""
+
+
+def build_refinement_messages(original_prompt: str, current_bicep: str, change_request: str, retrieved_content: str) -> List[Dict[str, str]]:
+    """Assemble the chat messages for a follow-up: the context, the current template, then the change."""
+    return [
+        {"role": "system", "content": REFINE_SYSTEM_MESSAGE},
+        {"role": "user", "content": f"""{retrieved_content}
+
+Original Request: "{original_prompt}"
+
+Current main.bicep:
+```bicep
+{current_bicep}
+```
+
+Change Request: "{change_request}\""""},
+    ]
@@ -0,0 +1,221 @@
+"""Multi-turn refinement of a generated template.
+
+A follow-up such as "now add a private endpoint" or "switch the SKU to
+Premium" should not repeat the search and the full generation. Every
+single-mode `/generate` opens a ``RefinementSession`` under its request id,
+which keeps the generated Bicep and the documents it was grounded on
+(bounded and TTL'd in a ``SessionStore``). `/refine` then:
+
+- searches only for resources the follow-up adds that the session has no
+  documents for (``new_resource_phrases``), and reuses the stored documents
+  of the resources it mentions (``reused_documents``);
+- sends the current Bicep and the change request, and asks the agent for
+  search/replace edits instead of the whole file
+  (``prompting.REFINE_SYSTEM_MESSAGE``);
+- applies the edits here (``apply_edits``) and streams the patched template.
+"""
+from __future__ import annotations
+
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from partial_json import loads_tolerant
+from retrieval import decompose_query
+
+# Follow-ups that introduce a resource; anything else ("switch", "rename", "remove") edits what is there
+_ADDITION = re.compile(r"\b(?:add|adding|include|introduce|attach|create|deploy|provision|also|plus|along with)\b", re.IGNORECASE)
+_FOLLOW_UP_FILLER = re.compile(
+    r"^(?:(?:now|then|also|please|can you|could you|and|add|include|introduce|attach|create|deploy|provision|an?|the|some|another|new|one|two|\d+)\s+)+",
+    re.IGNORECASE,
+)
+_WORD = re.compile(r"[a-z0-9]+")
+_STOP_WORDS = frozenset({"a", "an", "the", "to", "of", "for", "in", "on", "and", "with", "it", "its", "now", "also"})
+_MIN_PHRASE_CHARS = 3
+
+
+def _content_words(text: str) -> List[str]:
+    return [word for word in _WORD.findall(text.lower()) if word not in _STOP_WORDS]
+
+
+def normalize_phrase(phrase: str) -> str:
+    return " ".join(_content_words(phrase))
+
+
+class RefinementSession:
+    """The state a follow-up builds on: the current template and the documents behind it."""
+
+    def __init__(self, session_id: str, mode: str, prompt: str) -> None:
+        self.session_id = session_id
+        self.mode = mode
+        self.prompt = prompt
+        self.bicep: Optional[str] = None
+        self.documents: Dict[str, Dict[str, str]] = {}
+        self.resources: Dict[str, List[str]] = {}  # normalized resource phrase -> document ids
+        self.turns = 0
+        self.updated_at = time.time()
+        self.busy = False
+        self.lock = threading.Lock()
+
+    def commit(self, bicep: str, documents: Iterable[Dict[str, str]] = (), resources: Optional[Dict[str, List[str]]] = None) -> None:
+        """Record the template of a finished generation or refinement and the documents it used."""
+        with self.lock:
+            self.bicep = bicep
+            for doc in documents:
+                key = doc.get("id") or doc.get("content") or ""
+                self.documents[key] = doc
+            for phrase, ids in (resources or {}).items():
+                known = self.resources.setdefault(normalize_phrase(phrase), [])
+                known.extend(doc_id for doc_id in ids if doc_id not in known)
+            self.turns += 1
+            self.updated_at = time.time()
+
+    def acquire(self) -> bool:
+        """Claim the session for one refinement; False while another one is running."""
+        with self.lock:
+            if self.busy:
+                return False
+            self.busy = True
+            return True
+
+    def release(self) -> None:
+        with self.lock:
+            self.busy = False
+
+
+class SessionStore:
+    """LRU- and TTL-bounded map of session id to `RefinementSession`; the TTL counts from last use."""
+
+    def __init__(self, max_entries: int = 200, ttl: float = 1800.0) -> None:
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._sessions: "OrderedDict[str, RefinementSession]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def create(self, session_id: str, mode: str, prompt: str) -> RefinementSession:
+        session = RefinementSession(session_id, mode, prompt)
+        with self._lock:
+            self._evict()
+            self._sessions[session_id] = session
+            while len(self._sessions) > self.max_entries:
+                self._sessions.popitem(last=False)
+        return session
+
+    def get(self, session_id: str) -> Optional[RefinementSession]:
+        with self._lock:
+            self._evict()
+            session = self._sessions.get(session_id)
+            if session is not None:
+                session.updated_at = time.time()
+                self._sessions.move_to_end(session_id)
+            return session
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._sessions)
+
+    def _evict(self) -> None:
+        cutoff = time.time() - self.ttl
+        while self._sessions:
+            oldest = next(iter(self._sessions.values()))
+            if oldest.updated_at >= cutoff:
+                break
+            self._sessions.popitem(last=False)
+
+
+def new_resource_phrases(
+    follow_up: str,
+    session: RefinementSession,
+    names_resource: Optional[Callable[[str], bool]] = None,
+) -> List[str]:
+    """The resources a follow-up adds that the session has no documents for yet."""
+    if not _ADDITION.search(follow_up):
+        return []
+    phrases = []
+    for part in decompose_query(follow_up, names_resource) or [follow_up]:
+        phrase = _FOLLOW_UP_FILLER.sub("", part.strip(" .")).strip()
+        key = normalize_phrase(phrase)
+        if len(phrase) < _MIN_PHRASE_CHARS or not key or key in session.resources or phrase in phrases:
+            continue
+        phrases.append(phrase)
+    return phrases
+
+
+def reused_documents(follow_up: str, session: RefinementSession) -> List[Dict[str, str]]:
+    """Stored documents of the resources a follow-up mentions (at least half of a resource phrase's words)."""
+    words = set(_content_words(follow_up))
+    documents = []
+    seen = set()
+    for phrase, ids in session.resources.items():
+        phrase_words = phrase.split()
+        if not phrase_words or 2 * sum(word in words for word in phrase_words) < len(phrase_words):
+            continue
+        for doc_id in ids:
+            if doc_id in session.documents and doc_id not in seen:
+                seen.add(doc_id)
+                documents.append(session.documents[doc_id])
+    return documents
+
+
+def parse_edits(content: str) -> Tuple[List[Dict[str, str]], Optional[str], List[str]]:
+    """(edits, replacement Bicep or None, warnings) from the agent's refinement JSON.
+
+    A response that returns the whole file as `bicep` instead of edits is accepted too.
+    Raises ValueError when the content is not a complete JSON object; a cut-off edit
+    must not be applied.
+    """
+    payload, complete = loads_tolerant(content)
+    if not isinstance(payload, dict):
+        raise ValueError("Refinement response is not a JSON object")
+    if not complete:
+        raise ValueError("Refinement response was cut off")
+    warnings = payload.get("warnings") or []
+    warnings = [str(warning) for warning in warnings] if isinstance(warnings, list) else [str(warnings)]
+
+    bicep = payload.get("bicep")
+    if isinstance(bicep, str) and bicep.strip() and not payload.get("edits"):
+        return [], bicep, warnings
+
+    edits = []
+    for edit in payload.get("edits") or []:
+        if isinstance(edit, dict) and isinstance(edit.get("replace"), str):
+            edits.append({"find": str(edit.get("find") or ""), "replace": edit["replace"]})
+    return edits, None, warnings
+
+
+def _locate(source: str, find: str) -> Tuple[Optional[Tuple[int, int]], str]:
+    """Span of the single occurrence of `find` in `source`, compared exactly and then ignoring whitespace."""
+    count = source.count(find)
+    if count == 1:
+        start = source.index(find)
+        return (start, start + len(find)), ""
+    if count > 1:
+        return None, "matches more than once"
+
+    tokens = find.split()
+    if not tokens:
+        return None, "is empty"
+    pattern = re.compile(r"\s+".join(re.escape(token) for token in tokens))
+    matches = list(pattern.finditer(source))
+    if len(matches) == 1:
+        return matches[0].span(), ""
+    return None, "matches more than once" if matches else "was not found"
+
+
+def apply_edits(source: str, edits: List[Dict[str, str]]) -> Tuple[str, List[str]]:
+    """Apply search/replace edits in order; an empty `find` appends. Returns the new source and the failures."""
+    failures = []
+    for index, edit in enumerate(edits, start=1):
+        find, replace = edit["find"], edit["replace"]
+        if not find.strip():
+            source = source.rstrip("\n") + "\n\n" + replace.strip("\n") + "\n"
+            continue
+        span, problem = _locate(source, find)
+        if span is None:
+            preview = " ".join(find.split())[:80]
+            failures.append(f"Edit {index}: the find text {problem}: {preview!r}")
+            continue
+        source = source[:span[0]] + replace + source[span[1]:]
+    return source, failures
@@ -0,0 +1,154 @@
+"""Request deadlines and circuit breakers for the Azure dependencies.
+
+Every generation gets one ``Deadline``; each phase asks it for a budget
+(``share``) instead of using a fixed timeout, so a slow search leaves less
+time for the model call rather than pushing the whole request past the
+ingress idle timeout.
+
+A ``CircuitBreaker`` per dependency counts consecutive failures, where a
+call that succeeds but takes longer than ``slow_after`` also counts. After
+``failure_threshold`` of them the breaker opens and callers skip the
+dependency (going straight to their fallback) for ``reset_after`` seconds;
+then one trial call is let through (half-open) and its outcome closes or
+re-opens the breaker.
+
+A ``Deadline`` can also be cancelled (the client went away, see
+``result_store.ResultEntry``). Each phase checks ``raise_if_cancelled``
+between calls and the streamed completion checks it between chunks, so
+nobody pays for search or tokens whose result will not be read.
+"""
+from __future__ import annotations
+
+import threading
+import time
+from typing import Optional
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a dependency whose breaker is open."""
+
+
+class BudgetExhausted(TimeoutError):
+    """Raised before a call when the request's own time is spent; says nothing about the dependency."""
+
+
+class RequestCancelled(Exception):
+    """Raised inside a pipeline whose request was cancelled."""
+
+    def __init__(self, phase: str, generated_tokens: int = 0) -> None:
+        super().__init__(f"Request cancelled during {phase}")
+        self.phase = phase
+        self.generated_tokens = generated_tokens
+
+
+class Deadline:
+    """Wall-clock budget for one request, measured with a monotonic clock.
+
+    `cancelled` is the event that cancels the request; pass the result store
+    entry's so that the SSE side can cancel it.
+    """
+
+    def __init__(self, seconds: float, cancelled: Optional[threading.Event] = None) -> None:
+        self.seconds = seconds
+        self.started = time.monotonic()
+        self.expires = self.started + seconds
+        self.cancelled = cancelled if cancelled is not None else threading.Event()
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires - time.monotonic())
+
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started
+
+    def expired(self) -> bool:
+        return self.remaining() <= 0.0
+
+    def is_cancelled(self) -> bool:
+        return self.cancelled.is_set()
+
+    def raise_if_cancelled(self, phase: str, generated_tokens: int = 0) -> None:
+        if self.cancelled.is_set():
+            raise RequestCancelled(phase, generated_tokens)
+
+    def share(self, fraction: float, cap: Optional[float] = None) -> float:
+        """A `fraction` of the remaining time, at most `cap` seconds."""
+        budget = self.remaining() * fraction
+        return min(budget, cap) if cap is not None else budget
+
+
+class CircuitBreaker:
+    """Consecutive-failure breaker; thread-safe, shared by all requests in a worker."""
+
+    def __init__(self, name: str, failure_threshold: int, reset_after: float, slow_after: Optional[float] = None) -> None:
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_after = reset_after
+        self.slow_after = slow_after
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self.times_opened = 0
+        self.short_circuited = 0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self) -> str:
+        if self._state == OPEN and time.monotonic() - self._opened_at >= self.reset_after:
+            self._state = HALF_OPEN
+            self._trial_in_flight = False
+        return self._state
+
+    def allow(self) -> bool:
+        """Whether a call may go to the dependency now. Half-open lets a single trial call through."""
+        with self._lock:
+            state = self._current_state()
+            if state == CLOSED:
+                return True
+            if state == HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            self.short_circuited += 1
+            return False
+
+    def record_success(self, duration: float) -> None:
+        if self.slow_after is not None and duration > self.slow_after:
+            self.record_failure()
+            return
+        with self._lock:
+            self._state = CLOSED
+            self._failures = 0
+            self._trial_in_flight = False
+
+    def abandon(self) -> None:
+        """The call let through ended without a verdict (it was cancelled); let the next one try."""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self._current_state() == HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != OPEN:
+                    self.times_opened += 1
+                self._state = OPEN
+                self._opened_at = time.monotonic()
+                self._trial_in_flight = False
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "state": self._current_state(),
+                "consecutive_failures": self._failures,
+                "trial_in_flight": self._trial_in_flight,
+                "times_opened": self.times_opened,
+                "short_circuited": self.short_circuited,
+            }
@@ -0,0 +1,153 @@
+"""Bounded, TTL'd in-memory store of generation event streams.
+
+Every `/generate` request runs its pipeline in a background thread that
+appends events here under the request's `X-Request-ID`. SSE responses only
+tail the stored events, so a client whose connection drops can reconnect
+with `Last-Event-ID` and pick up where it left off, and a finished result
+can be fetched again without paying for another search and completion.
+
+Each entry counts the SSE responses attached to it and carries the event
+that cancels its pipeline (shared with the request's ``Deadline``), so the
+app can stop the work once nobody is left to read it.
+"""
+from __future__ import annotations
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterator, List, Optional, Tuple
+
+
+class ResultEntry:
+    """The events of one request, plus a condition to wake up readers."""
+
+    def __init__(self, request_id: str) -> None:
+        self.request_id = request_id
+        self.created_at = time.time()
+        self.events: List[Dict[str, object]] = []
+        self.done = False
+        self.condition = threading.Condition()
+        self.cancelled = threading.Event()
+        self.subscribers = 0
+
+    def attach(self) -> None:
+        with self.condition:
+            self.subscribers += 1
+
+    def detach(self) -> int:
+        """Drop one SSE subscriber and return how many are left."""
+        with self.condition:
+            self.subscribers -= 1
+            return self.subscribers
+
+    def cancel(self, only_if_detached: bool = False) -> bool:
+        """Ask the pipeline to stop; False when it had already finished (or, with
+        `only_if_detached`, when a client is attached again)."""
+        with self.condition:
+            if self.done or self.cancelled.is_set() or (only_if_detached and self.subscribers > 0):
+                return False
+            self.cancelled.set()
+            return True
+
+    def append(self, event: Dict[str, object]) -> int:
+        with self.condition:
+            self.events.append(event)
+            self.condition.notify_all()
+            return len(self.events) - 1
+
+    def finish(self) -> None:
+        with self.condition:
+            self.done = True
+            self.condition.notify_all()
+
+    def wait_for_events(self, after: int, timeout: float) -> Tuple[List[Tuple[int, Dict[str, object]]], bool]:
+        """Return the events with an id greater than `after`, waiting up to `timeout` for new ones."""
+        with self.condition:
+            if len(self.events) <= after + 1 and not self.done:
+                self.condition.wait(timeout)
+            start = after + 1
+            return list(enumerate(self.events[start:], start=start)), self.done
+
+
+class ResultStore:
+    """LRU- and TTL-bounded map of request id to `ResultEntry`."""
+
+    def __init__(self, max_entries: int = 200, ttl: float = 900.0) -> None:
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, ResultEntry]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def create(self, request_id: str) -> ResultEntry:
+        entry = ResultEntry(request_id)
+        with self._lock:
+            self._evict()
+            self._entries[request_id] = entry
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+    def get(self, request_id: str) -> Optional[ResultEntry]:
+        with self._lock:
+            self._evict()
+            return self._entries.get(request_id)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            self._evict()
+            running = sum(1 for entry in self._entries.values() if not entry.done)
+            detached = sum(1 for entry in self._entries.values() if not entry.done and entry.subscribers == 0)
+            return {"entries": len(self._entries), "running": running, "running_detached": detached}
+
+    def _evict(self) -> None:
+        cutoff = time.time() - self.ttl
+        while self._entries:
+            oldest = next(iter(self._entries.values()))
+            if oldest.created_at >= cutoff:
+                break
+            self._entries.popitem(last=False)
+
+
+def tail(entry: ResultEntry, last_event_id: int = -1, keepalive: float = 15.0) -> Iterator[Optional[Tuple[int, Dict[str, object]]]]:
+    """Yield (event id, event) pairs after `last_event_id` until the entry is finished.
+
+    Yields None whenever `keepalive` seconds pass without a new event so the
+    caller can send a heartbeat.
+    """
+    after = last_event_id
+    while True:
+        events, done = entry.wait_for_events(after, keepalive)
+        for event_id, event in events:
+            yield event_id, event
+            after = event_id
+        if done and not events:
+            return
+        if not events:
+            yield None
+
+
+def summarize(entry: ResultEntry) -> Dict[str, object]:
+    """Collapse the stored events of a request into its final result."""
+    results: Dict[str, Dict[str, object]] = {}
+    for event in entry.events:
+        variant = event.get("variant") or "default"
+        if event.get("status") == "complete":
+            results[variant] = {"status": "complete", "bicep": event.get("bicep"), "warnings": event.get("warnings", [])}
+            if event.get("parameters"):
+                results[variant]["parameters"] = event["parameters"]
+        elif event.get("status") == "error":
+            results[variant] = {"status": "error", "error": event.get("error")}
+        elif event.get("status") == "cancelled":
+            results[variant] = {"status": "cancelled"}
+
+    summary: Dict[str, object] = {
+        "request_id": entry.request_id,
+        "status": "complete" if entry.done else "running",
+        "created_at": entry.created_at,
+    }
+    if set(results) == {"default"}:
+        summary.update(results["default"])
+        summary["status"] = results["default"]["status"] if entry.done else "running"
+    else:
+        summary["variants"] = results
+    return summary
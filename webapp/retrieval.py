@@ -0,0 +1,106 @@
+"""Query decomposition and result merging for multi-resource prompts.
+
+A prompt such as "web app with key vault, storage account and private
+endpoints" names several resources, and a single top-3 search rarely covers
+all of them. The prompt is split into one sub-query per resource phrase, each
+sub-query is searched separately (concurrently, see ``app.retrieve_context``),
+and the result lists are merged into one deduplicated, token-bounded context.
+
+"with" often introduces a property of the resource before it ("storage account
+with private endpoint", "aks with azure cni"), so a phrase is only split on it
+when every side names a resource of its own (``names_resource``, backed by
+the entity index in the webapp).
+"""
+from __future__ import annotations
+
+import re
+from typing import Callable, Dict, List, Optional, Sequence
+
+MAX_SUB_QUERIES = 5
+
+_SPLIT_PATTERN = re.compile(
+    r"\s*(?:,|;|\+|&|\band\b|\bplus\b|\balong with\b|\bas well as\b|\bincluding\b)\s*",
+    re.IGNORECASE,
+)
+_WITH_PATTERN = re.compile(r"\s+with\s+", re.IGNORECASE)
+_LEADING_FILLER = re.compile(
+    r"^(?:(?:please|deploy|create|provision|set up|setup|add|build|generate|make|an?|the|some|one|two|three|four|five|\d+)\s+)+",
+    re.IGNORECASE,
+)
+_MIN_PHRASE_CHARS = 3
+
+
+def _split_parts(user_query: str, names_resource: Optional[Callable[[str], bool]]) -> List[str]:
+    parts: List[str] = []
+    for part in _SPLIT_PATTERN.split(user_query):
+        pieces = _WITH_PATTERN.split(part)
+        if len(pieces) > 1 and names_resource and all(names_resource(piece) for piece in pieces):
+            parts.extend(pieces)
+        else:
+            parts.append(part)
+    return parts
+
+
+def decompose_query(user_query: str, names_resource: Optional[Callable[[str], bool]] = None) -> List[str]:
+    """Split a prompt into resource phrases.
+
+    Returns an empty list when the prompt names at most one resource, in which
+    case a single search over the full prompt is enough. Without
+    `names_resource`, "with" never splits a phrase.
+    """
+    phrases: List[str] = []
+    seen = set()
+
+    for part in _split_parts(user_query, names_resource):
+        phrase = _LEADING_FILLER.sub("", part.strip(" .")).strip()
+        key = phrase.lower()
+        if len(phrase) < _MIN_PHRASE_CHARS or key in seen:
+            continue
+        seen.add(key)
+        phrases.append(phrase)
+
+    if len(phrases) < 2:
+        return []
+    return phrases[:MAX_SUB_QUERIES]
+
+
+def merge_documents(
+    result_lists: Sequence[Sequence[Dict[str, str]]],
+    max_tokens: int,
+    count_tokens: Callable[[str], int],
+) -> List[Dict[str, str]]:
+    """Merge ranked result lists into one deduplicated list within a token budget.
+
+    The first list (the search over the full prompt) is taken in rank order,
+    then the per-resource lists are interleaved round-robin so every resource
+    gets its best match in before any resource gets a second one. Documents
+    are deduplicated by id, falling back to their content.
+    """
+    merged: List[Dict[str, str]] = []
+    seen = set()
+    used_tokens = 0
+
+    def take(doc: Dict[str, str]) -> None:
+        nonlocal used_tokens
+        key = doc.get("id") or doc.get("content")
+        if key in seen:
+            return
+        tokens = count_tokens(doc.get("content") or "")
+        if merged and used_tokens + tokens > max_tokens:
+            return
+        seen.add(key)
+        merged.append(doc)
+        used_tokens += tokens
+
+    if result_lists:
+        for doc in result_lists[0]:
+            take(doc)
+
+        rest = result_lists[1:]
+        depth = max((len(results) for results in rest), default=0)
+        for rank in range(depth):
+            for results in rest:
+                if rank < len(results):
+                    take(results[rank])
+
+    return merged
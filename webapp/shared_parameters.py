@@ -0,0 +1,166 @@
+"""Shared parameter definitions factored out of the AVM grounding documents.
+
+Most AVM modules document `enableTelemetry`, `lock`, `roleAssignments`,
+`privateEndpoints` and friends with the same text. The extraction stage
+(``grounding-data/scripts/factor_shared_parameters.py``) stores each common
+definition once as a shared document and rewrites the module documents to
+reference it::
+
+    - lock (N/A): [shared:lock]
+
+When a prompt is assembled, ``expand_shared_references`` resolves the
+references again: a definition used by several retrieved documents is
+written once in a shared block in front of the documents (when that is
+shorter), and otherwise inlined back. The prompt is never longer than the
+unfactored one. The search index is uploaded with the references already
+inlined (``upload_search_index.py``), so only documents read from the corpus
+itself carry them.
+"""
+from __future__ import annotations
+
+import re
+from collections import Counter, defaultdict
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Tuple
+
+SHARED_DOCUMENT_PREFIX = "shared_param_"
+SHARED_SOURCE = "shared-parameters"
+
+SHARED_BLOCK_HEADER = "--- Shared Parameters ---"
+
+_PARAM_LINE = re.compile(r"^- (?P<name>[A-Za-z_$][\w$]*) \((?P<type>[^)]*)\): (?P<description>.+)$", re.MULTILINE)
+_REFERENCE = re.compile(r"\[shared:(?P<ref>[\w.$-]+)\]")
+_SHARED_ID_LINE = re.compile(r"^Shared ID: (?P<ref>\S+)$", re.MULTILINE)
+_SHARED_DEFINITION_LINE = re.compile(r"^Definition: (?P<description>.+)$", re.MULTILINE)
+
+
+@dataclass
+class SharedDefinition:
+    """One parameter description shared by several modules."""
+
+    ref: str
+    name: str
+    type: str
+    description: str
+    modules: int = 0
+
+
+def _block_saving(ref: str, description: str, uses: int) -> int:
+    """Characters saved by one block line plus `uses` references instead of `uses` inlined descriptions."""
+    return (uses - 1) * len(description) - (uses + 1) * len(reference(ref)) - 3
+
+
+def reference(ref: str) -> str:
+    return f"[shared:{ref}]"
+
+
+def is_shared_record(record: dict) -> bool:
+    return record.get("id", "").startswith(SHARED_DOCUMENT_PREFIX)
+
+
+def find_shared_definitions(records: Iterable[dict], min_modules: int, min_chars: int) -> List[SharedDefinition]:
+    """Find parameter lines repeated verbatim in at least `min_modules` parameter documents."""
+    counts: Counter = Counter()
+    for record in records:
+        if record.get("bicep") or is_shared_record(record):
+            continue  # README examples have no parameter descriptions
+        lines = {m.group("name", "type", "description") for m in _PARAM_LINE.finditer(record["content_to_embed"])}
+        counts.update(lines)
+
+    candidates = [
+        (key, count) for key, count in counts.items()
+        if count >= min_modules and len(key[2]) >= min_chars and not _REFERENCE.fullmatch(key[2])
+    ]
+    # The most common variant of a name gets the plain name as its ref, the others `name.2`, `name.3`, ...
+    candidates.sort(key=lambda item: (item[0][0], -item[1], item[0][2]))
+    definitions: List[SharedDefinition] = []
+    seen: Counter = Counter()
+    for (name, type_, description), count in candidates:
+        seen[name] += 1
+        ref = name if seen[name] == 1 else f"{name}.{seen[name]}"
+        definitions.append(SharedDefinition(ref, name, type_, description, count))
+    return definitions
+
+
+def shared_record(definition: SharedDefinition) -> dict:
+    """The shared document stored in the corpus for one definition (it is not uploaded to search)."""
+    content = (
+        f"Shared AVM Parameter Definition '{definition.name}' ({definition.type}), used by {definition.modules} modules.\n"
+        f"Shared ID: {definition.ref}\n"
+        f"Definition: {definition.description}"
+    )
+    return {
+        "id": f"{SHARED_DOCUMENT_PREFIX}{definition.ref.replace('.', '-').replace('$', '_')}",
+        "source": SHARED_SOURCE,
+        "content_to_embed": content,
+    }
+
+
+def load_shared_definitions(records: Iterable[dict]) -> Dict[str, str]:
+    """Map each shared ref to its description from the shared documents in the corpus."""
+    definitions = {}
+    for record in records:
+        if not is_shared_record(record):
+            continue
+        content = record.get("content_to_embed", "")
+        ref = _SHARED_ID_LINE.search(content)
+        description = _SHARED_DEFINITION_LINE.search(content)
+        if ref and description:
+            definitions[ref.group("ref")] = description.group("description")
+    return definitions
+
+
+def factor_content(content: str, refs_by_line: Dict[Tuple[str, str, str], str]) -> str:
+    """Replace shared parameter descriptions in a module document with references."""
+    def replace(match):
+        ref = refs_by_line.get(match.group("name", "type", "description"))
+        if ref is None:
+            return match.group(0)
+        return f"- {match.group('name')} ({match.group('type')}): {reference(ref)}"
+
+    return _PARAM_LINE.sub(replace, content)
+
+
+def inline_references(content: str, definitions: Dict[str, str]) -> str:
+    """Replace every known reference in `content` with its description."""
+    return _REFERENCE.sub(lambda m: definitions.get(m.group("ref"), m.group(0)), content)
+
+
+def expand_shared_references(
+    documents: List[Dict[str, str]],
+    definitions: Dict[str, str],
+) -> Tuple[List[Dict[str, str]], List[str]]:
+    """Resolve references for one prompt; return the documents and the shared block lines.
+
+    A reference stays a reference (defined once in the block) only when that
+    is shorter than inlining the description into every document using it;
+    otherwise it is inlined. Definitions whose shared document was itself
+    retrieved are not repeated.
+    """
+    if not definitions:
+        return documents, []
+
+    present = set()
+    usage: Dict[str, int] = defaultdict(int)
+    for doc in documents:
+        content = doc.get("content") or ""
+        shared_id = _SHARED_ID_LINE.search(content)
+        if shared_id:
+            present.add(shared_id.group("ref"))
+        for ref in set(_REFERENCE.findall(content)):
+            usage[ref] += 1
+
+    block_refs = sorted(
+        ref for ref, count in usage.items()
+        if ref in definitions and (ref in present or _block_saving(ref, definitions[ref], count) > 0)
+    )
+    if sum(_block_saving(ref, definitions[ref], usage[ref]) for ref in block_refs if ref not in present) < len(SHARED_BLOCK_HEADER):
+        block_refs = [ref for ref in block_refs if ref in present]
+    inline = {ref: definitions[ref] for ref in usage if ref in definitions and ref not in block_refs}
+
+    expanded = [
+        {**doc, "content": inline_references(doc.get("content") or "", inline)} if inline else doc
+        for doc in documents
+    ]
+    block = [f"{reference(ref)}: {definitions[ref]}" for ref in block_refs if ref not in present]
+    return expanded, block
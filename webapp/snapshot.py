@@ -0,0 +1,318 @@
+"""Hot reload of the grounding data without restarting the app.
+
+Everything the app builds from ``GROUNDING_DATA_DIR`` (the grounding index,
+local fallback retrieval, suggestions, entity detection, fast path and
+template catalog) lives in one ``GroundingSnapshot``. A request takes
+``SnapshotManager.current`` once when it starts and uses that object to the
+end, so replacing the reference never changes the data under a running
+generation. Old snapshots are freed when their last request finishes.
+
+The manager's watcher thread fingerprints the data directory (its resolved
+path plus the name, size and mtime of each ``*.jsonl``). When the fingerprint
+changes and stays the same for one more poll, so a copy in progress is not
+picked up half-written, it builds a new snapshot from the resolved directory
+in the background and swaps it in. A build that fails, or whose files
+changed while it ran, is discarded and the current snapshot stays. Pointing
+``GROUNDING_DATA_DIR`` at a symlink to a versioned release directory and
+replacing the symlink makes the switch atomic.
+"""
+from __future__ import annotations
+
+import glob
+import hashlib
+import os
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+from entities import EntityIndex
+from fallback_retrieval import LocalRetriever
+from fast_path import FastPathIndex
+from grounding import GroundingIndex
+from suggest import Suggester
+from template_catalog import CATALOG_FILE, TemplateCatalog
+
+DATA_FILE_GLOB = "*.jsonl"
+MEMORY_SAMPLE_SECONDS = 0.02
+
+
+def data_fingerprint(data_dir: str) -> str:
+    """Short hash of the resolved data directory and the name, size and mtime of its data files."""
+    resolved = os.path.realpath(data_dir)
+    digest = hashlib.sha1(resolved.encode("utf-8"))
+    for path in sorted(glob.glob(os.path.join(resolved, DATA_FILE_GLOB))):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        digest.update(f"\n{os.path.basename(path)}:{stat.st_size}:{stat.st_mtime_ns}".encode("utf-8"))
+    return digest.hexdigest()[:12]
+
+
+def rss_bytes() -> Optional[int]:
+    """Resident set size of this process, or None where /proc is not available."""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class GroundingSnapshot:
+    """Everything built from one version of the grounding data; not modified once published."""
+
+    def __init__(self, version: str, data_dir: str) -> None:
+        self.version = version
+        self.data_dir = data_dir
+        self.loaded_at = time.time()
+        self.grounding_index: Optional[GroundingIndex] = None
+        self.local_retriever: Optional[LocalRetriever] = None
+        self.suggester = Suggester()
+        self.entity_index = EntityIndex()
+        self.fast_path_index = FastPathIndex()
+        self.template_catalog = TemplateCatalog()
+
+    def describe(self) -> Dict[str, object]:
+        return {
+            "version": self.version,
+            "data_dir": self.data_dir,
+            "loaded_at": self.loaded_at,
+            "avm_modules": len(self.grounding_index.modules) if self.grounding_index else 0,
+            "fallback_documents": len(self.local_retriever) if self.local_retriever else 0,
+            "suggestions": len(self.suggester),
+            "entities": len(self.entity_index),
+            "fast_path_examples": len(self.fast_path_index),
+            "catalog_templates": len(self.template_catalog),
+        }
+
+
+def build_snapshot(
+    data_dir: str,
+    version: str,
+    fast_path_enabled: bool = True,
+    min_score: float = 0.75,
+    min_margin: float = 0.25,
+    report: Callable[[str], None] = print,
+    strict: bool = False,
+) -> GroundingSnapshot:
+    """Load every structure from `data_dir`.
+
+    At startup (`strict` off) a part that fails to load is reported and left empty, as
+    the app can run without it. A reload is `strict`: the first failure raises, so a
+    broken release never replaces a working snapshot.
+    """
+    snapshot = GroundingSnapshot(version, data_dir)
+
+    def load(description: str, build: Callable[[], None]) -> None:
+        try:
+            build()
+        except Exception as e:
+            if strict:
+                raise RuntimeError(f"Could not load {description} from {data_dir}: {e}") from e
+            report(f"⚠ Warning: Could not load {description} from {data_dir}: {e}")
+
+    def load_grounding_index() -> None:
+        snapshot.grounding_index = GroundingIndex.load(data_dir)
+        report(f"✓ Loaded grounding index: {len(snapshot.grounding_index.modules)} AVM modules, {len(snapshot.grounding_index.resource_types)} resource types")
+
+    def load_local_retriever() -> None:
+        snapshot.local_retriever = LocalRetriever.load(data_dir)
+        report(f"✓ Loaded local fallback retrieval: {len(snapshot.local_retriever)} documents")
+
+    def build_suggester() -> None:
+        started = time.perf_counter()
+        snapshot.suggester = Suggester.from_grounding_index(snapshot.grounding_index)
+        report(f"✓ Built suggestion index: {len(snapshot.suggester)} entries in {(time.perf_counter() - started) * 1000:.0f}ms")
+
+    def build_entity_index() -> None:
+        started = time.perf_counter()
+        documents = snapshot.local_retriever.documents if snapshot.local_retriever else []
+        snapshot.entity_index = EntityIndex.build(snapshot.grounding_index, documents)
+        report(f"✓ Built entity index: {len(snapshot.entity_index)} resource entities in {(time.perf_counter() - started) * 1000:.0f}ms")
+
+    def load_fast_path() -> None:
+        snapshot.fast_path_index = FastPathIndex.load(data_dir, min_score, min_margin)
+        report(f"✓ Loaded fast path: {len(snapshot.fast_path_index)} README examples")
+
+    def load_catalog() -> None:
+        snapshot.template_catalog = TemplateCatalog.load(os.path.join(data_dir, CATALOG_FILE))
+        report(f"✓ Loaded template catalog: {len(snapshot.template_catalog)} pre-generated templates")
+
+    snapshot.fast_path_index = FastPathIndex(min_score, min_margin)
+    load("grounding data", load_grounding_index)
+    load("local fallback retrieval", load_local_retriever)
+    if snapshot.grounding_index is not None:
+        load("the suggestion index", build_suggester)
+        load("the entity index", build_entity_index)
+    if fast_path_enabled:
+        load("fast path examples", load_fast_path)
+    load("the template catalog", load_catalog)
+    snapshot.loaded_at = time.time()
+    return snapshot
+
+
+class _PeakMemory:
+    """Samples the RSS on a helper thread while a build runs, to report its peak."""
+
+    def __init__(self) -> None:
+        self.before = rss_bytes()
+        self.peak = self.before
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, name="snapshot-memory", daemon=True)
+
+    def __enter__(self) -> "_PeakMemory":
+        if self.before is not None:
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+        self._observe()
+
+    def _observe(self) -> None:
+        current = rss_bytes()
+        if current is not None and (self.peak is None or current > self.peak):
+            self.peak = current
+
+    def _sample(self) -> None:
+        while not self._stop.wait(MEMORY_SAMPLE_SECONDS):
+            self._observe()
+
+
+def _megabytes(value: Optional[int]) -> Optional[float]:
+    return round(value / (1024 * 1024), 1) if value is not None else None
+
+
+class SnapshotManager:
+    """Holds the current `GroundingSnapshot` and replaces it when the data directory changes.
+
+    `build(data_dir, version, initial=False)` makes a snapshot; `initial` is set for the
+    first one, which `load` builds at startup.
+    """
+
+    def __init__(self, data_dir: str, build: Callable[..., GroundingSnapshot], poll_seconds: float = 60.0, logger=None) -> None:
+        self.data_dir = data_dir
+        self.poll_seconds = poll_seconds
+        self.logger = logger
+        self._build = build
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._pid = os.getpid()
+        self._pending: Optional[str] = None
+        self._failed: Optional[str] = None
+        self.current: Optional[GroundingSnapshot] = None
+        self.reloads = 0
+        self.failed_reloads = 0
+        self.last_build: Dict[str, object] = {}
+        self.last_error: Optional[str] = None
+
+    def load(self) -> GroundingSnapshot:
+        """Build the first snapshot synchronously, reporting each part as it loads."""
+        version = data_fingerprint(self.data_dir)
+        with _PeakMemory() as memory:
+            started = time.perf_counter()
+            self.current = self._build(os.path.realpath(self.data_dir), version, initial=True)
+            self._record_build(version, time.perf_counter() - started, memory)
+        return self.current
+
+    def start(self) -> None:
+        """Start the watcher thread in this process; a no-op when polling is off or it is already running."""
+        if self.poll_seconds <= 0:
+            return
+        if os.getpid() != self._pid:
+            # A fork copies the lock in whatever state the parent's threads left it
+            self._pid = os.getpid()
+            self._lock = threading.Lock()
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._watch, name="snapshot-watcher", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _watch(self) -> None:
+        while not self._stop.wait(self.poll_seconds):
+            try:
+                self.check()
+            except Exception as e:
+                self._log("error", f"Grounding data check failed: {e}")
+
+    def check(self) -> bool:
+        """One poll: reload when the data changed and has been stable since the last poll.
+
+        A version that failed to build is not retried until the data changes again.
+        """
+        version = data_fingerprint(self.data_dir)
+        if (self.current is not None and version == self.current.version) or version == self._failed:
+            self._pending = None
+            return False
+        if version != self._pending:
+            self._pending = version
+            return False
+        self._pending = None
+        return self.reload(version)
+
+    def reload(self, version: Optional[str] = None) -> bool:
+        """Build a snapshot of the data directory and swap it in; False when the build fails or the data moves."""
+        version = version or data_fingerprint(self.data_dir)
+        with self._lock:
+            data_dir = os.path.realpath(self.data_dir)
+            self._log("info", f"Building grounding snapshot {version} from {data_dir}")
+            with _PeakMemory() as memory:
+                started = time.perf_counter()
+                try:
+                    snapshot = self._build(data_dir, version)
+                except Exception as e:
+                    self.failed_reloads += 1
+                    self.last_error = str(e)
+                    self._failed = version
+                    self._log("error", f"Grounding snapshot {version} failed to build, keeping {self.current.version if self.current else 'none'}: {e}")
+                    return False
+                if data_fingerprint(self.data_dir) != version:
+                    self.failed_reloads += 1
+                    self.last_error = f"Data changed while snapshot {version} was building"
+                    self._log("warning", f"{self.last_error}; will retry once it settles")
+                    return False
+                previous = self.current
+                self.current = snapshot
+                build_seconds = time.perf_counter() - started
+            self.reloads += 1
+            self.last_error = None
+            self._record_build(version, build_seconds, memory)
+            self._log(
+                "info",
+                f"Swapped grounding snapshot {previous.version if previous else 'none'} -> {version} "
+                f"in {build_seconds:.2f}s (peak RSS {_megabytes(memory.peak)} MB)"
+            )
+            return True
+
+    def _record_build(self, version: str, seconds: float, memory: _PeakMemory) -> None:
+        self.last_build = {
+            "version": version,
+            "build_seconds": round(seconds, 3),
+            "rss_before_mb": _megabytes(memory.before),
+            "peak_rss_mb": _megabytes(memory.peak),
+            "rss_after_mb": _megabytes(rss_bytes()),
+            "finished_at": time.time(),
+        }
+
+    def _log(self, level: str, message: str) -> None:
+        if self.logger is not None:
+            getattr(self.logger, level)(message)
+
+    def stats(self) -> Dict[str, object]:
+        """The active snapshot, the last build and reload counts, for /health."""
+        return {
+            "active": self.current.describe() if self.current else None,
+            "last_build": self.last_build,
+            "reloads": self.reloads,
+            "failed_reloads": self.failed_reloads,
+            "last_error": self.last_error,
+            "watching": self._thread is not None and self._thread.is_alive(),
+            "poll_seconds": self.poll_seconds,
+        }
@@ -4,28 +4,275 @@ const statusMessage = document.getElementById('status-message');
 const outputCode = document.getElementById('output-code');
 
 let abortController = null;
-let isGenerating = false;
+// Bumped by every submit; a handler whose generation is no longer current leaves the UI alone
+let generation = 0;
+// Request id of the generation still running on the server, so it can be cancelled
+let activeRequestId = null;
+// The last single-mode result, which follow-ups can refine: { id, mode, prompt }
+let refineSession = null;
+const refineOption = document.getElementById('refine-option');
+const refineToggle = document.getElementById('refine-toggle');
+
+const MODE_LABELS = { avm: 'AVM', classic: 'Classic' };
+let compareResults = {};
+let compareDebug = {};
+let compareWarnings = {};
+let activeCompareTab = 'avm';
+
+const MAX_RECONNECT_ATTEMPTS = 5;
+
+const SUGGEST_DEBOUNCE_MS = 150;
+const SUGGEST_MIN_CHARS = 2;
+const suggestionList = document.getElementById('suggestion-list');
+let suggestTimer = null;
+let suggestController = null;
+let suggestions = [];
+let suggestionFragment = '';
+let activeSuggestion = -1;
+
+function selectedMode() {
+    if (document.getElementById('mode-compare').checked) {
+        return 'compare';
+    }
+    return document.getElementById('mode-avm').checked ? 'avm' : 'classic';
+}
 
-submitButton.addEventListener('click', async (event) => {
-    event.preventDefault();
+function renderCode(code) {
+    const codePre = document.getElementById('code-pre');
+    outputCode.textContent = code;
+    Prism.highlightElement(outputCode);
+    codePre.style.visibility = 'visible';
+}
+
+function renderWarnings(warnings) {
+    const container = document.getElementById('warnings-container');
+    const list = document.getElementById('warnings-list');
+    list.innerHTML = '';
 
-    if (isGenerating) {
+    if (!warnings || warnings.length === 0) {
+        container.classList.add('hidden');
         return;
     }
 
-    isGenerating = true;
+    for (const warning of warnings) {
+        const item = document.createElement('li');
+        item.textContent = warning;
+        list.appendChild(item);
+    }
+    container.classList.remove('hidden');
+}
+
+function renderDebug(debug, modeLabel) {
+    document.getElementById('debug-total-time').textContent = debug.total_time;
+    document.getElementById('debug-search-time').textContent = debug.search_time;
+    document.getElementById('debug-ai-time').textContent = debug.ai_time;
+    const retrieval = debug.budget && debug.budget.retrieval !== 'search' ? ` (fallback: ${debug.budget.retrieval})` : '';
+    document.getElementById('debug-search-results').textContent = debug.result_count + ' documents' + retrieval;
+    document.getElementById('debug-context-size').textContent = debug.context_size;
+    document.getElementById('debug-mode').textContent = debug.fast_path ? `${modeLabel} (fast path: README example)` : modeLabel;
+
+    const searchContentCode = document.getElementById('search-content-code');
+    if (debug.search_content && debug.search_content !== 'N/A') {
+        searchContentCode.textContent = debug.search_content;
+    } else {
+        searchContentCode.textContent = debug.search_content || 'No search content available';
+    }
+}
+
+function selectCompareTab(variant) {
+    activeCompareTab = variant;
+
+    for (const name of Object.keys(MODE_LABELS)) {
+        const tab = document.getElementById(`tab-${name}`);
+        tab.className = name === variant
+            ? 'text-xs px-3 py-1 rounded-t-md bg-gray-900 text-white'
+            : 'text-xs px-3 py-1 rounded-t-md bg-gray-300 text-gray-700';
+    }
+
+    renderWarnings(compareWarnings[variant]);
+
+    if (compareResults[variant] !== undefined) {
+        renderCode(compareResults[variant]);
+    } else {
+        renderCode(`// ${MODE_LABELS[variant]} template is still generating...`);
+    }
+
+    if (compareDebug[variant]) {
+        renderDebug(compareDebug[variant], `Compare (${MODE_LABELS[variant]})`);
+    }
+}
+
+function handleCompareEvent(event) {
+    const variant = event.variant;
+    const label = MODE_LABELS[variant] || variant;
+
+    if (event.status === 'progress') {
+        statusMessage.textContent = `[${label}] ${event.message}`;
+        statusMessage.className = 'text-sm text-blue-600 mb-4 font-semibold';
+    } else if (event.status === 'debug') {
+        compareDebug[variant] = event.debug;
+        if (variant === activeCompareTab) {
+            renderDebug(event.debug, `Compare (${label})`);
+        }
+    } else if (event.status === 'complete') {
+        compareResults[variant] = event.bicep || '// No code generated';
+        compareWarnings[variant] = event.warnings || [];
+        if (variant === activeCompareTab) {
+            renderCode(compareResults[variant]);
+            renderWarnings(compareWarnings[variant]);
+        }
+    } else if (event.status === 'cancelled') {
+        compareResults[variant] = '// Generation cancelled.';
+        if (variant === activeCompareTab) {
+            renderCode(compareResults[variant]);
+        }
+    } else if (event.status === 'error') {
+        compareResults[variant] = '// Error occurred. Please try again.';
+        statusMessage.textContent = `[${label}] ${event.error}`;
+        statusMessage.className = 'text-sm text-red-600 mb-4 font-semibold';
+        if (variant === activeCompareTab) {
+            renderCode(compareResults[variant]);
+        }
+    }
+}
+
+// Reads SSE frames from a fetch response, tracking the last event id so an
+// interrupted stream can be resumed from GET /stream/<request id>.
+async function readEventStream(response, stream, onEvent) {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+
+    while (true) {
+        const { done, value } = await reader.read();
+
+        if (done) break;
+
+        buffer += decoder.decode(value, { stream: true });
+
+        const frames = buffer.split('\n\n');
+        buffer = frames.pop();
+
+        for (const frame of frames) {
+            let eventId = null;
+            let jsonData = null;
+
+            for (const line of frame.split('\n')) {
+                if (line.startsWith('id: ')) {
+                    eventId = parseInt(line.substring(4), 10);
+                } else if (line.startsWith('data: ')) {
+                    jsonData = line.substring(6);
+                }
+            }
+
+            if (jsonData === null) {
+                continue;
+            }
+            if (eventId !== null) {
+                if (eventId <= stream.lastEventId) {
+                    continue;
+                }
+                stream.lastEventId = eventId;
+            }
+
+            try {
+                const event = JSON.parse(jsonData);
+                if (onEvent(event)) {
+                    stream.finished = true;
+                }
+            } catch (e) {
+                console.error('Error parsing SSE data:', e);
+            }
+        }
+    }
+}
+
+// Applies one event to the page. Returns true once the final result (or error) has arrived.
+function handleEvent(event, bicepMode) {
+    const codePre = document.getElementById('code-pre');
+
+    if (event.variant) {
+        handleCompareEvent(event);
+        const modes = Object.keys(MODE_LABELS);
+        return modes.every((name) => compareResults[name] !== undefined);
+    }
+
+    if (event.status === 'progress') {
+        statusMessage.textContent = event.message;
+        statusMessage.className = 'text-sm text-blue-600 mb-4 font-semibold';
+    } else if (event.status === 'debug') {
+        renderDebug(event.debug, MODE_LABELS[bicepMode]);
+    } else if (event.status === 'complete') {
+        const bicepCode = event.bicep || '// No code generated';
+        outputCode.textContent = bicepCode;
+        renderWarnings(event.warnings);
+
+        Prism.highlightElement(outputCode);
+        codePre.style.visibility = 'visible';
+
+        statusMessage.textContent = '✅ Template generated successfully!';
+        statusMessage.className = 'text-sm text-green-600 mb-4 font-semibold';
+
+        setTimeout(() => {
+            statusMessage.textContent = '';
+        }, 3000);
+        return true;
+    } else if (event.status === 'error') {
+        statusMessage.textContent = event.error;
+        statusMessage.className = 'text-sm text-red-600 mb-4 font-semibold';
+
+        outputCode.textContent = '// Error occurred. Please try again.';
+        Prism.highlightElement(outputCode);
+        codePre.style.visibility = 'visible';
+        return true;
+    } else if (event.status === 'cancelled') {
+        statusMessage.textContent = 'Generation cancelled.';
+        statusMessage.className = 'text-sm text-gray-600 mb-4 font-semibold';
+        return true;
+    }
+
+    return false;
+}
+
+// Tells the server to stop a generation nobody will read, so it stops searching and
+// generating tokens at once instead of after the disconnect grace period.
+function cancelActiveGeneration() {
+    if (!activeRequestId) {
+        return;
+    }
+    fetch(`/cancel/${activeRequestId}`, { method: 'POST', keepalive: true }).catch(() => {});
+    activeRequestId = null;
+}
+
+window.addEventListener('pagehide', () => {
+    if (activeRequestId) {
+        navigator.sendBeacon(`/cancel/${activeRequestId}`);
+    }
+});
+
+submitButton.addEventListener('click', async (event) => {
+    event.preventDefault();
 
     const promptText = promptInput.value.trim();
-    const modeAVM = document.getElementById('mode-avm').checked;
-    const bicepMode = modeAVM ? 'avm' : 'classic';
+    const refining = Boolean(refineSession && refineToggle.checked);
+    const bicepMode = refining ? refineSession.mode : selectedMode();
 
     if (!promptText) {
         statusMessage.textContent = 'Please enter a prompt.';
         statusMessage.className = 'text-sm text-red-600 mb-4';
-        isGenerating = false;
         return;
     }
 
+    // A new submit replaces the running generation: stop reading it and cancel it on the server
+    const thisGeneration = ++generation;
+    const isCurrent = () => thisGeneration === generation;
+    if (abortController) {
+        abortController.abort();
+    }
+    cancelActiveGeneration();
+    const controller = new AbortController();
+    abortController = controller;
+
     statusMessage.textContent = 'Starting...';
     statusMessage.className = 'text-sm text-blue-600 mb-4 font-semibold';
 
@@ -45,29 +292,57 @@ submitButton.addEventListener('click', async (event) => {
     const codePre = document.getElementById('code-pre');
     codePre.style.visibility = 'hidden';
 
-    submitButton.disabled = true;
-    submitButton.textContent = 'Generating...';
-    submitButton.className = 'w-full bg-gray-400 text-white py-2 px-4 rounded-md cursor-not-allowed transition';
-
-    try {
-        if (abortController) {
-            abortController.abort();
-        }
+    compareResults = {};
+    compareDebug = {};
+    compareWarnings = {};
+    renderWarnings([]);
+    activeCompareTab = 'avm';
+    const compareTabs = document.getElementById('compare-tabs');
+    if (bicepMode === 'compare') {
+        compareTabs.classList.remove('hidden');
+        selectCompareTab('avm');
+    } else {
+        compareTabs.classList.add('hidden');
+    }
 
-        abortController = new AbortController();
+    submitButton.textContent = 'Generating... (click to restart)';
+    submitButton.className = 'w-full bg-gray-500 text-white py-2 px-4 rounded-md hover:bg-gray-600 transition';
 
-        const response = await fetch('/generate', {
+    try {
+        // The retrieved context is only sent back when the debug panel is open
+        const debug = !document.getElementById('debug-content').classList.contains('hidden');
+        const startGeneration = (prompt) => fetch('/generate', {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json',
             },
-            body: JSON.stringify({
-                prompt: promptText,
-                mode: bicepMode
-            }),
-            signal: abortController.signal
+            body: JSON.stringify({ prompt, mode: bicepMode, debug }),
+            signal: controller.signal
         });
 
+        let response;
+        let generationPrompt = promptText;
+        if (refining) {
+            response = await fetch('/refine', {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify({ session_id: refineSession.id, prompt: promptText, debug }),
+                signal: controller.signal
+            });
+            if (response.status === 404) {
+                // The session expired (or lives in another worker): regenerate with both prompts
+                generationPrompt = `${refineSession.prompt}. ${promptText}`;
+                refineSession = null;
+                response = await startGeneration(generationPrompt);
+            }
+        } else {
+            response = await startGeneration(promptText);
+        }
+
+        if (!isCurrent()) {
+            return;
+        }
+
         if (!response.ok) {
             const errorData = await response.json().catch(() => ({}));
             const errorMessage = errorData.error || `Error: ${response.status} ${response.statusText}`;
@@ -78,85 +353,88 @@ submitButton.addEventListener('click', async (event) => {
             outputCode.textContent = '// Error occurred. Please try again.';
             Prism.highlightElement(outputCode);
             codePre.style.visibility = 'visible';
-
-            submitButton.disabled = false;
-            submitButton.textContent = 'Generate Bicep Template';
-            submitButton.className = 'w-full bg-blue-600 text-white py-2 px-4 rounded-md hover:bg-blue-700 transition';
-            isGenerating = false;
             return;
         }
 
-        const reader = response.body.getReader();
-        const decoder = new TextDecoder();
-        let buffer = '';
+        const requestId = response.headers.get('X-Request-ID');
+        activeRequestId = requestId;
+        const stream = { lastEventId: -1, finished: false, completed: false };
+        let currentResponse = response;
+        let reconnectAttempts = 0;
 
         while (true) {
-            const { done, value } = await reader.read();
-
-            if (done) break;
-
-            buffer += decoder.decode(value, { stream: true });
-
-            const lines = buffer.split('\n\n');
-            buffer = lines.pop();
-
-            for (const line of lines) {
-                if (line.startsWith('data: ')) {
-                    const jsonData = line.substring(6);
-                    try {
-                        const event = JSON.parse(jsonData);
-
-                        if (event.status === 'progress') {
-                            statusMessage.textContent = event.message;
-                            statusMessage.className = 'text-sm text-blue-600 mb-4 font-semibold';
-                        } else if (event.status === 'debug') {
-                            const debug = event.debug;
-                            const modeAVM = document.getElementById('mode-avm').checked;
-                            const bicepMode = modeAVM ? 'AVM' : 'Classic';
-
-                            document.getElementById('debug-total-time').textContent = debug.total_time;
-                            document.getElementById('debug-search-time').textContent = debug.search_time;
-                            document.getElementById('debug-ai-time').textContent = debug.ai_time;
-                            document.getElementById('debug-search-results').textContent = debug.result_count + ' documents';
-                            document.getElementById('debug-context-size').textContent = debug.context_size;
-                            document.getElementById('debug-mode').textContent = bicepMode;
-
-                            const searchContentCode = document.getElementById('search-content-code');
-                            if (debug.search_content && debug.search_content !== 'N/A') {
-                                searchContentCode.textContent = debug.search_content;
-                            } else {
-                                searchContentCode.textContent = debug.search_content || 'No search content available';
-                            }
-                        } else if (event.status === 'complete') {
-                            const bicepCode = event.bicep || '// No code generated';
-                            outputCode.textContent = bicepCode;
-
-                            Prism.highlightElement(outputCode);
-                            codePre.style.visibility = 'visible';
-
-                            statusMessage.textContent = '✅ Template generated successfully!';
-                            statusMessage.className = 'text-sm text-green-600 mb-4 font-semibold';
-
-                            setTimeout(() => {
-                                statusMessage.textContent = '';
-                            }, 3000);
-                        } else if (event.status === 'error') {
-                            statusMessage.textContent = event.error;
-                            statusMessage.className = 'text-sm text-red-600 mb-4 font-semibold';
-
-                            outputCode.textContent = '// Error occurred. Please try again.';
-                            Prism.highlightElement(outputCode);
-                            codePre.style.visibility = 'visible';
-                        }
-                    } catch (e) {
-                        console.error('Error parsing SSE data:', e);
+            try {
+                await readEventStream(currentResponse, stream, (event) => {
+                    if (event.status === 'complete' && !event.variant) {
+                        stream.completed = true;
                     }
+                    return handleEvent(event, bicepMode);
+                });
+            } catch (error) {
+                if (error.name === 'AbortError' || !requestId) {
+                    throw error;
                 }
+                console.warn('Stream interrupted:', error);
+            }
+
+            if (stream.finished) {
+                activeRequestId = null;
+                break;
+            }
+
+            // The connection dropped before the result arrived; the server keeps generating,
+            // so reconnect and replay the events after the last one we saw.
+            if (!requestId || reconnectAttempts >= MAX_RECONNECT_ATTEMPTS) {
+                throw new Error('Connection lost before the template was generated');
+            }
+            reconnectAttempts += 1;
+
+            statusMessage.textContent = `Connection lost, reconnecting (attempt ${reconnectAttempts})...`;
+            statusMessage.className = 'text-sm text-yellow-600 mb-4 font-semibold';
+            await new Promise((resolve) => setTimeout(resolve, 1000 * reconnectAttempts));
+            if (!isCurrent()) {
+                return;
+            }
+
+            currentResponse = await fetch(`/stream/${requestId}`, {
+                headers: { 'Last-Event-ID': String(stream.lastEventId) },
+                signal: controller.signal
+            });
+
+            if (!currentResponse.ok) {
+                throw new Error(`Could not resume generation (${currentResponse.status})`);
+            }
+        }
+
+        // A refinement keeps its session; a new single-mode result starts one under its request id
+        if (stream.completed && !(refining && refineSession)) {
+            refineSession = { id: requestId, mode: bicepMode, prompt: generationPrompt };
+        } else if (bicepMode === 'compare') {
+            refineSession = null;
+        }
+        refineOption.classList.toggle('hidden', !refineSession);
+        if (!refineSession) {
+            refineToggle.checked = false;
+        }
+
+        if (bicepMode === 'compare') {
+            const finished = Object.keys(MODE_LABELS).filter((name) => compareResults[name] !== undefined);
+            if (finished.length === Object.keys(MODE_LABELS).length && !statusMessage.className.includes('text-red-600')) {
+                statusMessage.textContent = '✅ Both templates generated successfully!';
+                statusMessage.className = 'text-sm text-green-600 mb-4 font-semibold';
+
+                setTimeout(() => {
+                    statusMessage.textContent = '';
+                }, 3000);
             }
         }
 
     } catch (error) {
+        if (!isCurrent()) {
+            return; // replaced by a newer submit, which already cancelled this one
+        }
         console.error('Network error:', error);
+        cancelActiveGeneration();
 
         statusMessage.textContent = `Network error: ${error.message}. Please check your connection and try again.`;
         statusMessage.className = 'text-sm text-red-600 mb-4 font-semibold';
@@ -166,10 +444,10 @@ submitButton.addEventListener('click', async (event) => {
         codePre.style.visibility = 'visible';
 
     } finally {
-        isGenerating = false;
-        submitButton.disabled = false;
-        submitButton.textContent = 'Generate Template';
-        submitButton.className = 'w-full bg-blue-600 text-white py-2 px-4 rounded-md hover:bg-blue-700 focus:outline-none focus:ring-2 focus:ring-blue-500 focus:ring-offset-2 transition';
+        if (isCurrent()) {
+            submitButton.textContent = 'Generate Template';
+            submitButton.className = 'w-full bg-blue-600 text-white py-2 px-4 rounded-md hover:bg-blue-700 focus:outline-none focus:ring-2 focus:ring-blue-500 focus:ring-offset-2 transition';
+        }
     }
 });
 
@@ -179,6 +457,133 @@ promptInput.addEventListener('keydown', (event) => {
     }
 });
 
+// Inline completions: after a short pause in typing, the words before the caret are sent
+// to /suggest and the matching module paths / resource types are offered under the prompt.
+function hideSuggestions() {
+    suggestions = [];
+    activeSuggestion = -1;
+    suggestionList.innerHTML = '';
+    suggestionList.classList.add('hidden');
+}
+
+function renderSuggestions() {
+    suggestionList.innerHTML = '';
+    if (suggestions.length === 0) {
+        suggestionList.classList.add('hidden');
+        return;
+    }
+
+    suggestions.forEach((suggestion, index) => {
+        const item = document.createElement('li');
+        item.setAttribute('role', 'option');
+        item.className = 'px-3 py-2 cursor-pointer flex justify-between gap-4 ' +
+            (index === activeSuggestion ? 'bg-blue-100' : 'hover:bg-gray-100');
+
+        const name = document.createElement('span');
+        name.className = 'font-mono text-gray-800 truncate';
+        name.textContent = suggestion.value;
+
+        const label = document.createElement('span');
+        label.className = 'text-xs text-gray-500 whitespace-nowrap';
+        label.textContent = suggestion.detail ? `${suggestion.label} · ${suggestion.detail}` : suggestion.label;
+
+        item.appendChild(name);
+        item.appendChild(label);
+        // mousedown rather than click, so the textarea does not lose focus first
+        item.addEventListener('mousedown', (event) => {
+            event.preventDefault();
+            acceptSuggestion(index);
+        });
+        suggestionList.appendChild(item);
+    });
+    suggestionList.classList.remove('hidden');
+}
+
+function acceptSuggestion(index) {
+    const suggestion = suggestions[index];
+    if (!suggestion) {
+        return;
+    }
+
+    const caret = promptInput.selectionStart;
+    const before = promptInput.value.substring(0, caret);
+    const after = promptInput.value.substring(caret);
+    // The server matched the last N words before the caret; replace exactly those.
+    const wordCount = suggestionFragment.split(/\s+/).length;
+    const fragmentPattern = new RegExp(`(?:\\S+\\s+){${wordCount - 1}}\\S+$`);
+    const match = before.match(fragmentPattern);
+    const start = match ? match.index : caret;
+
+    promptInput.value = before.substring(0, start) + suggestion.value + after;
+    const newCaret = start + suggestion.value.length;
+    promptInput.setSelectionRange(newCaret, newCaret);
+    hideSuggestions();
+}
+
+async function fetchSuggestions() {
+    const caret = promptInput.selectionStart;
+    const before = promptInput.value.substring(0, caret);
+    const lastWord = before.split(/\s/).pop();
+
+    if (lastWord.length < SUGGEST_MIN_CHARS) {
+        hideSuggestions();
+        return;
+    }
+
+    if (suggestController) {
+        suggestController.abort();
+    }
+    suggestController = new AbortController();
+
+    try {
+        const params = new URLSearchParams({ q: before.slice(-200), mode: selectedMode(), limit: '8' });
+        const response = await fetch(`/suggest?${params}`, { signal: suggestController.signal });
+        if (!response.ok) {
+            hideSuggestions();
+            return;
+        }
+
+        const data = await response.json();
+        suggestions = data.suggestions || [];
+        suggestionFragment = data.fragment || '';
+        activeSuggestion = suggestions.length > 0 ? 0 : -1;
+        renderSuggestions();
+    } catch (error) {
+        if (error.name !== 'AbortError') {
+            console.warn('Suggestions unavailable:', error);
+            hideSuggestions();
+        }
+    }
+}
+
+promptInput.addEventListener('input', () => {
+    clearTimeout(suggestTimer);
+    suggestTimer = setTimeout(fetchSuggestions, SUGGEST_DEBOUNCE_MS);
+});
+
+promptInput.addEventListener('keydown', (event) => {
+    if (suggestions.length === 0 || event.ctrlKey) {
+        return;
+    }
+
+    if (event.key === 'ArrowDown' || event.key === 'ArrowUp') {
+        event.preventDefault();
+        const step = event.key === 'ArrowDown' ? 1 : -1;
+        activeSuggestion = (activeSuggestion + step + suggestions.length) % suggestions.length;
+        renderSuggestions();
+    } else if (event.key === 'Enter' || event.key === 'Tab') {
+        event.preventDefault();
+        acceptSuggestion(activeSuggestion);
+    } else if (event.key === 'Escape') {
+        hideSuggestions();
+    }
+});
+
+promptInput.addEventListener('blur', () => {
+    clearTimeout(suggestTimer);
+    hideSuggestions();
+});
+
 function useExample(exampleText) {
     promptInput.value = exampleText;
     promptInput.focus();
@@ -0,0 +1,119 @@
+"""Queue-backed JSON logging that keeps log I/O off the request path.
+
+Request threads only put records on a bounded in-memory queue; a single
+listener thread formats them as one JSON object per line and writes them to
+stdout. When the queue is full, records are dropped and counted rather than
+blocking the SSE stream.
+"""
+from __future__ import annotations
+
+import atexit
+import copy
+import json
+import logging
+import os
+import queue
+import random
+import sys
+import time
+from logging.handlers import QueueHandler, QueueListener
+
+# Attributes every LogRecord has; anything else was passed through `extra=`.
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime", "taskName"}
+
+
+class JsonFormatter(logging.Formatter):
+    """Format a record, including its `extra` fields, as a single JSON line."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            "timestamp": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRIBUTES and not key.startswith("_"):
+                payload[key] = value
+        if record.exc_text:
+            payload["exception"] = record.exc_text
+        elif record.exc_info:
+            payload["exception"] = self.formatException(record.exc_info)
+        return json.dumps(payload, default=str)
+
+
+class DroppingQueueHandler(QueueHandler):
+    """QueueHandler that never blocks: records are dropped when the queue is full."""
+
+    def __init__(self, log_queue: "queue.Queue") -> None:
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Resolve the message and traceback on the calling thread (args may not be
+        # safe to format later), but leave the JSON formatting to the listener.
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def configure_logging(level: str = "INFO", max_queue_size: int = 10000) -> DroppingQueueHandler:
+    """Route all logging through a bounded queue to a JSON stdout writer."""
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(JsonFormatter())
+
+    queue_handler = DroppingQueueHandler(queue.Queue(maxsize=max_queue_size))
+    listener = QueueListener(queue_handler.queue, stream_handler, respect_handler_level=True)
+
+    def restart_listener_in_child() -> None:
+        # The listener thread does not survive fork (e.g. gunicorn --preload), and the
+        # queue's lock may have been held by it, so each child gets a fresh queue and thread.
+        nonlocal listener
+        queue_handler.queue = queue.Queue(maxsize=max_queue_size)
+        queue_handler.dropped = 0
+        listener = QueueListener(queue_handler.queue, stream_handler, respect_handler_level=True)
+        listener.start()
+
+    root = logging.getLogger()
+    root.handlers = [queue_handler]
+    root.setLevel(level.upper())
+
+    listener.start()
+    os.register_at_fork(after_in_child=restart_listener_in_child)
+    atexit.register(lambda: listener.stop())
+    return queue_handler
+
+
+def should_sample(rate: float) -> bool:
+    """Return True for roughly `rate` (0.0-1.0) of calls."""
+    return rate >= 1.0 or (rate > 0.0 and random.random() < rate)
+
+
+class RequestLog:
+    """Collects the fields and phase timings of one request for a single summary record."""
+
+    def __init__(self, request_id: str, **fields) -> None:
+        self.request_id = request_id
+        self.fields = dict(fields)
+        self.timings = {}
+        self._started = time.perf_counter()
+
+    def timing(self, phase: str, seconds: float) -> None:
+        self.timings[phase] = round(self.timings.get(phase, 0.0) + seconds, 4)
+
+    def update(self, **fields) -> None:
+        self.fields.update(fields)
+
+    def emit(self, logger: logging.Logger, message: str = "generation finished", level: int = logging.INFO) -> None:
+        self.timing("total", time.perf_counter() - self._started)
+        logger.log(level, message, extra={"request_id": self.request_id, "timings": self.timings, **self.fields})
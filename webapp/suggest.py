@@ -0,0 +1,324 @@
+"""Autocomplete over AVM module paths, module titles and ARM resource types.
+
+``Suggester`` is built once at startup from the ``GroundingIndex`` and backs
+``GET /suggest``. Every entry (one per module path or resource type) is
+reachable through a compressed (radix) trie keyed by
+
+* its full name - ``avm/res/key-vault/vault``, ``res/key-vault/vault`` or
+  ``microsoft.keyvault/vaults`` - so path-like queries complete directly, and
+* every token of its name and title (``key``, ``vault``, ``keyvault``, ...),
+  which is the token index used for free-text queries such as ``key vau``.
+
+Tokens of the entry's own name (the last path segment or type segment) rank
+above tokens it only inherits from its namespace or parents, so ``virtual
+net`` offers ``virtual-network`` before ``virtual-hub`` (Network). The other
+names an entry goes by count as its own: the abbreviations in
+``entities.ALIASES`` (``vnet``, ``aks``, ``kv``) and a provider with a single
+top-level module (``key-vault``). A one-word query offers top-level resources
+before child resources, so ``key`` puts ``key-vault/vault`` ahead of the
+``.../key`` children.
+
+Each trie node keeps its best-ranked entries precomputed, so a one-word
+query costs a walk of at most ``len(query)`` characters plus a short list
+copy. Multi-word queries start from the most selective word and check the
+others against each entry's tokens. With the ~500 module corpus a lookup
+takes tens of microseconds.
+"""
+from __future__ import annotations
+
+import re
+from dataclasses import dataclass, field
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from entities import ALIASES, module_phrases, resource_type_phrases, sole_provider_modules, words
+
+MAX_SUGGESTIONS = 20
+TOP_PER_NODE = 32
+MAX_QUERY_WORDS = 3
+
+_WORD = re.compile(r"[a-z0-9]+")
+_CAMEL_BOUNDARY = re.compile(r"(?<=[a-z0-9])(?=[A-Z])")
+_PATH_LIKE = re.compile(r"[/.:]")
+
+# Pattern and utility modules are less often what a prompt means than the resource modules.
+_MODULE_GROUP_RANK = {"avm/res/": 0, "avm/ptn/": 1, "avm/utl/": 2}
+
+
+@dataclass
+class SuggestEntry:
+    """One completion: `value` is what gets inserted into the prompt."""
+
+    value: str
+    label: str
+    kind: str  # "module" or "resource_type"
+    mode: str  # the /generate mode the entry belongs to
+    detail: str = ""
+    tokens: Tuple[str, ...] = ()
+    name_tokens: Tuple[str, ...] = ()
+    name_words: Tuple[str, ...] = ()
+    rank: Tuple = ()
+    child: bool = False  # a child resource (avm/res/key-vault/vault/key, Microsoft.KeyVault/vaults/keys)
+
+    def as_dict(self) -> dict:
+        return {"value": self.value, "label": self.label, "kind": self.kind, "mode": self.mode, "detail": self.detail}
+
+
+@dataclass
+class _Node:
+    children: Dict[str, Tuple[str, "_Node"]] = field(default_factory=dict)  # first char -> (edge, child)
+    exact: Dict[int, int] = field(default_factory=dict)  # entry id -> tier, for keys ending here
+    top: List[int] = field(default_factory=list)  # best entries in the subtree
+    size: int = 0  # distinct entries in the subtree
+
+
+class RadixTrie:
+    """Compressed trie mapping string keys to entry ids, with ranked top-k per node."""
+
+    def __init__(self) -> None:
+        self.root = _Node()
+
+    def insert(self, key: str, entry_id: int, tier: int = 0) -> None:
+        node = self.root
+        while key:
+            child = node.children.get(key[0])
+            if child is None:
+                leaf = _Node()
+                node.children[key[0]] = (key, leaf)
+                node = leaf
+                break
+
+            edge, target = child
+            common = _common_prefix_length(edge, key)
+            if common < len(edge):
+                # Split the edge at the divergence point.
+                middle = _Node(children={edge[common]: (edge[common:], target)})
+                node.children[key[0]] = (edge[:common], middle)
+                target = middle
+            node, key = target, key[common:]
+
+        node.exact[entry_id] = min(tier, node.exact.get(entry_id, tier))
+
+    def finalize(self, rank_of, child_of) -> None:
+        """Precompute each node's top entries and subtree size once all keys are inserted.
+
+        `rank_of(entry_id)` is the entry's static rank and `child_of(entry_id)`
+        whether it is a child resource; within a node top-level entries come
+        first, then entries are ordered by the best tier they are reachable
+        with, then by whether the key ends exactly here, then by that rank.
+        """
+        self._finalize(self.root, rank_of, child_of)
+
+    def _finalize(self, node: _Node, rank_of, child_of) -> Dict[int, int]:
+        subtree = dict(node.exact)
+        for _, child in node.children.values():
+            for entry_id, tier in self._finalize(child, rank_of, child_of).items():
+                subtree[entry_id] = min(tier, subtree.get(entry_id, tier))
+        order = sorted(subtree, key=lambda i: (child_of(i), subtree[i], i not in node.exact, rank_of(i)))
+        node.top = order[:TOP_PER_NODE]
+        node.size = len(subtree)
+        return subtree
+
+    def find(self, prefix: str) -> Optional[_Node]:
+        """Return the node covering `prefix`, or None when no key starts with it."""
+        node = self.root
+        while prefix:
+            child = node.children.get(prefix[0])
+            if child is None:
+                return None
+            edge, target = child
+            if prefix.startswith(edge):
+                node, prefix = target, prefix[len(edge):]
+            elif edge.startswith(prefix):
+                return target  # the prefix ends inside this edge
+            else:
+                return None
+        return node
+
+    def get(self, key: str) -> Dict[int, int]:
+        """Entries stored under exactly `key` (entry id -> tier)."""
+        node = self.root
+        while key:
+            child = node.children.get(key[0])
+            if child is None or not key.startswith(child[0]):
+                return {}
+            node, key = child[1], key[len(child[0]):]
+        return node.exact
+
+    def collect(self, node: _Node) -> Set[int]:
+        entries: Set[int] = set()
+        stack = [node]
+        while stack:
+            current = stack.pop()
+            entries.update(current.exact)
+            stack.extend(child for _, child in current.children.values())
+        return entries
+
+
+class Suggester:
+    """Ranked completions for module paths, titles and resource types."""
+
+    def __init__(self) -> None:
+        self.entries: List[SuggestEntry] = []
+        self.trie = RadixTrie()
+
+    @classmethod
+    def from_grounding_index(cls, index) -> "Suggester":
+        suggester = cls()
+        aliases: Dict[Tuple[str, ...], List[str]] = defaultdict(list)
+        for alias, phrase in ALIASES.items():
+            aliases[words(phrase)].append(alias)
+        providers = {top: provider for provider, top in sole_provider_modules(index.modules).items()}
+
+        for path, module in sorted(index.modules.items()):
+            group = next((rank for prefix, rank in _MODULE_GROUP_RANK.items() if path.startswith(prefix)), 3)
+            name = path.rsplit("/", 1)[-1]
+            other_names = [alias for phrase in module_phrases(path) for alias in aliases.get(phrase, ())]
+            if path in providers:
+                other_names.append(providers[path])
+            suggester.add(SuggestEntry(
+                value=path,
+                label=module.title or name,
+                kind="module",
+                mode="avm",
+                detail=_latest_version(module.versions),
+                rank=(group, path.count("/"), len(path), path),
+                child=path.startswith("avm/res/") and path.count("/") > 3,
+            ), keys=[path, path[len("avm/"):]], name=name, text=[path.split("/", 2)[-1], module.title or ""],
+                other_names=other_names)
+
+        for key, info in sorted(index.resource_types.items()):
+            namespace, _, type_path = info.resource_type.partition("/")
+            suggester.add(SuggestEntry(
+                value=info.resource_type,
+                label=type_path or info.resource_type,
+                kind="resource_type",
+                mode="classic",
+                detail=max(info.api_versions) if info.api_versions else "",
+                rank=(0, key.count("/"), len(key), key),
+                child="/" in type_path,
+            ), keys=[key], name=info.resource_type.rsplit("/", 1)[-1], text=[info.resource_type],
+                other_names=[alias for phrase in resource_type_phrases(info.resource_type)
+                             for alias in aliases.get(phrase, ())])
+
+        suggester.trie.finalize(
+            lambda entry_id: suggester.entries[entry_id].rank,
+            lambda entry_id: suggester.entries[entry_id].child,
+        )
+        return suggester
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def add(
+        self, entry: SuggestEntry, keys: Iterable[str], name: str, text: Iterable[str], other_names: Iterable[str] = (),
+    ) -> None:
+        """Index `entry` under its full-name `keys`, the tokens of its own `name` and of `text`.
+
+        The tokens of `other_names` (abbreviations, a provider naming only this
+        module) rank like those of `name`.
+        """
+        entry_id = len(self.entries)
+        entry.name_tokens = tuple(sorted(_tokens([name, *other_names])))
+        entry.name_words = tuple(_WORD.findall(_CAMEL_BOUNDARY.sub(" ", name).lower()))
+        entry.tokens = tuple(sorted(_tokens(text) | set(entry.name_tokens)))
+        self.entries.append(entry)
+        for key in keys:
+            self.trie.insert(key.lower(), entry_id)
+        for token in entry.tokens:
+            self.trie.insert(token, entry_id, tier=0 if token in entry.name_tokens else 1)
+
+    def suggest(self, query: str, mode: Optional[str] = None, limit: int = 8) -> Tuple[str, List[SuggestEntry]]:
+        """Complete the end of `query`; return the matched fragment and the ranked entries.
+
+        Only the trailing words of a prompt are meant to be completed, so the
+        longest trailing fragment (up to ``MAX_QUERY_WORDS`` words) that still
+        matches something wins; the caller replaces that fragment with the
+        chosen entry's value. The last word is a prefix, earlier words must
+        be whole tokens.
+        """
+        limit = max(1, min(limit, MAX_SUGGESTIONS))
+        words = query.rstrip().split()
+        if not words:
+            return "", []
+
+        for count in range(min(len(words), MAX_QUERY_WORDS), 0, -1):
+            fragment = " ".join(words[-count:])
+            matches = self._match(fragment, mode, limit)
+            if matches:
+                return fragment, matches
+        return "", []
+
+    def _match(self, fragment: str, mode: Optional[str], limit: int) -> List[SuggestEntry]:
+        lowered = fragment.lower()
+        if " " not in lowered and _PATH_LIKE.search(lowered):
+            node = self.trie.find(lowered)
+            return self._ranked(node, mode, limit) if node else []
+
+        words = _WORD.findall(lowered)
+        if not words:
+            return []
+        *whole, prefix = words
+        if not whole:
+            node = self.trie.find(prefix)
+            return self._ranked(node, mode, limit) if node else []
+
+        # Candidates carry every whole word as a token; the smallest token set is the seed.
+        token_sets = sorted((self.trie.get(word) for word in whole), key=len)
+        candidates = set(token_sets[0]).intersection(*token_sets[1:])
+        matches = [
+            self.entries[i] for i in candidates
+            if self._mode_matches(self.entries[i], mode)
+            and any(token.startswith(prefix) for token in self.entries[i].tokens)
+        ]
+
+        # Rank by how much of the entry's own name the query leaves uncovered.
+        def uncovered(entry: SuggestEntry) -> int:
+            return sum(1 for word in entry.name_words if word not in whole and not word.startswith(prefix))
+
+        matches.sort(key=lambda entry: (uncovered(entry), entry.rank))
+        return matches[:limit]
+
+    def _ranked(self, node: _Node, mode: Optional[str], limit: int) -> List[SuggestEntry]:
+        results = [self.entries[i] for i in node.top if self._mode_matches(self.entries[i], mode)][:limit]
+        if len(results) < limit and node.size > len(node.top):
+            # The precomputed top list was filtered too thin by the mode; rank the whole subtree.
+            order = {entry_id: position for position, entry_id in enumerate(node.top)}
+            candidates = sorted(
+                self.trie.collect(node),
+                key=lambda i: (order.get(i, len(order)), self.entries[i].rank),
+            )
+            results = [self.entries[i] for i in candidates if self._mode_matches(self.entries[i], mode)][:limit]
+        return results
+
+    @staticmethod
+    def _mode_matches(entry: SuggestEntry, mode: Optional[str]) -> bool:
+        return mode in (None, "compare") or entry.mode == mode
+
+
+def _common_prefix_length(a: str, b: str) -> int:
+    length = min(len(a), len(b))
+    for i in range(length):
+        if a[i] != b[i]:
+            return i
+    return length
+
+
+def _tokens(texts: Iterable[str]) -> Set[str]:
+    """Lowercase words of `texts`, plus camelCase parts and hyphenated words joined up."""
+    tokens: Set[str] = set()
+    for text in texts:
+        tokens.update(_WORD.findall(_CAMEL_BOUNDARY.sub(" ", text).lower()))
+        for part in re.split(r"[\s/.:()]+", text):
+            joined = "".join(_WORD.findall(part.lower()))
+            if joined:
+                tokens.add(joined)
+    return tokens
+
+
+def _latest_version(versions: Iterable[str]) -> str:
+    def key(version: str):
+        return [int(part) if part.isdigit() else -1 for part in version.split(".")]
+
+    versions = list(versions)
+    return max(versions, key=key) if versions else ""
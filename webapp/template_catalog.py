@@ -0,0 +1,80 @@
+"""Catalog of pre-generated templates, one per AVM module and classic resource type.
+
+The catalog is produced offline by
+``grounding-data/scripts/build_template_catalog.py`` (Batch API requests built
+with the same prompt assembly as ``/generate``) and stored as JSONL next to
+the grounding data. The webapp loads it read-only and serves entries
+instantly from ``/catalog``; ``/generate`` does not consult it.
+
+Each line is one entry::
+
+    {"key": "avm:avm/res/key-vault/vault", "mode": "avm", "title": "...",
+     "target": "br/public:avm/res/key-vault/vault:0.13.0", "prompt": "...",
+     "plan": {...}, "bicep": "...", "parameters": "...", "warnings": [...],
+     "status": "verified" | "needs_review", "generated_at": 1700000000.0}
+"""
+from __future__ import annotations
+
+import json
+import os
+from typing import Dict, Iterable, List, Optional
+
+CATALOG_FILE = "template_catalog.jsonl"
+
+
+class TemplateCatalog:
+    """Entries keyed by `key`; later lines override earlier ones so appends act as updates."""
+
+    def __init__(self, path: Optional[str] = None) -> None:
+        self.path = path
+        self.entries: Dict[str, dict] = {}
+
+    @classmethod
+    def load(cls, path: str) -> "TemplateCatalog":
+        catalog = cls(path)
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # a partially written last line from an interrupted ingest
+                    catalog.entries[entry["key"]] = entry
+        return catalog
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.entries
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def get(self, key: str) -> Optional[dict]:
+        return self.entries.get(key)
+
+    def append(self, entries: Iterable[dict]) -> int:
+        """Append entries to the catalog file and flush after each one so ingestion can resume."""
+        written = 0
+        with open(self.path, "a", encoding="utf-8") as f:
+            for entry in entries:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+                f.flush()
+                self.entries[entry["key"]] = entry
+                written += 1
+        return written
+
+    def search(self, query: str = "", mode: Optional[str] = None, limit: int = 50) -> List[dict]:
+        """List entries whose key or title contains every word of `query`."""
+        words = query.lower().split()
+        matches = []
+        for entry in self.entries.values():
+            if mode and entry.get("mode") != mode:
+                continue
+            haystack = f"{entry['key']} {entry.get('title', '')}".lower()
+            if all(word in haystack for word in words):
+                matches.append(entry)
+                if len(matches) >= limit:
+                    break
+        return matches
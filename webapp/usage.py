@@ -0,0 +1,93 @@
+"""Token usage accounting for Azure OpenAI completions."""
+from __future__ import annotations
+
+import threading
+from typing import Dict, Optional
+
+
+def extract_usage(response) -> Dict[str, int]:
+    """Pull prompt, completion and cached token counts out of a completion response."""
+    usage = getattr(response, "usage", None)
+    if usage is None:
+        return {"prompt_tokens": 0, "completion_tokens": 0, "cached_tokens": 0}
+
+    details = getattr(usage, "prompt_tokens_details", None)
+    cached_tokens = getattr(details, "cached_tokens", 0) if details is not None else 0
+
+    return {
+        "prompt_tokens": getattr(usage, "prompt_tokens", 0) or 0,
+        "completion_tokens": getattr(usage, "completion_tokens", 0) or 0,
+        "cached_tokens": cached_tokens or 0,
+    }
+
+
+class UsageStats:
+    """Thread-safe running totals of token usage and completion latency.
+
+    Latency is tracked separately for completions that hit the prompt cache
+    and those that did not, which is what we need to see the effect of a
+    stable prompt prefix.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._requests = 0
+        self._prompt_tokens = 0
+        self._completion_tokens = 0
+        self._cached_tokens = 0
+        self._cache_hits = 0
+        self._latency = {"cached": 0.0, "uncached": 0.0}
+        self._cancelled: Dict[str, int] = {}
+        self._cancelled_generated_tokens = 0
+        self._tokens_saved = 0
+
+    def record(self, usage: Dict[str, int], duration: Optional[float] = None) -> None:
+        """Add a single completion's usage to the totals."""
+        cached = usage.get("cached_tokens", 0) > 0
+        with self._lock:
+            self._requests += 1
+            self._prompt_tokens += usage.get("prompt_tokens", 0)
+            self._completion_tokens += usage.get("completion_tokens", 0)
+            self._cached_tokens += usage.get("cached_tokens", 0)
+            if cached:
+                self._cache_hits += 1
+            if duration is not None:
+                self._latency["cached" if cached else "uncached"] += duration
+
+    def average_completion_tokens(self) -> int:
+        with self._lock:
+            return self._completion_tokens // self._requests if self._requests else 0
+
+    def record_cancelled(self, phase: str, generated_tokens: int = 0) -> int:
+        """Count a cancelled generation and return the completion tokens it is estimated to have saved.
+
+        The estimate is the average completion so far minus what the model had
+        already generated when the stream was closed.
+        """
+        saved = max(0, self.average_completion_tokens() - generated_tokens)
+        with self._lock:
+            self._cancelled[phase] = self._cancelled.get(phase, 0) + 1
+            self._cancelled_generated_tokens += generated_tokens
+            self._tokens_saved += saved
+        return saved
+
+    def snapshot(self) -> Dict[str, object]:
+        """Return the aggregated totals and derived ratios."""
+        with self._lock:
+            misses = self._requests - self._cache_hits
+            return {
+                "requests": self._requests,
+                "prompt_tokens": self._prompt_tokens,
+                "completion_tokens": self._completion_tokens,
+                "cached_tokens": self._cached_tokens,
+                "cache_hit_requests": self._cache_hits,
+                "cached_token_ratio": round(self._cached_tokens / self._prompt_tokens, 4) if self._prompt_tokens else 0.0,
+                "avg_latency_cached": round(self._latency["cached"] / self._cache_hits, 3) if self._cache_hits else None,
+                "avg_latency_uncached": round(self._latency["uncached"] / misses, 3) if misses else None,
+                "cancelled": {
+                    "requests": sum(self._cancelled.values()),
+                    "by_phase": dict(self._cancelled),
+                    "completion_tokens_generated": self._cancelled_generated_tokens,
+                    "estimated_completion_tokens_saved": self._tokens_saved,
+                },
+            }